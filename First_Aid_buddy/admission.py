@@ -0,0 +1,252 @@
+"""
+Admission control for the chat API
+Bounds how many queries run at once. Queries beyond the limit wait in a
+priority queue (likely emergencies first) and general queries that would
+wait too long are shed, so an overloaded server answers "try again" quickly
+instead of slowly answering everyone late
+"""
+
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+
+from .config import Config
+from .governor import NORMAL, EMERGENCY
+from .logger import setup_logger
+from .metrics import registry
+
+logger = setup_logger('admission')
+
+QUEUE_DEPTH = registry.gauge(
+    'admission_queue_depth', 'Queries waiting for an admission slot', ('priority',)
+)
+IN_FLIGHT = registry.gauge(
+    'admission_in_flight', 'Queries holding an admission slot'
+)
+WAIT_SECONDS = registry.histogram(
+    'admission_wait_seconds', 'Time queries waited for an admission slot', ('priority', 'outcome'),
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+SHED = registry.counter(
+    'admission_shed_total', 'Queries refused by admission control', ('priority', 'reason')
+)
+
+# Queue order: lower rank is admitted first
+_RANK = {EMERGENCY: 0, NORMAL: 1}
+
+# Weight of the newest sample in the average slot hold time
+_SERVICE_TIME_ALPHA = 0.2
+
+
+class OverloadedError(Exception):
+    """Query shed by admission control; the client should retry later"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Concurrency limit with a priority queue in front of it
+
+    Up to `max_concurrency` queries run at once; `emergency_slots` more are
+    held back for likely emergencies, so they rarely queue at all. When no
+    slot is free, a query waits in a queue ordered emergencies first, then
+    arrival order, and each released slot goes to the head of the queue.
+
+    General queries are shed when the queue already holds `max_queue` of
+    them, or when they have waited `max_queue_wait` seconds. Emergencies
+    are never shed by the queue limits, only when the caller's own time
+    runs out. Shed queries get a Retry-After estimate from the queue length
+    and the average time a slot is held.
+
+    Runs on one event loop and is not thread-safe.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        emergency_slots: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        max_queue_wait: Optional[float] = None,
+        enabled: Optional[bool] = None
+    ):
+        """
+        Args:
+            max_concurrency: Queries run at once (defaults to ADMISSION_MAX_CONCURRENCY)
+            emergency_slots: Extra slots only emergencies may use (defaults to ADMISSION_EMERGENCY_SLOTS)
+            max_queue: General queries allowed to wait (defaults to ADMISSION_MAX_QUEUE)
+            max_queue_wait: Longest wait for a general query (defaults to ADMISSION_MAX_QUEUE_WAIT_SECONDS)
+            enabled: Admit everything immediately when False (defaults to ADMISSION_ENABLED)
+        """
+        self.enabled = Config.ADMISSION_ENABLED if enabled is None else enabled
+        self.max_concurrency = Config.ADMISSION_MAX_CONCURRENCY if max_concurrency is None else max_concurrency
+        self.emergency_slots = Config.ADMISSION_EMERGENCY_SLOTS if emergency_slots is None else emergency_slots
+        self.max_queue = Config.ADMISSION_MAX_QUEUE if max_queue is None else max_queue
+        self.max_queue_wait = Config.ADMISSION_MAX_QUEUE_WAIT_SECONDS if max_queue_wait is None else max_queue_wait
+        self._active = 0
+        # Heap of [rank, sequence, future]; abandoned entries are skipped when popped
+        self._queue: List[list] = []
+        self._sequence = itertools.count()
+        self._waiting: Dict[str, int] = {NORMAL: 0, EMERGENCY: 0}
+        self._service_time = 1.0
+
+    def _limit(self, priority: str) -> int:
+        return self.max_concurrency + (self.emergency_slots if priority == EMERGENCY else 0)
+
+    def _update_gauges(self) -> None:
+        IN_FLIGHT.set(self._active)
+        for priority, count in self._waiting.items():
+            QUEUE_DEPTH.set(count, priority=priority)
+
+    def retry_after(self) -> int:
+        """Whole seconds until a slot is likely free for a new general query"""
+        queued = sum(self._waiting.values())
+        estimate = self._service_time * (queued + 1) / max(1, self.max_concurrency)
+        return max(1, math.ceil(estimate))
+
+    def _shed(self, priority: str, reason: str, waited: float) -> OverloadedError:
+        SHED.inc(priority=priority, reason=reason)
+        WAIT_SECONDS.observe(waited, priority=priority, outcome='shed')
+        retry_after = self.retry_after()
+        logger.warning(
+            f"Admission: {priority} query shed ({reason}, waited {round(waited, 2)}s, "
+            f"{self._active} running, {sum(self._waiting.values())} queued)"
+        )
+        return OverloadedError("The service is busy. Please try again shortly.", retry_after)
+
+    def _wake(self) -> None:
+        """Hand free slots to the head of the queue"""
+        while self._queue:
+            rank, _, future = self._queue[0]
+            if future.done():
+                heapq.heappop(self._queue)
+                continue
+            priority = EMERGENCY if rank == _RANK[EMERGENCY] else NORMAL
+            if self._active >= self._limit(priority):
+                return
+            heapq.heappop(self._queue)
+            self._active += 1
+            future.set_result(None)
+
+    async def acquire(self, priority: str = NORMAL, max_wait: Optional[float] = None) -> float:
+        """
+        Wait for a slot
+
+        Args:
+            priority: NORMAL or EMERGENCY (queue-jumps and may use the emergency slots)
+            max_wait: Longest acceptable wait, e.g. the time left before the
+                request deadline; general queries also stop at max_queue_wait
+
+        Returns:
+            time.monotonic() at which the slot was taken (pass to release())
+
+        Raises:
+            OverloadedError: No slot became free in time
+        """
+        started = time.monotonic()
+        if not self.enabled:
+            return started
+
+        if self._active < self._limit(priority):
+            self._active += 1
+            self._update_gauges()
+            WAIT_SECONDS.observe(0.0, priority=priority, outcome='admitted')
+            return started
+
+        if priority != EMERGENCY:
+            if self._waiting[NORMAL] >= self.max_queue:
+                raise self._shed(priority, 'queue_full', 0.0)
+            max_wait = self.max_queue_wait if max_wait is None else min(max_wait, self.max_queue_wait)
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, [_RANK[priority], next(self._sequence), future])
+        self._waiting[priority] += 1
+        self._update_gauges()
+        try:
+            await asyncio.wait((future,), timeout=max_wait)
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Cancelled just after being handed a slot: pass it on
+                self._release_slot()
+            else:
+                future.cancel()
+            raise
+        finally:
+            self._waiting[priority] -= 1
+            if not future.done():
+                # Timed out: leave the queue without a slot
+                future.cancel()
+            self._update_gauges()
+
+        waited = time.monotonic() - started
+        if future.cancelled():
+            raise self._shed(priority, 'wait', waited)
+        WAIT_SECONDS.observe(waited, priority=priority, outcome='admitted')
+        return time.monotonic()
+
+    def _release_slot(self) -> None:
+        self._active = max(0, self._active - 1)
+        self._wake()
+
+    def release(self, admitted_at: float) -> None:
+        """
+        Give a slot back
+
+        Args:
+            admitted_at: Value returned by acquire()
+        """
+        if not self.enabled:
+            return
+        held = time.monotonic() - admitted_at
+        self._service_time += _SERVICE_TIME_ALPHA * (held - self._service_time)
+        self._release_slot()
+        self._update_gauges()
+
+    @asynccontextmanager
+    async def admit(self, priority: str = NORMAL, max_wait: Optional[float] = None) -> AsyncIterator[None]:
+        """
+        Hold a slot for the duration of the block
+
+        Args:
+            priority: NORMAL or EMERGENCY
+            max_wait: Longest acceptable wait (see acquire())
+
+        Raises:
+            OverloadedError: No slot became free in time
+        """
+        admitted_at = await self.acquire(priority, max_wait)
+        try:
+            yield
+        finally:
+            self.release(admitted_at)
+
+    def reset(self) -> None:
+        """Forget running and queued queries (waiters are abandoned)"""
+        for _, _, future in self._queue:
+            if not future.done():
+                future.cancel()
+        self._queue.clear()
+        self._active = 0
+        self._waiting = {NORMAL: 0, EMERGENCY: 0}
+        self._service_time = 1.0
+        self._update_gauges()
+
+    def snapshot(self) -> dict:
+        return {
+            'in_flight': self._active,
+            'max_concurrency': self.max_concurrency,
+            'emergency_slots': self.emergency_slots,
+            'queued_normal': self._waiting[NORMAL],
+            'queued_emergency': self._waiting[EMERGENCY],
+            'avg_service_s': round(self._service_time, 3),
+        }
+
+
+# Global controller for the chat API's event loop
+admission = AdmissionController()
@@ -8,11 +8,36 @@ import anthropic
 from typing import List
 import time
 import os
+import sys
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+# Make First_Aid_buddy.* importable when run via `streamlit run First_Aid_buddy/app.py`
+_project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _project_root not in sys.path:
+    sys.path.insert(0, _project_root)
+
+from First_Aid_buddy.client_factory import get_shared_client
+from First_Aid_buddy.config import Config
+from First_Aid_buddy.core import call_claude_with_retry
+from First_Aid_buddy.logger import start_log_listener
+
+
+@st.cache_resource
+def _log_writer():
+    """
+    Start the background log writer once per Streamlit process
+    (the script itself re-runs on every interaction). Queued records are
+    flushed by the logger's exit hook when the server shuts down.
+    """
+    return start_log_listener()
+
+
+if Config.LOG_ASYNC:
+    _log_writer()
+
 # ============================================================================
 # PAGE CONFIGURATION
 # ============================================================================
@@ -156,9 +181,9 @@ FIRST_AID_KNOWLEDGE_BASE = [
 # ============================================================================
 
 def initialize_client(api_key: str):
-    """Initialize the Anthropic client with the provided API key."""
+    """Get the shared, pooled Anthropic client for the provided API key (one per process, not per session)."""
     try:
-        return anthropic.Anthropic(api_key=api_key)
+        return get_shared_client(api_key)
     except Exception as e:
         st.error(f"Failed to initialize client: {e}")
         return None
@@ -171,7 +196,9 @@ def classify_intent(user_input: str, client) -> str:
     user_prompt = f"Analyze the following user input and output the single, appropriate category name: `{user_input}`"
 
     try:
-        response = client.messages.create(
+        response = call_claude_with_retry(
+            client,
+            'classify_intent',
             model="claude-sonnet-4-5-20250929",
             max_tokens=10,
             system=system_prompt,
@@ -254,7 +281,9 @@ def generate_final_answer(user_input: str, docs: str, is_emergency: bool, client
         user_message = f"User's Question: `{user_input}` Retrieved Documents (Use only this information to formulate your conversational response): `{docs}`"
 
     try:
-        response = client.messages.create(
+        response = call_claude_with_retry(
+            client,
+            'generate_answer',
             model="claude-sonnet-4-5-20250929",
             max_tokens=1000,
             system=system_prompt,
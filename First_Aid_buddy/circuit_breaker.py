@@ -0,0 +1,171 @@
+"""
+Circuit breaker for the Anthropic API
+Trips on a high error rate or a high share of slow calls so that requests
+fail fast (and degrade) instead of queueing behind a struggling upstream
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from .config import Config
+from .logger import setup_logger
+
+logger = setup_logger('circuit_breaker')
+
+
+class CircuitBreaker:
+    """
+    Count-based sliding-window circuit breaker
+
+    CLOSED    - calls flow; outcomes of the last window_size calls are tracked
+    OPEN      - calls are rejected until open_seconds have passed
+    HALF_OPEN - a limited number of probe calls decide whether to close again
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(
+        self,
+        failure_rate_threshold: Optional[float] = None,
+        slow_call_seconds: Optional[float] = None,
+        slow_call_rate_threshold: Optional[float] = None,
+        window_size: Optional[int] = None,
+        min_calls: Optional[int] = None,
+        open_seconds: Optional[float] = None,
+        half_open_max_calls: int = 1
+    ):
+        self.failure_rate_threshold = (
+            Config.CIRCUIT_FAILURE_RATE_THRESHOLD if failure_rate_threshold is None else failure_rate_threshold
+        )
+        self.slow_call_seconds = Config.CIRCUIT_SLOW_CALL_SECONDS if slow_call_seconds is None else slow_call_seconds
+        self.slow_call_rate_threshold = (
+            Config.CIRCUIT_SLOW_CALL_RATE_THRESHOLD if slow_call_rate_threshold is None else slow_call_rate_threshold
+        )
+        self.window_size = Config.CIRCUIT_WINDOW_SIZE if window_size is None else window_size
+        self.min_calls = Config.CIRCUIT_MIN_CALLS if min_calls is None else min_calls
+        self.open_seconds = Config.CIRCUIT_OPEN_SECONDS if open_seconds is None else open_seconds
+        self.half_open_max_calls = half_open_max_calls
+
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=self.window_size)  # (failed, slow) per call
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._half_open_in_flight = 0
+        self._rejected = 0
+
+    # ------------------------------------------------------------------
+    # State
+    # ------------------------------------------------------------------
+
+    def _refresh(self) -> None:
+        """Move OPEN -> HALF_OPEN once the cool-down has elapsed (lock held)"""
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = self.HALF_OPEN
+            self._half_open_in_flight = 0
+            logger.info("Circuit half-open: probing Anthropic API")
+
+    def _trip(self, reason: str) -> None:
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        logger.warning(f"Circuit opened: {reason}")
+
+    def _close(self) -> None:
+        self._state = self.CLOSED
+        self._outcomes.clear()
+        logger.info("Circuit closed: Anthropic API recovered")
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh()
+            return self._state
+
+    # ------------------------------------------------------------------
+    # Call accounting
+    # ------------------------------------------------------------------
+
+    def allow_request(self) -> bool:
+        """
+        Check whether a call may be attempted now
+
+        Returns:
+            True if the call may proceed; the caller must then report the
+            outcome with record_success(), record_failure() or release()
+        """
+        with self._lock:
+            self._refresh()
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and self._half_open_in_flight < self.half_open_max_calls:
+                self._half_open_in_flight += 1
+                return True
+            self._rejected += 1
+            return False
+
+    def record_success(self, duration_s: float) -> None:
+        """Report a call that reached the API and returned (or failed on our side)"""
+        self._record(False, duration_s)
+
+    def record_failure(self, duration_s: float) -> None:
+        """Report a call that failed because of the upstream (timeout, 429, 5xx, ...)"""
+        self._record(True, duration_s)
+
+    def release(self) -> None:
+        """Report a call whose outcome says nothing about upstream health"""
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+
+    def _record(self, failed: bool, duration_s: float) -> None:
+        slow = duration_s >= self.slow_call_seconds
+
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+                if failed or slow:
+                    self._trip("probe call failed" if failed else "probe call slow")
+                else:
+                    self._close()
+                return
+
+            if self._state == self.OPEN:
+                # Late result from a call that started before the trip
+                return
+
+            self._outcomes.append((failed, slow))
+            calls = len(self._outcomes)
+            if calls < self.min_calls:
+                return
+
+            failure_rate = sum(1 for f, _ in self._outcomes if f) / calls
+            slow_rate = sum(1 for _, s in self._outcomes if s) / calls
+            if failure_rate >= self.failure_rate_threshold:
+                self._trip(f"failure rate {failure_rate:.0%} over last {calls} calls")
+            elif slow_rate >= self.slow_call_rate_threshold:
+                self._trip(f"slow-call rate {slow_rate:.0%} over last {calls} calls")
+
+    def reset(self) -> None:
+        """Force the breaker closed and forget history"""
+        with self._lock:
+            self._state = self.CLOSED
+            self._outcomes.clear()
+            self._half_open_in_flight = 0
+            self._rejected = 0
+
+    def snapshot(self) -> dict:
+        """Current state and window statistics (safe for logging/health checks)"""
+        with self._lock:
+            self._refresh()
+            calls = len(self._outcomes)
+            return {
+                'state': self._state,
+                'window_calls': calls,
+                'failure_rate': round(sum(1 for f, _ in self._outcomes if f) / calls, 3) if calls else 0.0,
+                'slow_call_rate': round(sum(1 for _, s in self._outcomes if s) / calls, 3) if calls else 0.0,
+                'rejected_calls': self._rejected,
+            }
@@ -0,0 +1,296 @@
+"""
+Shared Anthropic client factory
+One pooled, timeout-aware client per API key and process, with connection
+reuse statistics and an optional warm-up that opens connections up front
+"""
+
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import anthropic
+
+try:
+    # anthropic>=1.0 sends requests through its own httpx fork
+    import httpx2 as httpx
+except ImportError:
+    import httpx
+
+from .config import Config
+from .logger import setup_logger
+from .metrics import registry
+
+logger = setup_logger('client_factory')
+
+HTTP_REQUESTS = registry.counter(
+    'anthropic_http_requests_total', 'HTTP requests sent by shared Anthropic clients', ('client',)
+)
+HTTP_CONNECTIONS = registry.counter(
+    'anthropic_http_connections_opened_total', 'New TCP connections opened by shared Anthropic clients', ('client',)
+)
+
+# Distinct API keys (e.g. Streamlit users entering their own) kept per process
+MAX_CACHED_CLIENTS = 32
+
+
+class PoolStats:
+    """Counts requests and newly opened connections for one HTTP pool"""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections_opened = 0
+
+    def record_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+        HTTP_REQUESTS.inc(client=self.kind)
+
+    def record_connection(self) -> None:
+        with self._lock:
+            self.connections_opened += 1
+        HTTP_CONNECTIONS.inc(client=self.kind)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            reused = max(0, self.requests - self.connections_opened)
+            return {
+                'requests': self.requests,
+                'connections_opened': self.connections_opened,
+                'reuse_ratio': round(reused / self.requests, 3) if self.requests else 0.0,
+            }
+
+
+class _CountingTransport(httpx.HTTPTransport):
+    """HTTP transport that counts requests and new connections via httpcore trace events"""
+
+    def __init__(self, stats: PoolStats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self.stats.record_request()
+        previous = request.extensions.get('trace')
+
+        def trace(event_name: str, info: dict) -> None:
+            if event_name == 'connection.connect_tcp.complete':
+                self.stats.record_connection()
+            if previous is not None:
+                previous(event_name, info)
+
+        request.extensions = {**request.extensions, 'trace': trace}
+        return super().handle_request(request)
+
+
+class _AsyncCountingTransport(httpx.AsyncHTTPTransport):
+    """Async counterpart of _CountingTransport"""
+
+    def __init__(self, stats: PoolStats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.stats.record_request()
+        previous = request.extensions.get('trace')
+
+        async def trace(event_name: str, info: dict) -> None:
+            if event_name == 'connection.connect_tcp.complete':
+                self.stats.record_connection()
+            if previous is not None:
+                await previous(event_name, info)
+
+        request.extensions = {**request.extensions, 'trace': trace}
+        return await super().handle_async_request(request)
+
+
+def http_timeout(read_timeout: Optional[float] = None) -> httpx.Timeout:
+    """
+    Build the HTTP timeout for Anthropic calls
+
+    Args:
+        read_timeout: Overall/read timeout in seconds (defaults to API_TIMEOUT)
+
+    Returns:
+        httpx.Timeout with the connect timeout capped by the read timeout
+    """
+    read_timeout = float(Config.API_TIMEOUT if read_timeout is None else read_timeout)
+    return httpx.Timeout(read_timeout, connect=min(Config.API_CONNECT_TIMEOUT, read_timeout))
+
+
+def _pool_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=Config.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=Config.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=Config.HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+class _ClientEntry:
+    """A shared client together with its HTTP pool"""
+
+    def __init__(self, client, http_client, stats: PoolStats):
+        self.client = client
+        self.http_client = http_client
+        self.stats = stats
+
+
+_lock = threading.Lock()
+_entries: 'OrderedDict[tuple, _ClientEntry]' = OrderedDict()
+_entries_by_client: Dict[int, _ClientEntry] = {}
+
+
+def _cache_key(kind: str, api_key: str, base_url: Optional[str]) -> tuple:
+    # Never keep raw keys around as dict keys
+    return kind, hashlib.sha256((api_key or '').encode()).hexdigest(), base_url
+
+
+def _build_entry(kind: str, api_key: str, base_url: Optional[str]) -> _ClientEntry:
+    stats = PoolStats(kind)
+    # Retries are ours (core.call_claude_with_retry); SDK and transport retries off
+    if kind == 'async':
+        http_client = httpx.AsyncClient(
+            transport=_AsyncCountingTransport(stats, limits=_pool_limits(), retries=0),
+            timeout=http_timeout(),
+        )
+        client = anthropic.AsyncAnthropic(
+            api_key=api_key, base_url=base_url, http_client=http_client,
+            timeout=http_timeout(), max_retries=0,
+        )
+    else:
+        http_client = httpx.Client(
+            transport=_CountingTransport(stats, limits=_pool_limits(), retries=0),
+            timeout=http_timeout(),
+        )
+        client = anthropic.Anthropic(
+            api_key=api_key, base_url=base_url, http_client=http_client,
+            timeout=http_timeout(), max_retries=0,
+        )
+    return _ClientEntry(client, http_client, stats)
+
+
+def _get_shared(kind: str, api_key: str, base_url: Optional[str]):
+    key = _cache_key(kind, api_key, base_url)
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None:
+            _entries.move_to_end(key)
+            return entry.client
+
+        entry = _build_entry(kind, api_key, base_url)
+        _entries[key] = entry
+        _entries_by_client[id(entry.client)] = entry
+
+        # Idle clients for old keys are dropped (their pools close on GC)
+        while len(_entries) > MAX_CACHED_CLIENTS:
+            _, evicted = _entries.popitem(last=False)
+            _entries_by_client.pop(id(evicted.client), None)
+
+    logger.info(f"Shared {kind} Anthropic client created")
+    return entry.client
+
+
+def get_shared_client(api_key: str, base_url: Optional[str] = None) -> anthropic.Anthropic:
+    """
+    Get the process-wide pooled Anthropic client for this API key
+
+    The client has SDK retries disabled: send requests through
+    core.call_claude_with_retry(), not messages.create() directly.
+
+    Args:
+        api_key: Anthropic API key
+        base_url: Optional API base URL (defaults to the SDK's / ANTHROPIC_BASE_URL)
+
+    Returns:
+        Shared client (created on first use)
+    """
+    return _get_shared('sync', api_key, base_url)
+
+
+def get_shared_async_client(api_key: str, base_url: Optional[str] = None) -> anthropic.AsyncAnthropic:
+    """
+    Get the process-wide pooled AsyncAnthropic client for this API key
+
+    The client has SDK retries disabled: send requests through
+    core.call_claude_with_retry_async(), not messages.create() directly.
+
+    Args:
+        api_key: Anthropic API key
+        base_url: Optional API base URL (defaults to the SDK's / ANTHROPIC_BASE_URL)
+
+    Returns:
+        Shared async client (created on first use)
+    """
+    return _get_shared('async', api_key, base_url)
+
+
+async def warm_up_async(client, connections: Optional[int] = None) -> int:
+    """
+    Open pooled connections before the first user arrives
+
+    Sends concurrent unauthenticated HEAD requests to the API host so that
+    TCP and TLS handshakes are done and the connections sit in the keep-alive
+    pool. No API quota is used.
+
+    Args:
+        client: Client returned by get_shared_client()/get_shared_async_client()
+        connections: Number of connections to open (defaults to HTTP_WARMUP_CONNECTIONS)
+
+    Returns:
+        Number of warm-up requests that completed
+    """
+    connections = Config.HTTP_WARMUP_CONNECTIONS if connections is None else connections
+    entry = _entries_by_client.get(id(client))
+    if entry is None or connections <= 0:
+        return 0
+
+    url = str(client.base_url)
+    timeout = httpx.Timeout(Config.API_CONNECT_TIMEOUT)
+
+    if isinstance(entry.http_client, httpx.AsyncClient):
+        async def head():
+            await entry.http_client.head(url, timeout=timeout)
+    else:
+        async def head():
+            await asyncio.to_thread(entry.http_client.head, url, timeout=timeout)
+
+    results = await asyncio.gather(*(head() for _ in range(connections)), return_exceptions=True)
+    failures = [r for r in results if isinstance(r, Exception)]
+    if failures:
+        logger.warning(f"Connection warm-up: {len(failures)}/{connections} failed ({type(failures[0]).__name__})")
+
+    warmed = connections - len(failures)
+    logger.info(f"Connection warm-up: {warmed} connection(s) ready")
+    return warmed
+
+
+def pool_stats() -> dict:
+    """Connection reuse statistics per shared client kind"""
+    totals: Dict[str, dict] = {}
+    with _lock:
+        entries = list(_entries.values())
+    for entry in entries:
+        snapshot = entry.stats.snapshot()
+        total = totals.setdefault(entry.stats.kind, {'clients': 0, 'requests': 0, 'connections_opened': 0})
+        total['clients'] += 1
+        total['requests'] += snapshot['requests']
+        total['connections_opened'] += snapshot['connections_opened']
+    for total in totals.values():
+        reused = max(0, total['requests'] - total['connections_opened'])
+        total['reuse_ratio'] = round(reused / total['requests'], 3) if total['requests'] else 0.0
+    return totals
+
+
+async def close_shared_clients() -> None:
+    """Close every shared client's connection pool (call on shutdown)"""
+    with _lock:
+        entries = list(_entries.values())
+        _entries.clear()
+        _entries_by_client.clear()
+    for entry in entries:
+        if isinstance(entry.http_client, httpx.AsyncClient):
+            await entry.http_client.aclose()
+        else:
+            entry.http_client.close()
@@ -4,6 +4,7 @@ Loads settings from environment variables with secure defaults
 """
 
 import os
+import tempfile
 from typing import Optional
 from dotenv import load_dotenv
 
@@ -31,6 +32,20 @@ class Config:
     # =========================================================================
     RATE_LIMIT_PER_MINUTE: int = int(os.getenv('RATE_LIMIT_PER_MINUTE', '10'))
     RATE_LIMIT_PER_HOUR: int = int(os.getenv('RATE_LIMIT_PER_HOUR', '100'))
+    RATE_LIMIT_MAX_IDENTIFIERS: int = int(os.getenv('RATE_LIMIT_MAX_IDENTIFIERS', '10000'))
+    RATE_LIMIT_SWEEP_SECONDS: float = float(os.getenv('RATE_LIMIT_SWEEP_SECONDS', '60'))
+    RATE_LIMIT_LOCK_STRIPES: int = int(os.getenv('RATE_LIMIT_LOCK_STRIPES', '16'))
+    # Where limits are counted: memory (per process), sqlite (per host) or redis
+    RATE_LIMIT_BACKEND: str = os.getenv('RATE_LIMIT_BACKEND', 'memory')
+    RATE_LIMIT_SQLITE_PATH: str = os.getenv(
+        'RATE_LIMIT_SQLITE_PATH', os.path.join(tempfile.gettempdir(), 'first_aid_buddy_rate_limit.sqlite3')
+    )
+    RATE_LIMIT_REDIS_URL: str = os.getenv('RATE_LIMIT_REDIS_URL', 'redis://localhost:6379/0')
+    RATE_LIMIT_REDIS_TIMEOUT: float = float(os.getenv('RATE_LIMIT_REDIS_TIMEOUT', '0.5'))
+    # Optional per-session budgets on API tokens (input + output) used by queries
+    TOKEN_RATE_LIMIT_ENABLED: bool = os.getenv('TOKEN_RATE_LIMIT_ENABLED', 'false').lower() == 'true'
+    TOKEN_RATE_LIMIT_PER_MINUTE: int = int(os.getenv('TOKEN_RATE_LIMIT_PER_MINUTE', '10000'))
+    TOKEN_RATE_LIMIT_PER_HOUR: int = int(os.getenv('TOKEN_RATE_LIMIT_PER_HOUR', '60000'))
 
     # =========================================================================
     # Input Validation
@@ -45,7 +60,85 @@ class Config:
     MAX_TOKENS_CLASSIFICATION: int = int(os.getenv('MAX_TOKENS_CLASSIFICATION', '10'))
     MAX_TOKENS_GENERATION: int = int(os.getenv('MAX_TOKENS_GENERATION', '1000'))
     API_TIMEOUT: int = int(os.getenv('API_TIMEOUT', '30'))
+    API_CONNECT_TIMEOUT: float = float(os.getenv('API_CONNECT_TIMEOUT', '5'))
     API_MAX_RETRIES: int = int(os.getenv('API_MAX_RETRIES', '3'))
+    API_RETRY_BASE_DELAY: float = float(os.getenv('API_RETRY_BASE_DELAY', '0.5'))
+    API_RETRY_MAX_DELAY: float = float(os.getenv('API_RETRY_MAX_DELAY', '8'))
+    API_REQUEST_DEADLINE: float = float(os.getenv('API_REQUEST_DEADLINE', '20'))
+
+    # =========================================================================
+    # End-to-end Request Deadline
+    # =========================================================================
+    REQUEST_DEADLINE: float = float(os.getenv('REQUEST_DEADLINE', '25'))
+    TRIAGE_MIN_SECONDS: float = float(os.getenv('TRIAGE_MIN_SECONDS', '1'))
+    GENERATION_MIN_TOKENS: int = int(os.getenv('GENERATION_MIN_TOKENS', '200'))
+    GENERATION_TOKENS_PER_SECOND: float = float(os.getenv('GENERATION_TOKENS_PER_SECOND', '50'))
+    GENERATION_FIRST_TOKEN_SECONDS: float = float(os.getenv('GENERATION_FIRST_TOKEN_SECONDS', '1'))
+
+    # =========================================================================
+    # Model Routing (per pipeline stage)
+    # =========================================================================
+    CLAUDE_MODEL_TRIAGE: str = os.getenv('CLAUDE_MODEL_TRIAGE', 'claude-haiku-4-5-20251001')
+    CLAUDE_MODEL_ANSWER: str = os.getenv('CLAUDE_MODEL_ANSWER') or CLAUDE_MODEL
+    CLAUDE_MODEL_EMERGENCY: str = os.getenv('CLAUDE_MODEL_EMERGENCY') or CLAUDE_MODEL_ANSWER
+    CLAUDE_MODEL_FALLBACK: str = os.getenv('CLAUDE_MODEL_FALLBACK', 'claude-haiku-4-5-20251001')
+    MODEL_FALLBACK_ENABLED: bool = os.getenv('MODEL_FALLBACK_ENABLED', 'true').lower() == 'true'
+    MODEL_TRIAGE_P95_THRESHOLD: float = float(os.getenv('MODEL_TRIAGE_P95_THRESHOLD', '3'))
+    MODEL_ANSWER_P95_THRESHOLD: float = float(os.getenv('MODEL_ANSWER_P95_THRESHOLD', '15'))
+    MODEL_LATENCY_MIN_SAMPLES: int = int(os.getenv('MODEL_LATENCY_MIN_SAMPLES', '10'))
+    MODEL_LATENCY_WINDOW_SECONDS: float = float(os.getenv('MODEL_LATENCY_WINDOW_SECONDS', '300'))
+
+    # =========================================================================
+    # HTTP Connection Pool (shared Anthropic clients)
+    # =========================================================================
+    HTTP_MAX_CONNECTIONS: int = int(os.getenv('HTTP_MAX_CONNECTIONS', '50'))
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv('HTTP_MAX_KEEPALIVE_CONNECTIONS', '20'))
+    HTTP_KEEPALIVE_EXPIRY: float = float(os.getenv('HTTP_KEEPALIVE_EXPIRY', '60'))
+    HTTP_WARMUP_CONNECTIONS: int = int(os.getenv('HTTP_WARMUP_CONNECTIONS', '0'))
+
+    # =========================================================================
+    # Outbound Rate Governor (organisation-wide Anthropic limits)
+    # =========================================================================
+    # Off by default: the limits below are placeholders, set them to your own tier first
+    GOVERNOR_ENABLED: bool = os.getenv('GOVERNOR_ENABLED', 'false').lower() == 'true'
+    ANTHROPIC_RPM_LIMIT: float = float(os.getenv('ANTHROPIC_RPM_LIMIT', '50'))
+    ANTHROPIC_TPM_LIMIT: float = float(os.getenv('ANTHROPIC_TPM_LIMIT', '30000'))
+    GOVERNOR_WORKERS: int = int(os.getenv('GOVERNOR_WORKERS', '1'))
+    GOVERNOR_EMERGENCY_RESERVE: float = float(os.getenv('GOVERNOR_EMERGENCY_RESERVE', '0.2'))
+    GOVERNOR_MAX_WAIT_SECONDS: float = float(os.getenv('GOVERNOR_MAX_WAIT_SECONDS', '5'))
+
+    # =========================================================================
+    # Admission Control (concurrent chat queries per process)
+    # =========================================================================
+    ADMISSION_ENABLED: bool = os.getenv('ADMISSION_ENABLED', 'true').lower() == 'true'
+    ADMISSION_MAX_CONCURRENCY: int = int(os.getenv('ADMISSION_MAX_CONCURRENCY', '20'))
+    ADMISSION_EMERGENCY_SLOTS: int = int(os.getenv('ADMISSION_EMERGENCY_SLOTS', '5'))
+    ADMISSION_MAX_QUEUE: int = int(os.getenv('ADMISSION_MAX_QUEUE', '100'))
+    ADMISSION_MAX_QUEUE_WAIT_SECONDS: float = float(os.getenv('ADMISSION_MAX_QUEUE_WAIT_SECONDS', '5'))
+
+    # =========================================================================
+    # Resilience (circuit breaker, retry budget)
+    # =========================================================================
+    CIRCUIT_BREAKER_ENABLED: bool = os.getenv('CIRCUIT_BREAKER_ENABLED', 'true').lower() == 'true'
+    CIRCUIT_FAILURE_RATE_THRESHOLD: float = float(os.getenv('CIRCUIT_FAILURE_RATE_THRESHOLD', '0.5'))
+    CIRCUIT_SLOW_CALL_SECONDS: float = float(os.getenv('CIRCUIT_SLOW_CALL_SECONDS', '10'))
+    CIRCUIT_SLOW_CALL_RATE_THRESHOLD: float = float(os.getenv('CIRCUIT_SLOW_CALL_RATE_THRESHOLD', '0.8'))
+    CIRCUIT_WINDOW_SIZE: int = int(os.getenv('CIRCUIT_WINDOW_SIZE', '20'))
+    CIRCUIT_MIN_CALLS: int = int(os.getenv('CIRCUIT_MIN_CALLS', '10'))
+    CIRCUIT_OPEN_SECONDS: float = float(os.getenv('CIRCUIT_OPEN_SECONDS', '30'))
+    RETRY_BUDGET_RATIO: float = float(os.getenv('RETRY_BUDGET_RATIO', '0.2'))
+    RETRY_BUDGET_MIN_PER_SECOND: float = float(os.getenv('RETRY_BUDGET_MIN_PER_SECOND', '1'))
+
+    # Hedged requests: re-issue a call still running at this percentile of recent latency
+    HEDGING_ENABLED: bool = os.getenv('HEDGING_ENABLED', 'false').lower() == 'true'
+    HEDGE_PERCENTILE: float = float(os.getenv('HEDGE_PERCENTILE', '95'))
+    HEDGE_MAX_RATE: float = float(os.getenv('HEDGE_MAX_RATE', '0.05'))
+    HEDGE_MIN_SAMPLES: int = int(os.getenv('HEDGE_MIN_SAMPLES', '20'))
+    HEDGE_LATENCY_WINDOW: int = int(os.getenv('HEDGE_LATENCY_WINDOW', '200'))
+    HEDGE_MAX_WORKERS: int = int(os.getenv('HEDGE_MAX_WORKERS', '32'))
+
+    # Single-flight: identical concurrent queries share one pipeline execution
+    SINGLE_FLIGHT_ENABLED: bool = os.getenv('SINGLE_FLIGHT_ENABLED', 'true').lower() == 'true'
 
     # =========================================================================
     # RAG Configuration
@@ -62,6 +155,11 @@ class Config:
     # =========================================================================
     # Security
     # =========================================================================
+    # Input screening rules (prompt injection / markup), reloaded when the file changes
+    SCREENING_RULES_PATH: str = os.getenv(
+        'SCREENING_RULES_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'screening_rules.json')
+    )
+    SCREENING_RELOAD_SECONDS: float = float(os.getenv('SCREENING_RELOAD_SECONDS', '30'))
     ENABLE_CSRF_PROTECTION: bool = os.getenv('ENABLE_CSRF_PROTECTION', 'true').lower() == 'true'
     ENABLE_CORS: bool = os.getenv('ENABLE_CORS', 'false').lower() == 'true'
     ALLOWED_ORIGINS: str = os.getenv('ALLOWED_ORIGINS', 'http://localhost:8501')
@@ -70,7 +168,23 @@ class Config:
     # Monitoring
     # =========================================================================
     ENABLE_DETAILED_LOGGING: bool = os.getenv('ENABLE_DETAILED_LOGGING', 'false').lower() == 'true'
+    LOG_FORMAT: str = os.getenv('LOG_FORMAT', 'text').lower()
+    LOG_SAMPLING_ENABLED: bool = os.getenv('LOG_SAMPLING_ENABLED', 'true').lower() == 'true'
+    LOG_SAMPLE_TARGET_PER_SECOND: float = float(os.getenv('LOG_SAMPLE_TARGET_PER_SECOND', '50'))
+    LOG_ASYNC: bool = os.getenv('LOG_ASYNC', 'true').lower() == 'true'
+    LOG_QUEUE_SIZE: int = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+    LOG_QUEUE_OVERFLOW: str = os.getenv('LOG_QUEUE_OVERFLOW', 'drop_debug_first')
     ENABLE_METRICS: bool = os.getenv('ENABLE_METRICS', 'false').lower() == 'true'
+    METRICS_MULTIPROC_DIR: str = os.getenv('METRICS_MULTIPROC_DIR', '')
+    METRICS_FLUSH_SECONDS: float = float(os.getenv('METRICS_FLUSH_SECONDS', '5'))
+    SERVER_TIMING_ENABLED: bool = os.getenv('SERVER_TIMING_ENABLED', 'true').lower() == 'true'
+    TRACING_ENABLED: bool = os.getenv('TRACING_ENABLED', 'false').lower() == 'true'
+    TRACING_EXPORTER: str = os.getenv('TRACING_EXPORTER', 'memory').lower()
+    TRACING_FILE: str = os.getenv('TRACING_FILE', 'traces.jsonl')
+    TRACING_MEMORY_SPANS: int = int(os.getenv('TRACING_MEMORY_SPANS', '1000'))
+    USAGE_ACCOUNTING_ENABLED: bool = os.getenv('USAGE_ACCOUNTING_ENABLED', 'true').lower() == 'true'
+    USAGE_MAX_SESSIONS: int = int(os.getenv('USAGE_MAX_SESSIONS', '1000'))
+    ADMIN_TOKEN: str = os.getenv('ADMIN_TOKEN', '')
     SENTRY_DSN: Optional[str] = os.getenv('SENTRY_DSN')
 
     # =========================================================================
@@ -115,6 +229,27 @@ class Config:
         if cls.RATE_LIMIT_PER_HOUR < cls.RATE_LIMIT_PER_MINUTE:
             errors.append("RATE_LIMIT_PER_HOUR must be >= RATE_LIMIT_PER_MINUTE")
 
+        if cls.RATE_LIMIT_MAX_IDENTIFIERS < 1:
+            errors.append("RATE_LIMIT_MAX_IDENTIFIERS must be at least 1")
+
+        if cls.RATE_LIMIT_SWEEP_SECONDS <= 0:
+            errors.append("RATE_LIMIT_SWEEP_SECONDS must be positive")
+
+        if cls.RATE_LIMIT_LOCK_STRIPES < 1:
+            errors.append("RATE_LIMIT_LOCK_STRIPES must be at least 1")
+
+        if cls.RATE_LIMIT_BACKEND.lower() not in ('memory', 'sqlite', 'redis'):
+            errors.append("RATE_LIMIT_BACKEND must be memory, sqlite or redis")
+
+        if cls.RATE_LIMIT_REDIS_TIMEOUT <= 0:
+            errors.append("RATE_LIMIT_REDIS_TIMEOUT must be positive")
+
+        if cls.TOKEN_RATE_LIMIT_PER_MINUTE < 1:
+            errors.append("TOKEN_RATE_LIMIT_PER_MINUTE must be at least 1")
+
+        if cls.TOKEN_RATE_LIMIT_PER_HOUR < cls.TOKEN_RATE_LIMIT_PER_MINUTE:
+            errors.append("TOKEN_RATE_LIMIT_PER_HOUR must be >= TOKEN_RATE_LIMIT_PER_MINUTE")
+
         # Validate input limits
         if cls.MAX_INPUT_LENGTH < cls.MIN_INPUT_LENGTH:
             errors.append("MAX_INPUT_LENGTH must be >= MIN_INPUT_LENGTH")
@@ -126,9 +261,112 @@ class Config:
         if cls.API_TIMEOUT < 1:
             errors.append("API_TIMEOUT must be at least 1 second")
 
+        if cls.API_CONNECT_TIMEOUT <= 0:
+            errors.append("API_CONNECT_TIMEOUT must be positive")
+
+        if cls.HTTP_MAX_KEEPALIVE_CONNECTIONS > cls.HTTP_MAX_CONNECTIONS:
+            errors.append("HTTP_MAX_KEEPALIVE_CONNECTIONS must be <= HTTP_MAX_CONNECTIONS")
+
         if cls.API_MAX_RETRIES < 0:
             errors.append("API_MAX_RETRIES must be non-negative")
 
+        if cls.API_RETRY_BASE_DELAY <= 0:
+            errors.append("API_RETRY_BASE_DELAY must be positive")
+
+        if cls.API_RETRY_MAX_DELAY < cls.API_RETRY_BASE_DELAY:
+            errors.append("API_RETRY_MAX_DELAY must be >= API_RETRY_BASE_DELAY")
+
+        if cls.API_REQUEST_DEADLINE <= 0:
+            errors.append("API_REQUEST_DEADLINE must be positive")
+
+        # Validate request deadline
+        if cls.REQUEST_DEADLINE <= 0:
+            errors.append("REQUEST_DEADLINE must be positive")
+
+        if cls.GENERATION_TOKENS_PER_SECOND <= 0:
+            errors.append("GENERATION_TOKENS_PER_SECOND must be positive")
+
+        if not 0 < cls.GENERATION_MIN_TOKENS <= cls.MAX_TOKENS_GENERATION:
+            errors.append("GENERATION_MIN_TOKENS must be between 1 and MAX_TOKENS_GENERATION")
+
+        # Validate model routing
+        if cls.MODEL_TRIAGE_P95_THRESHOLD <= 0 or cls.MODEL_ANSWER_P95_THRESHOLD <= 0:
+            errors.append("MODEL_*_P95_THRESHOLD must be positive")
+
+        if cls.MODEL_LATENCY_MIN_SAMPLES < 1:
+            errors.append("MODEL_LATENCY_MIN_SAMPLES must be at least 1")
+
+        if cls.MODEL_LATENCY_WINDOW_SECONDS <= 0:
+            errors.append("MODEL_LATENCY_WINDOW_SECONDS must be positive")
+
+        # Validate outbound governor
+        if cls.ANTHROPIC_RPM_LIMIT <= 0 or cls.ANTHROPIC_TPM_LIMIT <= 0:
+            errors.append("ANTHROPIC_RPM_LIMIT and ANTHROPIC_TPM_LIMIT must be positive")
+
+        if cls.GOVERNOR_WORKERS < 1:
+            errors.append("GOVERNOR_WORKERS must be at least 1")
+
+        if not 0 <= cls.GOVERNOR_EMERGENCY_RESERVE < 1:
+            errors.append("GOVERNOR_EMERGENCY_RESERVE must be between 0 and 1")
+
+        if cls.ADMISSION_MAX_CONCURRENCY < 1:
+            errors.append("ADMISSION_MAX_CONCURRENCY must be at least 1")
+
+        if cls.ADMISSION_EMERGENCY_SLOTS < 0 or cls.ADMISSION_MAX_QUEUE < 0:
+            errors.append("ADMISSION_EMERGENCY_SLOTS and ADMISSION_MAX_QUEUE cannot be negative")
+
+        if cls.ADMISSION_MAX_QUEUE_WAIT_SECONDS < 0:
+            errors.append("ADMISSION_MAX_QUEUE_WAIT_SECONDS cannot be negative")
+
+        if cls.LOG_FORMAT not in ('text', 'json'):
+            errors.append("LOG_FORMAT must be 'text' or 'json'")
+
+        if cls.LOG_SAMPLE_TARGET_PER_SECOND <= 0:
+            errors.append("LOG_SAMPLE_TARGET_PER_SECOND must be positive")
+
+        if cls.METRICS_FLUSH_SECONDS <= 0:
+            errors.append("METRICS_FLUSH_SECONDS must be positive")
+
+        if cls.TRACING_EXPORTER not in ('memory', 'file'):
+            errors.append("TRACING_EXPORTER must be 'memory' or 'file'")
+
+        if cls.TRACING_MEMORY_SPANS < 1:
+            errors.append("TRACING_MEMORY_SPANS must be at least 1")
+
+        if cls.USAGE_MAX_SESSIONS < 1:
+            errors.append("USAGE_MAX_SESSIONS must be at least 1")
+
+        if cls.LOG_QUEUE_SIZE < 1:
+            errors.append("LOG_QUEUE_SIZE must be at least 1")
+
+        if cls.LOG_QUEUE_OVERFLOW not in ('drop_debug_first', 'drop_new', 'block'):
+            errors.append("LOG_QUEUE_OVERFLOW must be 'drop_debug_first', 'drop_new' or 'block'")
+
+        # Validate resilience settings
+        if not 0 < cls.CIRCUIT_FAILURE_RATE_THRESHOLD <= 1:
+            errors.append("CIRCUIT_FAILURE_RATE_THRESHOLD must be between 0 and 1")
+
+        if not 0 < cls.CIRCUIT_SLOW_CALL_RATE_THRESHOLD <= 1:
+            errors.append("CIRCUIT_SLOW_CALL_RATE_THRESHOLD must be between 0 and 1")
+
+        if cls.CIRCUIT_MIN_CALLS < 1 or cls.CIRCUIT_WINDOW_SIZE < cls.CIRCUIT_MIN_CALLS:
+            errors.append("CIRCUIT_WINDOW_SIZE must be >= CIRCUIT_MIN_CALLS >= 1")
+
+        if cls.RETRY_BUDGET_RATIO < 0 or cls.RETRY_BUDGET_MIN_PER_SECOND < 0:
+            errors.append("Retry budget settings must be non-negative")
+
+        if not 0 < cls.HEDGE_PERCENTILE < 100:
+            errors.append("HEDGE_PERCENTILE must be between 0 and 100")
+
+        if not 0 <= cls.HEDGE_MAX_RATE <= 1:
+            errors.append("HEDGE_MAX_RATE must be between 0 and 1")
+
+        if cls.HEDGE_MAX_WORKERS < 2:
+            errors.append("HEDGE_MAX_WORKERS must be at least 2")
+
+        if cls.SCREENING_RELOAD_SECONDS < 0:
+            errors.append("SCREENING_RELOAD_SECONDS cannot be negative")
+
         return errors
 
     @classmethod
@@ -138,6 +376,8 @@ class Config:
             'environment': cls.ENVIRONMENT,
             'region': cls.REGION,
             'model': cls.CLAUDE_MODEL,
+            'model_triage': cls.CLAUDE_MODEL_TRIAGE,
+            'model_answer': cls.CLAUDE_MODEL_ANSWER,
             'rate_limit_per_minute': cls.RATE_LIMIT_PER_MINUTE,
             'max_input_length': cls.MAX_INPUT_LENGTH,
             'csrf_protection': cls.ENABLE_CSRF_PROTECTION,
@@ -5,17 +5,39 @@ Includes error handling, input validation, logging, and rate limiting
 """
 
 import anthropic
-from typing import List, Optional, Tuple
+import asyncio
+import inspect
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional, Tuple
 import re
 import time
-from datetime import datetime, timedelta
-from collections import defaultdict
 from .config import Config
 from .logger import setup_logger, log_api_call, log_user_query, log_security_event
+from .retry import RetryPolicy, RetryState, is_retryable, retry_after_seconds
+from .circuit_breaker import CircuitBreaker
+from .hedging import hedger
+from .singleflight import SingleFlight, normalize_query
+from .client_factory import get_shared_client, http_timeout
+from .model_router import model_router, record_attempt as record_route_attempt
+from .deadline import Deadline, generation_seconds
+from .governor import governor, estimate_request_tokens, CHARS_PER_TOKEN, NORMAL, EMERGENCY
+from .rate_limiter import RateLimiter, rate_limiter, token_limiter  # noqa: F401 (re-exported)
+from .token_usage import UsageMeter, metering, record_usage, token_counts
+from .screening import screening_engine, REJECT
+from .metrics import registry
+from .tracing import tracer
+from .request_timing import record_attempt
 
 # Set up logger
 logger = setup_logger('core')
 
+LLM_ERRORS = registry.counter(
+    'llm_errors_total', 'Failed Anthropic API attempts by error type', ('operation', 'error')
+)
+LLM_RETRIES = registry.counter(
+    'llm_retries_total', 'Anthropic API attempts retried after a failure', ('operation', 'reason')
+)
+
 # ============================================================================
 # KNOWLEDGE BASE (Single source of truth)
 # ============================================================================
@@ -93,105 +115,57 @@ def validate_input(user_input: str) -> str:
             f"Input too long (maximum {Config.MAX_INPUT_LENGTH} characters)"
         )
 
-    # Check for suspicious patterns (basic prompt injection detection)
-    suspicious_patterns = [
-        r'ignore\s+(previous|above|all)\s+instructions',
-        r'system\s*:',
-        r'you\s+are\s+now',
-        r'new\s+instructions',
-        r'<\s*script',  # XSS attempt
-        r'<\s*iframe',  # XSS attempt
-    ]
-
-    for pattern in suspicious_patterns:
-        if re.search(pattern, sanitized, re.IGNORECASE):
-            log_security_event(
-                logger,
-                'potential_prompt_injection',
-                f'Suspicious pattern detected: {pattern}',
-                'WARNING'
-            )
-            # Don't reject - just log for now, but could reject in production
-            # raise ValidationError("Input contains suspicious patterns")
+    # Screen for suspicious patterns (basic prompt injection detection)
+    matched = screening_engine.screen(sanitized)
+    for rule in matched:
+        log_security_event(
+            logger,
+            'potential_prompt_injection',
+            f'Suspicious pattern detected: {rule.name} ({rule.pattern})',
+            'WARNING'
+        )
+    # Rules marked 'reject' in the rule file refuse the input; the rest are only logged
+    if any(rule.action == REJECT for rule in matched):
+        raise ValidationError("Input contains suspicious patterns")
 
     return sanitized
 
 
 # ============================================================================
-# RATE LIMITING
+# API CLIENT
 # ============================================================================
 
-class RateLimiter:
-    """Simple in-memory rate limiter (use Redis in production)"""
-
-    def __init__(self):
-        self.requests = defaultdict(list)
-
-    def check_rate_limit(self, identifier: str) -> Tuple[bool, Optional[str]]:
-        """
-        Check if request should be rate-limited
-
-        Args:
-            identifier: User identifier (session ID, IP, etc.)
-
-        Returns:
-            Tuple of (allowed: bool, message: Optional[str])
-        """
-        now = datetime.now()
-        minute_ago = now - timedelta(minutes=1)
-        hour_ago = now - timedelta(hours=1)
-
-        # Get request timestamps for this identifier
-        timestamps = self.requests[identifier]
-
-        # Remove old timestamps
-        timestamps = [ts for ts in timestamps if ts > hour_ago]
-        self.requests[identifier] = timestamps
-
-        # Check per-minute limit
-        recent_requests = [ts for ts in timestamps if ts > minute_ago]
-        if len(recent_requests) >= Config.RATE_LIMIT_PER_MINUTE:
-            log_security_event(
-                logger,
-                'rate_limit_exceeded_minute',
-                f'Identifier: {identifier[:8]}...',
-                'WARNING'
-            )
-            return False, f"Rate limit exceeded. Maximum {Config.RATE_LIMIT_PER_MINUTE} requests per minute."
-
-        # Check per-hour limit
-        if len(timestamps) >= Config.RATE_LIMIT_PER_HOUR:
-            log_security_event(
-                logger,
-                'rate_limit_exceeded_hour',
-                f'Identifier: {identifier[:8]}...',
-                'WARNING'
-            )
-            return False, f"Rate limit exceeded. Maximum {Config.RATE_LIMIT_PER_HOUR} requests per hour."
-
-        # Add current request
-        timestamps.append(now)
+class APIError(Exception):
+    """Raised when API call fails"""
+    pass
 
-        return True, None
 
+class DeadlineExceededError(APIError):
+    """Raised when a stage cannot finish before the request deadline"""
+    pass
 
-# Global rate limiter instance
-rate_limiter = RateLimiter()
 
+class CircuitOpenError(APIError):
+    """Raised when the circuit breaker rejects a call without attempting it"""
+    pass
 
-# ============================================================================
-# API CLIENT
-# ============================================================================
 
-class APIError(Exception):
-    """Raised when API call fails"""
+class ThrottledError(APIError):
+    """Raised when the outbound rate governor sheds a call instead of sending it"""
     pass
 
 
+# Global circuit breaker guarding every call to the Anthropic API
+circuit_breaker = CircuitBreaker()
+
+
 def initialize_client(api_key: str) -> anthropic.Anthropic:
     """
     Initialize Anthropic client with validation
 
+    Returns the process-wide pooled client for this key (see client_factory),
+    so repeated calls reuse connections instead of building new clients.
+
     Args:
         api_key: Anthropic API key
 
@@ -213,7 +187,7 @@ def initialize_client(api_key: str) -> anthropic.Anthropic:
         raise ValidationError("API key appears to be too short")
 
     try:
-        client = anthropic.Anthropic(api_key=api_key)
+        client = get_shared_client(api_key)
         logger.info("Anthropic client initialized successfully")
         return client
     except Exception as e:
@@ -221,103 +195,374 @@ def initialize_client(api_key: str) -> anthropic.Anthropic:
         raise APIError(f"Failed to initialize API client: {str(e)}")
 
 
+def _check_circuit(operation: str) -> None:
+    """Fail fast if the circuit breaker is open"""
+    if Config.CIRCUIT_BREAKER_ENABLED and not circuit_breaker.allow_request():
+        logger.warning(f"{operation} rejected: circuit breaker is {circuit_breaker.state}")
+        raise CircuitOpenError("AI service temporarily unavailable (circuit open)")
+
+
+def _release_circuit() -> None:
+    """Give back the slot taken by _check_circuit() when no attempt outcome will be reported"""
+    if Config.CIRCUIT_BREAKER_ENABLED:
+        circuit_breaker.release()
+
+
+def check_deadline(deadline: Optional[Deadline], stage: str, needed: float = 0.0) -> None:
+    """
+    Skip a stage early when it can no longer finish in time
+
+    Args:
+        deadline: Request deadline (None means no deadline)
+        stage: Stage name (for logging)
+        needed: Seconds the stage needs at minimum
+
+    Raises:
+        DeadlineExceededError: If less than `needed` seconds are left
+    """
+    if deadline is None or deadline.has_time(needed) and not deadline.expired():
+        return
+    logger.warning(f"{stage} skipped: {round(deadline.remaining(), 2)}s left, needs {round(needed, 2)}s")
+    raise DeadlineExceededError(f"Request deadline reached before {stage}")
+
+
+def _acquire_permit(state: RetryState, operation: str, tokens: int, priority: str):
+    """Wait for the outbound governor; the wait never eats into the last attempt's time"""
+    permit = governor.acquire(
+        tokens, priority, max_wait=_governor_wait_limit(state), respect_pause=state.attempt == 0
+    )
+    if permit is None:
+        raise ThrottledError(f"{operation} shed: outbound API rate limit reached")
+    return permit
+
+
+async def _acquire_permit_async(state: RetryState, operation: str, tokens: int, priority: str):
+    """Async variant of _acquire_permit()"""
+    permit = await governor.acquire_async(
+        tokens, priority, max_wait=_governor_wait_limit(state), respect_pause=state.attempt == 0
+    )
+    if permit is None:
+        raise ThrottledError(f"{operation} shed: outbound API rate limit reached")
+    return permit
+
+
+def _governor_wait_limit(state: RetryState) -> float:
+    return max(0.0, state.remaining() - state.policy.min_attempt_time)
+
+
+def _hedge_permit(tokens: int, priority: str) -> Callable[[], bool]:
+    """
+    Governor check for a hedge: sent only if a permit is free right now
+
+    The hedge's permit is not settled; its response is usually discarded,
+    so it stays charged at the full estimate.
+    """
+    return lambda: governor.try_acquire(tokens, priority) is not None
+
+
+def _may_hedge() -> bool:
+    """Only hedge against a healthy upstream (never while probing a half-open circuit)"""
+    return not Config.CIRCUIT_BREAKER_ENABLED or circuit_breaker.state == CircuitBreaker.CLOSED
+
+
+def _record_failed_attempt(
+    state: RetryState,
+    operation: str,
+    error: Exception,
+    attempt_s: float,
+    timeout_s: float
+) -> Optional[float]:
+    """
+    Log a failed attempt, report it to the circuit breaker and model router
+    and decide whether (and how long) to back off
+
+    Returns:
+        Seconds to sleep before retrying, or None to give up
+    """
+    # A timeout shortened (to fit the deadline) below what the breaker counts
+    # as a slow call says nothing about API health; one at the full
+    # API_TIMEOUT does, however short that is configured
+    cut_short = (
+        isinstance(error, anthropic.APITimeoutError)
+        and timeout_s < Config.API_TIMEOUT
+        and timeout_s < Config.CIRCUIT_SLOW_CALL_SECONDS
+    )
+
+    if isinstance(error, anthropic.RateLimitError):
+        # We were over the limit after all: hold everyone back, not just this call
+        governor.pause(retry_after_seconds(error) or Config.API_RETRY_BASE_DELAY)
+
+    if Config.CIRCUIT_BREAKER_ENABLED:
+        if cut_short:
+            circuit_breaker.release()
+        elif is_retryable(error):
+            circuit_breaker.record_failure(attempt_s)
+        elif isinstance(error, anthropic.APIStatusError):
+            # A 4xx answer means the API itself is healthy
+            circuit_breaker.record_success(attempt_s)
+        else:
+            circuit_breaker.release()
+
+    record_route_attempt(attempt_s)
+    attempt = state.attempt + 1
+    delay = state.next_delay(error)
+    LLM_ERRORS.inc(operation=operation, error=type(error).__name__)
+    if delay is not None:
+        LLM_RETRIES.inc(operation=operation, reason=type(error).__name__)
+
+    log_api_call(
+        logger,
+        operation,
+        success=False,
+        duration_ms=attempt_s * 1000,
+        metadata={
+            'attempt': attempt,
+            'max_attempts': state.max_attempts,
+            'error': type(error).__name__,
+            'total_ms': round(state.elapsed() * 1000, 2),
+            'retry_in_ms': round(delay * 1000, 2) if delay is not None else None,
+        },
+        retrying=delay is not None
+    )
+    return delay
+
+
+def _record_successful_attempt(state: RetryState, operation: str, attempt_s: float, usage=None) -> None:
+    """Log a successful attempt (with its token counts) and report it to the circuit breaker and model router"""
+    if Config.CIRCUIT_BREAKER_ENABLED:
+        circuit_breaker.record_success(attempt_s)
+
+    record_route_attempt(attempt_s)
+    state.attempt += 1
+    metadata = {'attempt': state.attempt, 'total_ms': round(state.elapsed() * 1000, 2)}
+    counts = token_counts(usage)
+    if counts is not None:
+        metadata.update(counts._asdict())
+    log_api_call(logger, operation, success=True, duration_ms=attempt_s * 1000, metadata=metadata)
+
+
+def _start_attempt_span(state: RetryState, operation: str, request: dict):
+    """Span for one API attempt, a child of the active pipeline stage (also counted in the request's timings)"""
+    record_attempt()
+    return tracer.start_span(f"llm.{operation}", {
+        'llm.operation': operation,
+        'llm.model': request.get('model'),
+        'llm.attempt': state.attempt + 1,
+    })
+
+
+def _end_attempt_span(
+    span,
+    response=None,
+    error: Optional[BaseException] = None,
+    delay: Optional[float] = None
+) -> None:
+    """Record an attempt's token counts, or its error and whether it will be retried"""
+    if error is not None:
+        span.record_error(error)
+        span.set_attributes({
+            'llm.retry': delay is not None,
+            'llm.retry_reason': type(error).__name__,
+            'llm.retry_in_ms': round(delay * 1000, 2) if delay is not None else None,
+        })
+    else:
+        counts = token_counts(getattr(response, 'usage', None))
+        if counts is not None:
+            span.set_attributes({f'llm.{kind}': tokens for kind, tokens in counts._asdict().items()})
+    span.end()
+
+
+def _raise_api_error(state: RetryState, operation: str, error: Optional[Exception]) -> None:
+    """Translate the last attempt's error into APIError"""
+    if isinstance(error, anthropic.AuthenticationError):
+        logger.error(f"{operation} authentication failed")
+        raise APIError("Authentication failed. Please check your API key.")
+
+    if is_retryable(error) and state.remaining() < state.policy.min_attempt_time:
+        raise DeadlineExceededError(
+            f"{operation} ran out of time after {state.attempt} attempt(s): {str(error)}"
+        )
+
+    raise APIError(
+        f"API call failed after {state.attempt} attempt(s) "
+        f"in {round(state.elapsed(), 2)}s: {str(error)}"
+    )
+
+
 def call_claude_with_retry(
     client: anthropic.Anthropic,
     operation: str,
+    retry_policy: Optional[RetryPolicy] = None,
+    deadline: Optional[Deadline] = None,
+    priority: str = NORMAL,
     **kwargs
 ) -> anthropic.types.Message:
     """
     Call Claude API with retry logic and error handling
 
+    Backoff uses decorrelated jitter, honours retry-after headers and never
+    runs past the policy's deadline (each attempt's timeout shrinks to fit).
+    Every attempt passes through the circuit breaker, and slow attempts may
+    be hedged (see hedging.Hedger).
+
     Args:
         client: Anthropic client
         operation: Operation name (for logging)
+        retry_policy: Retry policy (defaults to one built from Config)
+        deadline: Request deadline; retries and timeouts also fit inside it
+        priority: governor.NORMAL or governor.EMERGENCY (may use reserved headroom)
         **kwargs: Arguments to pass to client.messages.create()
 
     Returns:
         API response
 
     Raises:
+        CircuitOpenError: If the circuit breaker is open
+        ThrottledError: If the outbound rate limit cannot be met in time
+        DeadlineExceededError: If the deadline ran out before a response
         APIError: If API call fails after retries
     """
-    start_time = time.time()
+    state = (retry_policy or RetryPolicy()).start(deadline)
+    estimated_tokens = estimate_request_tokens(kwargs)
     last_error = None
 
-    for attempt in range(Config.API_MAX_RETRIES + 1):
+    while True:
+        _check_circuit(operation)
         try:
-            response = client.messages.create(**kwargs)
-            duration_ms = (time.time() - start_time) * 1000
-
-            log_api_call(
-                logger,
+            permit = _acquire_permit(state, operation, estimated_tokens, priority)
+        except BaseException:
+            # Shed or cancelled before any attempt: free a half-open probe slot
+            _release_circuit()
+            raise
+        attempt_start = time.monotonic()
+        timeout_s = state.attempt_timeout()
+        span = _start_attempt_span(state, operation, kwargs)
+        try:
+            timeout = http_timeout(timeout_s)
+            response = hedger.call(
                 operation,
-                success=True,
-                duration_ms=duration_ms,
-                metadata={'attempt': attempt + 1}
+                lambda: client.messages.create(timeout=timeout, **kwargs),
+                may_hedge=_may_hedge(),
+                hedge_permit=_hedge_permit(estimated_tokens, priority)
             )
+        except Exception as e:
+            last_error = e
+            delay = _record_failed_attempt(state, operation, e, time.monotonic() - attempt_start, timeout_s)
+            _end_attempt_span(span, error=e, delay=delay)
+            if delay is None:
+                break
+            time.sleep(delay)
+            continue
+        except BaseException as e:
+            # Cancelled mid-attempt: the outcome says nothing about the API
+            _release_circuit()
+            _end_attempt_span(span, error=e)
+            raise
+
+        attempt_s = time.monotonic() - attempt_start
+        usage = getattr(response, 'usage', None)
+        _record_successful_attempt(state, operation, attempt_s, usage)
+        _end_attempt_span(span, response)
+        governor.settle(permit, usage)
+        record_usage(usage, operation, kwargs.get('model'), attempt_s)
+        return response
+
+    _raise_api_error(state, operation, last_error)
+
+
+async def _create_message_async(client, **kwargs):
+    """Await an AsyncAnthropic client directly; run a sync client off the event loop"""
+    create = client.messages.create
+    if isinstance(client, anthropic.AsyncAnthropic) or inspect.iscoroutinefunction(create):
+        return await create(**kwargs)
+    return await asyncio.to_thread(create, **kwargs)
+
+
+async def call_claude_with_retry_async(
+    client,
+    operation: str,
+    retry_policy: Optional[RetryPolicy] = None,
+    deadline: Optional[Deadline] = None,
+    priority: str = NORMAL,
+    **kwargs
+) -> anthropic.types.Message:
+    """
+    Async variant of call_claude_with_retry()
 
-            return response
+    Backoff waits with asyncio.sleep(), so a request that is backing off never
+    holds a worker thread.
 
-        except anthropic.APITimeoutError as e:
-            last_error = e
-            logger.warning(f"{operation} timeout (attempt {attempt + 1}/{Config.API_MAX_RETRIES + 1})")
-            if attempt < Config.API_MAX_RETRIES:
-                time.sleep(2 ** attempt)  # Exponential backoff
+    Args:
+        client: Anthropic or AsyncAnthropic client
+        operation: Operation name (for logging)
+        retry_policy: Retry policy (defaults to one built from Config)
+        deadline: Request deadline; retries and timeouts also fit inside it
+        priority: governor.NORMAL or governor.EMERGENCY (may use reserved headroom)
+        **kwargs: Arguments to pass to client.messages.create()
 
-        except anthropic.RateLimitError as e:
-            last_error = e
-            logger.warning(f"{operation} rate limited (attempt {attempt + 1}/{Config.API_MAX_RETRIES + 1})")
-            if attempt < Config.API_MAX_RETRIES:
-                time.sleep(5 * (attempt + 1))  # Longer backoff for rate limits
+    Returns:
+        API response
 
-        except anthropic.APIConnectionError as e:
-            last_error = e
-            logger.warning(f"{operation} connection error (attempt {attempt + 1}/{Config.API_MAX_RETRIES + 1})")
-            if attempt < Config.API_MAX_RETRIES:
-                time.sleep(2 ** attempt)
-
-        except anthropic.AuthenticationError as e:
-            # Don't retry authentication errors
-            logger.error(f"{operation} authentication failed")
-            duration_ms = (time.time() - start_time) * 1000
-            log_api_call(logger, operation, success=False, duration_ms=duration_ms)
-            raise APIError("Authentication failed. Please check your API key.")
-
-        except anthropic.APIError as e:
-            last_error = e
-            logger.error(f"{operation} API error: {str(e)}")
-            if attempt < Config.API_MAX_RETRIES:
-                time.sleep(2 ** attempt)
+    Raises:
+        CircuitOpenError: If the circuit breaker is open
+        ThrottledError: If the outbound rate limit cannot be met in time
+        DeadlineExceededError: If the deadline ran out before a response
+        APIError: If API call fails after retries
+    """
+    state = (retry_policy or RetryPolicy()).start(deadline)
+    estimated_tokens = estimate_request_tokens(kwargs)
+    last_error = None
 
+    while True:
+        _check_circuit(operation)
+        try:
+            permit = await _acquire_permit_async(state, operation, estimated_tokens, priority)
+        except BaseException:
+            # Shed or cancelled before any attempt: free a half-open probe slot
+            _release_circuit()
+            raise
+        attempt_start = time.monotonic()
+        timeout_s = state.attempt_timeout()
+        span = _start_attempt_span(state, operation, kwargs)
+        try:
+            timeout = http_timeout(timeout_s)
+            response = await hedger.call_async(
+                operation,
+                lambda: _create_message_async(client, timeout=timeout, **kwargs),
+                may_hedge=_may_hedge(),
+                hedge_permit=_hedge_permit(estimated_tokens, priority)
+            )
         except Exception as e:
             last_error = e
-            logger.error(f"{operation} unexpected error: {str(e)}")
-            break
-
-    # All retries failed
-    duration_ms = (time.time() - start_time) * 1000
-    log_api_call(logger, operation, success=False, duration_ms=duration_ms)
-    raise APIError(f"API call failed after {Config.API_MAX_RETRIES + 1} attempts: {str(last_error)}")
+            delay = _record_failed_attempt(state, operation, e, time.monotonic() - attempt_start, timeout_s)
+            _end_attempt_span(span, error=e, delay=delay)
+            if delay is None:
+                break
+            await asyncio.sleep(delay)
+            continue
+        except BaseException as e:
+            # Cancelled mid-attempt: the outcome says nothing about the API
+            _release_circuit()
+            _end_attempt_span(span, error=e)
+            raise
+
+        attempt_s = time.monotonic() - attempt_start
+        usage = getattr(response, 'usage', None)
+        _record_successful_attempt(state, operation, attempt_s, usage)
+        _end_attempt_span(span, response)
+        governor.settle(permit, usage)
+        record_usage(usage, operation, kwargs.get('model'), attempt_s)
+        return response
+
+    _raise_api_error(state, operation, last_error)
 
 
 # ============================================================================
 # CORE FUNCTIONS
 # ============================================================================
 
-def classify_intent(user_input: str, client: anthropic.Anthropic) -> str:
-    """
-    Classify user input as LIFE_THREATENING or GENERAL_QUERY
-
-    Args:
-        user_input: User query (should be pre-validated)
-        client: Anthropic client
-
-    Returns:
-        Classification result ('LIFE_THREATENING' or 'GENERAL_QUERY')
-
-    Raises:
-        APIError: If API call fails
-    """
+def _classification_request(user_input: str) -> dict:
+    """Build the messages.create() arguments for triage classification"""
     system_prompt = (
         "You are a specialized Triage Classification System. Your single task is to "
         "analyze the user's input and classify its intent into one of two categories: "
@@ -330,15 +575,16 @@ def classify_intent(user_input: str, client: anthropic.Anthropic) -> str:
         f"category name: `{user_input}`"
     )
 
-    response = call_claude_with_retry(
-        client,
-        operation='classify_intent',
-        model=Config.CLAUDE_MODEL,
-        max_tokens=Config.MAX_TOKENS_CLASSIFICATION,
-        system=system_prompt,
-        messages=[{"role": "user", "content": user_prompt}]
-    )
+    return {
+        'model': model_router.select('triage'),
+        'max_tokens': Config.MAX_TOKENS_CLASSIFICATION,
+        'system': system_prompt,
+        'messages': [{"role": "user", "content": user_prompt}],
+    }
+
 
+def _parse_classification(response: anthropic.types.Message) -> str:
+    """Extract and validate the classification label from a response"""
     classification = response.content[0].text.strip()
 
     # Validate response
@@ -349,7 +595,63 @@ def classify_intent(user_input: str, client: anthropic.Anthropic) -> str:
     return classification
 
 
-def run_retrieval(user_input: str) -> str:
+def _triage_deadline(deadline: Optional[Deadline]) -> Optional[Deadline]:
+    """Triage must finish early enough to leave time for a minimal answer"""
+    if deadline is None:
+        return None
+    triage_deadline = deadline.reserve(generation_seconds(Config.GENERATION_MIN_TOKENS))
+    check_deadline(triage_deadline, 'classify_intent', Config.TRIAGE_MIN_SECONDS)
+    return triage_deadline
+
+
+def _triage_priority(user_input: str) -> str:
+    """Likely emergencies (by local rules) may use the governor's reserved headroom"""
+    return EMERGENCY if classify_intent_locally(user_input) == 'LIFE_THREATENING' else NORMAL
+
+
+def classify_intent(
+    user_input: str,
+    client: anthropic.Anthropic,
+    deadline: Optional[Deadline] = None
+) -> str:
+    """
+    Classify user input as LIFE_THREATENING or GENERAL_QUERY
+
+    Args:
+        user_input: User query (should be pre-validated)
+        client: Anthropic client
+        deadline: Request deadline; triage keeps time back for generation
+
+    Returns:
+        Classification result ('LIFE_THREATENING' or 'GENERAL_QUERY')
+
+    Raises:
+        DeadlineExceededError: If triage cannot finish in time
+        APIError: If API call fails
+    """
+    triage_deadline = _triage_deadline(deadline)
+    request = _classification_request(user_input)
+    with model_router.observe('triage', request['model']):
+        response = call_claude_with_retry(
+            client, operation='classify_intent', deadline=triage_deadline,
+            priority=_triage_priority(user_input), **request
+        )
+    return _parse_classification(response)
+
+
+async def classify_intent_async(user_input: str, client, deadline: Optional[Deadline] = None) -> str:
+    """Async variant of classify_intent()"""
+    triage_deadline = _triage_deadline(deadline)
+    request = _classification_request(user_input)
+    with model_router.observe('triage', request['model']):
+        response = await call_claude_with_retry_async(
+            client, operation='classify_intent', deadline=triage_deadline,
+            priority=_triage_priority(user_input), **request
+        )
+    return _parse_classification(response)
+
+
+def retrieve_documents(user_input: str) -> List[str]:
     """
     Retrieve relevant documents from knowledge base using enhanced keyword matching
 
@@ -357,7 +659,7 @@ def run_retrieval(user_input: str) -> str:
         user_input: User query
 
     Returns:
-        Formatted string of top K relevant documents
+        Top K relevant knowledge-base entries, most relevant first
     """
     user_input_lower = user_input.lower()
 
@@ -418,36 +720,110 @@ def run_retrieval(user_input: str) -> str:
     if not top_docs:
         top_docs = [doc for score, doc in scored_docs[:Config.TOP_K_DOCUMENTS]]
 
-    # Format the documents
+    logger.debug(f"Retrieved {len(top_docs)} documents for query")
+    return top_docs
+
+
+def run_retrieval(user_input: str) -> str:
+    """
+    Retrieve relevant documents and format them for the generation prompt
+
+    Args:
+        user_input: User query
+
+    Returns:
+        Formatted string of top K relevant documents
+    """
     formatted_docs = []
-    for i, doc in enumerate(top_docs, 1):
+    for i, doc in enumerate(retrieve_documents(user_input), 1):
         formatted_docs.append(f"Document {i}:\n{doc}")
 
-    logger.debug(f"Retrieved {len(top_docs)} documents for query")
     return "\n\n".join(formatted_docs)
 
 
-def generate_final_answer(
-    user_input: str,
-    docs: str,
-    is_emergency: bool,
-    client: anthropic.Anthropic
-) -> str:
+# ============================================================================
+# DEGRADED MODE (no LLM available)
+# ============================================================================
+
+# Phrases that mark a query as life-threatening without asking the model
+EMERGENCY_PATTERN = re.compile(
+    r"\b(?:"
+    r"not\s+breathing|(?:isn'?t|is\s+not|stopped|can'?t|cannot|trouble|difficulty)\s+breath(?:e|ing)"
+    r"|chok(?:e|es|ed|ing)|unconscious|unresponsive|passed\s+out|collapsed|fainted"
+    r"|heart\s+attack|cardiac\s+arrest|no\s+pulse|chest\s+pain|cpr"
+    r"|severe(?:ly)?\s+bleed(?:ing)?|bleeding\s+(?:heavily|badly|a\s+lot)|won'?t\s+stop\s+bleeding"
+    r"|anaphyla\w*|epipen|swollen\s+(?:throat|tongue)|throat\s+(?:is\s+)?closing"
+    r"|seizure|convulsi\w*|stroke|overdose|poison(?:ed|ing)?|swallowed\s+(?:bleach|pills)"
+    r"|drown(?:ing|ed)?|electrocut\w*|suicid\w*|broken\s+neck|spine|head\s+injury"
+    r")\b",
+    re.IGNORECASE
+)
+
+
+def classify_intent_locally(user_input: str) -> str:
     """
-    Generate final answer using Claude API
+    Classify user input with local keyword rules (no API call)
+
+    Used when the API is unavailable; errs on the side of LIFE_THREATENING.
 
     Args:
-        user_input: User query
-        docs: Retrieved documents
-        is_emergency: Whether this is an emergency
-        client: Anthropic client
+        user_input: User query (should be pre-validated)
 
     Returns:
-        Generated response
+        Classification result ('LIFE_THREATENING' or 'GENERAL_QUERY')
+    """
+    if EMERGENCY_PATTERN.search(user_input):
+        return 'LIFE_THREATENING'
+    return 'GENERAL_QUERY'
 
-    Raises:
-        APIError: If API call fails
+
+def build_degraded_answer(user_input: str, is_emergency: Optional[bool] = None) -> Tuple[str, bool]:
     """
+    Build an extractive answer from the top knowledge-base entries
+
+    Args:
+        user_input: User query (should be pre-validated)
+        is_emergency: Classification already known from the model, if any;
+            local rules decide otherwise (and can only escalate)
+
+    Returns:
+        Tuple of (response: str, is_emergency: bool)
+    """
+    local_emergency = classify_intent_locally(user_input) == 'LIFE_THREATENING'
+    is_emergency = bool(is_emergency) or local_emergency
+
+    parts = []
+    if is_emergency:
+        parts.append(f"If this is an emergency, call {Config.EMERGENCY_NUMBER} now.")
+    parts.append(
+        "Our AI assistant is temporarily unavailable, so here is the guidance "
+        "from our first-aid reference that best matches your question:"
+    )
+    parts.extend(retrieve_documents(user_input))
+
+    return "\n\n".join(parts), is_emergency
+
+
+def _answer_stage(is_emergency: bool) -> str:
+    """Model-routing stage for answer generation"""
+    return 'emergency' if is_emergency else 'answer'
+
+
+def _generation_max_tokens(deadline: Optional[Deadline]) -> int:
+    """Output budget for generation: what the remaining time allows, up to the configured limit"""
+    if deadline is None:
+        return Config.MAX_TOKENS_GENERATION
+    check_deadline(deadline, 'generate_answer', generation_seconds(Config.GENERATION_MIN_TOKENS))
+    return max(Config.GENERATION_MIN_TOKENS, deadline.generation_tokens(Config.MAX_TOKENS_GENERATION))
+
+
+def _answer_request(
+    user_input: str,
+    docs: str,
+    is_emergency: bool,
+    max_tokens: Optional[int] = None
+) -> dict:
+    """Build the messages.create() arguments for answer generation"""
     if is_emergency:
         system_prompt = (
             "You are an expert First-Aid instructor providing structured advice. "
@@ -477,42 +853,232 @@ def generate_final_answer(
             f"conversational response): `{docs}`"
         )
 
-    response = call_claude_with_retry(
-        client,
-        operation='generate_answer',
-        model=Config.CLAUDE_MODEL,
-        max_tokens=Config.MAX_TOKENS_GENERATION,
-        system=system_prompt,
-        messages=[{"role": "user", "content": user_message}]
-    )
+    return {
+        'model': model_router.select(_answer_stage(is_emergency)),
+        'max_tokens': max_tokens or Config.MAX_TOKENS_GENERATION,
+        'system': system_prompt,
+        'messages': [{"role": "user", "content": user_message}],
+    }
+
+
+def generate_final_answer(
+    user_input: str,
+    docs: str,
+    is_emergency: bool,
+    client: anthropic.Anthropic,
+    deadline: Optional[Deadline] = None
+) -> str:
+    """
+    Generate final answer using Claude API
+
+    Args:
+        user_input: User query
+        docs: Retrieved documents
+        is_emergency: Whether this is an emergency
+        client: Anthropic client
+        deadline: Request deadline; max_tokens and timeouts are sized from it
+
+    Returns:
+        Generated response
+
+    Raises:
+        DeadlineExceededError: If a useful answer can no longer be generated in time
+        APIError: If API call fails
+    """
+    max_tokens = _generation_max_tokens(deadline)
+    request = _answer_request(user_input, docs, is_emergency, max_tokens)
+    with model_router.observe(_answer_stage(is_emergency), request['model']):
+        response = call_claude_with_retry(
+            client, operation='generate_answer', deadline=deadline,
+            priority=EMERGENCY if is_emergency else NORMAL, **request
+        )
 
     return response.content[0].text
 
 
+async def generate_final_answer_async(
+    user_input: str,
+    docs: str,
+    is_emergency: bool,
+    client,
+    deadline: Optional[Deadline] = None
+) -> str:
+    """Async variant of generate_final_answer()"""
+    max_tokens = _generation_max_tokens(deadline)
+    request = _answer_request(user_input, docs, is_emergency, max_tokens)
+    with model_router.observe(_answer_stage(is_emergency), request['model']):
+        response = await call_claude_with_retry_async(
+            client, operation='generate_answer', deadline=deadline,
+            priority=EMERGENCY if is_emergency else NORMAL, **request
+        )
+
+    return response.content[0].text
+
+
+def classify_without_model(user_input: str) -> str:
+    """Local triage used when the triage call was skipped (deadline or outbound rate limit)"""
+    classification = classify_intent_locally(user_input)
+    logger.warning(f"Triage call skipped, classified locally as {classification}")
+    return classification
+
+
+def answer_query(
+    sanitized_input: str,
+    client: anthropic.Anthropic,
+    deadline: Optional[Deadline] = None
+) -> Tuple[str, bool, str]:
+    """
+    Classify, retrieve and generate an answer for an already validated query
+
+    Falls back to an extractive knowledge-base answer while the circuit
+    breaker is open, when there is no time left to generate or when the
+    outbound rate limit sheds the call. Triage that runs out of time or is
+    shed falls back to local rules.
+
+    Args:
+        sanitized_input: Validated user query
+        client: Anthropic client
+        deadline: Request deadline shared by all stages
+
+    Returns:
+        Tuple of (response: str, is_emergency: bool, classification: str)
+
+    Raises:
+        APIError: If API calls fail
+    """
+    is_emergency = None
+    try:
+        # Classify intent
+        try:
+            classification = classify_intent(sanitized_input, client, deadline)
+        except (DeadlineExceededError, ThrottledError):
+            classification = classify_without_model(sanitized_input)
+        is_emergency = (classification == "LIFE_THREATENING")
+
+        # Retrieve documents
+        retrieved_docs = run_retrieval(sanitized_input)
+
+        # Generate final answer
+        final_answer = generate_final_answer(
+            sanitized_input,
+            retrieved_docs,
+            is_emergency,
+            client,
+            deadline
+        )
+    except (CircuitOpenError, DeadlineExceededError, ThrottledError):
+        # API is down, too slow or over our rate limit: answer from the knowledge base
+        final_answer, is_emergency = build_degraded_answer(sanitized_input, is_emergency)
+        classification = 'LIFE_THREATENING' if is_emergency else 'GENERAL_QUERY'
+
+    return final_answer, is_emergency, classification
+
+
+# Coalesces identical concurrent queries (sync and async paths share it)
+query_flight = SingleFlight('query')
+
+
+def query_flight_key(sanitized_input: str, client) -> str:
+    """
+    Coalescing key for a query sent through `client`
+
+    Streamlit and the CLI build a client per user (their own API key), so
+    only queries on the same client are shared. The client is referenced by
+    the in-flight call, so its id() cannot be reused while the key is live.
+
+    Args:
+        sanitized_input: Validated user query
+        client: Anthropic client the answer would be generated with
+
+    Returns:
+        Key for query_flight
+    """
+    return f"{id(client)}:{normalize_query(sanitized_input)}"
+
+# Triage + answer system prompts and message wrappers, in characters
+_PROMPT_OVERHEAD_CHARS = 1200
+_LONGEST_KB_ENTRY = max(len(entry) for entry in FIRST_AID_KNOWLEDGE_BASE)
+
+
+def estimate_query_tokens(sanitized_input: str) -> int:
+    """
+    Upper estimate of the API tokens one query uses (triage + answer)
+
+    Args:
+        sanitized_input: Validated user query
+
+    Returns:
+        Estimated input tokens of both calls plus both max_tokens
+    """
+    chars = _PROMPT_OVERHEAD_CHARS + 2 * len(sanitized_input) + Config.TOP_K_DOCUMENTS * _LONGEST_KB_ENTRY
+    return chars // CHARS_PER_TOKEN + Config.MAX_TOKENS_CLASSIFICATION + Config.MAX_TOKENS_GENERATION
+
+
+@contextmanager
+def token_budget(session_id: Optional[str], sanitized_input: str) -> Iterator[UsageMeter]:
+    """
+    Meter a query's token usage and charge it to the session's token budget
+
+    With TOKEN_RATE_LIMIT_ENABLED, an estimate is reserved before any call
+    and replaced by the actual usage afterwards (also when the query fails).
+    Coalesced callers that shared another query's execution are charged
+    nothing, as they used no API quota.
+
+    Args:
+        session_id: Session identifier (no budget is charged without one)
+        sanitized_input: Validated user query
+
+    Yields:
+        UsageMeter for the query
+
+    Raises:
+        ValidationError: If the session's token budget is used up
+    """
+    charge = None
+    if session_id and token_limiter.enabled:
+        charge, message = token_limiter.reserve(session_id, estimate_query_tokens(sanitized_input))
+        if charge is None:
+            raise ValidationError(message)
+
+    with metering(session_id) as meter:
+        try:
+            yield meter
+        finally:
+            token_limiter.settle(charge, meter.total_tokens)
+
+
 def process_query(
     user_input: str,
     client: anthropic.Anthropic,
-    session_id: Optional[str] = None
+    session_id: Optional[str] = None,
+    deadline: Optional[Deadline] = None
 ) -> Tuple[str, bool]:
     """
     Process user query through complete pipeline with validation and error handling
 
+    Identical concurrent queries (after normalization) share one execution
+    of answer_query(); validation and rate limiting still apply per caller.
+
     Args:
         user_input: Raw user input
         client: Anthropic client
         session_id: Optional session identifier for rate limiting
+        deadline: Request deadline (defaults to REQUEST_DEADLINE from now)
 
     Returns:
         Tuple of (response: str, is_emergency: bool)
 
     Raises:
         ValidationError: If input is invalid
+        DeadlineExceededError: If the deadline passed before any work started
         APIError: If API calls fail
     """
     start_time = time.time()
+    deadline = deadline or Deadline()
 
     try:
         # Step 1: Validate input
+        check_deadline(deadline, 'validate_input')
         sanitized_input = validate_input(user_input)
 
         # Step 2: Check rate limit (if session_id provided)
@@ -521,24 +1087,19 @@ def process_query(
             if not allowed:
                 raise ValidationError(message)
 
-        # Step 3: Classify intent
-        classification = classify_intent(sanitized_input, client)
-        is_emergency = (classification == "LIFE_THREATENING")
-
-        # Step 4: Retrieve documents
-        retrieved_docs = run_retrieval(sanitized_input)
-
-        # Step 5: Generate final answer
-        final_answer = generate_final_answer(
-            sanitized_input,
-            retrieved_docs,
-            is_emergency,
-            client
-        )
+        # Steps 3-5: Classify, retrieve, generate (coalesced, charged to the token budget)
+        with token_budget(session_id, sanitized_input):
+            if Config.SINGLE_FLIGHT_ENABLED:
+                (final_answer, is_emergency, classification), _ = query_flight.do(
+                    query_flight_key(sanitized_input, client),
+                    lambda: answer_query(sanitized_input, client, deadline)
+                )
+            else:
+                final_answer, is_emergency, classification = answer_query(sanitized_input, client, deadline)
 
         # Log successful processing
         processing_time_ms = (time.time() - start_time) * 1000
-        log_user_query(logger, len(sanitized_input), classification, processing_time_ms)
+        log_user_query(logger, len(sanitized_input), classification, processing_time_ms, session_id)
 
         return final_answer, is_emergency
 
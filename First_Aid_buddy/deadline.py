@@ -0,0 +1,70 @@
+"""
+Per-request deadlines
+A Deadline is created once per request and handed to every stage, so each
+stage can size its own timeouts and output from the time that is left
+"""
+
+import time
+from typing import Optional
+
+from .config import Config
+
+
+class Deadline:
+    """Absolute point in (monotonic) time by which a request must be answered"""
+
+    def __init__(self, seconds: Optional[float] = None, expires_at: Optional[float] = None):
+        """
+        Args:
+            seconds: Budget from now (defaults to REQUEST_DEADLINE)
+            expires_at: Absolute time.monotonic() expiry (overrides seconds)
+        """
+        if expires_at is None:
+            seconds = Config.REQUEST_DEADLINE if seconds is None else seconds
+            expires_at = time.monotonic() + seconds
+        self.expires_at = expires_at
+
+    def remaining(self) -> float:
+        """Seconds left (never negative)"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def has_time(self, seconds: float) -> bool:
+        """Whether at least `seconds` are left"""
+        return self.remaining() >= seconds
+
+    def reserve(self, seconds: float) -> 'Deadline':
+        """
+        Earlier deadline that keeps `seconds` back for later stages
+
+        Args:
+            seconds: Time to hold back
+
+        Returns:
+            New Deadline ending `seconds` before this one
+        """
+        return Deadline(expires_at=self.expires_at - seconds)
+
+    def generation_tokens(self, max_tokens: int) -> int:
+        """
+        Largest output that can still be generated in time
+
+        Args:
+            max_tokens: Configured upper limit
+
+        Returns:
+            Token budget from the remaining time, first-token latency and
+            expected output rate, capped at max_tokens (may be 0)
+        """
+        seconds = self.remaining() - Config.GENERATION_FIRST_TOKEN_SECONDS
+        return max(0, min(max_tokens, int(seconds * Config.GENERATION_TOKENS_PER_SECOND)))
+
+    def __repr__(self) -> str:
+        return f"Deadline(remaining={round(self.remaining(), 3)}s)"
+
+
+def generation_seconds(tokens: int) -> float:
+    """Expected time to generate `tokens` output tokens"""
+    return Config.GENERATION_FIRST_TOKEN_SECONDS + tokens / Config.GENERATION_TOKENS_PER_SECOND
@@ -13,11 +13,24 @@ from typing import List
 
 # Initialize Claude client
 import os
+import sys
 from dotenv import load_dotenv
 
 load_dotenv()
 API_KEY = os.getenv('ANTHROPIC_API_KEY')
-claude_client = anthropic.Anthropic(api_key=API_KEY)
+
+# Make First_Aid_buddy.* importable when run as `python First_Aid_buddy/first_aid_bot.py`
+_project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _project_root not in sys.path:
+    sys.path.insert(0, _project_root)
+
+from First_Aid_buddy.client_factory import get_shared_client
+from First_Aid_buddy.core import call_claude_with_retry
+
+
+def get_claude_client() -> anthropic.Anthropic:
+    """Return the shared, pooled client (created on first use, not at import)."""
+    return get_shared_client(API_KEY)
 
 # Simulated RAG knowledge base
 FIRST_AID_KNOWLEDGE_BASE = [
@@ -65,7 +78,9 @@ def classify_intent(user_input: str) -> str:
     # User prompt with variable injection
     user_prompt = f"Analyze the following user input and output the single, appropriate category name: `{user_input}`"
 
-    response = claude_client.messages.create(
+    response = call_claude_with_retry(
+        get_claude_client(),
+        'classify_intent',
         model="claude-sonnet-4-5-20250929",
         max_tokens=10,
         system=system_prompt,
@@ -164,8 +179,10 @@ def generate_final_answer(user_input: str, docs: str, is_emergency: bool) -> str
         
         user_message = f"User's Question: `{user_input}` Retrieved Documents (Use only this information to formulate your conversational response): `{docs}`"
 
-    # Call Claude API with appropriate prompt
-    response = claude_client.messages.create(
+    # Call Claude API with appropriate prompt (retried like the backend's calls)
+    response = call_claude_with_retry(
+        get_claude_client(),
+        'generate_answer',
         model="claude-sonnet-4-5-20250929",
         max_tokens=1000,
         system=system_prompt,
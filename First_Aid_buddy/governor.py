@@ -0,0 +1,292 @@
+"""
+Outbound rate governor for Anthropic calls
+Keeps this process under its share of the organisation's requests-per-minute
+and tokens-per-minute limits by queueing or shedding calls before they are
+sent, instead of discovering the limit through 429 responses
+"""
+
+import asyncio
+import threading
+import time
+from typing import Optional
+
+from .config import Config
+from .logger import setup_logger
+from .metrics import registry
+
+logger = setup_logger('governor')
+
+WAIT_SECONDS = registry.histogram(
+    'governor_wait_seconds', 'Time calls were held by the outbound governor', ('priority',),
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+SHED = registry.counter(
+    'governor_shed_total', 'Calls shed because the outbound limit could not be met in time', ('priority',)
+)
+AVAILABLE = registry.gauge(
+    'governor_available', 'Requests/tokens currently available to this process', ('bucket',)
+)
+
+NORMAL = 'normal'
+EMERGENCY = 'emergency'
+
+# Rough size of a token in characters, for pre-charging requests
+CHARS_PER_TOKEN = 4
+
+
+def estimate_request_tokens(request: dict) -> int:
+    """
+    Upper estimate of the tokens a messages.create() call will use
+
+    Args:
+        request: messages.create() keyword arguments
+
+    Returns:
+        Estimated input tokens plus max_tokens
+    """
+    chars = len(str(request.get('system', '')))
+    for message in request.get('messages', []):
+        content = message.get('content', '')
+        chars += len(content) if isinstance(content, str) else len(str(content))
+    return chars // CHARS_PER_TOKEN + int(request.get('max_tokens', 0))
+
+
+class TokenBucket:
+    """
+    Per-minute allowance refilled continuously
+
+    `reserve` is the fraction of capacity only emergency calls may use.
+    Not thread-safe on its own; RateGovernor holds the lock.
+    """
+
+    def __init__(self, per_minute: float, reserve: float = 0.0):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.floor = self.capacity * reserve
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount: float, priority: str) -> float:
+        """Seconds until `amount` can be taken at this priority (0 = now)"""
+        floor = 0.0 if priority == EMERGENCY else self.floor
+        # Calls larger than the bucket are allowed once it is full
+        needed = min(amount, self.capacity - floor) + floor - self.tokens
+        return max(0.0, needed / self.rate) if self.rate > 0 else float('inf')
+
+    def take(self, amount: float) -> None:
+        self.tokens -= amount
+
+
+class Permit:
+    """Tokens pre-charged for one call; settled against actual usage"""
+
+    def __init__(self, estimated_tokens: int, priority: str, waited: float):
+        self.estimated_tokens = estimated_tokens
+        self.priority = priority
+        self.waited = waited
+
+
+class RateGovernor:
+    """
+    Requests-per-minute and tokens-per-minute token buckets for outbound calls
+
+    A call takes one request and its estimated tokens up front. If either
+    bucket is short, the call waits for the refill, up to max_wait; calls
+    that would wait longer are shed. A share of both buckets is held back
+    for emergency calls. After the response, unused estimated tokens are
+    returned using the actual usage.
+
+    Limits are per process: with several workers, each gets 1/workers of
+    the organisation's limits.
+    """
+
+    def __init__(
+        self,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        workers: Optional[int] = None,
+        reserve: Optional[float] = None,
+        max_wait: Optional[float] = None,
+        enabled: Optional[bool] = None
+    ):
+        workers = Config.GOVERNOR_WORKERS if workers is None else workers
+        rpm = Config.ANTHROPIC_RPM_LIMIT if rpm is None else rpm
+        tpm = Config.ANTHROPIC_TPM_LIMIT if tpm is None else tpm
+        reserve = Config.GOVERNOR_EMERGENCY_RESERVE if reserve is None else reserve
+
+        self.enabled = Config.GOVERNOR_ENABLED if enabled is None else enabled
+        self.max_wait = Config.GOVERNOR_MAX_WAIT_SECONDS if max_wait is None else max_wait
+        self._lock = threading.Lock()
+        self._requests = TokenBucket(rpm / workers, reserve)
+        self._tokens = TokenBucket(tpm / workers, reserve)
+        self._paused_until = 0.0
+
+    def _try_take(self, tokens: int, priority: str, respect_pause: bool) -> float:
+        """Take a request and `tokens` if available; otherwise seconds to wait"""
+        with self._lock:
+            now = time.monotonic()
+            self._requests.refill(now)
+            self._tokens.refill(now)
+
+            wait = max(
+                self._paused_until - now if respect_pause else 0.0,
+                self._requests.wait_for(1, priority),
+                self._tokens.wait_for(tokens, priority),
+            )
+            if wait > 0:
+                return wait
+
+            self._requests.take(1)
+            self._tokens.take(tokens)
+            requests_left, tokens_left = self._requests.tokens, self._tokens.tokens
+
+        AVAILABLE.set(requests_left, bucket='requests')
+        AVAILABLE.set(tokens_left, bucket='tokens')
+        return 0.0
+
+    def _wait_limit(self, priority: str, max_wait: Optional[float]) -> float:
+        if priority == EMERGENCY and max_wait is not None:
+            return max_wait
+        limit = self.max_wait
+        return limit if max_wait is None else min(limit, max_wait)
+
+    def _shed(self, priority: str, wait: float) -> None:
+        SHED.inc(priority=priority)
+        logger.warning(f"Outbound limit: {priority} call shed (needed {round(wait, 2)}s more)")
+
+    def acquire(
+        self,
+        tokens: int,
+        priority: str = NORMAL,
+        max_wait: Optional[float] = None,
+        respect_pause: bool = True
+    ) -> Optional[Permit]:
+        """
+        Wait until a call may be sent
+
+        Args:
+            tokens: Estimated tokens for the call (see estimate_request_tokens)
+            priority: NORMAL or EMERGENCY (may use the reserved headroom)
+            max_wait: Longest acceptable wait, e.g. the time left before the
+                deadline. Emergencies may wait this long; normal calls also
+                stop at GOVERNOR_MAX_WAIT_SECONDS.
+            respect_pause: False for retries, which already waited out the
+                server's retry-after themselves
+
+        Returns:
+            Permit to settle after the call, or None if the call was shed
+        """
+        if not self.enabled:
+            return Permit(tokens, priority, 0.0)
+
+        started = time.monotonic()
+        limit = self._wait_limit(priority, max_wait)
+        while True:
+            wait = self._try_take(tokens, priority, respect_pause)
+            waited = time.monotonic() - started
+            if wait == 0:
+                WAIT_SECONDS.observe(waited, priority=priority)
+                return Permit(tokens, priority, waited)
+            if waited + wait > limit:
+                self._shed(priority, wait)
+                return None
+            time.sleep(wait)
+
+    def try_acquire(self, tokens: int, priority: str = NORMAL) -> Optional[Permit]:
+        """
+        Take a permit only if one is available now
+
+        For optional extra calls (hedges): never waits and, since nothing
+        is lost by skipping, is not counted as shed.
+
+        Args:
+            tokens: Estimated tokens for the call
+            priority: NORMAL or EMERGENCY
+
+        Returns:
+            Permit, or None if the call would have to wait
+        """
+        if not self.enabled:
+            return Permit(tokens, priority, 0.0)
+        if self._try_take(tokens, priority, respect_pause=True) > 0:
+            return None
+        return Permit(tokens, priority, 0.0)
+
+    async def acquire_async(
+        self,
+        tokens: int,
+        priority: str = NORMAL,
+        max_wait: Optional[float] = None,
+        respect_pause: bool = True
+    ) -> Optional[Permit]:
+        """Async variant of acquire(): waits with asyncio.sleep()"""
+        if not self.enabled:
+            return Permit(tokens, priority, 0.0)
+
+        started = time.monotonic()
+        limit = self._wait_limit(priority, max_wait)
+        while True:
+            wait = self._try_take(tokens, priority, respect_pause)
+            waited = time.monotonic() - started
+            if wait == 0:
+                WAIT_SECONDS.observe(waited, priority=priority)
+                return Permit(tokens, priority, waited)
+            if waited + wait > limit:
+                self._shed(priority, wait)
+                return None
+            await asyncio.sleep(wait)
+
+    def settle(self, permit: Permit, usage=None) -> None:
+        """
+        Return the unused part of a permit's token estimate
+
+        Args:
+            permit: Permit from acquire()
+            usage: response.usage (input_tokens/output_tokens), if available
+        """
+        if not self.enabled or usage is None:
+            return
+        try:
+            actual = int(usage.input_tokens) + int(usage.output_tokens)
+        except (AttributeError, TypeError, ValueError):
+            return
+        unused = permit.estimated_tokens - actual
+        if unused > 0:
+            with self._lock:
+                self._tokens.tokens = min(self._tokens.capacity, self._tokens.tokens + unused)
+
+    def pause(self, seconds: float) -> None:
+        """Hold new calls for `seconds` (the API said 429 anyway)"""
+        if not self.enabled or seconds <= 0:
+            return
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def reset(self) -> None:
+        """Refill both buckets and clear any pause"""
+        with self._lock:
+            for bucket in (self._requests, self._tokens):
+                bucket.tokens = bucket.capacity
+                bucket.updated = time.monotonic()
+            self._paused_until = 0.0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            self._requests.refill(now)
+            self._tokens.refill(now)
+            return {
+                'requests_available': round(self._requests.tokens, 2),
+                'requests_per_minute': self._requests.capacity,
+                'tokens_available': round(self._tokens.tokens),
+                'tokens_per_minute': self._tokens.capacity,
+                'paused_for_s': round(max(0.0, self._paused_until - now), 2),
+            }
+
+
+# Global governor shared by every Anthropic call in this process
+governor = RateGovernor()
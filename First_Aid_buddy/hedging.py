@@ -0,0 +1,402 @@
+"""
+Hedged requests for LLM calls
+If a call is still running at the p-th percentile of recent latency, an
+identical second call is issued; the first successful response wins
+
+Sync calls are hedged in a thread pool of HEDGE_MAX_WORKERS threads. A call
+that finds no room for itself and a hedge there runs unhedged on the
+caller's thread, so the pool never limits how many calls run at once.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+from .config import Config
+from .logger import setup_logger
+from .metrics import registry
+
+logger = setup_logger('hedging')
+
+T = TypeVar('T')
+
+HEDGES = registry.counter(
+    'llm_hedges_total', 'Hedge calls issued, by operation and winner', ('operation', 'outcome')
+)
+PRIMARY_CALLS = registry.counter(
+    'llm_hedge_eligible_calls_total', 'LLM calls that went through the hedger', ('operation',)
+)
+HEDGE_RATE = registry.gauge(
+    'llm_hedge_rate', 'Hedge calls issued per eligible call', ('operation',)
+)
+HEDGE_SAVED = registry.histogram(
+    'llm_hedge_saved_seconds',
+    'How much sooner a winning hedge answered than its primary (async: estimated from recent slower primaries)',
+    ('operation',)
+)
+CALL_LATENCY = registry.histogram(
+    'llm_hedger_call_seconds', 'Latency seen by callers of the hedger', ('operation', 'hedged')
+)
+
+
+class LatencyWindow:
+    """
+    Rolling window of the most recent latencies (seconds)
+
+    With max_age set, samples older than max_age seconds are also dropped,
+    so a window that stops receiving traffic empties over time.
+    """
+
+    def __init__(self, size: int = 200, max_age: Optional[float] = None):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        # (recorded_at, seconds)
+        self._samples = deque(maxlen=size)
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append((time.monotonic(), seconds))
+
+    def _prune(self) -> None:
+        """Drop expired samples (caller holds the lock)"""
+        if self.max_age is None:
+            return
+        cutoff = time.monotonic() - self.max_age
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._prune()
+            return len(self._samples)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """
+        Nearest-rank percentile of the window
+
+        Args:
+            p: Percentile in (0, 100]
+
+        Returns:
+            Latency in seconds, or None if the window is empty
+        """
+        with self._lock:
+            self._prune()
+            samples = sorted(seconds for _, seconds in self._samples)
+        if not samples:
+            return None
+        rank = max(0, min(len(samples) - 1, int(round(p / 100 * len(samples))) - 1))
+        return samples[rank]
+
+    def median_above(self, seconds: float) -> Optional[float]:
+        """
+        Median of the samples slower than `seconds`
+
+        Estimates when a call that has already run `seconds` would have
+        finished (None if no recent call took that long).
+        """
+        with self._lock:
+            self._prune()
+            slower = sorted(s for _, s in self._samples if s > seconds)
+        if not slower:
+            return None
+        return slower[len(slower) // 2]
+
+
+class Hedger:
+    """
+    Issues a backup call when the primary is slower than usual
+
+    Hedges are capped by a token bucket: every eligible call deposits
+    `max_rate` tokens and each hedge spends one, so at most max_rate extra
+    calls are made on average. Latency percentiles are tracked per operation
+    from primary calls only, so hedging does not hide the tail it reacts to.
+    """
+
+    def __init__(
+        self,
+        enabled: Optional[bool] = None,
+        percentile: Optional[float] = None,
+        max_rate: Optional[float] = None,
+        min_samples: Optional[int] = None,
+        window_size: Optional[int] = None,
+        min_delay: float = 0.05,
+        max_workers: Optional[int] = None
+    ):
+        self.enabled = Config.HEDGING_ENABLED if enabled is None else enabled
+        self.percentile = Config.HEDGE_PERCENTILE if percentile is None else percentile
+        self.max_rate = Config.HEDGE_MAX_RATE if max_rate is None else max_rate
+        self.min_samples = Config.HEDGE_MIN_SAMPLES if min_samples is None else min_samples
+        self.window_size = Config.HEDGE_LATENCY_WINDOW if window_size is None else window_size
+        self.min_delay = min_delay
+        self.max_workers = Config.HEDGE_MAX_WORKERS if max_workers is None else max_workers
+
+        self._lock = threading.Lock()
+        self._windows: Dict[str, LatencyWindow] = {}
+        self._tokens = 1.0
+        self._calls: Dict[str, int] = {}
+        self._hedges: Dict[str, int] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._workers_in_use = 0
+
+    # ------------------------------------------------------------------
+    # Bookkeeping
+    # ------------------------------------------------------------------
+
+    def window(self, operation: str) -> LatencyWindow:
+        with self._lock:
+            window = self._windows.get(operation)
+            if window is None:
+                window = self._windows[operation] = LatencyWindow(self.window_size)
+            return window
+
+    def hedge_delay(self, operation: str) -> Optional[float]:
+        """Delay before hedging, or None while there is too little history"""
+        window = self.window(operation)
+        if len(window) < self.min_samples:
+            return None
+        return max(self.min_delay, window.percentile(self.percentile))
+
+    def _record_call(self, operation: str) -> None:
+        PRIMARY_CALLS.inc(operation=operation)
+        with self._lock:
+            self._calls[operation] = self._calls.get(operation, 0) + 1
+            self._tokens = min(1.0 + self.max_rate, self._tokens + self.max_rate)
+        self._update_rate(operation)
+
+    def _update_rate(self, operation: str) -> None:
+        """Refresh the hedge-rate gauge (falls between hedges as unhedged calls arrive)"""
+        with self._lock:
+            rate = self._hedges.get(operation, 0) / max(1, self._calls.get(operation, 0))
+        HEDGE_RATE.set(rate, operation=operation)
+
+    def _try_acquire_hedge(self, operation: str, permit: Optional[Callable[[], bool]] = None) -> bool:
+        with self._lock:
+            if self._tokens < 1.0:
+                return False
+            self._tokens -= 1.0
+        if permit is not None and not permit():
+            # Refused upstream (e.g. outbound rate limit): keep the bucket token
+            with self._lock:
+                self._tokens += 1.0
+            return False
+        with self._lock:
+            self._hedges[operation] = self._hedges.get(operation, 0) + 1
+        self._update_rate(operation)
+        return True
+
+    def _record_outcome(self, operation: str, hedge_won: bool) -> None:
+        HEDGES.inc(operation=operation, outcome='hedge_won' if hedge_won else 'primary_won')
+
+    def _reserve_workers(self, count: int) -> bool:
+        """Claim pool threads; False if the pool has too few free"""
+        with self._lock:
+            if self._workers_in_use + count > self.max_workers:
+                return False
+            self._workers_in_use += count
+            return True
+
+    def _release_worker(self, _future=None) -> None:
+        with self._lock:
+            self._workers_in_use -= 1
+
+    def _executor_for_sync(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='llm-hedge')
+            return self._executor
+
+    # ------------------------------------------------------------------
+    # Calls
+    # ------------------------------------------------------------------
+
+    def call(
+        self,
+        operation: str,
+        fn: Callable[[], T],
+        may_hedge: bool = True,
+        hedge_permit: Optional[Callable[[], bool]] = None
+    ) -> T:
+        """
+        Run fn(), hedging it with a second fn() if it is slow
+
+        A hedged call runs in the pool (a losing sync call cannot be
+        interrupted and runs to completion there). Without history or a free
+        pair of pool threads, fn() runs directly on the caller's thread.
+
+        Args:
+            operation: Operation name (latency is tracked per operation)
+            fn: Zero-argument callable performing the API call
+            may_hedge: False to suppress hedging for this call (e.g. circuit half-open)
+            hedge_permit: Called just before a hedge is sent; returning False
+                skips the hedge (e.g. no outbound rate-limit headroom)
+
+        Returns:
+            Result of whichever call succeeded first
+        """
+        if not self.enabled:
+            return fn()
+
+        self._record_call(operation)
+        delay = self.hedge_delay(operation) if may_hedge else None
+        started = time.monotonic()
+
+        # Reserve threads for the primary and a possible hedge up front
+        if delay is None or not self._reserve_workers(2):
+            result = fn()
+            self.window(operation).record(time.monotonic() - started)
+            return result
+
+        executor = self._executor_for_sync()
+        primary = executor.submit(fn)
+        primary.add_done_callback(self._release_worker)
+        primary.add_done_callback(
+            lambda f: f.cancelled() or self._record_primary(operation, f.exception() is None, started)
+        )
+
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._try_acquire_hedge(operation, hedge_permit):
+            self._release_worker()
+            result = primary.result()
+            self._observe_effective(operation, started, hedged=False)
+            return result
+
+        logger.debug(f"{operation}: hedging after {round(delay * 1000)}ms")
+        hedge = executor.submit(fn)
+        hedge.add_done_callback(self._release_worker)
+        pending = {primary, hedge}
+        last_error = None
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    hedge_won = future is hedge
+                    self._record_outcome(operation, hedge_won)
+                    self._observe_effective(operation, started, hedged=True)
+                    for loser in pending:
+                        # A running SDK call cannot be interrupted; its result is discarded
+                        loser.cancel()
+                        if hedge_won:
+                            loser.add_done_callback(self._saved_time_recorder(operation))
+                    return future.result()
+                last_error = future.exception()
+
+        raise last_error
+
+    async def call_async(
+        self,
+        operation: str,
+        fn: Callable[[], Awaitable[T]],
+        may_hedge: bool = True,
+        hedge_permit: Optional[Callable[[], bool]] = None
+    ) -> T:
+        """
+        Async variant of call(): the losing task is cancelled
+
+        A cancelled primary never reports its latency, so the time a winning
+        hedge saved is estimated from recent primaries that ran longer.
+
+        Args:
+            operation: Operation name (latency is tracked per operation)
+            fn: Zero-argument callable returning a fresh awaitable per call
+            may_hedge: False to suppress hedging for this call
+            hedge_permit: As for call()
+
+        Returns:
+            Result of whichever call succeeded first
+        """
+        if not self.enabled:
+            return await fn()
+
+        self._record_call(operation)
+        delay = self.hedge_delay(operation) if may_hedge else None
+        started = time.monotonic()
+
+        if delay is None:
+            result = await fn()
+            self.window(operation).record(time.monotonic() - started)
+            return result
+
+        primary = asyncio.ensure_future(fn())
+        primary.add_done_callback(
+            lambda t: t.cancelled() or self._record_primary(operation, t.exception() is None, started)
+        )
+
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or not self._try_acquire_hedge(operation, hedge_permit):
+            result = await primary
+            self._observe_effective(operation, started, hedged=False)
+            return result
+
+        logger.debug(f"{operation}: hedging after {round(delay * 1000)}ms")
+        hedge = asyncio.ensure_future(fn())
+        pending = {primary, hedge}
+        last_error = None
+
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self._record_outcome(operation, task is hedge)
+                        self._observe_effective(operation, started, hedged=True)
+                        if task is hedge and primary in pending:
+                            self._estimate_saved_time(operation, started)
+                        return task.result()
+                    last_error = task.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise last_error
+
+    def _record_primary(self, operation: str, succeeded: bool, started: float) -> None:
+        if succeeded:
+            self.window(operation).record(time.monotonic() - started)
+
+    def _observe_effective(self, operation: str, started: float, hedged: bool) -> None:
+        """Latency the caller actually saw (compare hedged vs unhedged tails)"""
+        CALL_LATENCY.observe(time.monotonic() - started, operation=operation, hedged=str(hedged).lower())
+
+    def _saved_time_recorder(self, operation: str) -> Callable:
+        """Done-callback for a losing primary: how long the caller would have waited"""
+        won_at = time.monotonic()
+
+        def record(future) -> None:
+            if not future.cancelled() and future.exception() is None:
+                HEDGE_SAVED.observe(time.monotonic() - won_at, operation=operation)
+
+        return record
+
+    def _estimate_saved_time(self, operation: str, started: float) -> None:
+        """Observe a cancelled primary's expected remaining time"""
+        elapsed = time.monotonic() - started
+        expected = self.window(operation).median_above(elapsed)
+        if expected is not None:
+            HEDGE_SAVED.observe(expected - elapsed, operation=operation)
+
+    def snapshot(self) -> dict:
+        """Hedge counts, rate and current hedge delay per operation"""
+        with self._lock:
+            operations = sorted(self._windows)
+            calls = dict(self._calls)
+            hedges = dict(self._hedges)
+        return {
+            operation: {
+                'calls': calls.get(operation, 0),
+                'hedges': hedges.get(operation, 0),
+                'hedge_rate': round(hedges.get(operation, 0) / max(1, calls.get(operation, 0)), 4),
+                'hedge_delay_ms': round((self.hedge_delay(operation) or 0) * 1000, 1),
+                'p50_ms': round((self.window(operation).percentile(50) or 0) * 1000, 1),
+                'p99_ms': round((self.window(operation).percentile(99) or 0) * 1000, 1),
+            }
+            for operation in operations
+        }
+
+
+# Global hedger for Anthropic calls
+hedger = Hedger()
@@ -3,12 +3,67 @@ Logging configuration for First-Aid Buddy Bot
 Provides structured logging with proper security (no PII/API keys logged)
 """
 
+import atexit
+import copy
+import hashlib
+import json
 import logging
+import logging.handlers
+import queue
+import random
 import sys
-from typing import Any, Dict
-from datetime import datetime
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+from datetime import datetime, timezone
 import re
 from .config import Config
+from .metrics import registry
+
+DROPPED = registry.counter(
+    'log_records_dropped_total', 'Log records dropped because the log queue was full', ('level',)
+)
+SAMPLED_OUT = registry.counter(
+    'log_records_sampled_out_total', 'Routine log records skipped by sampling', ('event',)
+)
+SAMPLE_RATE = registry.gauge(
+    'log_sample_rate', 'Fraction of routine log records currently kept (computed at scrape time)', ('event',)
+)
+
+# Overflow policies for the log queue
+DROP_DEBUG_FIRST = 'drop_debug_first'
+DROP_NEW = 'drop_new'
+BLOCK = 'block'
+
+
+def _combine(patterns: Dict[str, 're.Pattern']) -> 're.Pattern':
+    """
+    One alternation with a named group per pattern
+
+    Runs of patterns that start with \\b share one leading \\b, so positions
+    that are not a word boundary are rejected once instead of per pattern.
+    Per-pattern flags are kept as scoped groups.
+    """
+    parts: List[str] = []
+    bounded: List[str] = []
+    for name, pattern in patterns.items():
+        source = pattern.pattern
+        at_boundary = source.startswith(r'\b')
+        if at_boundary:
+            source = source[2:]
+        if pattern.flags & re.IGNORECASE:
+            source = f'(?i:{source})'
+        group = f'(?P<{name}>{source})'
+        if at_boundary:
+            bounded.append(group)
+            continue
+        if bounded:
+            parts.append(r'\b(?:' + '|'.join(bounded) + ')')
+            bounded = []
+        parts.append(group)
+    if bounded:
+        parts.append(r'\b(?:' + '|'.join(bounded) + ')')
+    return re.compile('|'.join(parts))
 
 
 class SanitizingFormatter(logging.Formatter):
@@ -20,7 +75,8 @@ class SanitizingFormatter(logging.Formatter):
     # Patterns to redact
     PATTERNS = {
         'api_key': re.compile(r'sk-ant-[a-zA-Z0-9_-]+'),
-        'email': re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'),
+        # Bounded repeats (RFC 5321 lengths): unbounded ones backtrack quadratically
+        'email': re.compile(r'\b[A-Za-z0-9._%+-]{1,64}@[A-Za-z0-9.-]{1,255}\.[A-Za-z]{2,63}\b'),
         'phone_uk': re.compile(r'\b0\d{10}\b'),
         'phone_us': re.compile(r'\b\d{3}[-.]?\d{3}[-.]?\d{4}\b'),
         'credit_card': re.compile(r'\b\d{4}[-\s]?\d{4}[-\s]?\d{4}[-\s]?\d{4}\b'),
@@ -28,42 +84,344 @@ class SanitizingFormatter(logging.Formatter):
         'postcode_uk': re.compile(r'\b[A-Z]{1,2}\d{1,2}\s?\d[A-Z]{2}\b', re.IGNORECASE),
     }
 
-    def format(self, record: logging.LogRecord) -> str:
-        """Format log record and sanitize sensitive information"""
-        # Format the message normally
-        original = super().format(record)
+    # All patterns in one pass; the leftmost match wins, ties go to the
+    # pattern listed first
+    COMBINED = _combine(PATTERNS)
+    REPLACEMENTS = {name: f'[REDACTED_{name.upper()}]' for name in PATTERNS}
 
-        # Sanitize the message
-        sanitized = original
-        for pattern_name, pattern in self.PATTERNS.items():
-            sanitized = pattern.sub(f'[REDACTED_{pattern_name.upper()}]', sanitized)
+    # Every pattern needs a digit, an '@' or the API key prefix
+    MARKERS = re.compile(r'[\d@]|sk-ant-')
 
-        return sanitized
+    @classmethod
+    def sanitize(cls, text: str) -> str:
+        """Redact every pattern in `text` in a single pass"""
+        if not cls.MARKERS.search(text):
+            return text
+        replacements = cls.REPLACEMENTS
+        return cls.COMBINED.sub(lambda match: replacements[match.lastgroup], text)
 
+    # Only the parts of a record that can carry user data are scanned, not
+    # the timestamp, level or source location around them
 
-def setup_logger(name: str = 'first_aid_bot') -> logging.Logger:
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        """Format the record with its message sanitized"""
+        record.message = self.sanitize(record.message)
+        return super().formatMessage(record)
+
+    def formatException(self, ei) -> str:
+        return self.sanitize(super().formatException(ei))
+
+    def formatStack(self, stack_info: str) -> str:
+        return self.sanitize(super().formatStack(stack_info))
+
+
+# ============================================================================
+# Structured logging
+# ============================================================================
+
+# Keys of every JSON log line, in order; unset ones are null so each line has
+# the same columns
+JSON_KEYS = (
+    'ts', 'level', 'logger', 'event', 'operation', 'stage', 'duration_ms',
+    'attempt', 'classification', 'query_length', 'session', 'sample_weight', 'message', 'details',
+)
+
+
+def session_hash(session_id: Optional[str]) -> Optional[str]:
+    """Short stable digest of a session id, so lines can be grouped without logging the id"""
+    if not session_id:
+        return None
+    return hashlib.sha256(session_id.encode()).hexdigest()[:16]
+
+
+class StructuredMessage:
     """
-    Set up logger with appropriate configuration
+    Log message made of schema fields
 
-    Args:
-        name: Logger name (usually module name)
+    Holds the fields only; the text form is rendered when the record is
+    formatted (on the log writer thread), and the JSON formatter emits the
+    fields directly.
+    """
 
-    Returns:
-        Configured logger instance
+    __slots__ = ('event', 'fields', 'details', '_render')
+
+    def __init__(
+        self,
+        event: str,
+        fields: Dict[str, Any],
+        details: Optional[Dict[str, Any]] = None,
+        render: Optional[Callable[['StructuredMessage'], str]] = None
+    ):
+        """
+        Args:
+            event: Event name (JSON 'event' key)
+            fields: Values for keys in JSON_KEYS
+            details: Any other values (JSON 'details' object)
+            render: Builds the text-format line
+        """
+        self.event = event
+        self.fields = fields
+        self.details = details or {}
+        self._render = render
+
+    def __str__(self) -> str:
+        if self._render is None:
+            return f"{self.event}: {dict(self.fields, **self.details)}"
+        return self._render(self)
+
+
+class JsonFormatter(SanitizingFormatter):
     """
-    logger = logging.getLogger(name)
+    One JSON object per line with the fixed JSON_KEYS columns
 
-    # Only configure if not already configured
-    if logger.handlers:
-        return logger
+    Structured messages fill their columns; plain messages go in 'message'.
+    Strings are sanitized like in text logs.
+    """
 
-    # Set log level from config
-    log_level = getattr(logging, Config.LOG_LEVEL.upper(), logging.INFO)
-    logger.setLevel(log_level)
+    def format(self, record: logging.LogRecord) -> str:
+        sanitize = self.sanitize
+        line: Dict[str, Any] = dict.fromkeys(JSON_KEYS)
+        line['ts'] = datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds')
+        line['level'] = record.levelname
+        line['logger'] = record.name
+        line['sample_weight'] = 1
+
+        msg = record.msg
+        if isinstance(msg, StructuredMessage) and not record.args:
+            line['event'] = msg.event
+            for key, value in msg.fields.items():
+                line[key] = sanitize(value) if isinstance(value, str) else value
+            if msg.details:
+                line['details'] = {
+                    key: sanitize(value) if isinstance(value, str) else value
+                    for key, value in msg.details.items()
+                }
+        else:
+            line['message'] = sanitize(record.getMessage())
+
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            line['exc'] = record.exc_text
+        if record.stack_info:
+            line['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(line, separators=(',', ':'), ensure_ascii=False, default=str)
+
+
+# ============================================================================
+# Sampling
+# ============================================================================
+
+# Structured events that are routine when logged at INFO
+SAMPLED_EVENTS = ('api_call', 'user_query')
+
+
+class LogSampler(logging.Filter):
+    """
+    Keeps a throughput-dependent fraction of routine log lines
+
+    Only INFO-or-lower structured api_call/user_query records are sampled;
+    warnings, errors, security events, plain messages and emergency
+    classifications always pass. Each event's throughput is measured over
+    one-second windows, and lines are kept with probability
+    target_per_second / throughput (1 while under target). A kept line's
+    `sample_weight` is the number of lines it stands for, so summing the
+    weights reconstructs the true counts.
+    """
+
+    def __init__(self, target_per_second: float, enabled: bool = True, clock=time.monotonic):
+        """
+        Args:
+            target_per_second: Routine lines per second per event to aim for
+            enabled: False keeps every line
+            clock: Monotonic time source in seconds (injectable for tests)
+        """
+        super().__init__()
+        self.target_per_second = target_per_second
+        self.enabled = enabled
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._windows: Dict[str, List[float]] = {}
+
+    def _keep_probability(self, event: str) -> float:
+        """Count one line for `event` and return the current keep probability"""
+        now = self.clock()
+        with self._lock:
+            window = self._windows.get(event)
+            if window is None:
+                # [window start, lines in window, last window's rate]
+                window = self._windows[event] = [now, 0, 0.0]
+            elapsed = now - window[0]
+            if elapsed >= 1.0:
+                window[2] = window[1] / elapsed
+                window[0], window[1] = now, 0
+            window[1] += 1
+            # The running window counts too, so a sudden burst is sampled
+            # within its first second
+            observed = max(window[2], window[1])
+        return min(1.0, self.target_per_second / observed) if observed else 1.0
+
+    def keep_probabilities(self) -> Dict[str, float]:
+        """
+        Keep probability per event as of now, without counting a line
+
+        A window that has run its second is rated on its own, so an event
+        whose burst ended (or that stopped altogether) reads 1 again.
+        """
+        now = self.clock()
+        probabilities = {}
+        with self._lock:
+            for event, (started, lines, last_rate) in self._windows.items():
+                elapsed = now - started
+                observed = lines / elapsed if elapsed >= 1.0 else max(last_rate, lines)
+                probabilities[event] = min(1.0, self.target_per_second / observed) if observed else 1.0
+        return probabilities
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        msg = record.msg
+        if (
+            not self.enabled
+            or record.levelno > logging.INFO
+            or not isinstance(msg, StructuredMessage)
+            or msg.event not in SAMPLED_EVENTS
+            or msg.fields.get('classification') == 'LIFE_THREATENING'
+        ):
+            return True
+
+        probability = self._keep_probability(msg.event)
+        if probability < 1.0:
+            if random.random() >= probability:
+                SAMPLED_OUT.inc(event=msg.event)
+                return False
+            msg.fields['sample_weight'] = round(1 / probability, 2)
+        return True
+
+    def reset(self) -> None:
+        with self._lock:
+            self._windows.clear()
+
+
+log_sampler = LogSampler(Config.LOG_SAMPLE_TARGET_PER_SECOND, enabled=Config.LOG_SAMPLING_ENABLED)
+
+
+def _export_sample_rates() -> None:
+    """Set log_sample_rate when metrics are read, so it recovers once a burst ends"""
+    for event, probability in log_sampler.keep_probabilities().items():
+        SAMPLE_RATE.set(probability, event=event)
+
+
+registry.on_collect(_export_sample_rates)
+
+
+# ============================================================================
+# Background log writer
+# ============================================================================
+
+class LogQueue(queue.Queue):
+    """
+    Bounded record queue with an overflow policy
+
+    DROP_DEBUG_FIRST: when full, evict the oldest queued record of the
+    lowest level below the incoming one (DEBUG before INFO, ...); if none
+    is lower, the incoming record is dropped. Warnings and errors survive
+    a flood of debug output.
+    DROP_NEW: when full, drop the incoming record.
+    BLOCK: wait for space (the caller pays for the backlog, nothing is lost).
+    """
+
+    def __init__(self, maxsize: int, overflow: str = DROP_DEBUG_FIRST):
+        super().__init__(maxsize)
+        self.overflow = overflow
+
+    def offer(self, record: logging.LogRecord) -> None:
+        """Enqueue `record`, applying the overflow policy if the queue is full"""
+        if self.overflow == BLOCK:
+            self.put(record)
+            return
+
+        dropped = record
+        with self.not_full:
+            if self.maxsize <= 0 or self._qsize() < self.maxsize:
+                dropped = None
+            elif self.overflow == DROP_DEBUG_FIRST:
+                victim = self._lowest_below(record.levelno)
+                if victim is not None:
+                    dropped = self.queue[victim]
+                    del self.queue[victim]
+            if dropped is not record:
+                self._put(record)
+                if dropped is None:
+                    # An evicted record's pending task passes to its replacement
+                    self.unfinished_tasks += 1
+                self.not_empty.notify()
+        if dropped is not None:
+            DROPPED.inc(level=dropped.levelname)
+
+    def _lowest_below(self, levelno: int) -> Optional[int]:
+        """Index of the oldest queued record with the lowest level under `levelno`"""
+        best, best_level = None, levelno
+        for i, queued in enumerate(self.queue):
+            level = getattr(queued, 'levelno', levelno)
+            if level < best_level:
+                best, best_level = i, level
+                if level <= logging.DEBUG:
+                    break
+        return best
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the listener thread
 
-    # Create console handler
+    Only the message arguments are merged on the calling thread (they may
+    be mutated after the call returns; structured messages already hold a
+    snapshot); sanitizing, traceback formatting and the write happen on
+    the listener. Once the listener is stopped,
+    records are written synchronously so late shutdown logs are not lost.
+    """
+
+    def __init__(self, log_queue: LogQueue, fallback: logging.Handler):
+        super().__init__(log_queue)
+        self.fallback = fallback
+        self.running = False
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        if not isinstance(record.msg, StructuredMessage) or record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        self.queue.offer(record)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if not self.running:
+            self.fallback.handle(record)
+            return
+        super().emit(record)
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # Waits for space rather than failing on a full queue
+        self.queue.put(self._sentinel)
+
+
+_lock = threading.Lock()
+_handler: Optional[_QueueHandler] = None
+_listener: Optional[_QueueListener] = None
+_atexit_registered = False
+
+
+def _console_handler() -> logging.Handler:
+    """stdout handler with the sanitizing (text) or JSON formatter"""
     console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(log_level)
+
+    if Config.LOG_FORMAT == 'json':
+        console_handler.setFormatter(JsonFormatter())
+        return console_handler
 
     # Create formatter
     if Config.ENABLE_DETAILED_LOGGING:
@@ -81,9 +439,91 @@ def setup_logger(name: str = 'first_aid_bot') -> logging.Logger:
         datefmt='%Y-%m-%d %H:%M:%S'
     )
     console_handler.setFormatter(formatter)
+    return console_handler
+
+
+def start_log_listener() -> logging.Handler:
+    """
+    Start the background log writer (idempotent)
+
+    Returns:
+        The shared queue handler every logger writes to
+    """
+    global _handler, _listener, _atexit_registered
+    with _lock:
+        if _handler is None:
+            output = _console_handler()
+            log_queue = LogQueue(Config.LOG_QUEUE_SIZE, Config.LOG_QUEUE_OVERFLOW)
+            _handler = _QueueHandler(log_queue, output)
+            # Sampled out before queueing, so skipped lines cost no queue space
+            _handler.addFilter(log_sampler)
+            _listener = _QueueListener(log_queue, output)
+        if not _handler.running:
+            _listener.start()
+            _handler.running = True
+        if not _atexit_registered:
+            # Covers processes without a lifespan hook (Streamlit, the CLI bot)
+            atexit.register(stop_log_listener)
+            _atexit_registered = True
+        return _handler
+
+
+def flush_logs() -> None:
+    """Block until every queued record has been written"""
+    with _lock:
+        handler = _handler if _handler is not None and _handler.running else None
+    if handler is not None:
+        handler.queue.join()
+    sys.stdout.flush()
+
+
+def stop_log_listener() -> None:
+    """
+    Write out queued records and stop the listener thread
+
+    Loggers keep working afterwards, writing synchronously, until
+    start_log_listener() is called again.
+    """
+    with _lock:
+        if _handler is None or not _handler.running:
+            return
+        _listener.stop()
+        _handler.running = False
+    sys.stdout.flush()
+
+
+def setup_logger(name: str = 'first_aid_bot') -> logging.Logger:
+    """
+    Set up logger with appropriate configuration
+
+    With LOG_ASYNC enabled every logger shares one queue handler and the
+    formatting and stdout writes run on the listener thread.
+
+    Args:
+        name: Logger name (usually module name)
+
+    Returns:
+        Configured logger instance
+    """
+    logger = logging.getLogger(name)
+
+    # Only configure if not already configured
+    if logger.handlers:
+        return logger
+
+    # Set log level from config
+    log_level = getattr(logging, Config.LOG_LEVEL.upper(), logging.INFO)
+    logger.setLevel(log_level)
+
+    if Config.LOG_ASYNC:
+        handler = start_log_listener()
+    else:
+        handler = _console_handler()
+        handler.setLevel(log_level)
+        handler.addFilter(log_sampler)
 
     # Add handler to logger
-    logger.addHandler(console_handler)
+    logger.addHandler(handler)
 
     # Prevent propagation to root logger (avoid duplicate logs)
     logger.propagate = False
@@ -91,52 +531,88 @@ def setup_logger(name: str = 'first_aid_bot') -> logging.Logger:
     return logger
 
 
+def _render_api_call(message: StructuredMessage) -> str:
+    fields = message.fields
+    log_data = {
+        'operation': fields['operation'],
+        'status': fields['stage'].upper(),
+        'duration_ms': fields['duration_ms'],
+    }
+    if fields.get('attempt') is not None:
+        log_data['attempt'] = fields['attempt']
+    log_data.update(message.details)
+    if fields.get('sample_weight'):
+        log_data['sample_weight'] = fields['sample_weight']
+    return f"API Call: {log_data}"
+
+
+def _render_user_query(message: StructuredMessage) -> str:
+    fields = message.fields
+    text = (
+        f"Query processed: length={fields['query_length']}, "
+        f"classification={fields['classification']}, "
+        f"time={fields['duration_ms']}ms"
+    )
+    if fields.get('sample_weight'):
+        text += f", sample_weight={fields['sample_weight']}"
+    return text
+
+
 def log_api_call(
     logger: logging.Logger,
     operation: str,
     success: bool,
     duration_ms: float,
-    metadata: Dict[str, Any] = None
+    metadata: Dict[str, Any] = None,
+    retrying: bool = False
 ) -> None:
     """
     Log an API call with standardized format
 
+    Nothing is built unless the level is enabled.
+
     Args:
         logger: Logger instance
         operation: Operation name (e.g., "classify_intent", "generate_answer")
         success: Whether operation succeeded
         duration_ms: Duration in milliseconds
-        metadata: Additional metadata (will be sanitized)
+        metadata: Additional metadata (will be sanitized); 'attempt' fills
+            its own JSON column
+        retrying: Failed attempt that will be retried (logged as a warning)
     """
-    status = "SUCCESS" if success else "FAILURE"
+    if success:
+        stage, level = 'success', logging.INFO
+    elif retrying:
+        stage, level = 'retry', logging.WARNING
+    else:
+        stage, level = 'failure', logging.ERROR
 
-    log_data = {
-        'operation': operation,
-        'status': status,
-        'duration_ms': round(duration_ms, 2),
-    }
+    if not logger.isEnabledFor(level):
+        return
 
+    details = {}
     if metadata:
         # Filter out sensitive keys
-        safe_metadata = {
+        details = {
             k: v for k, v in metadata.items()
             if k not in ['api_key', 'user_input', 'response']
         }
-        log_data.update(safe_metadata)
-
-    log_message = f"API Call: {log_data}"
 
-    if success:
-        logger.info(log_message)
-    else:
-        logger.error(log_message)
+    fields = {
+        'operation': operation,
+        'stage': stage,
+        'duration_ms': round(duration_ms, 2),
+        'attempt': details.pop('attempt', None),
+    }
+    logger.log(level, StructuredMessage('api_call', fields, details, _render_api_call))
 
 
 def log_user_query(
     logger: logging.Logger,
     query_length: int,
     classification: str,
-    processing_time_ms: float
+    processing_time_ms: float,
+    session_id: Optional[str] = None
 ) -> None:
     """
     Log user query (without logging actual query text for privacy)
@@ -146,12 +622,20 @@ def log_user_query(
         query_length: Length of user query
         classification: Classification result (LIFE_THREATENING or GENERAL_QUERY)
         processing_time_ms: Total processing time
+        session_id: Session identifier (logged as a hash)
     """
-    logger.info(
-        f"Query processed: length={query_length}, "
-        f"classification={classification}, "
-        f"time={round(processing_time_ms, 2)}ms"
-    )
+    if not logger.isEnabledFor(logging.INFO):
+        return
+
+    fields = {
+        'operation': 'process_query',
+        'stage': 'complete',
+        'duration_ms': round(processing_time_ms, 2),
+        'classification': classification,
+        'query_length': query_length,
+        'session': session_hash(session_id),
+    }
+    logger.info(StructuredMessage('user_query', fields, render=_render_user_query))
 
 
 def log_security_event(
@@ -0,0 +1,511 @@
+"""
+In-process metrics registry
+Thread-safe counters, gauges and histograms with optional labels, Prometheus
+text exposition, and aggregation across worker processes
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: archiving is not locked across processes
+    fcntl = None
+
+# Latency buckets in seconds (LLM calls run from tens of ms to tens of seconds)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _Metric:
+    """Base class: one named metric with a value per label combination"""
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def labels_of(self, key: Tuple[str, ...]) -> Dict[str, str]:
+        """Map a stored key back to its label names"""
+        return dict(zip(self.labelnames, key))
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    kind = 'counter'
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def items(self) -> List[Tuple[Tuple[str, ...], float]]:
+        with self._lock:
+            return list(self._values.items())
+
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+
+    kind = 'gauge'
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def items(self) -> List[Tuple[Tuple[str, ...], float]]:
+        with self._lock:
+            return list(self._values.items())
+
+
+class Histogram(_Metric):
+    """Distribution of observations in cumulative buckets"""
+
+    kind = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Optional[Sequence[float]] = None
+    ):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets or DEFAULT_BUCKETS))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [per-bucket counts (+Inf last), sum, count]
+                state = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._values[key] = state
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state[2] if state else 0
+
+    def sum(self, **labels) -> float:
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state[1] if state else 0.0
+
+    def items(self) -> List[Tuple[Tuple[str, ...], Tuple[List[int], float, int]]]:
+        """(key, (non-cumulative bucket counts, sum, count)) per label combination"""
+        with self._lock:
+            return [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+
+
+class MetricsRegistry:
+    """Get-or-create registry so modules can declare metrics at import time"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+        self._collect_hooks: List[Callable[[], None]] = []
+
+    def _get_or_create(self, cls, name: str, help_text: str, labelnames: Sequence[str], **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, help_text, labelnames, **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} already registered as {metric.kind}")
+            return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, help_text, labelnames)
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, help_text, labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Optional[Sequence[float]] = None
+    ) -> Histogram:
+        return self._get_or_create(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def collect(self) -> List[_Metric]:
+        """All registered metrics, sorted by name"""
+        with self._lock:
+            return [self._metrics[name] for name in sorted(self._metrics)]
+
+    def on_collect(self, hook: Callable[[], None]) -> None:
+        """Run hook() before every snapshot, for gauges derived at scrape time"""
+        with self._lock:
+            self._collect_hooks.append(hook)
+
+    def refresh(self) -> None:
+        """Run the on_collect hooks"""
+        with self._lock:
+            hooks = list(self._collect_hooks)
+        for hook in hooks:
+            hook()
+
+    def get(self, name: str) -> Optional[_Metric]:
+        with self._lock:
+            return self._metrics.get(name)
+
+    def reset(self) -> None:
+        """Zero every metric (registrations are kept)"""
+        for metric in self.collect():
+            metric.reset()
+
+
+# Global registry
+registry = MetricsRegistry()
+
+
+# =============================================================================
+# Snapshots and exposition
+# =============================================================================
+
+def snapshot(source: MetricsRegistry = None) -> Dict[str, dict]:
+    """
+    JSON-serialisable copy of every metric's current values
+
+    Args:
+        source: Registry to read (defaults to the global registry)
+
+    Returns:
+        {name: {kind, help, labelnames, buckets?, values: [[label values, value], ...]}}
+        where a histogram value is [non-cumulative bucket counts, sum, count]
+    """
+    source = source or registry
+    source.refresh()
+    metrics = {}
+    for metric in source.collect():
+        entry = {
+            'kind': metric.kind,
+            'help': metric.help,
+            'labelnames': list(metric.labelnames),
+            'values': [[list(key), value] for key, value in metric.items()],
+        }
+        if isinstance(metric, Histogram):
+            entry['buckets'] = list(metric.buckets)
+        metrics[metric.name] = entry
+    return metrics
+
+
+def without_gauges(metrics: Dict[str, dict]) -> Dict[str, dict]:
+    """A snapshot minus its gauges (for processes that have exited)"""
+    return {name: entry for name, entry in metrics.items() if entry['kind'] != 'gauge'}
+
+
+def merge(snapshots: Sequence[Dict[str, dict]]) -> Dict[str, dict]:
+    """
+    Add up per-process snapshots
+
+    Counters, gauges and histogram buckets/sums/counts are summed per label
+    combination. A metric registered with a different type or buckets in a
+    later snapshot (another code version) is skipped.
+
+    Returns:
+        A snapshot of the combined values
+    """
+    merged: Dict[str, dict] = {}
+    totals: Dict[str, Dict[Tuple[str, ...], object]] = {}
+
+    for source in snapshots:
+        for name, entry in source.items():
+            target = merged.get(name)
+            if target is None:
+                target = merged[name] = {k: v for k, v in entry.items() if k != 'values'}
+                totals[name] = {}
+            elif target['kind'] != entry['kind'] or target.get('buckets') != entry.get('buckets'):
+                continue
+            values = totals[name]
+            for labels, value in entry['values']:
+                key = tuple(labels)
+                current = values.get(key)
+                if entry['kind'] != 'histogram':
+                    values[key] = (current or 0.0) + value
+                elif current is None:
+                    values[key] = [list(value[0]), value[1], value[2]]
+                else:
+                    current[0] = [a + b for a, b in zip(current[0], value[0])]
+                    current[1] += value[1]
+                    current[2] += value[2]
+
+    for name, target in merged.items():
+        target['values'] = [[list(key), value] for key, value in totals[name].items()]
+    return merged
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(labelnames: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def render(metrics: Dict[str, dict]) -> str:
+    """
+    Prometheus text exposition format (version 0.0.4) for a snapshot
+
+    Args:
+        metrics: Output of snapshot() or merge()
+
+    Returns:
+        Exposition text, metrics sorted by name
+    """
+    lines: List[str] = []
+    for name in sorted(metrics):
+        entry = metrics[name]
+        kind, labelnames = entry['kind'], entry['labelnames']
+        help_text = entry['help'].replace('\\', '\\\\').replace('\n', '\\n')
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in sorted(entry['values'], key=lambda item: item[0]):
+            if kind == 'histogram':
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(list(entry['buckets']) + [float('inf')], counts):
+                    cumulative += bucket_count
+                    le = 'le="' + _number(bound) + '"'
+                    lines.append(f"{name}_bucket{_labels(labelnames, labels, le)} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labelnames, labels)} {_number(total)}")
+                lines.append(f"{name}_count{_labels(labelnames, labels)} {count}")
+            else:
+                lines.append(f"{name}{_labels(labelnames, labels)} {_number(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+# =============================================================================
+# Multi-worker aggregation
+# =============================================================================
+
+class MultiprocessExporter:
+    """
+    Shares metrics between worker processes through a directory
+
+    Each worker writes its snapshot to <directory>/<pid>.json every
+    `interval` seconds (atomically, via rename). collect() merges the
+    caller's live values with every other worker's file, so a scrape
+    answered by any worker covers all of them. Gauges of a worker whose file
+    is `stale_after` seconds old are dropped.
+
+    Files of workers that have exited are folded into archive.json (counters
+    and histograms only, so their counts stay in the totals) and deleted: on
+    stop(), on start() (a leftover file with our PID belongs to an earlier
+    process, so a reused PID never overwrites its counts) and during
+    collect() for stale files whose process is gone.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        source: Optional[MetricsRegistry] = None,
+        interval: float = 5.0,
+        stale_after: Optional[float] = None
+    ):
+        """
+        Args:
+            directory: Shared directory (created if missing)
+            source: Registry to export (defaults to the global registry)
+            interval: Seconds between snapshot writes
+            stale_after: Age after which a worker's gauges are ignored
+                (defaults to three intervals)
+        """
+        self.directory = directory
+        self.source = source or registry
+        self.interval = interval
+        self.stale_after = stale_after if stale_after is not None else 3 * interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    ARCHIVE = 'archive.json'
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, f"{os.getpid()}.json")
+
+    @contextmanager
+    def _archive_lock(self) -> Iterator[None]:
+        """Serialize archiving between workers"""
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.directory, 'archive.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _archive(self, paths: Sequence[str]) -> None:
+        """Fold exited workers' files into the archive and delete them"""
+        archive_path = os.path.join(self.directory, self.ARCHIVE)
+        with self._archive_lock():
+            sources = []
+            for path in (archive_path, *paths):
+                try:
+                    with open(path, encoding='utf-8') as f:
+                        sources.append(without_gauges(json.load(f).get('metrics', {})))
+                except FileNotFoundError:
+                    continue
+                except ValueError:
+                    # A corrupt file would be retried forever; give up on it
+                    sources.append({})
+            data = {'pid': None, 'written_at': time.time(), 'metrics': merge(sources)}
+            tmp = f"{archive_path}.{os.getpid()}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(tmp, archive_path)
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def write(self) -> None:
+        """Write this worker's snapshot now"""
+        os.makedirs(self.directory, exist_ok=True)
+        data = {'pid': os.getpid(), 'written_at': time.time(), 'metrics': snapshot(self.source)}
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp, self.path)
+
+    def _others(self) -> List[Tuple[str, dict]]:
+        """(path, contents) of every other worker's file and the archive (unreadable ones skipped)"""
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        own = os.path.basename(self.path)
+        files = []
+        for name in names:
+            if not name.endswith('.json') or name == own:
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, encoding='utf-8') as f:
+                    files.append((path, json.load(f)))
+            except (OSError, ValueError):
+                continue
+        return files
+
+    def collect(self) -> Dict[str, dict]:
+        """Merged snapshot of this worker (live) and all others"""
+        now = time.time()
+        sources = [snapshot(self.source)]
+        dead = []
+        for path, data in self._others():
+            metrics = data.get('metrics', {})
+            if now - data.get('written_at', 0) > self.stale_after:
+                metrics = without_gauges(metrics)
+                if data.get('pid') is not None and not _pid_alive(data['pid']):
+                    dead.append(path)
+            sources.append(metrics)
+        merged = merge(sources)
+        if dead:
+            # Counted above already; the archive takes them over for later scrapes
+            try:
+                self._archive(dead)
+            except OSError:
+                pass
+        return merged
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except OSError:
+                # A full or missing disk must not take the worker down
+                pass
+
+    def start(self) -> None:
+        """Write now and then every `interval` seconds on a daemon thread"""
+        if self._thread is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self.path):
+            # Left by an exited process that had our PID
+            self._archive([self.path])
+        self.write()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='metrics-exporter', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the writer thread and hand the final values to the archive"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        try:
+            self.write()
+            self._archive([self.path])
+        except OSError:
+            pass
+
+
+def _pid_alive(pid: int) -> bool:
+    """Whether a process with this PID exists on this host"""
+    if os.name != 'posix':
+        # os.kill() would terminate it; a stale file is taken as exited
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
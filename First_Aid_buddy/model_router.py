@@ -0,0 +1,192 @@
+"""
+Per-stage model routing
+Picks the Claude model for each pipeline stage (triage, answer, emergency)
+and moves a stage to a fallback model while its model is running slow
+"""
+
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from .config import Config
+from .hedging import LatencyWindow
+from .logger import setup_logger
+from .metrics import registry
+
+logger = setup_logger('model_router')
+
+ROUTED = registry.counter(
+    'model_routed_calls_total', 'LLM calls routed, by stage and model', ('stage', 'model')
+)
+FALLBACK_ACTIVE = registry.gauge(
+    'model_fallback_active', '1 while a stage is routed to the fallback model', ('stage',)
+)
+STAGE_LATENCY = registry.histogram(
+    'model_stage_seconds', 'LLM attempt latency per stage and model (excluding backoff and queueing)',
+    ('stage', 'model')
+)
+
+# (router, stage, model) the API attempts in this context are recorded for
+_current_route: ContextVar[Optional[Tuple[Any, str, str]]] = ContextVar('model_route', default=None)
+
+STAGES = ('triage', 'answer', 'emergency')
+
+
+class ModelRouter:
+    """
+    Chooses a model per stage from a rolling latency estimate
+
+    Latency is tracked per (stage, model) because the same model answers a
+    10-token triage call much faster than a 1000-token answer. A stage moves
+    to the fallback model while its primary model's p95 exceeds the stage
+    threshold, unless the fallback is itself over the threshold.
+
+    Samples expire after `window_seconds`; once a slow primary's samples
+    have aged out it is tried again, so routing recovers without probes.
+    """
+
+    def __init__(
+        self,
+        routes: Optional[Dict[str, str]] = None,
+        fallback: Optional[str] = None,
+        thresholds: Optional[Dict[str, float]] = None,
+        enabled: Optional[bool] = None,
+        min_samples: Optional[int] = None,
+        window_seconds: Optional[float] = None,
+        window_size: int = 200
+    ):
+        self.routes = routes or {
+            'triage': Config.CLAUDE_MODEL_TRIAGE,
+            'answer': Config.CLAUDE_MODEL_ANSWER,
+            'emergency': Config.CLAUDE_MODEL_EMERGENCY,
+        }
+        self.fallback = Config.CLAUDE_MODEL_FALLBACK if fallback is None else fallback
+        self.thresholds = thresholds or {
+            'triage': Config.MODEL_TRIAGE_P95_THRESHOLD,
+            'answer': Config.MODEL_ANSWER_P95_THRESHOLD,
+            'emergency': Config.MODEL_ANSWER_P95_THRESHOLD,
+        }
+        self.enabled = Config.MODEL_FALLBACK_ENABLED if enabled is None else enabled
+        self.min_samples = Config.MODEL_LATENCY_MIN_SAMPLES if min_samples is None else min_samples
+        self.window_seconds = Config.MODEL_LATENCY_WINDOW_SECONDS if window_seconds is None else window_seconds
+        self.window_size = window_size
+
+        self._lock = threading.Lock()
+        self._windows: Dict[Tuple[str, str], LatencyWindow] = {}
+        self._on_fallback: Dict[str, bool] = {}
+
+    def _window(self, stage: str, model: str) -> LatencyWindow:
+        with self._lock:
+            window = self._windows.get((stage, model))
+            if window is None:
+                window = LatencyWindow(self.window_size, max_age=self.window_seconds)
+                self._windows[(stage, model)] = window
+            return window
+
+    def p95(self, stage: str, model: str) -> Optional[float]:
+        """p95 latency of a model on a stage, or None with too few recent samples"""
+        window = self._window(stage, model)
+        if len(window) < self.min_samples:
+            return None
+        return window.percentile(95)
+
+    def is_slow(self, stage: str, model: str) -> bool:
+        """Whether a model's recent p95 on this stage is over the threshold"""
+        p95 = self.p95(stage, model)
+        return p95 is not None and p95 > self.thresholds[stage]
+
+    def select(self, stage: str) -> str:
+        """
+        Model to use for the next call of a stage
+
+        Args:
+            stage: 'triage', 'answer' or 'emergency'
+
+        Returns:
+            Model name
+        """
+        primary = self.routes[stage]
+        use_fallback = (
+            self.enabled
+            and self.fallback
+            and self.fallback != primary
+            and self.is_slow(stage, primary)
+            and not self.is_slow(stage, self.fallback)
+        )
+        self._note_route(stage, primary, bool(use_fallback))
+        model = self.fallback if use_fallback else primary
+        ROUTED.inc(stage=stage, model=model)
+        return model
+
+    def _note_route(self, stage: str, primary: str, use_fallback: bool) -> None:
+        """Log and export switches between primary and fallback"""
+        with self._lock:
+            changed = self._on_fallback.get(stage, False) != use_fallback
+            self._on_fallback[stage] = use_fallback
+        if not changed:
+            return
+        FALLBACK_ACTIVE.set(1 if use_fallback else 0, stage=stage)
+        if use_fallback:
+            logger.warning(
+                f"{stage}: {primary} p95 {round(self.p95(stage, primary), 2)}s over "
+                f"{self.thresholds[stage]}s, routing to {self.fallback}"
+            )
+        else:
+            logger.info(f"{stage}: routing back to {primary}")
+
+    def record(self, stage: str, model: str, seconds: float) -> None:
+        """Record how long a call of this stage took on this model"""
+        self._window(stage, model).record(seconds)
+        STAGE_LATENCY.observe(seconds, stage=stage, model=model)
+
+    @contextmanager
+    def observe(self, stage: str, model: str) -> Iterator[None]:
+        """
+        Record every API attempt made inside the block for this stage and model
+
+        Only each attempt's own duration counts (see record_attempt()), so
+        retry backoff, Retry-After waits and governor queueing do not make a
+        model look slow. Failed attempts are recorded too (a timeout was slow).
+        """
+        token = _current_route.set((self, stage, model))
+        try:
+            yield
+        finally:
+            _current_route.reset(token)
+
+    def reset(self) -> None:
+        """Forget all latency history"""
+        with self._lock:
+            self._windows.clear()
+            self._on_fallback.clear()
+
+    def snapshot(self) -> dict:
+        """Current model and per-model p95 for each stage"""
+        with self._lock:
+            on_fallback = dict(self._on_fallback)
+            keys = sorted(self._windows)
+        result = {}
+        for stage in STAGES:
+            result[stage] = {
+                'primary': self.routes[stage],
+                'on_fallback': on_fallback.get(stage, False),
+                'p95_ms': {
+                    model: round(p95 * 1000, 1)
+                    for key_stage, model in keys
+                    if key_stage == stage and (p95 := self.p95(stage, model)) is not None
+                },
+            }
+        return result
+
+
+# Global router for Anthropic calls
+model_router = ModelRouter()
+
+
+def record_attempt(seconds: float) -> None:
+    """Record one API attempt's duration for the active observe() block (no-op outside one)"""
+    route = _current_route.get()
+    if route is not None:
+        router, stage, model = route
+        router.record(stage, model, seconds)
@@ -0,0 +1,578 @@
+"""
+Per-identifier rate limiting
+Sliding minute/hour windows per session or client IP, with idle identifiers
+swept out and a hard cap on how many identifiers are tracked
+"""
+
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from typing import List, Optional, Tuple
+
+from .config import Config
+from .logger import setup_logger, log_security_event
+from .metrics import registry
+
+logger = setup_logger('rate_limiter')
+
+IDENTIFIERS = registry.gauge(
+    'rate_limiter_identifiers', 'Identifiers currently tracked by the rate limiter', ('limiter',)
+)
+MEMORY_BYTES = registry.gauge(
+    'rate_limiter_bytes', 'Estimated memory held by rate limiter state (exact as of each stripe sweep)', ('limiter',)
+)
+EVICTIONS = registry.counter(
+    'rate_limiter_evictions_total', 'Identifiers dropped from the rate limiter', ('limiter', 'reason')
+)
+BACKEND_ERRORS = registry.counter(
+    'rate_limiter_backend_errors_total', 'Checks allowed because the rate limit store failed', ('backend',)
+)
+
+# Window lengths in seconds
+MINUTE = 60.0
+HOUR = 3600.0
+
+# Names of the windows, as returned by acquire()
+MINUTE_WINDOW = 'minute'
+HOUR_WINDOW = 'hour'
+
+
+class BackendError(Exception):
+    """A shared rate limit store failed (connection, protocol or database error)"""
+
+
+class RequestWindow:
+    """
+    Timestamps of one identifier's allowed requests
+
+    Two deques of time.monotonic() values, one per limit window. Requests
+    are appended in time order, so expired entries are always at the left
+    and pruning is amortized O(1). Each deque holds at most its limit.
+    """
+
+    __slots__ = ('minute', 'hour')
+
+    def __init__(self):
+        self.minute: deque = deque()
+        self.hour: deque = deque()
+
+    def prune(self, now: float) -> None:
+        """Drop timestamps that are outside their window"""
+        minute_ago = now - MINUTE
+        hour_ago = now - HOUR
+        minute, hour = self.minute, self.hour
+        while minute and minute[0] <= minute_ago:
+            minute.popleft()
+        while hour and hour[0] <= hour_ago:
+            hour.popleft()
+
+    def append(self, timestamp: float) -> None:
+        self.minute.append(timestamp)
+        self.hour.append(timestamp)
+
+    def idle(self, now: float) -> bool:
+        """Whether nothing is left in the hour window (forgetting it changes no answer)"""
+        return not self.hour or self.hour[-1] <= now - HOUR
+
+    def size_bytes(self) -> int:
+        return sys.getsizeof(self) + sys.getsizeof(self.minute) + sys.getsizeof(self.hour)
+
+    def __len__(self) -> int:
+        return len(self.hour)
+
+
+class TokenCharge:
+    """Tokens charged to an identifier for one request; settled against actual usage"""
+
+    __slots__ = ('identifier', 'timestamp', 'tokens', 'in_minute', 'in_hour', 'window')
+
+    def __init__(self, identifier: str, timestamp: float, tokens: int):
+        self.identifier = identifier
+        self.timestamp = timestamp
+        self.tokens = tokens
+        self.in_minute = True
+        self.in_hour = True
+        self.window: Optional['TokenWindow'] = None
+
+
+class TokenWindow:
+    """
+    Token charges of one identifier with running per-window totals
+
+    Like RequestWindow, but each entry carries a token count and the
+    windows keep their sums, so checks stay O(1) amortized. A charge can be
+    corrected after the fact (estimate -> actual usage) while it is still
+    in a window.
+    """
+
+    __slots__ = ('minute', 'hour', 'minute_tokens', 'hour_tokens')
+
+    def __init__(self):
+        self.minute: deque = deque()
+        self.hour: deque = deque()
+        self.minute_tokens = 0
+        self.hour_tokens = 0
+
+    def prune(self, now: float) -> None:
+        """Drop charges that are outside their window"""
+        minute_ago = now - MINUTE
+        hour_ago = now - HOUR
+        minute, hour = self.minute, self.hour
+        while minute and minute[0].timestamp <= minute_ago:
+            charge = minute.popleft()
+            charge.in_minute = False
+            self.minute_tokens -= charge.tokens
+        while hour and hour[0].timestamp <= hour_ago:
+            charge = hour.popleft()
+            charge.in_hour = False
+            self.hour_tokens -= charge.tokens
+
+    def append(self, charge: TokenCharge) -> None:
+        charge.window = self
+        self.minute.append(charge)
+        self.hour.append(charge)
+        self.minute_tokens += charge.tokens
+        self.hour_tokens += charge.tokens
+
+    def adjust(self, charge: TokenCharge, tokens: int) -> None:
+        """Change a charge's tokens, keeping the window totals consistent"""
+        delta = tokens - charge.tokens
+        charge.tokens = tokens
+        if charge.in_minute:
+            self.minute_tokens += delta
+        if charge.in_hour:
+            self.hour_tokens += delta
+
+    def idle(self, now: float) -> bool:
+        """Whether nothing is left in the hour window (forgetting it changes no answer)"""
+        return not self.hour or self.hour[-1].timestamp <= now - HOUR
+
+    def size_bytes(self) -> int:
+        size = sys.getsizeof(self) + sys.getsizeof(self.minute) + sys.getsizeof(self.hour)
+        if self.hour:
+            size += len(self.hour) * sys.getsizeof(self.hour[0])
+        return size
+
+    def __len__(self) -> int:
+        return len(self.hour)
+
+
+class _Stripe:
+    """One lock and the identifiers that hash to it"""
+
+    __slots__ = ('lock', 'requests', 'capacity', 'last_sweep', 'bytes')
+
+    def __init__(self, capacity: int, now: float):
+        self.lock = threading.Lock()
+        self.requests: OrderedDict = OrderedDict()
+        self.capacity = capacity
+        self.last_sweep = now
+        # Running estimate of size_bytes(): adjusted per identifier, recounted on sweep
+        self.bytes = self.size_bytes()
+
+    def sweep(self, now: float) -> int:
+        """Drop idle identifiers and recount the bytes estimate (lock held)"""
+        self.last_sweep = now
+        idle = [identifier for identifier, window in self.requests.items() if window.idle(now)]
+        for identifier in idle:
+            del self.requests[identifier]
+        self.bytes = self.size_bytes()
+        return len(idle)
+
+    def size_bytes(self) -> int:
+        """Bytes held by the index, identifiers and windows (lock held)"""
+        return sys.getsizeof(self.requests) + sum(
+            sys.getsizeof(identifier) + window.size_bytes()
+            for identifier, window in self.requests.items()
+        )
+
+
+class _StripedWindows:
+    """
+    Per-identifier windows in memory, spread over independently locked stripes
+
+    Identifiers are spread over `stripes` partitions by hash, so concurrent
+    checks for different users rarely wait on each other, while checks for
+    the same identifier are serialized and never lose an update. Locks are
+    only held for the in-memory bookkeeping (no I/O, no awaits), so checks
+    are safe to call from threads and directly from async code.
+
+    Within a stripe, identifiers are kept in least-recently-checked order.
+    Every `sweep_interval` seconds a check also drops that stripe's
+    identifiers with nothing in the last hour; beyond its share of
+    `max_identifiers` a stripe evicts its least recently checked identifier,
+    so memory stays bounded however many distinct IPs or sessions arrive.
+    """
+
+    kind = 'requests'
+    window_class = RequestWindow
+
+    def __init__(
+        self,
+        clock=time.monotonic,
+        max_identifiers: Optional[int] = None,
+        sweep_interval: Optional[float] = None,
+        stripes: Optional[int] = None
+    ):
+        """
+        Args:
+            clock: Monotonic time source in seconds (injectable for tests)
+            max_identifiers: Hard cap on tracked identifiers (defaults to RATE_LIMIT_MAX_IDENTIFIERS)
+            sweep_interval: Seconds between idle sweeps (defaults to RATE_LIMIT_SWEEP_SECONDS)
+            stripes: Number of lock stripes (defaults to RATE_LIMIT_LOCK_STRIPES)
+        """
+        self.clock = clock
+        self.max_identifiers = Config.RATE_LIMIT_MAX_IDENTIFIERS if max_identifiers is None else max_identifiers
+        self.sweep_interval = Config.RATE_LIMIT_SWEEP_SECONDS if sweep_interval is None else sweep_interval
+        stripes = Config.RATE_LIMIT_LOCK_STRIPES if stripes is None else stripes
+        stripes = max(1, min(stripes, self.max_identifiers))
+
+        capacity = self.max_identifiers // stripes
+        now = clock()
+        self._stripes = tuple(_Stripe(capacity, now) for _ in range(stripes))
+
+    def _stripe(self, identifier: str) -> _Stripe:
+        return self._stripes[hash(identifier) % len(self._stripes)]
+
+    def _window_locked(self, stripe: _Stripe, identifier: str, now: float) -> Tuple[object, bool]:
+        """
+        Sweep the stripe if due, then get or start the identifier's window,
+        marking it most recently used (stripe lock held)
+
+        Returns:
+            (window, whether the tracked identifiers or the bytes estimate changed)
+        """
+        swept = now - stripe.last_sweep >= self.sweep_interval
+        removed = stripe.sweep(now) if swept else 0
+        if removed:
+            EVICTIONS.inc(removed, limiter=self.kind, reason='idle')
+
+        requests = stripe.requests
+        window = requests.get(identifier)
+        if window is not None:
+            requests.move_to_end(identifier)
+            return window, swept
+
+        index_bytes = sys.getsizeof(requests)
+        window = requests[identifier] = self.window_class()
+        added = sys.getsizeof(identifier) + window.size_bytes()
+        if len(requests) > stripe.capacity:
+            evicted, evicted_window = requests.popitem(last=False)
+            added -= sys.getsizeof(evicted) + evicted_window.size_bytes()
+            EVICTIONS.inc(limiter=self.kind, reason='capacity')
+        stripe.bytes += added + sys.getsizeof(requests) - index_bytes
+        return window, True
+
+    def _tracked_changed(self) -> None:
+        IDENTIFIERS.set(len(self), limiter=self.kind)
+        MEMORY_BYTES.set(sum(stripe.bytes for stripe in self._stripes), limiter=self.kind)
+
+    def window(self, identifier: str):
+        """
+        Get an identifier's window, marking it most recently used
+
+        For inspection and tests; the window is not locked once returned.
+
+        Args:
+            identifier: User identifier
+
+        Returns:
+            Existing or newly tracked window
+        """
+        stripe = self._stripe(identifier)
+        with stripe.lock:
+            window, changed = self._window_locked(stripe, identifier, self.clock())
+        if changed:
+            self._tracked_changed()
+        return window
+
+    def identifiers(self) -> List[str]:
+        """Tracked identifiers, least recently checked first within each stripe"""
+        result: List[str] = []
+        for stripe in self._stripes:
+            with stripe.lock:
+                result.extend(stripe.requests)
+        return result
+
+    def __len__(self) -> int:
+        return sum(len(stripe.requests) for stripe in self._stripes)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """
+        Drop identifiers with nothing in the last hour
+
+        Args:
+            now: Current clock value (defaults to clock())
+
+        Returns:
+            Number of identifiers removed
+        """
+        now = self.clock() if now is None else now
+        removed = 0
+        for stripe in self._stripes:
+            with stripe.lock:
+                removed += stripe.sweep(now)
+        if removed:
+            EVICTIONS.inc(removed, limiter=self.kind, reason='idle')
+            logger.debug(f"Rate limiter sweep ({self.kind}): {removed} idle identifier(s) dropped")
+        self._tracked_changed()
+        return removed
+
+    def memory_bytes(self) -> int:
+        """Estimated bytes held by identifiers, windows and the indexes"""
+        total = 0
+        for stripe in self._stripes:
+            with stripe.lock:
+                total += stripe.size_bytes()
+        return total
+
+    def reset(self) -> None:
+        """Forget every identifier"""
+        for stripe in self._stripes:
+            with stripe.lock:
+                stripe.requests.clear()
+                stripe.bytes = stripe.size_bytes()
+        self._tracked_changed()
+
+
+class BaseRateLimiter(ABC):
+    """
+    Per-identifier minute/hour limits on top of a pluggable store
+
+    Backends implement acquire(): atomically prune the identifier's expired
+    requests, and record this one only if both windows have room. Everything
+    else (limits, messages, security logging, failure policy) lives here.
+
+    If a shared store is unreachable the request is allowed and the error
+    counted: losing rate limiting briefly is better than refusing first-aid
+    questions.
+    """
+
+    backend = 'base'
+
+    @abstractmethod
+    def acquire(self, identifier: str) -> Optional[str]:
+        """
+        Record a request if both windows have room
+
+        Args:
+            identifier: User identifier
+
+        Returns:
+            None if recorded, otherwise the exceeded window ('minute' or 'hour')
+        """
+
+    @abstractmethod
+    def reset(self) -> None:
+        """Forget every identifier"""
+
+    def close(self) -> None:
+        """Release connections (no-op for in-memory state)"""
+
+    def check_rate_limit(self, identifier: str) -> Tuple[bool, Optional[str]]:
+        """
+        Check if request should be rate-limited
+
+        Args:
+            identifier: User identifier (session ID, IP, etc.)
+
+        Returns:
+            Tuple of (allowed: bool, message: Optional[str])
+        """
+        try:
+            exceeded = self.acquire(identifier)
+        except (OSError, BackendError) as exc:
+            BACKEND_ERRORS.inc(backend=self.backend)
+            logger.error(f"Rate limit store ({self.backend}) unavailable, allowing request: {exc}")
+            return True, None
+
+        # Check per-minute limit
+        if exceeded == MINUTE_WINDOW:
+            log_security_event(
+                logger,
+                'rate_limit_exceeded_minute',
+                f'Identifier: {identifier[:8]}...',
+                'WARNING'
+            )
+            return False, f"Rate limit exceeded. Maximum {Config.RATE_LIMIT_PER_MINUTE} requests per minute."
+
+        # Check per-hour limit
+        if exceeded == HOUR_WINDOW:
+            log_security_event(
+                logger,
+                'rate_limit_exceeded_hour',
+                f'Identifier: {identifier[:8]}...',
+                'WARNING'
+            )
+            return False, f"Rate limit exceeded. Maximum {Config.RATE_LIMIT_PER_HOUR} requests per hour."
+
+        return True, None
+
+
+class RateLimiter(_StripedWindows, BaseRateLimiter):
+    """
+    Per-identifier sliding-window rate limiter (in-memory, per process)
+
+    Each check prunes expired timestamps from the front of the identifier's
+    windows and compares their lengths with the limits, so it costs O(1)
+    amortized regardless of how many requests are on record. See
+    _StripedWindows for locking and memory bounds.
+
+    State is per process; see shared_rate_limit.py for stores shared by
+    several workers.
+    """
+
+    backend = 'memory'
+
+    def acquire(self, identifier: str) -> Optional[str]:
+        stripe = self._stripe(identifier)
+        with stripe.lock:
+            now = self.clock()
+            window, changed = self._window_locked(stripe, identifier, now)
+            window.prune(now)
+
+            if len(window.minute) >= Config.RATE_LIMIT_PER_MINUTE:
+                exceeded = MINUTE_WINDOW
+            elif len(window.hour) >= Config.RATE_LIMIT_PER_HOUR:
+                exceeded = HOUR_WINDOW
+            else:
+                exceeded = None
+                window.append(now)
+
+        if changed:
+            self._tracked_changed()
+        return exceeded
+
+
+class TokenRateLimiter(_StripedWindows):
+    """
+    Per-identifier token budgets (in-memory, per process)
+
+    Charges sessions by the API tokens their queries use rather than by
+    query count, so a heavy user is throttled in proportion to the load
+    they put on the Anthropic quota. A query reserves an estimate up front
+    (so concurrent queries see it) and is settled to the actual usage from
+    response.usage once it finishes.
+
+    A query is admitted while the identifier's usage in both windows is
+    below the budget; the query that crosses the budget still runs.
+    """
+
+    kind = 'tokens'
+    window_class = TokenWindow
+
+    def __init__(
+        self,
+        per_minute: Optional[int] = None,
+        per_hour: Optional[int] = None,
+        enabled: Optional[bool] = None,
+        **kwargs
+    ):
+        """
+        Args:
+            per_minute: Token budget per minute (defaults to TOKEN_RATE_LIMIT_PER_MINUTE)
+            per_hour: Token budget per hour (defaults to TOKEN_RATE_LIMIT_PER_HOUR)
+            enabled: Whether budgets are enforced (defaults to TOKEN_RATE_LIMIT_ENABLED)
+            **kwargs: clock, max_identifiers, sweep_interval, stripes (see _StripedWindows)
+        """
+        super().__init__(**kwargs)
+        self.per_minute = Config.TOKEN_RATE_LIMIT_PER_MINUTE if per_minute is None else per_minute
+        self.per_hour = Config.TOKEN_RATE_LIMIT_PER_HOUR if per_hour is None else per_hour
+        self.enabled = Config.TOKEN_RATE_LIMIT_ENABLED if enabled is None else enabled
+
+    def reserve(self, identifier: str, tokens: int) -> Tuple[Optional[TokenCharge], Optional[str]]:
+        """
+        Pre-charge a query's estimated tokens if the identifier has budget left
+
+        Args:
+            identifier: User identifier (session ID, IP, etc.)
+            tokens: Estimated tokens for the whole query
+
+        Returns:
+            (charge to settle later, None) if admitted, else (None, message)
+        """
+        stripe = self._stripe(identifier)
+        with stripe.lock:
+            now = self.clock()
+            window, changed = self._window_locked(stripe, identifier, now)
+            window.prune(now)
+
+            if window.minute_tokens >= self.per_minute:
+                exceeded, limit = MINUTE_WINDOW, self.per_minute
+            elif window.hour_tokens >= self.per_hour:
+                exceeded, limit = HOUR_WINDOW, self.per_hour
+            else:
+                exceeded = limit = None
+                charge = TokenCharge(identifier, now, tokens)
+                window.append(charge)
+
+        if changed:
+            self._tracked_changed()
+        if exceeded is None:
+            return charge, None
+
+        log_security_event(
+            logger,
+            f'token_limit_exceeded_{exceeded}',
+            f'Identifier: {identifier[:8]}...',
+            'WARNING'
+        )
+        return None, f"Usage limit exceeded. Maximum {limit} tokens per {exceeded}. Please try again later."
+
+    def settle(self, charge: Optional[TokenCharge], tokens: int) -> None:
+        """
+        Replace a charge's estimate with the tokens actually used
+
+        Args:
+            charge: Charge from reserve() (None is ignored)
+            tokens: Input plus output tokens the query used
+        """
+        if charge is None:
+            return
+        # The charge's own window, even if the identifier was evicted meanwhile
+        with self._stripe(charge.identifier).lock:
+            charge.window.adjust(charge, tokens)
+
+    def usage(self, identifier: str) -> Tuple[int, int]:
+        """Tokens charged to an identifier in the last (minute, hour)"""
+        stripe = self._stripe(identifier)
+        with stripe.lock:
+            window = stripe.requests.get(identifier)
+            if window is None:
+                return 0, 0
+            window.prune(self.clock())
+            return window.minute_tokens, window.hour_tokens
+
+
+def create_rate_limiter(backend: Optional[str] = None) -> BaseRateLimiter:
+    """
+    Build the limiter for the configured backend
+
+    Args:
+        backend: 'memory', 'sqlite' or 'redis' (defaults to RATE_LIMIT_BACKEND)
+
+    Returns:
+        Rate limiter; shared backends are imported only when selected
+
+    Raises:
+        ValueError: Unknown backend name
+    """
+    backend = (Config.RATE_LIMIT_BACKEND if backend is None else backend).lower()
+    if backend == 'memory':
+        return RateLimiter()
+    if backend == 'sqlite':
+        from .shared_rate_limit import SQLiteRateLimiter
+        return SQLiteRateLimiter(Config.RATE_LIMIT_SQLITE_PATH)
+    if backend == 'redis':
+        from .shared_rate_limit import RedisRateLimiter
+        return RedisRateLimiter(Config.RATE_LIMIT_REDIS_URL)
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {backend}")
+
+
+# Global rate limiter instance
+rate_limiter = create_rate_limiter()
+
+# Global per-session token budgets (only enforced when TOKEN_RATE_LIMIT_ENABLED)
+token_limiter = TokenRateLimiter()
@@ -0,0 +1,100 @@
+"""
+Per-request stage timings
+Collects how long each pipeline stage of one query took and how many LLM
+attempts it made, for the Server-Timing header, without threading a
+collector through every function
+"""
+
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+# Stages in the order they run (and appear in Server-Timing)
+STAGES = ('validate', 'rate_limit', 'retrieve', 'classify', 'generate', 'total')
+
+CACHE_HIT = 'hit'
+CACHE_MISS = 'miss'
+
+
+class RequestTimings:
+    """Stage durations, LLM attempts and cache status of one query"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages_ms: Dict[str, float] = {}
+        self.llm_attempts = 0
+        self.cache = CACHE_MISS
+
+    def add_stage(self, stage: str, seconds: float) -> None:
+        """Add time spent in `stage` (repeated stages add up)"""
+        with self._lock:
+            self.stages_ms[stage] = self.stages_ms.get(stage, 0.0) + seconds * 1000
+
+    def add_attempt(self) -> None:
+        with self._lock:
+            self.llm_attempts += 1
+
+    def server_timing(self) -> str:
+        """
+        Server-Timing header value, e.g.
+        'validate;dur=0.4, ..., total;dur=812.5, llm;desc="2 attempts", cache;desc="miss"'
+        """
+        with self._lock:
+            stages = dict(self.stages_ms)
+            attempts = self.llm_attempts
+        entries = [f"{stage};dur={stages[stage]:.1f}" for stage in STAGES if stage in stages]
+        entries.append(f'llm;desc="{attempts} attempt{"" if attempts == 1 else "s"}"')
+        entries.append(f'cache;desc="{self.cache}"')
+        return ', '.join(entries)
+
+    def as_dict(self) -> dict:
+        """Stage durations as '<stage>_ms' keys (None for stages that did not run)"""
+        with self._lock:
+            timings = {f"{stage}_ms": round(self.stages_ms[stage], 1) if stage in self.stages_ms else None
+                       for stage in STAGES}
+            timings['llm_attempts'] = self.llm_attempts
+        timings['cache'] = self.cache
+        return timings
+
+    def __repr__(self) -> str:
+        return f"RequestTimings({self.server_timing()})"
+
+
+# Timings of the query being handled; copied into tasks and to_thread() calls
+_current_timings: ContextVar[Optional[RequestTimings]] = ContextVar('request_timings', default=None)
+
+
+@contextmanager
+def timing() -> Iterator[RequestTimings]:
+    """
+    Collect stage timings for everything run inside the block
+
+    Yields:
+        RequestTimings filled in as stages finish
+    """
+    timings = RequestTimings()
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    """The current query's timings (None outside timing())"""
+    return _current_timings.get()
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """Add a stage duration to the current query (no-op outside timing())"""
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.add_stage(stage, seconds)
+
+
+def record_attempt() -> None:
+    """Count an LLM attempt for the current query (no-op outside timing())"""
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.add_attempt()
@@ -0,0 +1,262 @@
+"""
+Retry policy for Anthropic API calls
+Decorrelated-jitter backoff that honours Retry-After headers and fits every
+retry inside a per-request deadline budget, plus a process-wide retry budget
+that stops retry storms
+"""
+
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Optional
+
+import anthropic
+
+from .config import Config
+from .deadline import Deadline
+
+
+# Status codes worth retrying (request timeout, conflict, rate limit, server errors)
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Decide whether an error from client.messages.create() is worth retrying
+
+    Args:
+        error: Exception raised by the API call
+
+    Returns:
+        True if another attempt may succeed
+    """
+    if isinstance(error, (anthropic.APITimeoutError, anthropic.APIConnectionError)):
+        return True
+
+    if isinstance(error, anthropic.APIStatusError):
+        status_code = getattr(error, 'status_code', None)
+        if status_code is None:
+            return True
+        return status_code in RETRYABLE_STATUS_CODES or status_code >= 500
+
+    # Other SDK errors (e.g. malformed responses) keep the old retry behaviour;
+    # anything outside the SDK is a programming error and fails immediately
+    return isinstance(error, anthropic.APIError)
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """
+    Extract the server-requested wait from retry-after-ms / retry-after headers
+
+    Args:
+        error: Exception raised by the API call
+
+    Returns:
+        Seconds to wait, or None if the server did not say
+    """
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get('retry-after-ms')
+    if retry_after_ms:
+        try:
+            return max(0.0, float(retry_after_ms) / 1000)
+        except ValueError:
+            pass
+
+    retry_after = headers.get('retry-after')
+    if not retry_after:
+        return None
+
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+
+    # HTTP-date form
+    try:
+        retry_at = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class RetryBudget:
+    """
+    Process-wide retry budget (token bucket)
+
+    Every request deposits `ratio` tokens and the bucket also refills at
+    `min_per_second`; each retry spends one token. During an outage retries
+    are therefore capped at roughly ratio x request rate instead of
+    multiplying load by API_MAX_RETRIES.
+    """
+
+    def __init__(
+        self,
+        ratio: Optional[float] = None,
+        min_per_second: Optional[float] = None,
+        max_tokens: float = 10.0
+    ):
+        self.ratio = Config.RETRY_BUDGET_RATIO if ratio is None else ratio
+        self.min_per_second = Config.RETRY_BUDGET_MIN_PER_SECOND if min_per_second is None else min_per_second
+        self.max_tokens = max_tokens
+
+        self._lock = threading.Lock()
+        self._tokens = max_tokens
+        self._last_refill = time.monotonic()
+        self._denied = 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.max_tokens, self._tokens + (now - self._last_refill) * self.min_per_second)
+        self._last_refill = now
+
+    def record_request(self) -> None:
+        """Credit the budget for a new (first-attempt) request"""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        """
+        Withdraw one retry from the budget
+
+        Returns:
+            True if the retry may proceed
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            self._denied += 1
+            return False
+
+    def reset(self) -> None:
+        """Refill the budget completely"""
+        with self._lock:
+            self._tokens = self.max_tokens
+            self._last_refill = time.monotonic()
+            self._denied = 0
+
+    def snapshot(self) -> dict:
+        """Current balance and denied retries"""
+        with self._lock:
+            self._refill()
+            return {'tokens': round(self._tokens, 2), 'denied_retries': self._denied}
+
+
+# Global retry budget shared by every RetryPolicy that does not bring its own
+retry_budget = RetryBudget()
+
+
+class RetryState:
+    """Bookkeeping for one request's retries against its deadline"""
+
+    def __init__(self, policy: 'RetryPolicy', deadline: Optional[Deadline] = None):
+        self.policy = policy
+        self.started = time.monotonic()
+        self.expires_at = self.started + policy.deadline
+        if deadline is not None:
+            # The request's own deadline wins when it is sooner
+            self.expires_at = min(self.expires_at, deadline.expires_at)
+        self.attempt = 0
+        self._previous_delay = policy.base_delay
+
+    @property
+    def max_attempts(self) -> int:
+        return self.policy.max_retries + 1
+
+    def elapsed(self) -> float:
+        """Seconds since the request started"""
+        return time.monotonic() - self.started
+
+    def remaining(self) -> float:
+        """Seconds left in the deadline budget"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def attempt_timeout(self) -> float:
+        """Timeout for the next attempt: the configured timeout, shrunk to fit the budget"""
+        return max(0.001, min(float(Config.API_TIMEOUT), self.remaining()))
+
+    def next_delay(self, error: BaseException) -> Optional[float]:
+        """
+        Record a failed attempt and compute the wait before the next one
+
+        Args:
+            error: Exception raised by the attempt
+
+        Returns:
+            Seconds to sleep, or None if the request should give up
+        """
+        self.attempt += 1
+
+        if not is_retryable(error) or self.attempt >= self.max_attempts:
+            return None
+
+        # Decorrelated jitter: spread clients out instead of retrying in lockstep
+        delay = min(
+            self.policy.max_delay,
+            self.policy.rng.uniform(self.policy.base_delay, self._previous_delay * 3)
+        )
+        self._previous_delay = delay
+
+        # The server knows best when it will accept us again
+        server_delay = retry_after_seconds(error)
+        if server_delay is not None:
+            delay = server_delay
+
+        # Leave room for the next attempt to actually run
+        room = self.remaining() - self.policy.min_attempt_time
+        if room <= 0 or (server_delay is not None and server_delay > room):
+            return None
+
+        # Last check: the process-wide budget (prevents retry storms)
+        if not self.policy.budget.try_spend():
+            return None
+
+        return min(delay, room)
+
+
+class RetryPolicy:
+    """
+    Retry policy with decorrelated jitter and a total deadline
+
+    delay(n) = min(max_delay, uniform(base_delay, 3 * delay(n-1))), replaced by
+    the server's retry-after when present, and clipped so that the next
+    attempt still starts at least min_attempt_time before the deadline.
+    """
+
+    def __init__(
+        self,
+        max_retries: Optional[int] = None,
+        base_delay: Optional[float] = None,
+        max_delay: Optional[float] = None,
+        deadline: Optional[float] = None,
+        min_attempt_time: float = 0.5,
+        rng: Optional[random.Random] = None,
+        budget: Optional[RetryBudget] = None
+    ):
+        self.max_retries = Config.API_MAX_RETRIES if max_retries is None else max_retries
+        self.base_delay = Config.API_RETRY_BASE_DELAY if base_delay is None else base_delay
+        self.max_delay = Config.API_RETRY_MAX_DELAY if max_delay is None else max_delay
+        self.deadline = Config.API_REQUEST_DEADLINE if deadline is None else deadline
+        self.min_attempt_time = min_attempt_time
+        self.rng = rng or random.Random()
+        self.budget = budget or retry_budget
+
+    def start(self, deadline: Optional[Deadline] = None) -> RetryState:
+        """
+        Begin tracking a new request
+
+        Args:
+            deadline: Request deadline to stay within, if sooner than the policy's
+        """
+        self.budget.record_request()
+        return RetryState(self, deadline)
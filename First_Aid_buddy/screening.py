@@ -0,0 +1,299 @@
+"""
+Input screening rules
+Prompt-injection and markup patterns checked by validate_input(), loaded
+from a JSON data file, compiled once and reloaded when the file changes
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from .config import Config
+from .logger import setup_logger
+from .metrics import registry
+
+logger = setup_logger('screening')
+
+MATCHES = registry.counter(
+    'screening_matches_total', 'Inputs matched by each screening rule', ('rule',)
+)
+RULE_SECONDS = registry.counter(
+    'screening_rule_seconds_total', 'Time spent evaluating each screening rule', ('rule',)
+)
+SCREEN_SECONDS = registry.histogram(
+    'screening_seconds', 'Time to screen one input against all rules',
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005, 0.01)
+)
+RELOADS = registry.counter(
+    'screening_reloads_total', 'Screening rule file loads', ('outcome',)
+)
+
+LOG = 'log'
+REJECT = 'reject'
+
+# Words and single symbols; both the input and rule triggers are split this way
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+# Leading literal word of a pattern, used when a rule lists no triggers: it
+# must end at a word boundary (\s, \b, \W or a literal symbol) and not be
+# followed by a quantifier, group or alternation
+_LEADING_WORD = re.compile(r"^(?:\\b)?([a-z0-9]+)(?=\\[sbW]|[^\w\\*?{+(|\[.])", re.IGNORECASE)
+
+
+def _has_top_level_alternation(pattern: str) -> bool:
+    """Whether `pattern` has a | outside any group or character class"""
+    depth, in_class, escaped = 0, False, False
+    for char in pattern:
+        if escaped:
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif in_class:
+            in_class = char != ']'
+        elif char == '[':
+            in_class = True
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '|' and depth == 0:
+            return True
+    return False
+
+
+def derive_triggers(pattern: str) -> Optional[List[str]]:
+    """
+    Trigger token for a pattern that starts with a literal word
+
+    Args:
+        pattern: Rule regular expression
+
+    Returns:
+        [leading word] or None if the pattern does not start with a whole word
+    """
+    if _has_top_level_alternation(pattern):
+        return None
+    leading = _LEADING_WORD.match(pattern)
+    return [leading.group(1)] if leading else None
+
+
+# Used when the rule file is missing or invalid at startup
+DEFAULT_RULES = [
+    {'name': 'ignore_instructions', 'pattern': r'ignore\s+(previous|above|all)\s+instructions'},
+    {'name': 'system_prefix', 'pattern': r'system\s*:'},
+    {'name': 'role_override', 'pattern': r'you\s+are\s+now'},
+    {'name': 'new_instructions', 'pattern': r'new\s+instructions'},
+    {'name': 'script_tag', 'pattern': r'<\s*script', 'triggers': ['<']},
+    {'name': 'iframe_tag', 'pattern': r'<\s*iframe', 'triggers': ['<']},
+]
+
+
+class RuleError(ValueError):
+    """A screening rule or rule file is invalid"""
+
+
+class Rule:
+    """One compiled screening pattern"""
+
+    __slots__ = ('name', 'pattern', 'action', 'description', 'triggers', 'regex')
+
+    def __init__(
+        self,
+        name: str,
+        pattern: str,
+        action: str = LOG,
+        description: str = '',
+        triggers: Optional[Iterable[str]] = None
+    ):
+        """
+        Args:
+            name: Unique rule name (metric label and log text)
+            pattern: Regular expression, matched case-insensitively
+            action: LOG (record only) or REJECT (validate_input refuses the input)
+            description: Human-readable purpose
+            triggers: Tokens (words or single symbols) of which at least one
+                must appear as a whole token for the rule to fire; derived
+                from the pattern's first word if omitted. An empty list means
+                the rule is checked on every input.
+
+        Raises:
+            RuleError: Invalid pattern or action, or no trigger can be derived
+        """
+        if action not in (LOG, REJECT):
+            raise RuleError(f"Rule {name!r}: action must be {LOG!r} or {REJECT!r}")
+        try:
+            self.regex = re.compile(pattern, re.IGNORECASE)
+        except re.error as exc:
+            raise RuleError(f"Rule {name!r}: invalid pattern: {exc}") from exc
+
+        if triggers is None:
+            triggers = derive_triggers(pattern)
+            if triggers is None:
+                raise RuleError(f"Rule {name!r}: pattern does not start with a whole word; list its triggers")
+
+        self.name = name
+        self.pattern = pattern
+        self.action = action
+        self.description = description
+        self.triggers: FrozenSet[str] = frozenset(token.lower() for token in triggers)
+
+    def __repr__(self) -> str:
+        return f"Rule({self.name!r}, {self.pattern!r}, action={self.action!r})"
+
+
+class RuleSet:
+    """
+    Immutable set of compiled rules indexed by trigger token
+
+    Screening splits the input into tokens once, looks each distinct token
+    up in the index and runs only the rules it selects, so the cost follows
+    the input length and the number of rules that could match, not the
+    number of rules loaded.
+    """
+
+    def __init__(self, rules: List[Rule]):
+        names = [rule.name for rule in rules]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            raise RuleError(f"Duplicate rule names: {', '.join(duplicates)}")
+
+        self.rules = rules
+        self._order = {rule.name: i for i, rule in enumerate(rules)}
+        self._always = [rule for rule in rules if not rule.triggers]
+        self._index: Dict[str, List[Rule]] = {}
+        for rule in rules:
+            for token in rule.triggers:
+                self._index.setdefault(token, []).append(rule)
+
+    @classmethod
+    def from_dicts(cls, entries: Iterable[dict]) -> 'RuleSet':
+        """
+        Build from rule-file entries
+
+        Raises:
+            RuleError: Any entry is invalid
+        """
+        rules = []
+        for entry in entries:
+            try:
+                rules.append(Rule(
+                    entry['name'], entry['pattern'], entry.get('action', LOG),
+                    entry.get('description', ''), entry.get('triggers'),
+                ))
+            except (KeyError, TypeError) as exc:
+                raise RuleError(f"Malformed rule entry {entry!r}: {exc}") from exc
+        return cls(rules)
+
+    def candidates(self, text: str) -> List[Rule]:
+        """Rules whose triggers occur in `text`, in file order"""
+        selected = {}
+        for token in set(_TOKEN.findall(text.lower())):
+            for rule in self._index.get(token, ()):
+                selected[rule.name] = rule
+        for rule in self._always:
+            selected[rule.name] = rule
+        return sorted(selected.values(), key=lambda rule: self._order[rule.name])
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+
+class ScreeningEngine:
+    """
+    Screens inputs against a rule file, reloading it when it changes
+
+    The file's modification time is checked at most every
+    `reload_interval` seconds from screen() itself. A file that fails to
+    load is logged and the previous rules stay in force (the built-in
+    defaults if the very first load fails).
+    """
+
+    def __init__(self, path: Optional[str] = None, reload_interval: Optional[float] = None):
+        """
+        Args:
+            path: JSON rule file (defaults to SCREENING_RULES_PATH)
+            reload_interval: Seconds between change checks; 0 disables reloading
+                (defaults to SCREENING_RELOAD_SECONDS)
+        """
+        self.path = Config.SCREENING_RULES_PATH if path is None else path
+        self.reload_interval = Config.SCREENING_RELOAD_SECONDS if reload_interval is None else reload_interval
+        self._lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self._checked = time.monotonic()
+        self.rules = RuleSet.from_dicts(DEFAULT_RULES)
+        self.reload()
+
+    def _file_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return None
+
+    def reload(self) -> bool:
+        """
+        Load the rule file now
+
+        Returns:
+            True if new rules are in force, False if the file could not be used
+        """
+        with self._lock:
+            self._checked = time.monotonic()
+            mtime = self._file_mtime()
+            try:
+                with open(self.path, encoding='utf-8') as f:
+                    data = json.load(f)
+                rules = RuleSet.from_dicts(data['rules'] if isinstance(data, dict) else data)
+            except (OSError, ValueError, KeyError, TypeError) as exc:
+                # Remember the mtime so a broken file is not re-parsed every check
+                self._mtime = mtime
+                RELOADS.inc(outcome='error')
+                logger.error(f"Screening rules not loaded from {self.path}: {exc}; keeping {len(self.rules)} rule(s)")
+                return False
+
+            self.rules = rules
+            self._mtime = mtime
+            RELOADS.inc(outcome='ok')
+            logger.info(f"Loaded {len(rules)} screening rule(s) from {self.path}")
+            return True
+
+    def maybe_reload(self) -> None:
+        """Reload if the check interval has passed and the file changed"""
+        if self.reload_interval <= 0 or time.monotonic() - self._checked < self.reload_interval:
+            return
+        self._checked = time.monotonic()
+        if self._file_mtime() != self._mtime:
+            self.reload()
+
+    def screen(self, text: str) -> List[Rule]:
+        """
+        Find the rules an input matches
+
+        Args:
+            text: Input to screen
+
+        Returns:
+            Matched rules, in file order
+        """
+        self.maybe_reload()
+        started = time.perf_counter()
+        matched = []
+        timings: List[Tuple[str, float]] = []
+        for rule in self.rules.candidates(text):
+            rule_started = time.perf_counter()
+            if rule.regex.search(text):
+                matched.append(rule)
+            timings.append((rule.name, time.perf_counter() - rule_started))
+        SCREEN_SECONDS.observe(time.perf_counter() - started)
+
+        for name, seconds in timings:
+            RULE_SECONDS.inc(seconds, rule=name)
+        for rule in matched:
+            MATCHES.inc(rule=rule.name)
+        return matched
+
+
+# Global engine used by validate_input()
+screening_engine = ScreeningEngine()
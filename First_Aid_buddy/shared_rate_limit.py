@@ -0,0 +1,385 @@
+"""
+Shared rate limit stores
+Rate limiters whose state is shared by every worker process: SQLite (WAL)
+for several workers on one host, Redis for several hosts
+"""
+
+import itertools
+import os
+import socket
+import sqlite3
+import threading
+import time
+import weakref
+from contextlib import nullcontext
+from typing import List, Optional, Sequence
+from urllib.parse import unquote, urlparse
+
+from .config import Config
+from .logger import setup_logger
+from .rate_limiter import BaseRateLimiter, BackendError, MINUTE, HOUR, MINUTE_WINDOW, HOUR_WINDOW
+
+logger = setup_logger('shared_rate_limit')
+
+
+# ============================================================================
+# SQLITE (single host)
+# ============================================================================
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_limit_hits (
+    identifier TEXT NOT NULL,
+    ts REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rate_limit_hits_identifier_ts ON rate_limit_hits (identifier, ts);
+CREATE INDEX IF NOT EXISTS rate_limit_hits_ts ON rate_limit_hits (ts);
+"""
+
+# Check and record in one statement: the row is only inserted while both
+# windows have room, and a single statement is its own atomic transaction
+_INSERT_IF_ROOM = """
+INSERT INTO rate_limit_hits (identifier, ts)
+SELECT :identifier, :now
+WHERE (SELECT COUNT(*) FROM rate_limit_hits
+       WHERE identifier = :identifier AND ts > :minute_ago) < :per_minute
+  AND (SELECT COUNT(*) FROM rate_limit_hits
+       WHERE identifier = :identifier AND ts > :hour_ago) < :per_hour
+"""
+
+_COUNT_MINUTE = "SELECT COUNT(*) FROM rate_limit_hits WHERE identifier = ? AND ts > ?"
+
+
+class _ThreadConnection:
+    """A thread's connection; closed when the thread ends and this is collected"""
+
+    __slots__ = ('conn', '__weakref__')
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+
+class SQLiteRateLimiter(BaseRateLimiter):
+    """
+    Rate limiter stored in a SQLite database in WAL mode
+
+    Every worker on the host opens the same file. A check is one
+    conditional INSERT (count both windows, insert only if there is room),
+    which SQLite runs atomically under its write lock, so limits hold
+    exactly across processes and restarts. With WAL and synchronous=NORMAL
+    commits do not fsync, keeping a check in the tens of microseconds.
+
+    Each thread has its own connection, so threads of one worker contend
+    only on SQLite's own write lock (reads never block), not on a Python
+    lock around a shared connection. The exception is ':memory:', a private
+    per-connection database: it keeps one connection that threads take
+    turns on.
+
+    Rows older than an hour no longer count and are deleted in bulk every
+    `sweep_interval` seconds by whichever worker notices first.
+    """
+
+    backend = 'sqlite'
+
+    def __init__(
+        self,
+        path: str,
+        clock=time.time,
+        sweep_interval: Optional[float] = None,
+        busy_timeout: float = 5.0
+    ):
+        """
+        Args:
+            path: Database file (created if missing; ':memory:' for a private store)
+            clock: Wall-clock time source shared by all processes
+            sweep_interval: Seconds between deletes of expired rows (defaults to RATE_LIMIT_SWEEP_SECONDS)
+            busy_timeout: Seconds to wait for another process's write lock
+        """
+        self.path = path
+        self.clock = clock
+        self.sweep_interval = Config.RATE_LIMIT_SWEEP_SECONDS if sweep_interval is None else sweep_interval
+        self.busy_timeout = busy_timeout
+        self._shared = path == ':memory:'
+        self._lock = threading.Lock() if self._shared else nullcontext()
+        self._local = threading.local()
+        # Every open connection, so close() can reach other threads' ones
+        self._connections: 'weakref.WeakSet[_ThreadConnection]' = weakref.WeakSet()
+        self._shared_connection: Optional[_ThreadConnection] = None
+        self._last_sweep = clock()
+
+    def _connect(self) -> sqlite3.Connection:
+        holder = self._shared_connection if self._shared else getattr(self._local, 'connection', None)
+        if holder is None:
+            conn = sqlite3.connect(
+                self.path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False
+            )
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(_SCHEMA)
+            holder = _ThreadConnection(conn)
+            self._connections.add(holder)
+            if self._shared:
+                self._shared_connection = holder
+            else:
+                self._local.connection = holder
+        return holder.conn
+
+    def acquire(self, identifier: str) -> Optional[str]:
+        with self._lock:
+            try:
+                conn = self._connect()
+                now = self.clock()
+                if now - self._last_sweep >= self.sweep_interval:
+                    self._sweep(conn, now)
+
+                cursor = conn.execute(_INSERT_IF_ROOM, {
+                    'identifier': identifier,
+                    'now': now,
+                    'minute_ago': now - MINUTE,
+                    'hour_ago': now - HOUR,
+                    'per_minute': Config.RATE_LIMIT_PER_MINUTE,
+                    'per_hour': Config.RATE_LIMIT_PER_HOUR,
+                })
+                if cursor.rowcount == 1:
+                    return None
+
+                # Blocked: find out which window (rare path, read only)
+                minute_count = conn.execute(_COUNT_MINUTE, (identifier, now - MINUTE)).fetchone()[0]
+            except sqlite3.Error as exc:
+                raise BackendError(f"SQLite: {exc}") from exc
+
+        return MINUTE_WINDOW if minute_count >= Config.RATE_LIMIT_PER_MINUTE else HOUR_WINDOW
+
+    def _sweep(self, conn: sqlite3.Connection, now: float) -> None:
+        # Threads racing here both delete; the second finds nothing to do
+        self._last_sweep = now
+        removed = conn.execute("DELETE FROM rate_limit_hits WHERE ts <= ?", (now - HOUR,)).rowcount
+        if removed:
+            logger.debug(f"Rate limit store sweep: {removed} expired row(s) deleted")
+
+    def reset(self) -> None:
+        with self._lock:
+            try:
+                self._connect().execute("DELETE FROM rate_limit_hits")
+            except sqlite3.Error as exc:
+                raise BackendError(f"SQLite: {exc}") from exc
+
+    def close(self) -> None:
+        """Close every thread's connection (call at shutdown, not while checks are running)"""
+        with self._lock:
+            for holder in list(self._connections):
+                holder.conn.close()
+            self._connections = weakref.WeakSet()
+            self._local = threading.local()
+            self._shared_connection = None
+
+
+# ============================================================================
+# REDIS (several hosts)
+# ============================================================================
+
+class RedisReplyError(BackendError):
+    """Redis answered a command with an error reply"""
+
+
+class RedisConnection:
+    """
+    Minimal Redis (RESP2) client: one socket, pipelined commands
+
+    Only what the rate limiter needs, so Redis support adds no dependency.
+    Not thread-safe; RedisRateLimiter holds a lock around it. A failed
+    socket is dropped and reopened on the next call.
+    """
+
+    def __init__(self, url: str, timeout: float):
+        """
+        Args:
+            url: redis://[:password@]host[:port][/db]
+            timeout: Connect and read timeout in seconds
+
+        Raises:
+            ValueError: URL is not a redis:// URL
+        """
+        parsed = urlparse(url)
+        if parsed.scheme != 'redis':
+            raise ValueError(f"Unsupported Redis URL scheme: {parsed.scheme!r} (use redis://)")
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.timeout = timeout
+        self._sock: Optional[socket.socket] = None
+        self._reader = None
+
+    def _open(self) -> None:
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock = sock
+        self._reader = sock.makefile('rb')
+        setup: List[Sequence] = []
+        if self.password:
+            setup.append(('AUTH', self.password))
+        if self.db:
+            setup.append(('SELECT', self.db))
+        for reply in self._round_trip(setup) if setup else ():
+            if isinstance(reply, RedisReplyError):
+                raise reply
+
+    def close(self) -> None:
+        if self._sock is not None:
+            try:
+                self._reader.close()
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._reader = None
+
+    @staticmethod
+    def _encode(commands: Sequence[Sequence]) -> bytes:
+        out = []
+        for command in commands:
+            out.append(b'*%d\r\n' % len(command))
+            for arg in command:
+                data = arg if isinstance(arg, bytes) else str(arg).encode()
+                out.append(b'$%d\r\n%s\r\n' % (len(data), data))
+        return b''.join(out)
+
+    def _read_reply(self):
+        line = self._reader.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError("Redis closed the connection")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode()
+        if kind == b'-':
+            return RedisReplyError(payload.decode())
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2].decode()
+        if kind == b'*':
+            length = int(payload)
+            return None if length < 0 else [self._read_reply() for _ in range(length)]
+        raise BackendError(f"Redis: unexpected reply {line[:40]!r}")
+
+    def _round_trip(self, commands: Sequence[Sequence]) -> list:
+        self._sock.sendall(self._encode(commands))
+        return [self._read_reply() for _ in commands]
+
+    def execute(self, *commands: Sequence) -> list:
+        """
+        Send commands in one round trip
+
+        Args:
+            *commands: Each a sequence of command name and arguments
+
+        Returns:
+            One reply per command (error replies as RedisReplyError instances)
+
+        Raises:
+            BackendError: Connection or protocol failure
+        """
+        try:
+            if self._sock is None:
+                self._open()
+            return self._round_trip(commands)
+        except (OSError, ValueError, BackendError) as exc:
+            self.close()
+            if isinstance(exc, BackendError):
+                raise
+            raise BackendError(f"Redis {self.host}:{self.port}: {exc}") from exc
+
+
+class RedisRateLimiter(BaseRateLimiter):
+    """
+    Rate limiter stored in Redis sorted sets (one per identifier)
+
+    A check is one pipelined MULTI/EXEC round trip: drop entries older than
+    an hour, add this request, count both windows and refresh the key's
+    expiry. If a window is over its limit the request is removed again. The
+    transaction is atomic, so concurrent workers never admit more than the
+    limit; a request racing a blocked one may be refused while the blocked
+    entry is briefly present.
+
+    Keys expire an hour after their last request, so idle identifiers clean
+    themselves up.
+    """
+
+    backend = 'redis'
+
+    def __init__(
+        self,
+        url: str,
+        clock=time.time,
+        timeout: Optional[float] = None,
+        prefix: str = 'first_aid_buddy:rate:'
+    ):
+        """
+        Args:
+            url: redis://[:password@]host[:port][/db]
+            clock: Wall-clock time source shared by all hosts
+            timeout: Socket timeout in seconds (defaults to RATE_LIMIT_REDIS_TIMEOUT)
+            prefix: Key prefix for this application's entries
+        """
+        self.clock = clock
+        self.prefix = prefix
+        timeout = Config.RATE_LIMIT_REDIS_TIMEOUT if timeout is None else timeout
+        self._lock = threading.Lock()
+        self._conn = RedisConnection(url, timeout)
+        # Unique sorted-set members across hosts, processes and limiters
+        self._member_prefix = f"{os.urandom(6).hex()}:"
+        self._sequence = itertools.count()
+
+    def _execute(self, *commands: Sequence) -> list:
+        with self._lock:
+            replies = self._conn.execute(*commands)
+        for reply in replies:
+            if isinstance(reply, RedisReplyError):
+                raise reply
+        return replies
+
+    def acquire(self, identifier: str) -> Optional[str]:
+        key = self.prefix + identifier
+        now = self.clock()
+        member = f"{self._member_prefix}{next(self._sequence)}"
+
+        replies = self._execute(
+            ('MULTI',),
+            ('ZREMRANGEBYSCORE', key, '-inf', repr(now - HOUR)),
+            ('ZADD', key, repr(now), member),
+            ('ZCOUNT', key, f'({now - MINUTE!r}', '+inf'),
+            ('ZCARD', key),
+            ('PEXPIRE', key, int(HOUR * 1000)),
+            ('EXEC',),
+        )
+        results = replies[-1]
+        if not isinstance(results, list):
+            raise BackendError("Redis: transaction aborted")
+        for result in results:
+            if isinstance(result, RedisReplyError):
+                raise result
+        minute_count, hour_count = results[2], results[3]
+
+        if minute_count > Config.RATE_LIMIT_PER_MINUTE:
+            exceeded = MINUTE_WINDOW
+        elif hour_count > Config.RATE_LIMIT_PER_HOUR:
+            exceeded = HOUR_WINDOW
+        else:
+            return None
+
+        self._execute(('ZREM', key, member))
+        return exceeded
+
+    def reset(self) -> None:
+        """Delete this application's keys (KEYS scan: for tests and admin use)"""
+        keys = self._execute(('KEYS', self.prefix + '*'))[0]
+        if keys:
+            self._execute(('DEL', *keys))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
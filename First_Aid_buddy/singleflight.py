@@ -0,0 +1,154 @@
+"""
+Single-flight request coalescing
+Concurrent callers asking for the same key share one in-flight execution
+instead of each running it (e.g. many users asking the same question
+during an incident)
+"""
+
+import asyncio
+import re
+import threading
+from typing import Any, Awaitable, Callable, Dict, Tuple, TypeVar
+
+from .metrics import registry
+
+T = TypeVar('T')
+
+LEADERS = registry.counter(
+    'singleflight_executions_total', 'Executions actually run', ('flight',)
+)
+SHARED = registry.counter(
+    'singleflight_shared_total', 'Callers served by another caller\'s execution', ('flight',)
+)
+WAITERS = registry.gauge(
+    'singleflight_waiters', 'Callers currently waiting on an in-flight execution', ('flight',)
+)
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """
+    Normalize a query for coalescing: case, punctuation and spacing are ignored
+
+    Args:
+        text: User query
+
+    Returns:
+        Normalized key
+    """
+    text = _PUNCTUATION.sub(' ', text.lower())
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+class _Call:
+    """One in-flight execution shared by its waiters"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key
+
+    The first caller (the leader) runs the work; callers arriving while it is
+    in flight wait for and share its result or exception. Nothing is cached
+    once the execution finishes.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._async_calls: Dict[Tuple[int, str], asyncio.Future] = {}
+
+    def do(self, key: str, fn: Callable[[], T]) -> Tuple[T, bool]:
+        """
+        Run fn() once for all concurrent callers with this key
+
+        Args:
+            key: Coalescing key
+            fn: Work to run
+
+        Returns:
+            Tuple of (result, shared) where shared is True for waiters
+
+        Raises:
+            Whatever fn() raised, re-raised in every waiter
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            WAITERS.inc(flight=self.name)
+            SHARED.inc(flight=self.name)
+            try:
+                call.event.wait()
+            finally:
+                WAITERS.dec(flight=self.name)
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        LEADERS.inc(flight=self.name)
+        try:
+            call.result = fn()
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    async def do_async(self, key: str, fn: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """
+        Async variant of do()
+
+        The work runs in its own task, so a leader that is cancelled (e.g.
+        client disconnected) does not cancel it for the waiters.
+
+        Args:
+            key: Coalescing key
+            fn: Zero-argument callable returning the awaitable to run
+
+        Returns:
+            Tuple of (result, shared) where shared is True for waiters
+        """
+        loop_key = (id(asyncio.get_running_loop()), key)
+
+        with self._lock:
+            future = self._async_calls.get(loop_key)
+            leader = future is None
+            if leader:
+                future = asyncio.ensure_future(fn())
+                self._async_calls[loop_key] = future
+                future.add_done_callback(lambda _: self._forget(loop_key))
+
+        if leader:
+            LEADERS.inc(flight=self.name)
+            return await asyncio.shield(future), False
+
+        WAITERS.inc(flight=self.name)
+        SHARED.inc(flight=self.name)
+        try:
+            return await asyncio.shield(future), True
+        finally:
+            WAITERS.dec(flight=self.name)
+
+    def _forget(self, loop_key: Tuple[int, str]) -> None:
+        with self._lock:
+            self._async_calls.pop(loop_key, None)
+
+    def in_flight(self) -> int:
+        """Number of keys currently executing"""
+        with self._lock:
+            return len(self._calls) + len(self._async_calls)
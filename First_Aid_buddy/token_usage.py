@@ -0,0 +1,378 @@
+"""
+Per-request token usage and process-wide usage accounting
+Adds up response.usage from every Anthropic call made while handling one
+user query, without threading a collector through every function, and
+keeps bounded running totals by stage, model and (hashed) session
+"""
+
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from .config import Config
+from .logger import session_hash
+from .metrics import registry
+
+
+class TokenCounts(NamedTuple):
+    """Token counts of one response"""
+    input_tokens: int
+    output_tokens: int
+    cache_creation_input_tokens: int = 0
+    cache_read_input_tokens: int = 0
+
+    @property
+    def total(self) -> int:
+        return self.input_tokens + self.output_tokens + self.cache_creation_input_tokens + self.cache_read_input_tokens
+
+
+def token_counts(usage) -> Optional[TokenCounts]:
+    """
+    Read the token counts from a response.usage
+
+    Cache fields are None when prompt caching was not involved and count as 0.
+
+    Returns:
+        TokenCounts, or None if usage is missing or malformed
+    """
+    try:
+        input_tokens = int(usage.input_tokens)
+        output_tokens = int(usage.output_tokens)
+    except (AttributeError, TypeError, ValueError):
+        return None
+    cache_creation = getattr(usage, 'cache_creation_input_tokens', None)
+    cache_read = getattr(usage, 'cache_read_input_tokens', None)
+    return TokenCounts(
+        input_tokens,
+        output_tokens,
+        cache_creation if isinstance(cache_creation, int) else 0,
+        cache_read if isinstance(cache_read, int) else 0,
+    )
+
+
+class UsageMeter:
+    """Tokens used by one query (all calls, all retries that returned)"""
+
+    def __init__(self, session: Optional[str] = None):
+        """
+        Args:
+            session: Hashed session the query belongs to (see logger.session_hash)
+        """
+        self._lock = threading.Lock()
+        self.session = session
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cache_creation_input_tokens = 0
+        self.cache_read_input_tokens = 0
+        self.calls = 0
+
+    def add(self, usage) -> None:
+        """
+        Add one response's usage
+
+        Args:
+            usage: response.usage (input_tokens/output_tokens and the optional
+                cache counts); ignored if malformed
+        """
+        counts = usage if isinstance(usage, TokenCounts) else token_counts(usage)
+        if counts is None:
+            return
+        with self._lock:
+            self.input_tokens += counts.input_tokens
+            self.output_tokens += counts.output_tokens
+            self.cache_creation_input_tokens += counts.cache_creation_input_tokens
+            self.cache_read_input_tokens += counts.cache_read_input_tokens
+            self.calls += 1
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    def __repr__(self) -> str:
+        return f"UsageMeter(input={self.input_tokens}, output={self.output_tokens}, calls={self.calls})"
+
+
+# ============================================================================
+# Cost
+# ============================================================================
+
+# USD per million (input, output) tokens, by model id prefix (longest match
+# wins). Cache writes cost 1.25x and cache reads 0.1x the input price.
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    'claude-opus-4': (15.0, 75.0),
+    'claude-opus-4-5': (5.0, 25.0),
+    'claude-sonnet-4': (3.0, 15.0),
+    'claude-3-7-sonnet': (3.0, 15.0),
+    'claude-3-5-sonnet': (3.0, 15.0),
+    'claude-haiku-4-5': (1.0, 5.0),
+    'claude-3-5-haiku': (0.8, 4.0),
+    'claude-3-haiku': (0.25, 1.25),
+}
+CACHE_WRITE_MULTIPLIER = 1.25
+CACHE_READ_MULTIPLIER = 0.1
+
+
+def estimate_cost(model: Optional[str], counts: TokenCounts) -> Optional[float]:
+    """
+    List-price cost of one response in USD
+
+    Returns:
+        The cost, or None for a model without a known price
+    """
+    if not model:
+        return None
+    prefix = max((p for p in MODEL_PRICES if model.startswith(p)), key=len, default=None)
+    if prefix is None:
+        return None
+    input_price, output_price = MODEL_PRICES[prefix]
+    return (
+        counts.input_tokens * input_price
+        + counts.cache_creation_input_tokens * input_price * CACHE_WRITE_MULTIPLIER
+        + counts.cache_read_input_tokens * input_price * CACHE_READ_MULTIPLIER
+        + counts.output_tokens * output_price
+    ) / 1_000_000
+
+
+# ============================================================================
+# Usage ledger
+# ============================================================================
+
+# Breakdown key that absorbs new (operation, model) pairs once the ledger is full
+OTHER = 'other'
+
+
+class UsageTotals:
+    """Running token, cost and latency totals of a group of calls"""
+
+    __slots__ = ('calls', 'input_tokens', 'output_tokens', 'cache_creation_input_tokens',
+                 'cache_read_input_tokens', 'cost_usd', 'seconds')
+
+    def __init__(self):
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cache_creation_input_tokens = 0
+        self.cache_read_input_tokens = 0
+        self.cost_usd = 0.0
+        self.seconds = 0.0
+
+    def add(self, counts: TokenCounts, cost: Optional[float], seconds: float) -> None:
+        self.calls += 1
+        self.input_tokens += counts.input_tokens
+        self.output_tokens += counts.output_tokens
+        self.cache_creation_input_tokens += counts.cache_creation_input_tokens
+        self.cache_read_input_tokens += counts.cache_read_input_tokens
+        self.cost_usd += cost or 0.0
+        self.seconds += seconds
+
+    @property
+    def total_tokens(self) -> int:
+        return (self.input_tokens + self.output_tokens
+                + self.cache_creation_input_tokens + self.cache_read_input_tokens)
+
+    def as_dict(self) -> dict:
+        """Totals plus per-call averages (prompt size next to latency)"""
+        calls = self.calls or 1
+        return {
+            'calls': self.calls,
+            'input_tokens': self.input_tokens,
+            'output_tokens': self.output_tokens,
+            'cache_creation_input_tokens': self.cache_creation_input_tokens,
+            'cache_read_input_tokens': self.cache_read_input_tokens,
+            'cost_usd': round(self.cost_usd, 6),
+            'avg_prompt_tokens': round(
+                (self.input_tokens + self.cache_creation_input_tokens + self.cache_read_input_tokens) / calls, 1
+            ),
+            'avg_output_tokens': round(self.output_tokens / calls, 1),
+            'avg_latency_ms': round(self.seconds * 1000 / calls, 1),
+        }
+
+
+class UsageLedger:
+    """
+    In-memory usage totals by (operation, model) and by hashed session
+
+    Memory is bounded: the (operation, model) breakdown holds at most
+    max_breakdowns entries (later pairs are folded into 'other'), and only
+    the max_sessions most recently active sessions are kept.
+    """
+
+    def __init__(self, max_sessions: int = 1000, max_breakdowns: int = 100):
+        """
+        Args:
+            max_sessions: Sessions tracked before the least recently active is dropped
+            max_breakdowns: Distinct (operation, model) pairs tracked
+        """
+        self.max_sessions = max_sessions
+        self.max_breakdowns = max_breakdowns
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._total = UsageTotals()
+            self._by_stage: Dict[Tuple[str, str], UsageTotals] = {}
+            self._by_session: 'OrderedDict[str, UsageTotals]' = OrderedDict()
+            self.sessions_evicted = 0
+            self.unpriced_calls = 0
+
+    def record(
+        self,
+        operation: str,
+        model: Optional[str],
+        counts: TokenCounts,
+        seconds: float,
+        session: Optional[str] = None
+    ) -> Optional[float]:
+        """
+        Add one call
+
+        Args:
+            operation: Pipeline stage that made the call (e.g. "generate_answer")
+            model: Model id the call was sent to
+            counts: The response's token counts
+            seconds: Duration of the successful attempt
+            session: Hashed session id (None for calls outside a session)
+
+        Returns:
+            The call's estimated cost in USD (None if the model has no price)
+        """
+        cost = estimate_cost(model, counts)
+        key = (operation, model or OTHER)
+        with self._lock:
+            if cost is None:
+                self.unpriced_calls += 1
+            self._total.add(counts, cost, seconds)
+
+            stage = self._by_stage.get(key)
+            if stage is None:
+                if len(self._by_stage) >= self.max_breakdowns:
+                    key = (OTHER, OTHER)
+                stage = self._by_stage.setdefault(key, UsageTotals())
+            stage.add(counts, cost, seconds)
+
+            if session is not None:
+                totals = self._by_session.get(session)
+                if totals is None:
+                    totals = self._by_session[session] = UsageTotals()
+                    if len(self._by_session) > self.max_sessions:
+                        self._by_session.popitem(last=False)
+                        self.sessions_evicted += 1
+                else:
+                    self._by_session.move_to_end(session)
+                totals.add(counts, cost, seconds)
+        return cost
+
+    def report(self, top_sessions: int = 20) -> dict:
+        """
+        Snapshot of the totals for the admin endpoint
+
+        Args:
+            top_sessions: How many of the heaviest sessions (by tokens) to list
+
+        Returns:
+            Dict with overall totals, the (operation, model) breakdown sorted by
+            prompt tokens, and the top sessions
+        """
+        with self._lock:
+            stages: List[dict] = [
+                {'operation': operation, 'model': model, **totals.as_dict()}
+                for (operation, model), totals in self._by_stage.items()
+            ]
+            heaviest = sorted(self._by_session.items(), key=lambda item: item[1].total_tokens, reverse=True)
+            sessions = [{'session': session, **totals.as_dict()} for session, totals in heaviest[:top_sessions]]
+            report = {
+                'totals': self._total.as_dict(),
+                'by_stage': sorted(stages, key=lambda s: s['input_tokens'] + s['cache_creation_input_tokens']
+                                   + s['cache_read_input_tokens'], reverse=True),
+                'top_sessions': sessions,
+                'sessions_tracked': len(self._by_session),
+                'sessions_evicted': self.sessions_evicted,
+                'unpriced_calls': self.unpriced_calls,
+            }
+        return report
+
+
+# Global ledger fed by every Anthropic call
+usage_ledger = UsageLedger(max_sessions=Config.USAGE_MAX_SESSIONS)
+
+TOKENS = registry.counter(
+    'llm_tokens_total', 'Tokens used by Anthropic calls', ('operation', 'model', 'kind')
+)
+COST = registry.counter(
+    'llm_cost_usd_total', 'Estimated list-price cost of Anthropic calls in USD', ('operation', 'model')
+)
+PROMPT_TOKENS = registry.histogram(
+    'llm_prompt_tokens', 'Prompt tokens (input plus cached) per Anthropic call', ('operation',),
+    buckets=(250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+)
+
+
+# ============================================================================
+# Per-query collection
+# ============================================================================
+
+# Meter of the query being handled; copied into tasks and to_thread() calls
+_current_meter: ContextVar[Optional[UsageMeter]] = ContextVar('usage_meter', default=None)
+
+
+@contextmanager
+def metering(session_id: Optional[str] = None) -> Iterator[UsageMeter]:
+    """
+    Collect the usage of every API call made inside the block
+
+    Args:
+        session_id: Session the query belongs to (accounted as a hash)
+
+    Yields:
+        UsageMeter filled in as responses arrive
+    """
+    meter = UsageMeter(session_hash(session_id))
+    token = _current_meter.set(meter)
+    try:
+        yield meter
+    finally:
+        _current_meter.reset(token)
+
+
+def record_usage(
+    usage,
+    operation: Optional[str] = None,
+    model: Optional[str] = None,
+    seconds: float = 0.0
+) -> None:
+    """
+    Account a response's usage
+
+    Always adds to the current query's meter (if inside metering()). With an
+    operation and USAGE_ACCOUNTING_ENABLED, also adds to the global ledger
+    and the token/cost metrics.
+
+    Args:
+        usage: response.usage (ignored if missing or malformed)
+        operation: Pipeline stage that made the call
+        model: Model id the call was sent to
+        seconds: Duration of the successful attempt
+    """
+    counts = token_counts(usage) if usage is not None else None
+    if counts is None:
+        return
+    meter = _current_meter.get()
+    if meter is not None:
+        meter.add(counts)
+
+    if operation is None or not Config.USAGE_ACCOUNTING_ENABLED:
+        return
+    cost = usage_ledger.record(operation, model, counts, seconds, meter.session if meter is not None else None)
+    model_label = model or OTHER
+    for kind, tokens in zip(TokenCounts._fields, counts):
+        if tokens:
+            TOKENS.inc(tokens, operation=operation, model=model_label, kind=kind.replace('_tokens', ''))
+    if cost:
+        COST.inc(cost, operation=operation, model=model_label)
+    PROMPT_TOKENS.observe(
+        counts.input_tokens + counts.cache_creation_input_tokens + counts.cache_read_input_tokens,
+        operation=operation
+    )
@@ -0,0 +1,286 @@
+"""
+Request tracing
+OpenTelemetry-style spans (trace id, span id, parent, attributes, status)
+with W3C traceparent propagation and local exporters, so traces can be
+inspected without a collector service
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
+
+from .config import Config
+
+
+class SpanContext(NamedTuple):
+    """Identity of a span, as carried in a traceparent header"""
+    trace_id: str
+    span_id: str
+    sampled: bool = True
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[SpanContext]:
+    """
+    Parse a W3C traceparent header ("00-<trace id>-<parent id>-<flags>")
+
+    Returns:
+        The remote parent, or None if the header is missing or malformed
+    """
+    if not isinstance(header, str):
+        return None
+    parts = header.strip().lower().split('-')
+    if len(parts) < 4 or len(parts[0]) != 2 or parts[0] == 'ff':
+        return None
+    trace_id, span_id, flags = parts[1], parts[2], parts[3]
+    try:
+        if len(trace_id) != 32 or len(span_id) != 16 or len(flags) != 2:
+            return None
+        sampled = bool(int(flags, 16) & 0x01)
+        if int(trace_id, 16) == 0 or int(span_id, 16) == 0:
+            return None
+    except ValueError:
+        return None
+    return SpanContext(trace_id, span_id, sampled)
+
+
+class Span:
+    """One timed operation in a trace"""
+
+    __slots__ = ('name', 'context', 'parent_id', 'attributes', 'status', 'start_ns', 'end_ns', '_exporter')
+
+    def __init__(self, name: str, context: SpanContext, parent_id: Optional[str], exporter, attributes=None):
+        self.name = name
+        self.context = context
+        self.parent_id = parent_id
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.status = 'OK'
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self._exporter = exporter
+
+    @property
+    def recording(self) -> bool:
+        return True
+
+    @property
+    def traceparent(self) -> str:
+        """Header value that makes a downstream service continue this trace"""
+        return f"00-{self.context.trace_id}-{self.context.span_id}-01"
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]) -> None:
+        self.attributes.update(attributes)
+
+    def record_error(self, error: BaseException) -> None:
+        """Mark the span failed with the exception's type and message"""
+        self.status = 'ERROR'
+        self.attributes['exception.type'] = type(error).__name__
+        self.attributes['exception.message'] = str(error)
+        status_code = getattr(error, 'status_code', None)
+        if isinstance(status_code, int):
+            self.attributes['http.status_code'] = status_code
+
+    def end(self) -> None:
+        """Stop the clock and export (only the first call counts)"""
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        self._exporter.export(self)
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        return None if self.end_ns is None else (self.end_ns - self.start_ns) / 1e6
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'trace_id': self.context.trace_id,
+            'span_id': self.context.span_id,
+            'parent_id': self.parent_id,
+            'start_ns': self.start_ns,
+            'end_ns': self.end_ns,
+            'duration_ms': self.duration_ms,
+            'status': self.status,
+            'attributes': self.attributes,
+        }
+
+
+class _NonRecordingSpan:
+    """Stands in for spans while tracing is off or the trace is not sampled"""
+
+    __slots__ = ('context',)
+
+    recording = False
+    traceparent = None
+    parent_id = None
+    attributes: Dict[str, Any] = {}
+
+    def __init__(self, context: Optional[SpanContext] = None):
+        self.context = context
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_attributes(self, attributes: Dict[str, Any]) -> None:
+        pass
+
+    def record_error(self, error: BaseException) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+
+NON_RECORDING_SPAN = _NonRecordingSpan()
+
+
+# ============================================================================
+# Exporters
+# ============================================================================
+
+class InMemoryExporter:
+    """Keeps the most recent finished spans (for tests and debugging)"""
+
+    def __init__(self, max_spans: int = 1000):
+        self._lock = threading.Lock()
+        self._spans = deque(maxlen=max_spans)
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            self._spans.append(span)
+
+    def spans(self, trace_id: Optional[str] = None) -> List[Span]:
+        """Finished spans in end order, optionally of one trace"""
+        with self._lock:
+            spans = list(self._spans)
+        if trace_id is None:
+            return spans
+        return [span for span in spans if span.context.trace_id == trace_id]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._spans.clear()
+
+
+class FileExporter:
+    """Appends finished spans to a file, one JSON object per line"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), separators=(',', ':'), default=str)
+        with self._lock:
+            try:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(line + '\n')
+            except OSError:
+                # Losing a span must never fail the request
+                pass
+
+
+# ============================================================================
+# Tracer
+# ============================================================================
+
+_current: ContextVar[Optional[Any]] = ContextVar('current_span', default=None)
+
+
+def current_span():
+    """The active span in this context (NON_RECORDING_SPAN if none)"""
+    return _current.get() or NON_RECORDING_SPAN
+
+
+class Tracer:
+    """
+    Creates spans and tracks the active one per context
+
+    The active span lives in a ContextVar, so it follows asyncio tasks and
+    children are parented without passing spans around. Disabled tracing
+    and unsampled incoming traces cost one non-recording object per span.
+    """
+
+    def __init__(self, exporter=None, enabled: bool = True):
+        """
+        Args:
+            exporter: Receives finished spans (defaults to an InMemoryExporter)
+            enabled: False makes every span non-recording
+        """
+        self.exporter = exporter if exporter is not None else InMemoryExporter()
+        self.enabled = enabled
+
+    def start_span(
+        self,
+        name: str,
+        attributes: Optional[Dict[str, Any]] = None,
+        parent: Optional[SpanContext] = None
+    ):
+        """
+        Start a span without making it active (call end() on it)
+
+        Args:
+            name: Operation name
+            attributes: Initial attributes
+            parent: Remote parent (from parse_traceparent); defaults to the
+                active span, or a new trace if there is none
+        """
+        if not self.enabled:
+            return NON_RECORDING_SPAN
+        if parent is None:
+            active = _current.get()
+            if active is not None:
+                if not active.recording:
+                    return active
+                parent = active.context
+        elif not parent.sampled:
+            return _NonRecordingSpan(parent)
+
+        span_id = os.urandom(8).hex()
+        if parent is None:
+            context = SpanContext(os.urandom(16).hex(), span_id)
+            parent_id = None
+        else:
+            context = SpanContext(parent.trace_id, span_id)
+            parent_id = parent.span_id
+        return Span(name, context, parent_id, self.exporter, attributes)
+
+    @contextmanager
+    def span(
+        self,
+        name: str,
+        attributes: Optional[Dict[str, Any]] = None,
+        parent: Optional[SpanContext] = None
+    ) -> Iterator[Any]:
+        """
+        Run the enclosed block in a new active span (see start_span())
+
+        An exception leaving the block marks the span failed and propagates.
+        """
+        span = self.start_span(name, attributes, parent)
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as exc:
+            span.record_error(exc)
+            raise
+        finally:
+            _current.reset(token)
+            span.end()
+
+
+def _exporter_from_config():
+    if Config.TRACING_EXPORTER == 'file':
+        return FileExporter(Config.TRACING_FILE)
+    return InMemoryExporter(Config.TRACING_MEMORY_SPANS)
+
+
+# Global tracer used by the router, pipeline and LLM call layer
+tracer = Tracer(_exporter_from_config(), enabled=Config.TRACING_ENABLED)
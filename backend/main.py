@@ -19,9 +19,12 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from First_Aid_buddy.config import Config
-from First_Aid_buddy.logger import setup_logger
+from First_Aid_buddy.logger import setup_logger, start_log_listener, stop_log_listener
+from First_Aid_buddy.client_factory import warm_up_async, pool_stats, close_shared_clients
+from First_Aid_buddy.rate_limiter import rate_limiter
+from First_Aid_buddy.admission import admission
 from backend.services.pipeline import get_client
-from backend.routers import chat, health, rag
+from backend.routers import admin, chat, health, metrics, rag
 
 logger = setup_logger("main")
 
@@ -33,8 +36,12 @@ logger = setup_logger("main")
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
+    if Config.LOG_ASYNC:
+        start_log_listener()
     logger.info("Starting First-Aid Buddy API …")
     logger.info(f"Config: {Config.get_summary()}")
+    logger.info(f"Rate limit store: {rate_limiter.backend}")
+    logger.info(f"Admission control: {admission.snapshot()}")
 
     if not Config.ANTHROPIC_API_KEY:
         logger.warning(
@@ -51,9 +58,24 @@ async def lifespan(app: FastAPI):
             logger.warning(f"Could not initialise Anthropic client: {exc}. /chat will return 503 until the key is fixed.")
             app.state.anthropic_client = None
 
+    if Config.ENABLE_METRICS and metrics.exporter is not None:
+        metrics.exporter.start()
+        logger.info(f"Sharing metrics across workers via {metrics.exporter.directory}")
+
+    # Open pooled connections up front so the first users skip TCP/TLS setup
+    if app.state.anthropic_client is not None and Config.HTTP_WARMUP_CONNECTIONS > 0:
+        await warm_up_async(app.state.anthropic_client, Config.HTTP_WARMUP_CONNECTIONS)
+
     yield
     # Shutdown
+    logger.info(f"Anthropic connection pool: {pool_stats()}")
+    await close_shared_clients()
+    rate_limiter.close()
+    if metrics.exporter is not None:
+        metrics.exporter.stop()
     logger.info("Shutting down First-Aid Buddy API.")
+    # Write out queued log records before the worker exits
+    stop_log_listener()
 
 
 # ---------------------------------------------------------------------------
@@ -98,6 +120,8 @@ app.add_middleware(
 app.include_router(health.router)
 app.include_router(chat.router)
 app.include_router(rag.router)
+app.include_router(metrics.router)
+app.include_router(admin.router)
 
 
 # ---------------------------------------------------------------------------
@@ -10,6 +10,7 @@ class ChatRequest(BaseModel):
     message: str = Field(..., min_length=3, max_length=500, description="User's first-aid question")
     session_id: Optional[str] = Field(None, description="Browser session ID for rate limiting / history")
     region: Optional[str] = Field("UK", description="Region code used to surface correct emergency numbers")
+    include_timings: bool = Field(False, description="Return a per-stage timing breakdown in the response body")
 
 
 class Citation(BaseModel):
@@ -17,6 +18,17 @@ class Citation(BaseModel):
     snippet: str = Field(..., description="Relevant excerpt shown beneath the answer")
 
 
+class StageTimings(BaseModel):
+    validate_ms: Optional[float] = Field(None, description="Input validation and screening")
+    rate_limit_ms: Optional[float] = Field(None, description="Rate limit check")
+    retrieve_ms: Optional[float] = Field(None, description="Knowledge-base retrieval")
+    classify_ms: Optional[float] = Field(None, description="Triage classification (LLM or local fallback)")
+    generate_ms: Optional[float] = Field(None, description="Answer generation")
+    total_ms: Optional[float] = Field(None, description="Whole pipeline")
+    llm_attempts: int = Field(0, description="Anthropic API attempts made for this request, retries included")
+    cache: str = Field("miss", description="'hit' when the answer was shared with an identical in-flight query")
+
+
 class ChatResponse(BaseModel):
     answer: str = Field(..., description="Generated first-aid advice")
     is_emergency: bool = Field(..., description="True when the query was classified LIFE_THREATENING")
@@ -24,6 +36,8 @@ class ChatResponse(BaseModel):
     citations: List[Citation] = Field(default_factory=list, description="Source documents used")
     session_id: Optional[str] = Field(None, description="Echo of the session_id for the client to store")
     processing_ms: Optional[float] = Field(None, description="End-to-end processing time in milliseconds")
+    degraded: bool = Field(False, description="True when the AI service was unavailable and the answer is quoted from the knowledge base")
+    timings: Optional[StageTimings] = Field(None, description="Per-stage breakdown, when include_timings was requested")
 
 
 class HealthResponse(BaseModel):
@@ -1,2 +1,2 @@
 """FastAPI routers package."""
-from . import chat, health, rag
+from . import admin, chat, health, metrics, rag
@@ -0,0 +1,42 @@
+"""
+Admin router – GET /admin/usage
+Token usage and estimated cost of this worker's Anthropic calls by stage,
+model and hashed session, for finding prompts that grew (and slowed down).
+Disabled unless ADMIN_TOKEN is set; callers send it in X-Admin-Token.
+"""
+
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query, status
+
+import sys, os
+_project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if _project_root not in sys.path:
+    sys.path.insert(0, _project_root)
+
+from First_Aid_buddy.config import Config
+from First_Aid_buddy.token_usage import usage_ledger
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+
+def _require_admin(token: Optional[str]) -> None:
+    """404 while admin endpoints are disabled, 403 for a missing or wrong token"""
+    if not Config.ADMIN_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found.")
+    if not token or not hmac.compare_digest(token.encode(), Config.ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid admin token.")
+
+
+@router.get("/usage")
+async def usage(
+    top: int = Query(20, ge=0, le=1000, description="Heaviest sessions to list"),
+    x_admin_token: Optional[str] = Header(default=None),
+):
+    """Returns usage totals, the per-stage/model breakdown and the top sessions by tokens."""
+    _require_admin(x_admin_token)
+    return {
+        'accounting_enabled': Config.USAGE_ACCOUNTING_ENABLED,
+        **usage_ledger.report(top_sessions=top),
+    }
@@ -5,9 +5,10 @@ and returns a structured response with emergency flag and citations.
 """
 
 import uuid
-from fastapi import APIRouter, HTTPException, Request, status
+from typing import Dict, Optional
+from fastapi import APIRouter, HTTPException, Request, Response, status
 
-from ..models.chat import ChatRequest, ChatResponse, Citation
+from ..models.chat import ChatRequest, ChatResponse, Citation, StageTimings
 from ..services.pipeline import run_chat_pipeline
 
 import sys, os
@@ -16,13 +17,27 @@ if _project_root not in sys.path:
     sys.path.insert(0, _project_root)
 
 from First_Aid_buddy.config import Config
-from First_Aid_buddy.core import ValidationError, APIError
+from First_Aid_buddy.core import ValidationError, APIError, DeadlineExceededError
+from First_Aid_buddy.admission import OverloadedError
+from First_Aid_buddy.deadline import Deadline
+from First_Aid_buddy.metrics import registry
+from First_Aid_buddy.tracing import parse_traceparent, tracer
+from First_Aid_buddy.request_timing import RequestTimings, timing
 
 router = APIRouter(tags=["chat"])
 
+IN_FLIGHT = registry.gauge("chat_requests_in_flight", "/chat requests currently being handled")
+
+
+def _timing_headers(timings: RequestTimings, headers: Optional[Dict[str, str]] = None) -> Optional[Dict[str, str]]:
+    """`headers` plus Server-Timing (when enabled)"""
+    if not Config.SERVER_TIMING_ENABLED:
+        return headers
+    return {**(headers or {}), "Server-Timing": timings.server_timing()}
+
 
 @router.post("/chat", response_model=ChatResponse)
-async def chat(payload: ChatRequest, request: Request):
+async def chat(payload: ChatRequest, request: Request, response: Response):
     """
     Process a first-aid question through the full RAG + LLM pipeline.
 
@@ -30,7 +45,16 @@ async def chat(payload: ChatRequest, request: Request):
     - Classifies intent (LIFE_THREATENING vs GENERAL_QUERY).
     - Retrieves relevant knowledge-base documents.
     - Generates a structured answer with citations.
+    - Falls back to retrieval-only answers while the AI service is unavailable.
+    - Bounds the whole request by REQUEST_DEADLINE; every stage sizes its work
+      from the time left.
+    - Sheds general queries with 503 + Retry-After when the server is busy;
+      likely emergencies are admitted first.
+    - Reports per-stage durations, LLM attempts and cache status in a
+      Server-Timing header (and in the body when include_timings is set).
     """
+    deadline = Deadline(Config.REQUEST_DEADLINE)
+
     # Retrieve the shared Anthropic client initialized at startup
     client = request.app.state.anthropic_client
     if client is None:
@@ -42,22 +66,49 @@ async def chat(payload: ChatRequest, request: Request):
     # Use provided session_id or derive from IP (anonymous sessions)
     session_id = payload.session_id or str(request.client.host)
 
-    try:
-        answer, is_emergency, raw_citations, processing_ms = run_chat_pipeline(
-            user_input=payload.message,
-            client=client,
-            session_id=session_id,
-        )
-    except ValidationError as exc:
-        raise HTTPException(
-            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-            detail=str(exc),
-        )
-    except APIError as exc:
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail=f"AI service error: {str(exc)}",
-        )
+    IN_FLIGHT.inc()
+    # Root span; continues the caller's trace when a traceparent header is sent
+    with timing() as timings, tracer.span(
+        "POST /chat",
+        {"http.method": "POST", "http.route": "/chat"},
+        parent=parse_traceparent(request.headers.get("traceparent")),
+    ):
+        try:
+            answer, is_emergency, raw_citations, processing_ms, degraded = await run_chat_pipeline(
+                user_input=payload.message,
+                client=client,
+                session_id=session_id,
+                deadline=deadline,
+            )
+        except ValidationError as exc:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=str(exc),
+                headers=_timing_headers(timings),
+            )
+        except OverloadedError as exc:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=str(exc),
+                headers=_timing_headers(timings, {"Retry-After": str(exc.retry_after)}),
+            )
+        except DeadlineExceededError as exc:
+            raise HTTPException(
+                status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+                detail=f"Request timed out: {str(exc)}",
+                headers=_timing_headers(timings),
+            )
+        except APIError as exc:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"AI service error: {str(exc)}",
+                headers=_timing_headers(timings),
+            )
+        finally:
+            IN_FLIGHT.dec()
+
+    if Config.SERVER_TIMING_ENABLED:
+        response.headers["Server-Timing"] = timings.server_timing()
 
     citations = [Citation(title=c["title"], snippet=c["snippet"]) for c in raw_citations]
 
@@ -68,4 +119,6 @@ async def chat(payload: ChatRequest, request: Request):
         citations=citations,
         session_id=payload.session_id,
         processing_ms=round(processing_ms, 1),
+        degraded=degraded,
+        timings=StageTimings(**timings.as_dict()) if payload.include_timings else None,
     )
@@ -21,5 +21,5 @@ async def health_check():
         environment=Config.ENVIRONMENT,
         region=Config.REGION,
         api_key_configured=bool(Config.ANTHROPIC_API_KEY),
-        model=Config.CLAUDE_MODEL,
+        model=Config.CLAUDE_MODEL_ANSWER,
     )
@@ -0,0 +1,36 @@
+"""
+Metrics router – GET /metrics
+Prometheus text exposition of every registered metric. With
+METRICS_MULTIPROC_DIR set, each uvicorn worker shares its values through
+that directory and any worker's scrape returns the totals for all of them.
+"""
+
+from fastapi import APIRouter, HTTPException, status
+from fastapi.responses import PlainTextResponse
+
+import sys, os
+_project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if _project_root not in sys.path:
+    sys.path.insert(0, _project_root)
+
+from First_Aid_buddy.config import Config
+from First_Aid_buddy.metrics import MultiprocessExporter, registry, render, snapshot
+
+router = APIRouter(tags=["metrics"])
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Started and stopped by the app lifespan; None in single-process mode
+exporter = (
+    MultiprocessExporter(Config.METRICS_MULTIPROC_DIR, registry, interval=Config.METRICS_FLUSH_SECONDS)
+    if Config.METRICS_MULTIPROC_DIR else None
+)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Returns all metrics in the Prometheus text format (404 unless ENABLE_METRICS)."""
+    if not Config.ENABLE_METRICS:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Metrics are disabled.")
+    values = exporter.collect() if exporter is not None else snapshot(registry)
+    return PlainTextResponse(render(values), media_type=CONTENT_TYPE)
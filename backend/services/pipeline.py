@@ -3,10 +3,12 @@ Pipeline service: wraps First_Aid_buddy/core.py for the FastAPI layer.
 Adds structured citation extraction on top of the existing RAG pipeline.
 """
 
+import asyncio
 import sys
 import os
 import time
-from typing import List, Optional, Tuple
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
 
 # ---------------------------------------------------------------------------
 # Path setup – backend/ lives next to First_Aid_buddy/, so we add the
@@ -21,19 +23,60 @@ from First_Aid_buddy.core import (
     FIRST_AID_KNOWLEDGE_BASE,
     Config,
     APIError,
+    CircuitOpenError,
+    DeadlineExceededError,
+    ThrottledError,
     ValidationError,
     RateLimiter,
     initialize_client,
     validate_input,
-    classify_intent,
+    classify_intent_async,
     run_retrieval,
-    generate_final_answer,
+    generate_final_answer_async,
+    build_degraded_answer,
+    check_deadline,
+    classify_without_model,
+    classify_intent_locally,
     rate_limiter,
+    query_flight,
+    query_flight_key,
+    token_budget,
 )
+from First_Aid_buddy.admission import admission, OverloadedError
+from First_Aid_buddy.deadline import Deadline
+from First_Aid_buddy.governor import NORMAL, EMERGENCY
+from First_Aid_buddy.client_factory import get_shared_async_client
 from First_Aid_buddy.logger import setup_logger, log_user_query
+from First_Aid_buddy.metrics import registry
+from First_Aid_buddy.tracing import current_span, tracer
+from First_Aid_buddy.request_timing import CACHE_HIT, current_timings, record_stage
 
 logger = setup_logger("pipeline")
 
+STAGE_SECONDS = registry.histogram(
+    'chat_stage_seconds', 'Time spent in each chat pipeline stage (total: whole completed request)', ('stage',),
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+CLASSIFICATIONS = registry.counter(
+    'chat_classifications_total', 'Answered queries by triage classification', ('classification', 'degraded')
+)
+
+
+@contextmanager
+def _stage(name: str) -> Iterator[None]:
+    """
+    Time the enclosed block into chat_stage_seconds, a span and the
+    request's Server-Timing (also when it raises)
+    """
+    started = time.perf_counter()
+    try:
+        with tracer.span(f"pipeline.{name}"):
+            yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        record_stage(name, elapsed)
+
 
 # ---------------------------------------------------------------------------
 # Citation extraction
@@ -68,51 +111,161 @@ def _extract_citations(retrieved_docs_str: str) -> List[dict]:
 # Public API used by the routers
 # ---------------------------------------------------------------------------
 
-def get_client(api_key: str) -> anthropic.Anthropic:
-    """Create and return a validated Anthropic client."""
-    return initialize_client(api_key)
+def get_client(api_key: str) -> anthropic.AsyncAnthropic:
+    """
+    Validate the key and return the shared, pooled AsyncAnthropic client.
 
+    The async client lets the pipeline await API calls directly instead of
+    parking a thread per in-flight request.
+    """
+    initialize_client(api_key)  # key format validation
+    return get_shared_async_client(api_key)
+
+
+async def _answer_query(
+    sanitized: str,
+    retrieved_docs_str: str,
+    client,
+    deadline: Deadline,
+) -> Tuple[str, bool, str, bool]:
+    """
+    Run classification + generation under admission control.
+
+    Local triage decides the queue priority, so likely emergencies are
+    admitted ahead of general questions. A general query that cannot get a
+    slot in time raises OverloadedError (503 + Retry-After); an emergency
+    that cannot is answered from the knowledge base instead.
+
+    Returns:
+        (answer, is_emergency, classification, degraded)
 
-def run_chat_pipeline(
+    Raises:
+        OverloadedError – general query shed by admission control
+    """
+    likely_emergency = classify_intent_locally(sanitized) == "LIFE_THREATENING"
+    priority = EMERGENCY if likely_emergency else NORMAL
+    try:
+        async with admission.admit(priority, max_wait=deadline.remaining()):
+            return await _generate_answer(sanitized, retrieved_docs_str, client, deadline)
+    except OverloadedError:
+        if priority != EMERGENCY:
+            raise
+        answer, is_emergency = build_degraded_answer(sanitized, True)
+        return answer, is_emergency, "LIFE_THREATENING", True
+
+
+async def _generate_answer(
+    sanitized: str,
+    retrieved_docs_str: str,
+    client,
+    deadline: Deadline,
+) -> Tuple[str, bool, str, bool]:
+    """
+    Classify and generate via the async LLM path.
+
+    Triage that runs out of time (or is shed by the outbound rate governor)
+    falls back to local rules; generation that cannot fit in the remaining
+    time or is shed is skipped for a knowledge-base answer.
+
+    Returns:
+        (answer, is_emergency, classification, degraded)
+    """
+    is_emergency = None
+    try:
+        with _stage("classify"):
+            try:
+                classification = await classify_intent_async(sanitized, client, deadline)
+            except (DeadlineExceededError, ThrottledError):
+                classification = classify_without_model(sanitized)
+        is_emergency = classification == "LIFE_THREATENING"
+        with _stage("generate"):
+            answer = await generate_final_answer_async(sanitized, retrieved_docs_str, is_emergency, client, deadline)
+        return answer, is_emergency, classification, False
+    except (CircuitOpenError, DeadlineExceededError, ThrottledError):
+        answer, is_emergency = build_degraded_answer(sanitized, is_emergency)
+        classification = "LIFE_THREATENING" if is_emergency else "GENERAL_QUERY"
+        return answer, is_emergency, classification, True
+
+
+async def run_chat_pipeline(
     user_input: str,
     client: anthropic.Anthropic,
     session_id: Optional[str] = None,
-) -> Tuple[str, bool, List[dict], float]:
+    deadline: Optional[Deadline] = None,
+) -> Tuple[str, bool, List[dict], float, bool]:
     """
     Run the full chat pipeline, returning structured output for the API.
 
+    LLM calls go through the async retry path, so retry backoff yields the
+    event loop instead of blocking a worker. Identical concurrent questions
+    share one classification + generation, which holds one admission slot
+    for all of them (likely emergencies first). While the circuit breaker is
+    open the answer degrades to the top knowledge-base entries verbatim.
+
+    Every stage works against one request deadline (created by the router):
+    LLM timeouts and max_tokens are sized from the time left, and stages that
+    can no longer finish are skipped. Coalesced callers wait on an execution
+    that started earlier, so they never wait past their own deadline.
+
     Returns:
-        (answer, is_emergency, citations, processing_ms)
+        (answer, is_emergency, citations, processing_ms, degraded)
 
     Raises:
-        ValidationError – bad input / rate-limited
-        APIError        – Anthropic call failed
+        ValidationError       – bad input / rate-limited
+        DeadlineExceededError – deadline passed before any work started
+        OverloadedError       – shed by admission control (server busy)
+        APIError              – Anthropic call failed
     """
     start = time.time()
+    deadline = deadline or Deadline()
 
     # 1. Validate & sanitise
-    sanitized = validate_input(user_input)
+    check_deadline(deadline, "validate_input")
+    with _stage("validate"):
+        sanitized = validate_input(user_input)
 
     # 2. Rate-limit check
     if session_id:
-        allowed, msg = rate_limiter.check_rate_limit(session_id)
+        with _stage("rate_limit"):
+            if rate_limiter.backend == 'memory':
+                allowed, msg = rate_limiter.check_rate_limit(session_id)
+            else:
+                # Shared stores do blocking I/O; keep it off the event loop
+                allowed, msg = await asyncio.to_thread(rate_limiter.check_rate_limit, session_id)
         if not allowed:
             raise ValidationError(msg)
 
-    # 3. Classify intent
-    classification = classify_intent(sanitized, client)
-    is_emergency = classification == "LIFE_THREATENING"
-
-    # 4. Retrieve relevant docs
-    retrieved_docs_str = run_retrieval(sanitized)
+    # 3. Retrieve relevant docs (local, so citations survive an API outage)
+    with _stage("retrieve"):
+        retrieved_docs_str = run_retrieval(sanitized)
 
-    # 5. Extract citations (structured, for the JSON response)
+    # 4. Extract citations (structured, for the JSON response)
     citations = _extract_citations(retrieved_docs_str)
 
-    # 6. Generate answer
-    answer = generate_final_answer(sanitized, retrieved_docs_str, is_emergency, client)
+    # 5-6. Classify intent and generate answer (coalesced, charged to the token budget)
+    with token_budget(session_id, sanitized):
+        if Config.SINGLE_FLIGHT_ENABLED:
+            (answer, is_emergency, classification, degraded), shared = await query_flight.do_async(
+                query_flight_key(sanitized, client),
+                lambda: _answer_query(sanitized, retrieved_docs_str, client, deadline),
+            )
+            # A shared answer's classify/generate spans and timings belong to the caller that ran them
+            current_span().set_attribute("pipeline.coalesced", shared)
+            if shared and current_timings() is not None:
+                current_timings().cache = CACHE_HIT
+        else:
+            answer, is_emergency, classification, degraded = await _answer_query(
+                sanitized, retrieved_docs_str, client, deadline
+            )
 
     processing_ms = (time.time() - start) * 1000
-    log_user_query(logger, len(sanitized), classification, processing_ms)
+    STAGE_SECONDS.observe(processing_ms / 1000, stage="total")
+    record_stage("total", processing_ms / 1000)
+    current_span().set_attributes({
+        "pipeline.classification": classification,
+        "pipeline.degraded": degraded,
+    })
+    CLASSIFICATIONS.inc(classification=classification, degraded=str(degraded).lower())
+    log_user_query(logger, len(sanitized), classification, processing_ms, session_id)
 
-    return answer, is_emergency, citations, processing_ms
+    return answer, is_emergency, citations, processing_ms, degraded
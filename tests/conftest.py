@@ -82,6 +82,40 @@ def reset_config():
 
 @pytest.fixture(autouse=True)
 def reset_rate_limiter():
-    """Reset rate limiter between tests"""
-    from First_Aid_buddy.core import rate_limiter
-    rate_limiter.requests.clear()
+    """Reset rate limiter, token budgets and usage accounting between tests"""
+    from First_Aid_buddy.core import rate_limiter, token_limiter
+    from First_Aid_buddy.token_usage import usage_ledger
+    rate_limiter.reset()
+    token_limiter.reset()
+    usage_ledger.reset()
+
+
+@pytest.fixture(autouse=True)
+def reset_resilience():
+    """Reset circuit breaker, retry budget, model routing, governor and admission between tests"""
+    from First_Aid_buddy.core import circuit_breaker
+    from First_Aid_buddy.retry import retry_budget
+    from First_Aid_buddy.model_router import model_router
+    from First_Aid_buddy.governor import governor
+    from First_Aid_buddy.admission import admission
+    circuit_breaker.reset()
+    retry_budget.reset()
+    model_router.reset()
+    governor.reset()
+    admission.reset()
+
+
+@pytest.fixture
+def fake_anthropic():
+    """Local fake Anthropic Messages API (see tests/fake_anthropic_server.py)"""
+    from tests.fake_anthropic_server import FakeAnthropicServer
+    with FakeAnthropicServer() as server:
+        yield server
+
+
+@pytest.fixture
+def fake_redis():
+    """Local Redis stand-in (see tests/fake_redis_server.py)"""
+    from tests.fake_redis_server import FakeRedisServer
+    with FakeRedisServer() as server:
+        yield server
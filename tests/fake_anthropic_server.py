@@ -0,0 +1,474 @@
+"""
+Local stand-in for the Anthropic Messages API
+Serves POST /v1/messages (plain JSON and SSE streaming) with configurable
+latency, token rates and fault injection, so retries, hedging, pooling and
+throughput can be exercised over real HTTP without the live API.
+
+As a pytest fixture (see conftest.py):
+
+    def test_something(fake_anthropic):
+        fake_anthropic.configure(rate_429=0.2)
+        client = get_shared_client(key, base_url=fake_anthropic.base_url)
+
+As a CLI:
+
+    python -m tests.fake_anthropic_server --port 8765 --latency lognormal:0.3,0.5
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8765 uvicorn backend.main:app
+"""
+
+import argparse
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Deque, Dict, Optional
+
+# Mirrors the keywords the triage prompt is expected to escalate
+_EMERGENCY_WORDS = re.compile(
+    r"not breathing|breath|chok|unconscious|unresponsive|collapsed|heart attack|cardiac"
+    r"|chest pain|severe(?:ly)? bleed|bleeding heavily|anaphyla|seizure|stroke|overdose"
+    r"|poison|drown|electrocut|suicid",
+    re.IGNORECASE
+)
+
+_ERRORS = {
+    429: ('rate_limit_error', 'Number of request tokens has exceeded your per-minute rate limit'),
+    500: ('api_error', 'Internal server error'),
+    529: ('overloaded_error', 'Overloaded'),
+}
+
+
+# ============================================================================
+# LATENCY MODEL
+# ============================================================================
+
+class LatencyDistribution:
+    """
+    Time-to-first-token distribution parsed from a spec string
+
+    Specs: 'fixed:S', 'uniform:LOW,HIGH', 'normal:MEAN,STDDEV',
+    'lognormal:MEDIAN,SIGMA', 'exponential:MEAN' (all in seconds).
+    """
+
+    def __init__(self, spec: str = 'fixed:0'):
+        self.spec = spec
+        kind, _, args = spec.partition(':')
+        self.kind = kind
+        self.args = [float(a) for a in args.split(',') if a]
+        expected = {'fixed': 1, 'uniform': 2, 'normal': 2, 'lognormal': 2, 'exponential': 1}
+        if kind not in expected or len(self.args) != expected[kind]:
+            raise ValueError(f"Invalid latency spec: {spec!r}")
+
+    def sample(self, rng: random.Random) -> float:
+        a = self.args
+        if self.kind == 'fixed':
+            value = a[0]
+        elif self.kind == 'uniform':
+            value = rng.uniform(a[0], a[1])
+        elif self.kind == 'normal':
+            value = rng.gauss(a[0], a[1])
+        elif self.kind == 'lognormal':
+            value = rng.lognormvariate(math.log(a[0]), a[1])
+        else:
+            value = rng.expovariate(1 / a[0])
+        return max(0.0, value)
+
+    def __repr__(self) -> str:
+        return f"LatencyDistribution({self.spec!r})"
+
+
+@dataclass
+class FakeServerConfig:
+    """Behaviour of the fake server (can be changed while it runs)"""
+
+    latency: LatencyDistribution = field(default_factory=LatencyDistribution)
+    # Fraction of requests that take slow_latency instead (a heavy tail)
+    slow_fraction: float = 0.0
+    slow_latency: float = 5.0
+    # Output speed once the first token is out (0 = instant)
+    tokens_per_second: float = 0.0
+    # Fault injection rates (checked in this order)
+    rate_429: float = 0.0
+    rate_529: float = 0.0
+    rate_timeout: float = 0.0
+    retry_after: Optional[float] = 1.0
+    # How long an injected timeout stalls before dropping the connection
+    stall_seconds: float = 30.0
+    seed: Optional[int] = 0
+
+
+# ============================================================================
+# CANNED OUTPUTS
+# ============================================================================
+
+def _text_of(content) -> str:
+    if isinstance(content, str):
+        return content
+    return ' '.join(block.get('text', '') for block in content if isinstance(block, dict))
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def canned_reply(body: dict) -> str:
+    """
+    Deterministic reply for a Messages API request body
+
+    Triage requests (recognised by their system prompt) get a category name;
+    everything else gets a short, numbered first-aid style answer.
+    """
+    system = _text_of(body.get('system', ''))
+    user = ' '.join(_text_of(m.get('content', '')) for m in body.get('messages', []) if m.get('role') == 'user')
+
+    if 'Triage Classification' in system:
+        query = user.rsplit('`', 2)[-2] if user.count('`') >= 2 else user
+        return 'LIFE_THREATENING' if _EMERGENCY_WORDS.search(query) else 'GENERAL_QUERY'
+
+    steps = [
+        "Stay calm and make sure the area is safe.",
+        "Follow the steps in the retrieved first-aid guidance.",
+        "Keep the person comfortable and monitor them.",
+        "Get medical help if symptoms get worse.",
+    ]
+    return ' '.join(f"{i}. {step}" for i, step in enumerate(steps, 1))
+
+
+def _split_tokens(text: str, max_tokens: int):
+    """Words stand in for tokens; returns (chunks, stop_reason)"""
+    words = re.findall(r'\S+\s*', text)
+    if len(words) > max_tokens:
+        return words[:max_tokens], 'max_tokens'
+    return words, 'end_turn'
+
+
+# ============================================================================
+# SERVER
+# ============================================================================
+
+class FakeServerStats:
+    """Request counters for assertions and benchmarks"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.outcomes: Dict[str, int] = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.connections = 0
+
+    def begin(self) -> None:
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def end(self, outcome: str) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+
+    def connection_opened(self) -> None:
+        with self._lock:
+            self.connections += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'outcomes': dict(self.outcomes),
+                'in_flight': self.in_flight,
+                'max_in_flight': self.max_in_flight,
+                'connections': self.connections,
+            }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: '_Server'
+
+    def setup(self) -> None:
+        super().setup()
+        self.server.fake.stats.connection_opened()
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = 'application/json', headers=None) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('request-id', f"req_fake_{self.server.fake.next_id()}")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self) -> None:
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self) -> None:
+        self._send(200, json.dumps(self.server.fake.stats.snapshot()).encode())
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length)
+        if self.path.split('?')[0] != '/v1/messages':
+            self._send(404, b'{"type":"error","error":{"type":"not_found_error","message":"Not found"}}')
+            return
+
+        fake = self.server.fake
+        fake.stats.begin()
+        outcome = 'error'
+        try:
+            body = json.loads(raw or b'{}')
+            outcome = fake.handle(self, body)
+        finally:
+            fake.stats.end(outcome)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    fake: 'FakeAnthropicServer'
+
+
+class FakeAnthropicServer:
+    """
+    Messages API stand-in on a local port
+
+    Faults can be injected at random rates (configure()) or scripted for the
+    next N requests (fail_next()); canned replies are deterministic.
+    """
+
+    def __init__(self, config: Optional[FakeServerConfig] = None, host: str = '127.0.0.1', port: int = 0):
+        self.config = config or FakeServerConfig()
+        self.stats = FakeServerStats()
+        self._lock = threading.Lock()
+        self._rng = random.Random(self.config.seed)
+        self._scripted: Deque[int] = deque()
+        self._ids = itertools.count(1)
+        self._stopping = threading.Event()
+        self._httpd = _Server((host, port), _Handler)
+        self._httpd.fake = self
+        self._thread: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------
+    # Control
+    # ------------------------------------------------------------------
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'FakeAnthropicServer':
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True, name='fake-anthropic'
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopping.set()
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> 'FakeAnthropicServer':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def configure(self, **changes) -> None:
+        """Change behaviour on the fly (latency may be given as a spec string)"""
+        with self._lock:
+            if isinstance(changes.get('latency'), str):
+                changes['latency'] = LatencyDistribution(changes['latency'])
+            for name, value in changes.items():
+                if not hasattr(self.config, name):
+                    raise AttributeError(f"Unknown fake server setting: {name}")
+                setattr(self.config, name, value)
+            if 'seed' in changes:
+                self._rng.seed(changes['seed'])
+
+    def fail_next(self, status: int, count: int = 1) -> None:
+        """
+        Script the next `count` requests to fail
+
+        Args:
+            status: 429, 500 or 529 for an error response, or 0 for a stalled
+                request (client-side timeout)
+            count: Number of requests affected
+        """
+        with self._lock:
+            self._scripted.extend([status] * count)
+
+    def next_id(self) -> int:
+        return next(self._ids)
+
+    # ------------------------------------------------------------------
+    # Request handling
+    # ------------------------------------------------------------------
+
+    def _decide(self):
+        """Pick this request's fault (if any) and latency under the lock"""
+        with self._lock:
+            cfg = self.config
+            if self._scripted:
+                fault = self._scripted.popleft()
+            else:
+                roll = self._rng.random()
+                if roll < cfg.rate_429:
+                    fault = 429
+                elif roll < cfg.rate_429 + cfg.rate_529:
+                    fault = 529
+                elif roll < cfg.rate_429 + cfg.rate_529 + cfg.rate_timeout:
+                    fault = 0
+                else:
+                    fault = None
+            if self._rng.random() < cfg.slow_fraction:
+                latency = cfg.slow_latency
+            else:
+                latency = cfg.latency.sample(self._rng)
+            return fault, latency, cfg.tokens_per_second, cfg.retry_after, cfg.stall_seconds
+
+    def _sleep(self, seconds: float) -> bool:
+        """Sleep unless the server is stopping; False if interrupted"""
+        return not self._stopping.wait(seconds) if seconds > 0 else True
+
+    def handle(self, handler: _Handler, body: dict) -> str:
+        fault, latency, tokens_per_second, retry_after, stall = self._decide()
+
+        if fault == 0:
+            # Hold the request until the client gives up, then drop it
+            self._sleep(stall)
+            handler.close_connection = True
+            return 'timeout'
+
+        if fault is not None:
+            error_type, message = _ERRORS.get(fault, _ERRORS[500])
+            headers = {}
+            if fault == 429 and retry_after is not None:
+                headers['retry-after'] = str(retry_after)
+            payload = {'type': 'error', 'error': {'type': error_type, 'message': message}}
+            self._sleep(min(latency, 0.05))
+            handler._send(fault, json.dumps(payload).encode(), headers=headers)
+            return str(fault)
+
+        if not self._sleep(latency):
+            return 'aborted'
+
+        text = canned_reply(body)
+        chunks, stop_reason = _split_tokens(text, int(body.get('max_tokens', 1024)))
+        message_id = f"msg_fake_{self.next_id():06d}"
+        model = body.get('model', 'fake-model')
+        input_tokens = _estimate_tokens(_text_of(body.get('system', '')) + json.dumps(body.get('messages', [])))
+        delay = 1 / tokens_per_second if tokens_per_second > 0 else 0
+
+        if body.get('stream'):
+            self._stream(handler, message_id, model, chunks, stop_reason, input_tokens, delay)
+            return 'stream'
+
+        self._sleep(delay * len(chunks))
+        message = {
+            'id': message_id,
+            'type': 'message',
+            'role': 'assistant',
+            'model': model,
+            'content': [{'type': 'text', 'text': ''.join(chunks).rstrip()}],
+            'stop_reason': stop_reason,
+            'stop_sequence': None,
+            'usage': {'input_tokens': input_tokens, 'output_tokens': len(chunks)},
+        }
+        handler._send(200, json.dumps(message).encode())
+        return 'ok'
+
+    def _stream(self, handler, message_id, model, chunks, stop_reason, input_tokens, delay) -> None:
+        """Server-sent events in the Messages streaming format (chunked body)"""
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'text/event-stream')
+        handler.send_header('Cache-Control', 'no-cache')
+        handler.send_header('Transfer-Encoding', 'chunked')
+        handler.end_headers()
+
+        def event(name: str, data: dict) -> None:
+            payload = f"event: {name}\ndata: {json.dumps(data)}\n\n".encode()
+            handler.wfile.write(f"{len(payload):x}\r\n".encode() + payload + b"\r\n")
+            handler.wfile.flush()
+
+        event('message_start', {'type': 'message_start', 'message': {
+            'id': message_id, 'type': 'message', 'role': 'assistant', 'model': model, 'content': [],
+            'stop_reason': None, 'stop_sequence': None,
+            'usage': {'input_tokens': input_tokens, 'output_tokens': 0},
+        }})
+        event('content_block_start', {'type': 'content_block_start', 'index': 0,
+                                      'content_block': {'type': 'text', 'text': ''}})
+        event('ping', {'type': 'ping'})
+        for chunk in chunks:
+            if not self._sleep(delay):
+                break
+            event('content_block_delta', {'type': 'content_block_delta', 'index': 0,
+                                          'delta': {'type': 'text_delta', 'text': chunk}})
+        event('content_block_stop', {'type': 'content_block_stop', 'index': 0})
+        event('message_delta', {'type': 'message_delta',
+                                'delta': {'stop_reason': stop_reason, 'stop_sequence': None},
+                                'usage': {'output_tokens': len(chunks)}})
+        event('message_stop', {'type': 'message_stop'})
+        handler.wfile.write(b"0\r\n\r\n")
+        handler.wfile.flush()
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Local fake Anthropic Messages API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', default='fixed:0', help="e.g. fixed:0.2, uniform:0.1,0.5, lognormal:0.3,0.6")
+    parser.add_argument('--slow-fraction', type=float, default=0.0)
+    parser.add_argument('--slow-latency', type=float, default=5.0)
+    parser.add_argument('--tokens-per-second', type=float, default=0.0)
+    parser.add_argument('--rate-429', type=float, default=0.0)
+    parser.add_argument('--rate-529', type=float, default=0.0)
+    parser.add_argument('--rate-timeout', type=float, default=0.0)
+    parser.add_argument('--retry-after', type=float, default=1.0)
+    parser.add_argument('--stall-seconds', type=float, default=30.0)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    config = FakeServerConfig(
+        latency=LatencyDistribution(args.latency),
+        slow_fraction=args.slow_fraction,
+        slow_latency=args.slow_latency,
+        tokens_per_second=args.tokens_per_second,
+        rate_429=args.rate_429,
+        rate_529=args.rate_529,
+        rate_timeout=args.rate_timeout,
+        retry_after=args.retry_after,
+        stall_seconds=args.stall_seconds,
+        seed=args.seed,
+    )
+    server = FakeAnthropicServer(config, host=args.host, port=args.port).start()
+    print(f"Fake Anthropic API listening on {server.base_url}")
+    print(f"  export ANTHROPIC_BASE_URL={server.base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print(json.dumps(server.stats.snapshot(), indent=2))
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
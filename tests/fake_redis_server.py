@@ -0,0 +1,355 @@
+"""
+Local stand-in for a Redis server
+Speaks RESP2 over TCP and implements the handful of commands the shared
+rate limiter uses (sorted sets, MULTI/EXEC, key expiry), so the Redis
+backend can be tested over a real socket without a Redis install.
+
+As a pytest fixture (see conftest.py):
+
+    def test_something(fake_redis):
+        limiter = RedisRateLimiter(fake_redis.url)
+
+As a CLI:
+
+    python -m tests.fake_redis_server --port 6380
+    RATE_LIMIT_BACKEND=redis RATE_LIMIT_REDIS_URL=redis://127.0.0.1:6380/0 uvicorn backend.main:app
+"""
+
+import argparse
+import fnmatch
+import json
+import socket
+import socketserver
+import threading
+import time
+from typing import Dict, List, Optional, Set
+
+
+class _Error(Exception):
+    """Sent to the client as an error reply"""
+
+
+class _Status(str):
+    """Sent to the client as a simple status reply (+OK)"""
+
+
+OK = _Status('OK')
+QUEUED = _Status('QUEUED')
+PONG = _Status('PONG')
+
+
+def _score(text: str) -> tuple:
+    """Parse a ZRANGEBYSCORE-style bound into (value, exclusive)"""
+    exclusive = text.startswith('(')
+    text = text[1:] if exclusive else text
+    if text in ('-inf', '+inf', 'inf'):
+        return (float('-inf') if text == '-inf' else float('inf')), exclusive
+    try:
+        return float(text), exclusive
+    except ValueError:
+        raise _Error('ERR min or max is not a float')
+
+
+def _in_range(score: float, low: tuple, high: tuple) -> bool:
+    (lo, lo_open), (hi, hi_open) = low, high
+    above = score > lo if lo_open else score >= lo
+    below = score < hi if hi_open else score <= hi
+    return above and below
+
+
+class FakeRedisStats:
+    """Connection and command counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connections = 0
+        self.commands: Dict[str, int] = {}
+
+    def connection_opened(self) -> None:
+        with self._lock:
+            self.connections += 1
+
+    def command(self, name: str) -> None:
+        with self._lock:
+            self.commands[name] = self.commands.get(name, 0) + 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {'connections': self.connections, 'commands': dict(self.commands)}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: '_Server'
+
+    def setup(self) -> None:
+        super().setup()
+        # Like Redis: replies to pipelined commands go out without Nagle delays
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.server.fake.connection_opened(self.connection)
+
+    def finish(self) -> None:
+        self.server.fake.connection_closed(self.connection)
+        super().finish()
+
+    def handle(self) -> None:
+        fake = self.server.fake
+        queued: Optional[List[List[str]]] = None
+        while True:
+            try:
+                command = self._read_command()
+            except (ConnectionError, OSError):
+                return
+            if command is None:
+                return
+
+            name = command[0].upper()
+            fake.stats.command(name)
+            if name == 'MULTI':
+                queued = []
+                self._write(OK)
+            elif name == 'EXEC':
+                if queued is None:
+                    self._write(_Error('ERR EXEC without MULTI'))
+                else:
+                    self._write(fake.run_all(queued))
+                    queued = None
+            elif name == 'DISCARD':
+                queued = None
+                self._write(OK)
+            elif queued is not None:
+                queued.append(command)
+                self._write(QUEUED)
+            else:
+                self._write(fake.run_all([command])[0])
+
+    def _read_command(self) -> Optional[List[str]]:
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            raise ConnectionError('inline commands are not supported')
+        args = []
+        for _ in range(int(line[1:-2])):
+            header = self.rfile.readline()
+            length = int(header[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2].decode())
+        return args
+
+    def _encode(self, value) -> bytes:
+        if isinstance(value, _Error):
+            return b'-%s\r\n' % str(value).encode()
+        if isinstance(value, _Status):
+            return b'+%s\r\n' % value.encode()
+        if isinstance(value, bool) or isinstance(value, int):
+            return b':%d\r\n' % int(value)
+        if value is None:
+            return b'$-1\r\n'
+        if isinstance(value, list):
+            return b'*%d\r\n' % len(value) + b''.join(self._encode(item) for item in value)
+        data = str(value).encode()
+        return b'$%d\r\n%s\r\n' % (len(data), data)
+
+    def _write(self, value) -> None:
+        self.wfile.write(self._encode(value))
+        self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    fake: 'FakeRedisServer'
+
+
+class FakeRedisServer:
+    """
+    Redis stand-in on a local port
+
+    Supports PING, AUTH, SELECT, MULTI/EXEC/DISCARD, ZADD, ZREM, ZCARD,
+    ZCOUNT, ZREMRANGEBYSCORE, PEXPIRE, PTTL, DEL, KEYS and FLUSHDB. One
+    lock covers each command or transaction, matching Redis's
+    single-threaded atomicity. The database number is ignored.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        self.stats = FakeRedisStats()
+        self._lock = threading.Lock()
+        self._data: Dict[str, Dict[str, float]] = {}
+        self._expires: Dict[str, float] = {}
+        self._clients: Set[socket.socket] = set()
+        self._server = _Server((host, port), _Handler)
+        self._server.fake = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start(self) -> 'FakeRedisServer':
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True, name='fake-redis'
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop listening and drop every client connection"""
+        self._server.shutdown()
+        self._server.server_close()
+        with self._lock:
+            clients = list(self._clients)
+        for sock in clients:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def connection_opened(self, sock: socket.socket) -> None:
+        self.stats.connection_opened()
+        with self._lock:
+            self._clients.add(sock)
+
+    def connection_closed(self, sock: socket.socket) -> None:
+        with self._lock:
+            self._clients.discard(sock)
+
+    def __enter__(self) -> 'FakeRedisServer':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            self._expire_all()
+            return sorted(self._data)
+
+    def zset(self, key: str) -> Dict[str, float]:
+        """Copy of a sorted set's members and scores"""
+        with self._lock:
+            self._expire(key)
+            return dict(self._data.get(key, {}))
+
+    # ------------------------------------------------------------------
+    # Command execution
+    # ------------------------------------------------------------------
+
+    def run_all(self, commands: List[List[str]]) -> list:
+        """Run commands atomically; returns one reply (or _Error) per command"""
+        with self._lock:
+            results = []
+            for command in commands:
+                try:
+                    results.append(self._run(command[0].upper(), command[1:]))
+                except _Error as exc:
+                    results.append(exc)
+            return results
+
+    def _expire(self, key: str) -> None:
+        deadline = self._expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+
+    def _expire_all(self) -> None:
+        for key in list(self._expires):
+            self._expire(key)
+
+    def _zset(self, key: str, create: bool = False) -> Optional[Dict[str, float]]:
+        self._expire(key)
+        zset = self._data.get(key)
+        if zset is None and create:
+            zset = self._data[key] = {}
+        return zset
+
+    def _drop_if_empty(self, key: str) -> None:
+        if key in self._data and not self._data[key]:
+            del self._data[key]
+            self._expires.pop(key, None)
+
+    def _run(self, name: str, args: List[str]):
+        if name == 'PING':
+            return PONG
+        if name in ('AUTH', 'SELECT'):
+            return OK
+        if name == 'ZADD':
+            key, pairs = args[0], args[1:]
+            if not pairs or len(pairs) % 2:
+                raise _Error("ERR wrong number of arguments for 'zadd' command")
+            zset = self._zset(key, create=True)
+            added = 0
+            for score, member in zip(pairs[::2], pairs[1::2]):
+                added += member not in zset
+                zset[member] = _score(score)[0]
+            return added
+        if name == 'ZREM':
+            zset = self._zset(args[0]) or {}
+            removed = sum(zset.pop(member, None) is not None for member in args[1:])
+            self._drop_if_empty(args[0])
+            return removed
+        if name == 'ZCARD':
+            return len(self._zset(args[0]) or {})
+        if name in ('ZCOUNT', 'ZREMRANGEBYSCORE'):
+            key = args[0]
+            low, high = _score(args[1]), _score(args[2])
+            zset = self._zset(key) or {}
+            matching = [member for member, score in zset.items() if _in_range(score, low, high)]
+            if name == 'ZCOUNT':
+                return len(matching)
+            for member in matching:
+                del zset[member]
+            self._drop_if_empty(key)
+            return len(matching)
+        if name == 'PEXPIRE':
+            key = args[0]
+            if self._zset(key) is None:
+                return 0
+            self._expires[key] = time.monotonic() + int(args[1]) / 1000
+            return 1
+        if name == 'PTTL':
+            key = args[0]
+            if self._zset(key) is None:
+                return -2
+            deadline = self._expires.get(key)
+            return -1 if deadline is None else int((deadline - time.monotonic()) * 1000)
+        if name == 'DEL':
+            removed = 0
+            for key in args:
+                self._expire(key)
+                removed += self._data.pop(key, None) is not None
+                self._expires.pop(key, None)
+            return removed
+        if name == 'KEYS':
+            self._expire_all()
+            return [key for key in sorted(self._data) if fnmatch.fnmatchcase(key, args[0])]
+        if name == 'FLUSHDB':
+            self._data.clear()
+            self._expires.clear()
+            return OK
+        raise _Error(f"ERR unknown command '{name.lower()}'")
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Local Redis stand-in for the shared rate limiter")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6380)
+    args = parser.parse_args(argv)
+
+    server = FakeRedisServer(host=args.host, port=args.port).start()
+    print(f"Fake Redis listening on {server.url}")
+    print(f"  export RATE_LIMIT_BACKEND=redis RATE_LIMIT_REDIS_URL={server.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print(json.dumps(server.stats.snapshot(), indent=2))
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+"""
+Tests for admission control (bounded concurrency, priority queue, shedding)
+"""
+
+import asyncio
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+from fastapi import HTTPException, Response
+
+from First_Aid_buddy.admission import (
+    IN_FLIGHT, QUEUE_DEPTH, SHED, WAIT_SECONDS, AdmissionController, OverloadedError, admission
+)
+from First_Aid_buddy.deadline import Deadline
+from First_Aid_buddy.governor import EMERGENCY, NORMAL
+from backend.services.pipeline import run_chat_pipeline
+
+
+def answer_response(text):
+    response = Mock()
+    response.content = [Mock(text=text)]
+    return response
+
+
+class TestAdmissionController:
+    """Test the controller on its own"""
+
+    def test_admits_up_to_limit(self):
+        """Test that queries under the limit run without waiting"""
+        controller = AdmissionController(max_concurrency=2, emergency_slots=0, max_queue_wait=0.05)
+
+        async def main():
+            first = await controller.acquire()
+            second = await controller.acquire()
+            assert IN_FLIGHT.value() == 2
+            with pytest.raises(OverloadedError):
+                await controller.acquire()
+            controller.release(first)
+            controller.release(second)
+
+        asyncio.run(main())
+        assert controller.snapshot()['in_flight'] == 0
+
+    def test_emergencies_admitted_first(self):
+        """Test that a freed slot goes to a queued emergency before earlier general queries"""
+        controller = AdmissionController(max_concurrency=1, emergency_slots=0, max_queue_wait=5)
+        order = []
+
+        async def query(name, priority):
+            async with controller.admit(priority):
+                order.append(name)
+                await asyncio.sleep(0.01)
+
+        async def main():
+            holder = await controller.acquire()
+            tasks = [asyncio.create_task(query('splinter', NORMAL)),
+                     asyncio.create_task(query('sunburn', NORMAL))]
+            await asyncio.sleep(0.01)
+            tasks.append(asyncio.create_task(query('choking', EMERGENCY)))
+            await asyncio.sleep(0.01)
+            assert QUEUE_DEPTH.value(priority=NORMAL) == 2
+            assert QUEUE_DEPTH.value(priority=EMERGENCY) == 1
+            controller.release(holder)
+            await asyncio.gather(*tasks)
+
+        asyncio.run(main())
+        assert order == ['choking', 'splinter', 'sunburn']
+
+    def test_emergency_slots(self):
+        """Test that emergencies use reserved slots general queries cannot"""
+        controller = AdmissionController(max_concurrency=1, emergency_slots=1, max_queue_wait=0)
+
+        async def main():
+            await controller.acquire(NORMAL)
+            with pytest.raises(OverloadedError):
+                await controller.acquire(NORMAL)
+            await controller.acquire(EMERGENCY)
+
+        asyncio.run(main())
+        assert controller.snapshot()['in_flight'] == 2
+
+    def test_general_query_shed_after_max_wait(self):
+        """Test that a general query waiting past the threshold is shed with Retry-After"""
+        controller = AdmissionController(max_concurrency=1, emergency_slots=0, max_queue_wait=0.05)
+        before = SHED.value(priority=NORMAL, reason='wait')
+
+        async def main():
+            await controller.acquire()
+            with pytest.raises(OverloadedError) as exc_info:
+                await controller.acquire(NORMAL)
+            return exc_info.value
+
+        error = asyncio.run(main())
+        assert error.retry_after >= 1
+        assert SHED.value(priority=NORMAL, reason='wait') == before + 1
+        assert controller.snapshot()['queued_normal'] == 0
+
+    def test_full_queue_sheds_immediately(self):
+        """Test that general queries beyond max_queue are refused without waiting"""
+        controller = AdmissionController(max_concurrency=1, emergency_slots=0, max_queue=1, max_queue_wait=5)
+        before = SHED.value(priority=NORMAL, reason='queue_full')
+
+        async def main():
+            await controller.acquire()
+            waiter = asyncio.create_task(controller.acquire())
+            await asyncio.sleep(0.01)
+            with pytest.raises(OverloadedError):
+                await asyncio.wait_for(controller.acquire(), timeout=1)
+            waiter.cancel()
+
+        asyncio.run(main())
+        assert SHED.value(priority=NORMAL, reason='queue_full') == before + 1
+
+    def test_emergency_not_shed_by_queue_limits(self):
+        """Test that an emergency waits beyond max_queue_wait while it has time"""
+        controller = AdmissionController(max_concurrency=1, emergency_slots=0, max_queue=0, max_queue_wait=0)
+
+        async def main():
+            holder = await controller.acquire()
+            waiter = asyncio.create_task(controller.acquire(EMERGENCY, max_wait=5))
+            await asyncio.sleep(0.05)
+            controller.release(holder)
+            await waiter
+
+        asyncio.run(main())
+        assert controller.snapshot()['in_flight'] == 1
+
+    def test_cancelled_waiter_does_not_leak_slot(self):
+        """Test that a client disconnecting while queued leaves the queue cleanly"""
+        controller = AdmissionController(max_concurrency=1, emergency_slots=0, max_queue_wait=5)
+
+        async def main():
+            holder = await controller.acquire()
+            waiter = asyncio.create_task(controller.acquire())
+            await asyncio.sleep(0.01)
+            waiter.cancel()
+            await asyncio.gather(waiter, return_exceptions=True)
+            controller.release(holder)
+            # The slot is free again, not handed to the cancelled waiter
+            await asyncio.wait_for(controller.acquire(), timeout=1)
+
+        asyncio.run(main())
+        snapshot = controller.snapshot()
+        assert (snapshot['in_flight'], snapshot['queued_normal']) == (1, 0)
+
+    def test_queued_waiter_runs_to_completion(self):
+        """Test that a queued query gets the freed slot and gives it back"""
+        controller = AdmissionController(max_concurrency=1, emergency_slots=0, max_queue_wait=5)
+
+        async def main():
+            holder = await controller.acquire()
+            waiter = asyncio.create_task(controller.acquire())
+            await asyncio.sleep(0.01)
+            controller.release(holder)
+            controller.release(await asyncio.wait_for(waiter, timeout=1))
+
+        asyncio.run(main())
+        snapshot = controller.snapshot()
+        assert (snapshot['in_flight'], snapshot['queued_normal']) == (0, 0)
+
+    def test_waiter_cancelled_after_slot_handed_over(self):
+        """Test that a waiter cancelled before it could use its slot passes the slot on"""
+        controller = AdmissionController(max_concurrency=1, emergency_slots=0, max_queue_wait=5)
+
+        async def main():
+            holder = await controller.acquire()
+            waiter = asyncio.create_task(controller.acquire())
+            await asyncio.sleep(0.01)
+            controller.release(holder)
+            # The slot is handed to the waiter, which is cancelled before it resumes
+            waiter.cancel()
+            await asyncio.gather(waiter, return_exceptions=True)
+            assert waiter.cancelled()
+            assert controller.snapshot()['in_flight'] == 0
+            controller.release(await asyncio.wait_for(controller.acquire(), timeout=1))
+
+        asyncio.run(main())
+        snapshot = controller.snapshot()
+        assert (snapshot['in_flight'], snapshot['queued_normal']) == (0, 0)
+
+    def test_wait_histogram(self):
+        """Test that admitted waits are recorded per priority"""
+        controller = AdmissionController(max_concurrency=1)
+        before = WAIT_SECONDS.count(priority=EMERGENCY, outcome='admitted')
+
+        async def main():
+            async with controller.admit(EMERGENCY):
+                pass
+
+        asyncio.run(main())
+        assert WAIT_SECONDS.count(priority=EMERGENCY, outcome='admitted') == before + 1
+
+    def test_disabled_admits_everything(self):
+        """Test that a disabled controller never queues or sheds"""
+        controller = AdmissionController(max_concurrency=1, max_queue_wait=0, enabled=False)
+
+        async def main():
+            for _ in range(5):
+                await controller.acquire()
+
+        asyncio.run(main())
+        assert controller.snapshot()['in_flight'] == 0
+
+
+class TestAdmissionInPipeline:
+    """Test admission control in the chat pipeline and router"""
+
+    @pytest.fixture
+    def saturated(self, monkeypatch):
+        """Every slot taken by queries that never finish"""
+        monkeypatch.setattr(admission, 'max_concurrency', 1)
+        monkeypatch.setattr(admission, 'emergency_slots', 0)
+        monkeypatch.setattr(admission, 'max_queue_wait', 0.05)
+        monkeypatch.setattr(admission, '_active', 1)
+
+    @pytest.fixture
+    def async_client(self):
+        client = Mock()
+        client.messages.create = AsyncMock(side_effect=[
+            answer_response("GENERAL_QUERY"), answer_response("Clean the wound."),
+        ])
+        return client
+
+    def test_general_query_shed(self, saturated, async_client):
+        """Test that a general query is shed when no slot frees up"""
+        with pytest.raises(OverloadedError):
+            asyncio.run(run_chat_pipeline("How do I remove a splinter?", async_client, deadline=Deadline(5)))
+        async_client.messages.create.assert_not_called()
+
+    def test_emergency_answered_from_knowledge_base(self, saturated, async_client):
+        """Test that an emergency that cannot be admitted still gets an answer"""
+        answer, is_emergency, citations, _, degraded = asyncio.run(
+            run_chat_pipeline("My child is choking", async_client, deadline=Deadline(0.1))
+        )
+        assert is_emergency is True
+        assert degraded is True
+        assert "999" in answer
+        async_client.messages.create.assert_not_called()
+
+    def test_slot_released_after_query(self, async_client):
+        """Test that the pipeline gives its slot back"""
+        asyncio.run(run_chat_pipeline("How do I treat a minor cut?", async_client, deadline=Deadline(5)))
+        assert admission.snapshot()['in_flight'] == 0
+
+    def test_router_returns_503_with_retry_after(self, saturated, async_client):
+        """Test that /chat maps a shed query to 503 with a Retry-After header"""
+        from backend.models.chat import ChatRequest
+        from backend.routers.chat import chat
+
+        request = Mock()
+        request.app.state.anthropic_client = async_client
+        request.client.host = "127.0.0.1"
+
+        with pytest.raises(HTTPException) as exc_info:
+            asyncio.run(chat(ChatRequest(message="How do I remove a splinter?"), request, Response()))
+
+        assert exc_info.value.status_code == 503
+        assert int(exc_info.value.headers["Retry-After"]) >= 1
@@ -0,0 +1,185 @@
+"""
+Tests for the queued background log writer
+"""
+
+import logging
+import threading
+
+import pytest
+
+from First_Aid_buddy import logger as log_module
+from First_Aid_buddy.logger import (
+    BLOCK, DROP_DEBUG_FIRST, DROP_NEW, DROPPED, LogQueue, SanitizingFormatter,
+    _QueueHandler, _QueueListener
+)
+
+
+class Collector(logging.Handler):
+    """Keeps formatted lines and the thread that wrote them"""
+
+    def __init__(self):
+        super().__init__()
+        self.setFormatter(SanitizingFormatter('%(levelname)s %(message)s'))
+        self.lines = []
+        self.threads = set()
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+        self.threads.add(threading.get_ident())
+
+
+def make_record(level, message, args=None):
+    return logging.LogRecord('test', level, __file__, 1, message, args, None)
+
+
+def queued_levels(log_queue):
+    return [record.levelno for record in log_queue.queue]
+
+
+@pytest.fixture
+def pipeline():
+    """A handler, listener and collector wired as setup_logger does"""
+    output = Collector()
+    log_queue = LogQueue(100)
+    handler = _QueueHandler(log_queue, output)
+    listener = _QueueListener(log_queue, output)
+    listener.start()
+    handler.running = True
+    logger = logging.getLogger('test_async_logging')
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    yield logger, handler, listener, output
+    if handler.running:
+        listener.stop()
+    logger.handlers = []
+
+
+class TestLogQueue:
+    """Test the overflow policies"""
+
+    def test_drop_debug_first_evicts_lowest_level(self):
+        """Test that a warning replaces the oldest debug record when full"""
+        log_queue = LogQueue(3, DROP_DEBUG_FIRST)
+        for level in (logging.INFO, logging.DEBUG, logging.DEBUG):
+            log_queue.offer(make_record(level, 'x'))
+        before = DROPPED.value(level='DEBUG')
+
+        log_queue.offer(make_record(logging.WARNING, 'keep me'))
+        assert queued_levels(log_queue) == [logging.INFO, logging.DEBUG, logging.WARNING]
+        assert DROPPED.value(level='DEBUG') == before + 1
+
+        log_queue.offer(make_record(logging.ERROR, 'and me'))
+        log_queue.offer(make_record(logging.ERROR, 'me too'))
+        assert queued_levels(log_queue) == [logging.WARNING, logging.ERROR, logging.ERROR]
+
+    def test_drop_debug_first_drops_incoming_when_nothing_lower(self):
+        """Test that a record is dropped if everything queued is as important"""
+        log_queue = LogQueue(2, DROP_DEBUG_FIRST)
+        log_queue.offer(make_record(logging.INFO, 'a'))
+        log_queue.offer(make_record(logging.INFO, 'b'))
+        before = DROPPED.value(level='DEBUG')
+
+        log_queue.offer(make_record(logging.DEBUG, 'c'))
+        log_queue.offer(make_record(logging.INFO, 'd'))
+        assert [record.msg for record in log_queue.queue] == ['a', 'b']
+        assert DROPPED.value(level='DEBUG') == before + 1
+
+    def test_drop_new(self):
+        """Test that drop_new keeps what is queued, whatever the level"""
+        log_queue = LogQueue(1, DROP_NEW)
+        log_queue.offer(make_record(logging.DEBUG, 'old'))
+        log_queue.offer(make_record(logging.ERROR, 'new'))
+        assert [record.msg for record in log_queue.queue] == ['old']
+
+    def test_block_waits_for_space(self):
+        """Test that block loses nothing and resumes once the writer catches up"""
+        log_queue = LogQueue(1, BLOCK)
+        log_queue.offer(make_record(logging.INFO, 'first'))
+        writer = threading.Thread(target=log_queue.offer, args=(make_record(logging.INFO, 'second'),))
+        writer.start()
+        writer.join(0.05)
+        assert writer.is_alive()
+
+        assert log_queue.get().msg == 'first'
+        writer.join(1)
+        assert log_queue.get().msg == 'second'
+
+    def test_join_after_evictions(self):
+        """Test that evictions leave the pending-task count matching the queue"""
+        log_queue = LogQueue(2, DROP_DEBUG_FIRST)
+        for level in (logging.DEBUG, logging.DEBUG, logging.ERROR, logging.ERROR):
+            log_queue.offer(make_record(level, 'x'))
+        while not log_queue.empty():
+            log_queue.get()
+            log_queue.task_done()
+        log_queue.join()
+
+
+class TestQueuedLogging:
+    """Test records flowing through the listener thread"""
+
+    def test_written_on_listener_thread(self, pipeline):
+        """Test that formatting and output happen off the calling thread"""
+        logger, handler, listener, output = pipeline
+        logger.info("Call me on %s", "07700900123")
+        handler.queue.join()
+
+        assert output.lines == ["INFO Call me on [REDACTED_PHONE_UK]"]
+        assert threading.get_ident() not in output.threads
+
+    def test_arguments_merged_at_call_time(self, pipeline):
+        """Test that mutating an argument after logging does not change the line"""
+        logger, handler, _, output = pipeline
+        details = {'step': 1}
+        logger.info("state %s", details)
+        details['step'] = 2
+        handler.queue.join()
+        assert output.lines == ["INFO state {'step': 1}"]
+
+    def test_exception_formatted_and_sanitized(self, pipeline):
+        """Test that tracebacks reach the writer and are redacted there"""
+        logger, handler, _, output = pipeline
+        try:
+            raise ValueError("key sk-ant-secret")
+        except ValueError:
+            logger.exception("failed")
+        handler.queue.join()
+        assert "Traceback" in output.lines[0]
+        assert "sk-ant-secret" not in output.lines[0]
+
+    def test_stop_flushes_then_writes_synchronously(self, pipeline):
+        """Test that stopping drains the queue and later records still appear"""
+        logger, handler, listener, output = pipeline
+        for i in range(50):
+            logger.info(f"line {i}")
+        listener.stop()
+        handler.running = False
+        assert len(output.lines) == 50
+
+        logger.warning("after shutdown")
+        assert output.lines[-1] == "WARNING after shutdown"
+        assert threading.get_ident() in output.threads
+
+
+class TestLoggerLifecycle:
+    """Test the module-level start/flush/stop functions"""
+
+    def test_setup_logger_shares_queue_handler(self):
+        """Test that every logger writes to the one shared queue handler"""
+        first = log_module.setup_logger('test_async_first')
+        second = log_module.setup_logger('test_async_second')
+        assert first.handlers == second.handlers
+        assert isinstance(first.handlers[0], _QueueHandler)
+
+    def test_stop_and_restart(self):
+        """Test that stop_log_listener() writes out pending lines and can be restarted"""
+        logger = log_module.setup_logger('test_async_lifecycle')
+        handler = logger.handlers[0]
+        log_module.stop_log_listener()
+        log_module.stop_log_listener()
+        assert handler.running is False
+
+        log_module.start_log_listener()
+        assert handler.running is True
+        log_module.flush_logs()
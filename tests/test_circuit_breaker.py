@@ -0,0 +1,222 @@
+"""
+Tests for the circuit breaker, retry budget and degraded answers
+"""
+
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, Mock, patch
+
+import anthropic
+import httpx
+
+from First_Aid_buddy.circuit_breaker import CircuitBreaker
+from First_Aid_buddy.core import (
+    call_claude_with_retry,
+    call_claude_with_retry_async,
+    circuit_breaker,
+    classify_intent_locally,
+    build_degraded_answer,
+    process_query,
+    CircuitOpenError,
+    ThrottledError,
+)
+from First_Aid_buddy.retry import RetryBudget
+from First_Aid_buddy.config import Config
+
+
+def make_timeout_error():
+    request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+    return anthropic.APITimeoutError(request=request)
+
+
+def make_overloaded_error():
+    request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+    response = httpx.Response(529, request=request)
+    return anthropic.InternalServerError("overloaded", response=response, body=None)
+
+
+class TestCircuitBreaker:
+    """Test breaker state transitions"""
+
+    def test_stays_closed_below_min_calls(self):
+        """Test that a few failures do not trip the breaker"""
+        breaker = CircuitBreaker(window_size=10, min_calls=5, failure_rate_threshold=0.5)
+        for _ in range(4):
+            breaker.record_failure(0.1)
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_opens_on_failure_rate(self):
+        """Test that the breaker opens once the failure rate crosses the threshold"""
+        breaker = CircuitBreaker(window_size=10, min_calls=4, failure_rate_threshold=0.5, open_seconds=60)
+        breaker.record_success(0.1)
+        breaker.record_success(0.1)
+        breaker.record_failure(0.1)
+        breaker.record_failure(0.1)
+        assert breaker.state == CircuitBreaker.OPEN
+        assert breaker.allow_request() is False
+
+    def test_opens_on_slow_calls(self):
+        """Test that consistently slow successes also trip the breaker"""
+        breaker = CircuitBreaker(window_size=4, min_calls=4, slow_call_seconds=1.0,
+                                 slow_call_rate_threshold=0.75, open_seconds=60)
+        for _ in range(4):
+            breaker.record_success(2.0)
+        assert breaker.state == CircuitBreaker.OPEN
+
+    def test_half_open_probe_closes_on_success(self):
+        """Test that one successful probe closes the breaker after the cool-down"""
+        breaker = CircuitBreaker(window_size=2, min_calls=2, open_seconds=0)
+        breaker.record_failure(0.1)
+        breaker.record_failure(0.1)
+
+        assert breaker.allow_request() is True   # the single probe
+        assert breaker.allow_request() is False  # others wait for the probe
+        breaker.record_success(0.1)
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_half_open_probe_failure_reopens(self):
+        """Test that a failed probe re-opens the breaker"""
+        breaker = CircuitBreaker(window_size=2, min_calls=2, open_seconds=0)
+        breaker.record_failure(0.1)
+        breaker.record_failure(0.1)
+        assert breaker.allow_request() is True
+        breaker.open_seconds = 60
+        breaker.record_failure(0.1)
+        assert breaker.state == CircuitBreaker.OPEN
+
+
+class TestRetryBudget:
+    """Test the process-wide retry budget"""
+
+    def test_budget_exhausts(self):
+        """Test that retries are denied once the bucket is empty"""
+        budget = RetryBudget(ratio=0, min_per_second=0, max_tokens=2)
+        assert budget.try_spend() is True
+        assert budget.try_spend() is True
+        assert budget.try_spend() is False
+        assert budget.snapshot()['denied_retries'] == 1
+
+    def test_requests_replenish_budget(self):
+        """Test that every request earns a fraction of a retry"""
+        budget = RetryBudget(ratio=0.5, min_per_second=0, max_tokens=2)
+        budget.try_spend()
+        budget.try_spend()
+        budget.record_request()
+        budget.record_request()
+        assert budget.try_spend() is True
+
+
+class TestCallThroughBreaker:
+    """Test breaker integration with call_claude_with_retry"""
+
+    def test_open_breaker_fails_fast(self, mock_anthropic_client):
+        """Test that no API call is made while the breaker is open"""
+        for _ in range(Config.CIRCUIT_WINDOW_SIZE):
+            circuit_breaker.record_failure(0.1)
+
+        with pytest.raises(CircuitOpenError):
+            call_claude_with_retry(mock_anthropic_client, 'test', model='m')
+
+        mock_anthropic_client.messages.create.assert_not_called()
+
+    @patch('First_Aid_buddy.core.time.sleep')
+    def test_failures_feed_breaker(self, mock_sleep, mock_anthropic_client):
+        """Test that upstream failures are recorded by the breaker"""
+        mock_anthropic_client.messages.create.side_effect = make_overloaded_error()
+
+        for _ in range(Config.CIRCUIT_MIN_CALLS):
+            try:
+                call_claude_with_retry(mock_anthropic_client, 'test', model='m')
+            except CircuitOpenError:
+                break
+            except Exception:
+                pass
+
+        assert circuit_breaker.state == CircuitBreaker.OPEN
+
+    @patch('First_Aid_buddy.core.time.sleep')
+    def test_full_length_timeouts_open_breaker(self, mock_sleep, mock_anthropic_client, monkeypatch):
+        """Test that timeouts at API_TIMEOUT count even when it is below the slow-call threshold"""
+        monkeypatch.setattr(Config, 'API_TIMEOUT', 5)
+        mock_anthropic_client.messages.create.side_effect = make_timeout_error()
+
+        for _ in range(Config.CIRCUIT_MIN_CALLS):
+            try:
+                call_claude_with_retry(mock_anthropic_client, 'test', model='m')
+            except CircuitOpenError:
+                break
+            except Exception:
+                pass
+
+        assert circuit_breaker.state == CircuitBreaker.OPEN
+
+    @pytest.fixture
+    def half_open(self, monkeypatch):
+        """Trip the global breaker and let its cool-down pass"""
+        monkeypatch.setattr(circuit_breaker, 'open_seconds', 0)
+        for _ in range(Config.CIRCUIT_WINDOW_SIZE):
+            circuit_breaker.record_failure(0.1)
+        assert circuit_breaker.state == CircuitBreaker.HALF_OPEN
+
+    def test_shed_probe_frees_slot(self, half_open, mock_anthropic_client):
+        """Test that a probe shed by the governor does not block later calls"""
+        shedding = Mock()
+        shedding.acquire.return_value = None
+        with patch('First_Aid_buddy.core.governor', shedding):
+            with pytest.raises(ThrottledError):
+                call_claude_with_retry(mock_anthropic_client, 'test', model='m', max_tokens=5, messages=[])
+
+        mock_anthropic_client.messages.create.assert_not_called()
+        assert circuit_breaker.allow_request() is True
+
+    def test_cancelled_probe_frees_slot(self, half_open):
+        """Test that a probe cancelled mid-attempt (client gone) does not block later calls"""
+        async def hang(**kwargs):
+            await asyncio.sleep(60)
+
+        client = Mock()
+        client.messages.create = AsyncMock(side_effect=hang)
+
+        async def main():
+            task = asyncio.create_task(
+                call_claude_with_retry_async(client, 'test', model='m', max_tokens=5, messages=[])
+            )
+            await asyncio.sleep(0.01)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        asyncio.run(main())
+        assert circuit_breaker.allow_request() is True
+
+
+class TestDegradedMode:
+    """Test retrieval-only answers"""
+
+    def test_local_triage_flags_emergencies(self):
+        """Test that local rules catch obvious emergencies"""
+        assert classify_intent_locally("my child is choking") == 'LIFE_THREATENING'
+        assert classify_intent_locally("He is not breathing!") == 'LIFE_THREATENING'
+        assert classify_intent_locally("how do I remove a splinter") == 'GENERAL_QUERY'
+
+    def test_degraded_answer_quotes_knowledge_base(self):
+        """Test that the degraded answer contains KB entries verbatim"""
+        answer, is_emergency = build_degraded_answer("how do I treat a burn")
+        assert is_emergency is False
+        assert "Burns (Minor): Immediately cool the burn" in answer
+
+    def test_degraded_emergency_answer_leads_with_number(self):
+        """Test that emergencies start with the emergency number"""
+        answer, is_emergency = build_degraded_answer("someone is choking")
+        assert is_emergency is True
+        assert answer.startswith(f"If this is an emergency, call {Config.EMERGENCY_NUMBER}")
+
+    def test_process_query_degrades_when_open(self, mock_anthropic_client):
+        """Test that process_query answers from the KB while the breaker is open"""
+        for _ in range(Config.CIRCUIT_WINDOW_SIZE):
+            circuit_breaker.record_failure(0.1)
+
+        answer, is_emergency = process_query("my friend is choking", mock_anthropic_client)
+
+        assert is_emergency is True
+        assert "Choking" in answer
+        mock_anthropic_client.messages.create.assert_not_called()
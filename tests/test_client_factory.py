@@ -0,0 +1,135 @@
+"""
+Tests for the shared, pooled Anthropic client factory
+"""
+
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import anthropic
+import pytest
+
+from First_Aid_buddy import client_factory
+from First_Aid_buddy.client_factory import (
+    get_shared_client,
+    get_shared_async_client,
+    http_timeout,
+    pool_stats,
+    warm_up_async,
+)
+from First_Aid_buddy.config import Config
+
+API_KEY = "sk-ant-REDACTED"
+
+
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _reply(self, body=b""):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        self._reply(b"ok")
+
+    def do_HEAD(self):
+        self._reply()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def local_server():
+    """Keep-alive HTTP server on a free local port"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def fresh_clients():
+    """Drop shared clients created by each test"""
+    yield
+    asyncio.run(client_factory.close_shared_clients())
+
+
+class TestSharedClients:
+    """Test client sharing and configuration"""
+
+    def test_same_key_returns_same_client(self):
+        """Test that one client is shared per key"""
+        assert get_shared_client(API_KEY) is get_shared_client(API_KEY)
+
+    def test_different_keys_get_different_clients(self):
+        """Test that clients are not shared across keys"""
+        assert get_shared_client(API_KEY) is not get_shared_client(API_KEY + "x")
+
+    def test_sync_and_async_clients(self):
+        """Test that both client flavours are available"""
+        assert isinstance(get_shared_client(API_KEY), anthropic.Anthropic)
+        assert isinstance(get_shared_async_client(API_KEY), anthropic.AsyncAnthropic)
+
+    def test_timeouts_and_retries_from_config(self):
+        """Test that the client uses Config timeouts and leaves retries to core"""
+        client = get_shared_client(API_KEY)
+        assert client.timeout.read == Config.API_TIMEOUT
+        assert client.timeout.connect == Config.API_CONNECT_TIMEOUT
+        assert client.max_retries == 0
+
+    def test_connect_timeout_capped_by_read_timeout(self):
+        """Test that a short attempt budget also shortens the connect timeout"""
+        timeout = http_timeout(0.5)
+        assert timeout.read == 0.5
+        assert timeout.connect == 0.5
+
+    def test_cache_is_bounded(self, monkeypatch):
+        """Test that old keys are evicted beyond the cap"""
+        monkeypatch.setattr(client_factory, 'MAX_CACHED_CLIENTS', 2)
+        first = get_shared_client(API_KEY + "1")
+        get_shared_client(API_KEY + "2")
+        get_shared_client(API_KEY + "3")
+        assert get_shared_client(API_KEY + "1") is not first
+
+
+class TestConnectionReuse:
+    """Test pooling statistics and warm-up against a local server"""
+
+    def test_requests_reuse_one_connection(self, local_server):
+        """Test that sequential requests share a keep-alive connection"""
+        client = get_shared_client(API_KEY, base_url=local_server)
+        http_client = client_factory._entries_by_client[id(client)].http_client
+
+        for _ in range(3):
+            http_client.get(local_server)
+
+        stats = pool_stats()['sync']
+        assert stats['requests'] == 3
+        assert stats['connections_opened'] == 1
+        assert stats['reuse_ratio'] == pytest.approx(0.667, abs=0.001)
+
+    def test_warm_up_opens_connections(self, local_server):
+        """Test that warm-up leaves connections in the pool"""
+        client = get_shared_async_client(API_KEY, base_url=local_server)
+
+        async def run():
+            warmed = await warm_up_async(client, connections=3)
+            stats = pool_stats()['async']
+            # Close while the loop that owns the connections is still running
+            await client_factory.close_shared_clients()
+            return warmed, stats
+
+        warmed, stats = asyncio.run(run())
+
+        assert warmed == 3
+        assert stats['connections_opened'] == 3
+
+    def test_warm_up_unknown_client_is_noop(self):
+        """Test that warm-up ignores clients it did not build"""
+        assert asyncio.run(warm_up_async(object(), connections=3)) == 0
@@ -77,11 +77,11 @@ class TestClassifyIntent:
         assert result == "GENERAL_QUERY"
 
     def test_uses_correct_model(self, mock_anthropic_client):
-        """Test that correct model is used"""
+        """Test that the triage model is used"""
         classify_intent("test query", mock_anthropic_client)
 
         call_kwargs = mock_anthropic_client.messages.create.call_args[1]
-        assert call_kwargs['model'] == Config.CLAUDE_MODEL
+        assert call_kwargs['model'] == Config.CLAUDE_MODEL_TRIAGE
 
     def test_uses_correct_max_tokens(self, mock_anthropic_client):
         """Test that correct max_tokens is used"""
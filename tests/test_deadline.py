@@ -0,0 +1,156 @@
+"""
+Tests for end-to-end deadline propagation
+"""
+
+import asyncio
+
+import anthropic
+import httpx
+import pytest
+from unittest.mock import patch
+
+from First_Aid_buddy.config import Config
+from First_Aid_buddy.core import (
+    DeadlineExceededError,
+    answer_query,
+    call_claude_with_retry,
+    circuit_breaker,
+    classify_intent,
+    generate_final_answer,
+)
+from First_Aid_buddy.deadline import Deadline, generation_seconds
+from First_Aid_buddy.retry import RetryPolicy
+from backend.services.pipeline import run_chat_pipeline
+
+
+def make_timeout_error():
+    request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+    return anthropic.APITimeoutError(request=request)
+
+
+class TestDeadline:
+    """Test the deadline object"""
+
+    def test_remaining_and_expiry(self):
+        """Test that a fresh deadline has time and a zero one has none"""
+        assert 9 < Deadline(10).remaining() <= 10
+        assert Deadline(0).expired()
+
+    def test_reserve_ends_earlier(self):
+        """Test that reserving time moves the deadline forward"""
+        deadline = Deadline(10)
+        assert deadline.reserve(4).expires_at == pytest.approx(deadline.expires_at - 4)
+
+    def test_generation_tokens_from_remaining_time(self):
+        """Test that max_tokens follows the time left and the token rate"""
+        with patch.object(Config, 'GENERATION_TOKENS_PER_SECOND', 50), \
+                patch.object(Config, 'GENERATION_FIRST_TOKEN_SECONDS', 1):
+            assert Deadline(6).generation_tokens(1000) in (249, 250)
+            assert Deadline(100).generation_tokens(1000) == 1000
+            assert Deadline(0.5).generation_tokens(1000) == 0
+
+    def test_retry_state_uses_sooner_deadline(self):
+        """Test that the request deadline bounds the retry budget"""
+        state = RetryPolicy(deadline=20).start(Deadline(2))
+        assert state.remaining() <= 2
+        assert state.attempt_timeout() <= 2
+
+
+class TestStageBudgets:
+    """Test that stages size themselves from the remaining time"""
+
+    def test_max_tokens_derived_from_deadline(self, mock_anthropic_client):
+        """Test that generation asks for fewer tokens when time is short"""
+        with patch.object(Config, 'GENERATION_TOKENS_PER_SECOND', 50), \
+                patch.object(Config, 'GENERATION_FIRST_TOKEN_SECONDS', 1):
+            generate_final_answer("a cut", "docs", False, mock_anthropic_client, Deadline(6))
+
+        kwargs = mock_anthropic_client.messages.create.call_args[1]
+        assert Config.GENERATION_MIN_TOKENS <= kwargs['max_tokens'] <= 250
+        assert kwargs['timeout'].read <= 6
+
+    def test_generation_skipped_without_time(self, mock_anthropic_client):
+        """Test that generation is not started when a minimal answer cannot fit"""
+        deadline = Deadline(generation_seconds(Config.GENERATION_MIN_TOKENS) / 2)
+
+        with pytest.raises(DeadlineExceededError):
+            generate_final_answer("a cut", "docs", False, mock_anthropic_client, deadline)
+
+        mock_anthropic_client.messages.create.assert_not_called()
+
+    def test_triage_keeps_time_for_generation(self, mock_anthropic_client):
+        """Test that triage's timeout leaves the generation reserve untouched"""
+        reserve = generation_seconds(Config.GENERATION_MIN_TOKENS)
+        classify_intent("a cut", mock_anthropic_client, Deadline(reserve + 3))
+
+        timeout = mock_anthropic_client.messages.create.call_args[1]['timeout']
+        assert timeout.read <= 3
+
+    def test_triage_skipped_without_time(self, mock_anthropic_client):
+        """Test that triage is not started when it would eat the generation reserve"""
+        deadline = Deadline(generation_seconds(Config.GENERATION_MIN_TOKENS) + 0.1)
+
+        with pytest.raises(DeadlineExceededError):
+            classify_intent("a cut", mock_anthropic_client, deadline)
+
+        mock_anthropic_client.messages.create.assert_not_called()
+
+    @patch('First_Aid_buddy.core.time.sleep')
+    def test_retries_stop_at_deadline(self, mock_sleep, mock_anthropic_client):
+        """Test that running out of time is reported as a deadline error"""
+        mock_anthropic_client.messages.create.side_effect = make_timeout_error()
+
+        with pytest.raises(DeadlineExceededError):
+            call_claude_with_retry(mock_anthropic_client, 'test', deadline=Deadline(0.3), model='m')
+
+    @patch('First_Aid_buddy.core.time.sleep')
+    def test_shortened_timeouts_do_not_trip_breaker(self, mock_sleep, mock_anthropic_client):
+        """Test that timeouts we cut short are not counted against the API"""
+        mock_anthropic_client.messages.create.side_effect = make_timeout_error()
+
+        with pytest.raises(DeadlineExceededError):
+            call_claude_with_retry(mock_anthropic_client, 'test', deadline=Deadline(0.3), model='m')
+
+        assert circuit_breaker.snapshot()['window_calls'] == 0
+
+
+class TestDegradeOnDeadline:
+    """Test fallbacks when the deadline is short"""
+
+    def test_local_triage_then_generation(self, mock_anthropic_client, mock_generation_response):
+        """Test that skipped triage falls back to local rules and still generates"""
+        mock_anthropic_client.messages.create.return_value = mock_generation_response
+        deadline = Deadline(generation_seconds(Config.GENERATION_MIN_TOKENS) + 0.5)
+
+        answer, is_emergency, classification = answer_query(
+            "Someone is not breathing", mock_anthropic_client, deadline
+        )
+
+        assert classification == 'LIFE_THREATENING'
+        assert is_emergency is True
+        assert mock_anthropic_client.messages.create.call_count == 1
+        assert answer == mock_generation_response.content[0].text
+
+    def test_knowledge_base_answer_when_no_time(self, mock_anthropic_client):
+        """Test that no time at all yields a knowledge-base answer without API calls"""
+        answer, is_emergency, _ = answer_query("How do I treat a burn?", mock_anthropic_client, Deadline(0.01))
+
+        assert "first-aid reference" in answer
+        mock_anthropic_client.messages.create.assert_not_called()
+
+    def test_pipeline_rejects_expired_request(self, mock_anthropic_client):
+        """Test that a request whose deadline already passed does no work"""
+        with pytest.raises(DeadlineExceededError):
+            asyncio.run(run_chat_pipeline("How do I treat a burn?", mock_anthropic_client, deadline=Deadline(0)))
+
+        mock_anthropic_client.messages.create.assert_not_called()
+
+    def test_pipeline_degrades_when_short(self, mock_anthropic_client):
+        """Test that the API path returns a degraded answer when time is short"""
+        answer, _, citations, _, degraded = asyncio.run(
+            run_chat_pipeline("How do I treat a burn?", mock_anthropic_client, deadline=Deadline(0.5))
+        )
+
+        assert degraded is True
+        assert citations
+        mock_anthropic_client.messages.create.assert_not_called()
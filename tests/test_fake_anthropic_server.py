@@ -0,0 +1,135 @@
+"""
+Tests for the local fake Anthropic server, driven through the real SDK
+"""
+
+import asyncio
+import random
+
+import anthropic
+import pytest
+from unittest.mock import patch
+
+from First_Aid_buddy import client_factory
+from First_Aid_buddy.client_factory import get_shared_async_client, get_shared_client, pool_stats
+from First_Aid_buddy.core import APIError, call_claude_with_retry, classify_intent, generate_final_answer
+from First_Aid_buddy.retry import RetryPolicy
+from backend.services.pipeline import run_chat_pipeline
+from tests.fake_anthropic_server import LatencyDistribution, canned_reply
+
+API_KEY = "sk-ant-REDACTED"
+
+
+@pytest.fixture
+def client(fake_anthropic):
+    """Shared, pooled SDK client pointed at the fake server"""
+    yield get_shared_client(API_KEY, base_url=fake_anthropic.base_url)
+    asyncio.run(client_factory.close_shared_clients())
+
+
+class TestCannedOutputs:
+    """Test deterministic replies"""
+
+    def test_triage_reply(self):
+        """Test that triage requests get a category name"""
+        body = {
+            'system': "You are a specialized Triage Classification System.",
+            'messages': [{'role': 'user', 'content': "Classify: `my friend is not breathing`"}],
+        }
+        assert canned_reply(body) == 'LIFE_THREATENING'
+
+    def test_latency_specs(self):
+        """Test that latency distributions parse and sample deterministically"""
+        rng_a, rng_b = random.Random(1), random.Random(1)
+        dist = LatencyDistribution('lognormal:0.2,0.5')
+        assert dist.sample(rng_a) == dist.sample(rng_b)
+        assert LatencyDistribution('fixed:0.3').sample(rng_a) == 0.3
+        with pytest.raises(ValueError):
+            LatencyDistribution('gamma:1')
+
+
+class TestOverHttp:
+    """Test the pipeline against the fake server over real HTTP"""
+
+    def test_classification(self, client):
+        """Test that triage works end to end through the SDK"""
+        assert classify_intent("Someone is not breathing", client) == 'LIFE_THREATENING'
+        assert classify_intent("How do I treat a small cut?", client) == 'GENERAL_QUERY'
+
+    def test_generation_respects_max_tokens(self, client, fake_anthropic):
+        """Test that output is cut at max_tokens"""
+        response = client.messages.create(
+            model='m', max_tokens=3, messages=[{'role': 'user', 'content': 'help'}]
+        )
+        assert response.stop_reason == 'max_tokens'
+        assert response.usage.output_tokens == 3
+
+    def test_streaming(self, client, fake_anthropic):
+        """Test that SSE streaming yields the same text as a plain call"""
+        fake_anthropic.configure(tokens_per_second=500)
+        with client.messages.stream(
+            model='m', max_tokens=100, messages=[{'role': 'user', 'content': 'help'}]
+        ) as stream:
+            streamed = ''.join(stream.text_stream)
+            final = stream.get_final_message()
+
+        plain = client.messages.create(model='m', max_tokens=100, messages=[{'role': 'user', 'content': 'help'}])
+        assert streamed.strip() == plain.content[0].text
+        assert final.usage.output_tokens == plain.usage.output_tokens
+
+    @patch('First_Aid_buddy.core.time.sleep')
+    def test_injected_429_is_retried(self, mock_sleep, client, fake_anthropic):
+        """Test that a 429 with retry-after is retried after the server's delay"""
+        fake_anthropic.configure(retry_after=2)
+        fake_anthropic.fail_next(429)
+
+        generate_final_answer("a cut", "docs", False, client)
+
+        mock_sleep.assert_called_once_with(pytest.approx(2.0))
+        assert fake_anthropic.stats.snapshot()['outcomes'] == {'429': 1, 'ok': 1}
+
+    @patch('First_Aid_buddy.core.time.sleep')
+    def test_overload_exhausts_retries(self, mock_sleep, client, fake_anthropic):
+        """Test that persistent 529s surface as APIError"""
+        fake_anthropic.fail_next(529, count=10)
+
+        with pytest.raises(APIError):
+            call_claude_with_retry(
+                client, 'test', retry_policy=RetryPolicy(max_retries=2, deadline=60),
+                model='m', max_tokens=5, messages=[{'role': 'user', 'content': 'hi'}]
+            )
+
+        assert fake_anthropic.stats.snapshot()['outcomes'] == {'529': 3}
+
+    def test_injected_timeout(self, client, fake_anthropic):
+        """Test that a stalled request times out on the client"""
+        fake_anthropic.fail_next(0)
+
+        with pytest.raises(APIError):
+            call_claude_with_retry(
+                client, 'test', retry_policy=RetryPolicy(max_retries=0, deadline=0.3),
+                model='m', max_tokens=5, messages=[{'role': 'user', 'content': 'hi'}]
+            )
+
+    def test_connections_are_reused(self, client, fake_anthropic):
+        """Test that sequential calls share one pooled connection"""
+        for _ in range(5):
+            classify_intent("How do I treat a burn?", client)
+
+        assert fake_anthropic.stats.snapshot()['connections'] == 1
+        assert pool_stats()['sync']['reuse_ratio'] == pytest.approx(0.8)
+
+    def test_async_pipeline(self, fake_anthropic):
+        """Test the API pipeline with a real AsyncAnthropic client"""
+        async def run():
+            client = get_shared_async_client(API_KEY, base_url=fake_anthropic.base_url)
+            try:
+                return await run_chat_pipeline("My friend collapsed and is not breathing", client)
+            finally:
+                await client_factory.close_shared_clients()
+
+        answer, is_emergency, citations, _, degraded = asyncio.run(run())
+
+        assert is_emergency is True
+        assert degraded is False
+        assert answer.startswith("1.")
+        assert fake_anthropic.stats.snapshot()['outcomes'] == {'ok': 2}
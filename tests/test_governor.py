@@ -0,0 +1,201 @@
+"""
+Tests for the outbound RPM/TPM governor
+"""
+
+import asyncio
+import time
+
+import anthropic
+import httpx
+import pytest
+from unittest.mock import Mock, patch
+
+from First_Aid_buddy.core import ThrottledError, answer_query, call_claude_with_retry
+from First_Aid_buddy.governor import EMERGENCY, NORMAL, SHED, RateGovernor, estimate_request_tokens
+from First_Aid_buddy.hedging import Hedger
+
+
+def make_governor(**kwargs):
+    options = dict(rpm=600, tpm=600, workers=1, reserve=0.0, max_wait=5, enabled=True)
+    options.update(kwargs)
+    return RateGovernor(**options)
+
+
+def make_rate_limit_error(retry_after="3"):
+    request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+    response = httpx.Response(429, headers={"retry-after": retry_after}, request=request)
+    return anthropic.RateLimitError("rate limited", response=response, body=None)
+
+
+class TestRateGovernor:
+    """Test the token buckets"""
+
+    def test_within_limits_is_immediate(self):
+        """Test that calls under the limit are not held"""
+        governor = make_governor()
+        permit = governor.acquire(100)
+        assert permit is not None
+        assert permit.waited < 0.05
+
+    def test_sheds_when_wait_too_long(self):
+        """Test that calls that cannot fit within max_wait are shed"""
+        governor = make_governor()
+        assert governor.acquire(600) is not None
+        assert governor.acquire(100, max_wait=0.1) is None
+
+    def test_waits_for_refill(self):
+        """Test that short shortfalls are queued rather than shed"""
+        governor = make_governor()
+        governor.acquire(600)
+
+        started = time.monotonic()
+        permit = governor.acquire(2, max_wait=1)
+
+        assert permit is not None
+        assert 0.1 <= time.monotonic() - started < 1
+
+    def test_request_limit(self):
+        """Test that the request bucket limits call count independent of tokens"""
+        governor = make_governor(rpm=3, tpm=100000)
+        for _ in range(3):
+            assert governor.acquire(1) is not None
+        assert governor.acquire(1, max_wait=0.1) is None
+
+    def test_emergency_reserve(self):
+        """Test that reserved headroom is only available to emergencies"""
+        governor = make_governor(reserve=0.5)
+        assert governor.acquire(300) is not None
+        assert governor.acquire(10, max_wait=0) is None
+        assert governor.acquire(10, priority=EMERGENCY, max_wait=0) is not None
+
+    def test_workers_share_limits(self):
+        """Test that each worker gets its share of the organisation's limits"""
+        governor = make_governor(workers=3)
+        assert governor.snapshot()['tokens_per_minute'] == 200
+
+    def test_settle_returns_unused_tokens(self):
+        """Test that actual usage replaces the pre-charged estimate"""
+        governor = make_governor()
+        permit = governor.acquire(500)
+        governor.settle(permit, Mock(input_tokens=50, output_tokens=50))
+        assert governor.snapshot()['tokens_available'] >= 500
+
+    def test_settle_ignores_missing_usage(self):
+        """Test that responses without numeric usage keep the estimate"""
+        governor = make_governor()
+        permit = governor.acquire(500)
+        governor.settle(permit, Mock())
+        assert governor.snapshot()['tokens_available'] < 200
+
+    def test_pause_holds_new_calls_only(self):
+        """Test that a 429 pause holds new calls but not retries"""
+        governor = make_governor()
+        governor.pause(10)
+        assert governor.acquire(1, max_wait=0.1) is None
+        assert governor.acquire(1, max_wait=0.1, respect_pause=False) is not None
+
+    def test_try_acquire_never_waits(self):
+        """Test that try_acquire takes a free permit or returns None at once, without shedding"""
+        governor = make_governor(rpm=1)
+        before = SHED.value(priority=NORMAL)
+        assert governor.try_acquire(1) is not None
+        assert governor.try_acquire(1) is None
+        assert SHED.value(priority=NORMAL) == before
+
+    def test_disabled_never_holds(self):
+        """Test that a disabled governor lets everything through"""
+        governor = make_governor(enabled=False, rpm=1)
+        for _ in range(5):
+            assert governor.acquire(10000, max_wait=0) is not None
+
+    def test_async_waits_without_blocking(self):
+        """Test that the async variant waits with asyncio.sleep"""
+        governor = make_governor()
+        governor.acquire(600)
+        sleeps = []
+        real_sleep = asyncio.sleep
+
+        async def fake_sleep(delay):
+            sleeps.append(delay)
+            await real_sleep(delay)
+
+        with patch('First_Aid_buddy.governor.asyncio.sleep', fake_sleep):
+            permit = asyncio.run(governor.acquire_async(2, max_wait=1))
+
+        assert permit is not None
+        assert sleeps
+
+    def test_estimate_request_tokens(self):
+        """Test that estimates cover input characters and max_tokens"""
+        request = {'system': 'x' * 400, 'messages': [{'role': 'user', 'content': 'y' * 400}], 'max_tokens': 10}
+        assert estimate_request_tokens(request) == 210
+
+
+class TestGovernedCalls:
+    """Test the governor in front of API calls"""
+
+    def test_shed_call_raises_throttled(self, mock_anthropic_client):
+        """Test that shed calls never reach the API"""
+        governor = make_governor(rpm=1, max_wait=0)
+        governor.acquire(1)
+
+        with patch('First_Aid_buddy.core.governor', governor):
+            with pytest.raises(ThrottledError):
+                call_claude_with_retry(mock_anthropic_client, 'test', model='m', max_tokens=5, messages=[])
+
+        mock_anthropic_client.messages.create.assert_not_called()
+
+    def test_shed_answer_degrades(self, mock_anthropic_client):
+        """Test that a shed query gets the knowledge-base answer"""
+        governor = make_governor(rpm=1, max_wait=0)
+        governor.acquire(1)
+
+        with patch('First_Aid_buddy.core.governor', governor):
+            answer, _, _ = answer_query("How do I treat a burn?", mock_anthropic_client)
+
+        assert "first-aid reference" in answer
+        mock_anthropic_client.messages.create.assert_not_called()
+
+    def test_emergency_generation_uses_reserve(
+        self, mock_anthropic_client, mock_emergency_response, mock_generation_response
+    ):
+        """Test that emergencies still get through when only the reserve is left"""
+        mock_anthropic_client.messages.create.side_effect = [mock_emergency_response, mock_generation_response]
+        governor = make_governor(rpm=10, tpm=1000000, reserve=0.5, max_wait=0)
+        for _ in range(5):
+            governor.acquire(1)
+
+        with patch('First_Aid_buddy.core.governor', governor):
+            answer, is_emergency, _ = answer_query("Someone is not breathing", mock_anthropic_client)
+
+        assert is_emergency is True
+        assert mock_anthropic_client.messages.create.call_count == 2
+        assert answer == mock_generation_response.content[0].text
+
+    @patch('First_Aid_buddy.core.time.sleep')
+    def test_rate_limit_response_pauses_governor(self, mock_sleep, mock_anthropic_client):
+        """Test that a 429 from the API holds back other new calls"""
+        governor = make_governor()
+        mock_anthropic_client.messages.create.side_effect = [make_rate_limit_error("3"), Mock()]
+
+        with patch('First_Aid_buddy.core.governor', governor):
+            call_claude_with_retry(mock_anthropic_client, 'test', model='m', max_tokens=5, messages=[])
+
+        assert governor.snapshot()['paused_for_s'] > 2
+
+    def test_hedge_needs_a_permit(self, mock_anthropic_client):
+        """Test that a slow call is not hedged once the primary used the last permit"""
+        governor = make_governor(rpm=1)
+        hedger = Hedger(enabled=True, min_samples=1, min_delay=0.01)
+        hedger.window('test').record(0.001)
+
+        def slow(**kwargs):
+            time.sleep(0.1)
+            return Mock()
+
+        mock_anthropic_client.messages.create.side_effect = slow
+        with patch('First_Aid_buddy.core.governor', governor), patch('First_Aid_buddy.core.hedger', hedger):
+            call_claude_with_retry(mock_anthropic_client, 'test', model='m', max_tokens=5, messages=[])
+
+        assert mock_anthropic_client.messages.create.call_count == 1
+        assert hedger.snapshot()['test']['hedges'] == 0
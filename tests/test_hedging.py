@@ -0,0 +1,213 @@
+"""
+Tests for hedged LLM requests
+"""
+
+import asyncio
+import threading
+import time
+
+from First_Aid_buddy.hedging import Hedger, LatencyWindow, HEDGES, HEDGE_RATE, HEDGE_SAVED
+
+
+def primed_hedger(operation='op', **kwargs):
+    """Hedger with enough fast history that the hedge delay is ~min_delay"""
+    options = dict(enabled=True, percentile=95, max_rate=0.05, min_samples=5, min_delay=0.02)
+    options.update(kwargs)
+    hedger = Hedger(**options)
+    for _ in range(10):
+        hedger.window(operation).record(0.001)
+    return hedger
+
+
+class TestLatencyWindow:
+    """Test rolling percentiles"""
+
+    def test_percentiles(self):
+        """Test nearest-rank percentiles over the window"""
+        window = LatencyWindow(size=100)
+        for i in range(1, 101):
+            window.record(i / 100)
+        assert window.percentile(50) == 0.5
+        assert window.percentile(95) == 0.95
+        assert window.percentile(100) == 1.0
+
+    def test_window_is_bounded(self):
+        """Test that old samples fall out of the window"""
+        window = LatencyWindow(size=3)
+        for value in (10, 1, 2, 3):
+            window.record(value)
+        assert len(window) == 3
+        assert window.percentile(100) == 3
+
+    def test_empty_window(self):
+        """Test that an empty window has no percentile"""
+        assert LatencyWindow().percentile(99) is None
+
+
+class TestHedger:
+    """Test hedged calls"""
+
+    def test_disabled_calls_directly(self):
+        """Test that a disabled hedger simply calls through"""
+        hedger = Hedger(enabled=False)
+        assert hedger.call('op', lambda: 42) == 42
+
+    def test_no_hedge_without_history(self):
+        """Test that hedging waits for enough latency samples"""
+        hedger = Hedger(enabled=True, min_samples=5)
+        assert hedger.hedge_delay('op') is None
+        assert hedger.call('op', lambda: 'ok') == 'ok'
+
+    def test_slow_primary_is_hedged(self):
+        """Test that the hedge answers when the primary is slow"""
+        hedger = primed_hedger()
+        calls = []
+        lock = threading.Lock()
+
+        def fn():
+            with lock:
+                calls.append(1)
+                first = len(calls) == 1
+            if first:
+                time.sleep(0.5)
+                return 'primary'
+            return 'hedge'
+
+        before = HEDGES.value(operation='op', outcome='hedge_won')
+        started = time.monotonic()
+        assert hedger.call('op', fn) == 'hedge'
+        assert time.monotonic() - started < 0.4
+        assert len(calls) == 2
+        assert HEDGES.value(operation='op', outcome='hedge_won') == before + 1
+
+    def test_failed_hedge_falls_back_to_primary(self):
+        """Test that the first *successful* response wins"""
+        hedger = primed_hedger()
+        calls = []
+        lock = threading.Lock()
+
+        def fn():
+            with lock:
+                calls.append(1)
+                first = len(calls) == 1
+            if first:
+                time.sleep(0.1)
+                return 'primary'
+            raise RuntimeError("hedge failed")
+
+        assert hedger.call('op', fn) == 'primary'
+
+    def test_hedge_rate_is_capped(self):
+        """Test that hedges stay within max_rate of eligible calls"""
+        hedger = primed_hedger(max_rate=0.05)
+        calls = []
+        lock = threading.Lock()
+
+        def slow():
+            with lock:
+                calls.append(1)
+            time.sleep(0.04)
+            return 'ok'
+
+        for _ in range(5):
+            hedger.call('op', slow)
+
+        # One hedge from the initial token, then the bucket is empty
+        assert len(calls) == 6
+        assert hedger.snapshot()['op']['hedges'] == 1
+
+    def test_hedge_rate_falls_between_hedges(self):
+        """Test that the rate gauge is refreshed by unhedged calls too"""
+        hedger = primed_hedger()
+
+        def slow():
+            time.sleep(0.04)
+            return 'ok'
+
+        hedger.call('op', slow)
+        assert HEDGE_RATE.value(operation='op') == 1.0
+
+        hedger.call('op', lambda: 'ok', may_hedge=False)
+        hedger.call('op', lambda: 'ok', may_hedge=False)
+        assert HEDGE_RATE.value(operation='op') == 1 / 3
+
+    def test_refused_permit_skips_hedge(self):
+        """Test that no hedge is sent without a permit, and the hedge budget is kept"""
+        hedger = primed_hedger()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.05)
+            return 'ok'
+
+        assert hedger.call('op', slow, hedge_permit=lambda: False) == 'ok'
+        assert len(calls) == 1
+        assert hedger._tokens >= 1.0
+
+        assert hedger.call('op', slow, hedge_permit=lambda: True) == 'ok'
+        assert len(calls) == 3
+
+    def test_async_hedge_cancels_loser(self):
+        """Test that the async variant cancels the losing call"""
+        hedger = primed_hedger()
+        cancelled = []
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            if len(calls) == 1:
+                try:
+                    await asyncio.sleep(1)
+                except asyncio.CancelledError:
+                    cancelled.append(True)
+                    raise
+                return 'primary'
+            return 'hedge'
+
+        async def run():
+            result = await hedger.call_async('op', fn)
+            await asyncio.sleep(0)
+            return result
+
+        assert asyncio.run(run()) == 'hedge'
+        assert cancelled == [True]
+
+    def test_async_hedge_records_saved_time(self):
+        """Test that a winning async hedge estimates the cancelled primary's remaining time"""
+        # Own operation: losing primaries of earlier tests still record against 'op'
+        hedger = primed_hedger('saved')
+        hedger.window('saved').record(1.0)
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            if len(calls) == 1:
+                await asyncio.sleep(1)
+                return 'primary'
+            return 'hedge'
+
+        before = (HEDGE_SAVED.count(operation='saved'), HEDGE_SAVED.sum(operation='saved'))
+        assert asyncio.run(hedger.call_async('saved', fn)) == 'hedge'
+        assert HEDGE_SAVED.count(operation='saved') == before[0] + 1
+        assert 0.9 < HEDGE_SAVED.sum(operation='saved') - before[1] < 1.0
+
+    def test_full_pool_runs_on_caller_thread(self):
+        """Test that sync calls never queue behind the hedge pool"""
+        hedger = primed_hedger(max_workers=3)
+        release = threading.Event()
+        started = threading.Event()
+
+        def slow():
+            started.set()
+            release.wait(1)
+            return 'slow'
+
+        # One hedged call holds two of the three pool threads
+        background = threading.Thread(target=hedger.call, args=('op', slow))
+        background.start()
+        started.wait(1)
+
+        assert hedger.call('op', lambda: threading.current_thread()) is threading.current_thread()
+        release.set()
+        background.join()
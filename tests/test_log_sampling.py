@@ -0,0 +1,143 @@
+"""
+Tests for adaptive sampling of routine log lines
+"""
+
+import json
+import logging
+import random
+
+import pytest
+
+from First_Aid_buddy import logger as logger_module
+from First_Aid_buddy.logger import (
+    SAMPLE_RATE, SAMPLED_OUT, JsonFormatter, LogSampler, log_api_call, log_security_event, log_user_query
+)
+from First_Aid_buddy.metrics import registry, snapshot
+
+
+class Collector(logging.Handler):
+    def __init__(self, sampler):
+        super().__init__()
+        self.setFormatter(JsonFormatter())
+        self.addFilter(sampler)
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(json.loads(self.format(record)))
+
+
+@pytest.fixture
+def sampled_logger():
+    def make(target_per_second=10, enabled=True):
+        collector = Collector(LogSampler(target_per_second, enabled=enabled))
+        logger = logging.getLogger('test_log_sampling')
+        logger.handlers = [collector]
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        return logger, collector
+
+    yield make
+    logging.getLogger('test_log_sampling').handlers = []
+
+
+@pytest.fixture(autouse=True)
+def seeded_random(monkeypatch):
+    monkeypatch.setattr(random, 'random', random.Random(46).random)
+
+
+class TestLogSampler:
+    """Test which lines are sampled and how they are weighted"""
+
+    def test_all_kept_under_target(self, sampled_logger):
+        """Test that nothing is sampled at low throughput"""
+        logger, collector = sampled_logger(target_per_second=100)
+        for _ in range(50):
+            log_user_query(logger, 10, 'GENERAL_QUERY', 5.0)
+        assert len(collector.lines) == 50
+        assert {line['sample_weight'] for line in collector.lines} == {1}
+
+    def test_routine_lines_sampled_under_load(self, sampled_logger):
+        """Test that a burst is cut towards the target and weights restore the total"""
+        logger, collector = sampled_logger(target_per_second=10)
+        before = SAMPLED_OUT.value(event='api_call')
+        for _ in range(2000):
+            log_api_call(logger, 'classify_intent', success=True, duration_ms=1.0, metadata={'attempt': 1})
+
+        kept = len(collector.lines)
+        assert kept < 200
+        assert SAMPLED_OUT.value(event='api_call') == before + 2000 - kept
+        estimate = sum(line['sample_weight'] for line in collector.lines)
+        assert 1500 < estimate < 2500
+
+    def test_important_lines_always_kept(self, sampled_logger):
+        """Test that errors, security events, emergencies and plain messages bypass sampling"""
+        logger, collector = sampled_logger(target_per_second=1)
+        for _ in range(200):
+            log_user_query(logger, 10, 'GENERAL_QUERY', 5.0)
+        collector.lines.clear()
+
+        for _ in range(20):
+            log_user_query(logger, 10, 'LIFE_THREATENING', 5.0)
+            log_api_call(logger, 'generate_answer', success=False, duration_ms=1.0)
+            log_api_call(logger, 'generate_answer', success=False, duration_ms=1.0, retrying=True)
+            log_security_event(logger, 'rate_limit_exceeded', 'session abc')
+            logger.info("Loaded screening rules")
+        assert len(collector.lines) == 100
+
+    def test_events_sampled_independently(self, sampled_logger):
+        """Test that a flood of one event does not thin out another"""
+        logger, collector = sampled_logger(target_per_second=20)
+        for _ in range(1000):
+            log_api_call(logger, 'classify_intent', success=True, duration_ms=1.0)
+        for _ in range(10):
+            log_user_query(logger, 10, 'GENERAL_QUERY', 5.0)
+        assert sum(line['event'] == 'user_query' for line in collector.lines) == 10
+
+    def test_weight_in_text_lines(self, sampled_logger):
+        """Test that text-format lines carry the weight too"""
+        logger, collector = sampled_logger(target_per_second=1)
+        collector.setFormatter(logging.Formatter('%(message)s'))
+        collector.emit = lambda record: collector.lines.append(collector.format(record))
+        for _ in range(100):
+            log_user_query(logger, 10, 'GENERAL_QUERY', 5.0)
+        assert any('sample_weight=' in line for line in collector.lines)
+
+    def test_disabled_keeps_everything(self, sampled_logger):
+        logger, collector = sampled_logger(target_per_second=1, enabled=False)
+        for _ in range(100):
+            log_user_query(logger, 10, 'GENERAL_QUERY', 5.0)
+        assert len(collector.lines) == 100
+
+
+class TestSampleRateGauge:
+    """Test the log_sample_rate gauge"""
+
+    @pytest.fixture
+    def clocked_sampler(self, monkeypatch):
+        """Global sampler replaced by one on a manual clock"""
+        clock = [1000.0]
+        sampler = LogSampler(10, clock=lambda: clock[0])
+        monkeypatch.setattr(logger_module, 'log_sampler', sampler)
+        logger = logging.getLogger('test_sample_rate')
+        logger.handlers = [Collector(sampler)]
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        yield logger, clock
+        logger.handlers = []
+
+    def test_rate_recovers_after_burst(self, clocked_sampler):
+        """Test that the gauge returns to 1 once lines stop, without another line arriving"""
+        logger, clock = clocked_sampler
+        for _ in range(1000):
+            log_api_call(logger, 'classify_intent', success=True, duration_ms=1.0)
+
+        snapshot(registry)
+        assert SAMPLE_RATE.value(event='api_call') == pytest.approx(0.01)
+
+        clock[0] += 0.5
+        snapshot(registry)
+        assert SAMPLE_RATE.value(event='api_call') == pytest.approx(0.01)
+
+        clock[0] += 200
+        snapshot(registry)
+        assert SAMPLE_RATE.value(event='api_call') == 1.0
@@ -0,0 +1,107 @@
+"""
+Tests for the single-pass log sanitizer
+"""
+
+import logging
+import random
+import sys
+import time
+
+import pytest
+
+from First_Aid_buddy.logger import SanitizingFormatter
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Lines the request path logs on every query
+TYPICAL_MESSAGES = [
+    "API Call: {'operation': 'classify_intent', 'status': 'SUCCESS', 'duration_ms': 412.33, "
+    "'model': 'claude-haiku-4-5-20251001'}",
+    "Query processed: length=42, classification=GENERAL_QUERY, time=1234.5ms",
+    "Loaded screening rules from file",
+    "User wrote: call me on 07700900123 or john.doe@example.com, I live at M1 1AE",
+]
+
+
+def sequential_sanitize(text: str) -> str:
+    """The previous implementation: one sub() pass per pattern"""
+    for name, pattern in SanitizingFormatter.PATTERNS.items():
+        text = pattern.sub(f'[REDACTED_{name.upper()}]', text)
+    return text
+
+
+class SequentialFormatter(logging.Formatter):
+    def format(self, record):
+        return sequential_sanitize(super().format(record))
+
+
+def make_record(message, exc_info=None):
+    return logging.LogRecord('test', logging.INFO, __file__, 1, message, None, exc_info)
+
+
+def per_line_seconds(formatter, message, lines=2000):
+    record = make_record(message)
+    best = float('inf')
+    for _ in range(5):
+        started = time.perf_counter()
+        for _ in range(lines):
+            formatter.format(record)
+        best = min(best, (time.perf_counter() - started) / lines)
+    return best
+
+
+class TestSanitizer:
+    """Test redaction results"""
+
+    @pytest.mark.parametrize('text, expected', [
+        ("key sk-ant-api03-abc_DEF-123 here", "key [REDACTED_API_KEY] here"),
+        ("mail john.doe@example.co.uk now", "mail [REDACTED_EMAIL] now"),
+        ("ring 07700900123", "ring [REDACTED_PHONE_UK]"),
+        ("ring 555-123-4567", "ring [REDACTED_PHONE_US]"),
+        ("card 4111 1111 1111 1111", "card [REDACTED_CREDIT_CARD]"),
+        ("ssn 123-45-6789", "ssn [REDACTED_SSN]"),
+        ("at m1 1ae", "at [REDACTED_POSTCODE_UK]"),
+    ])
+    def test_redacts_each_kind(self, text, expected):
+        """Test every pattern through the combined regex"""
+        assert SanitizingFormatter.sanitize(text) == expected
+
+    def test_clean_line_returned_as_is(self):
+        """Test that lines without digits, '@' or key prefix skip the regex"""
+        text = "Loaded screening rules from file"
+        assert SanitizingFormatter.sanitize(text) is text
+
+    def test_matches_sequential_passes(self):
+        """Test that one pass redacts exactly what seven passes did"""
+        rng = random.Random(43)
+        alphabet = '0123456789 -.@_abcksntSWA'
+        for _ in range(5000):
+            text = ''.join(rng.choice(alphabet) for _ in range(rng.randint(5, 80)))
+            assert SanitizingFormatter.sanitize(text) == sequential_sanitize(text), text
+        for message in TYPICAL_MESSAGES:
+            assert SanitizingFormatter.sanitize(message) == sequential_sanitize(message)
+
+    def test_formatter_sanitizes_message_and_exception(self):
+        """Test that messages and tracebacks are redacted but the timestamp is not scanned"""
+        formatter = SanitizingFormatter(LOG_FORMAT)
+        try:
+            raise ValueError("bad key sk-ant-secret")
+        except ValueError:
+            record = make_record("from 07700900123", exc_info=sys.exc_info())
+
+        output = formatter.format(record)
+        assert "07700900123" not in output and "sk-ant-secret" not in output
+        assert "[REDACTED_PHONE_UK]" in output and "[REDACTED_API_KEY]" in output
+        assert output[:4].isdigit()
+
+
+class TestSanitizerCost:
+    """Benchmark the per-line cost before and after"""
+
+    def test_single_pass_cheaper_per_line(self):
+        """Test that every typical line formats faster than with sequential passes (costs shown with -s)"""
+        before, after = SequentialFormatter(LOG_FORMAT), SanitizingFormatter(LOG_FORMAT)
+        for message in TYPICAL_MESSAGES:
+            old, new = per_line_seconds(before, message), per_line_seconds(after, message)
+            print(f"{old * 1e6:6.1f}us -> {new * 1e6:6.1f}us  {message[:50]}")
+            assert new < old, message
@@ -0,0 +1,235 @@
+"""
+Tests for metrics exposition, multi-worker aggregation and request instrumentation
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+from fastapi import HTTPException
+
+from First_Aid_buddy.config import Config
+from First_Aid_buddy.core import LLM_ERRORS
+from First_Aid_buddy.deadline import Deadline
+from First_Aid_buddy.metrics import MetricsRegistry, MultiprocessExporter, merge, render, snapshot
+from backend.routers.metrics import metrics as metrics_endpoint
+from backend.services import pipeline
+from backend.services.pipeline import CLASSIFICATIONS, STAGE_SECONDS, run_chat_pipeline
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _traced() -> bool:
+    """Whether a tracer (coverage, a debugger) is slowing every line down"""
+    monitoring = getattr(sys, 'monitoring', None)
+    if monitoring is not None and monitoring.get_tool(monitoring.COVERAGE_ID) is not None:
+        return True
+    return sys.gettrace() is not None
+
+# Run in another process: count 3 requests and publish them to the directory
+WORKER_SCRIPT = """
+import sys
+sys.path.insert(0, {root!r})
+from First_Aid_buddy.metrics import MetricsRegistry, MultiprocessExporter
+source = MetricsRegistry()
+source.counter('requests_total', 'Requests', ('route',)).inc(3, route='/chat')
+source.gauge('in_flight', 'In flight').set(2)
+source.histogram('latency_seconds', 'Latency', buckets=(0.1, 1.0)).observe(0.5)
+MultiprocessExporter({directory!r}, source).write()
+"""
+
+
+def answer_response(text):
+    response = Mock()
+    response.content = [Mock(text=text)]
+    return response
+
+
+@pytest.fixture
+def source():
+    source = MetricsRegistry()
+    source.counter('requests_total', 'Requests', ('route',)).inc(2, route='/chat')
+    source.gauge('in_flight', 'In flight').set(1)
+    source.histogram('latency_seconds', 'Latency', buckets=(0.1, 1.0)).observe(0.05)
+    return source
+
+
+class TestExposition:
+    """Test the Prometheus text format"""
+
+    def test_render(self, source):
+        """Test HELP/TYPE lines, labels and cumulative histogram buckets"""
+        source.counter('requests_total', 'Requests', ('route',)).inc(route='say "hi"\n')
+        text = render(snapshot(source))
+        assert text.endswith('\n')
+        lines = text.splitlines()
+
+        assert '# TYPE requests_total counter' in lines
+        assert 'requests_total{route="/chat"} 2' in lines
+        assert 'requests_total{route="say \\"hi\\"\\n"} 1' in lines
+        assert 'in_flight 1' in lines
+        assert lines[lines.index('# TYPE latency_seconds histogram') + 1:][:5] == [
+            'latency_seconds_bucket{le="0.1"} 1',
+            'latency_seconds_bucket{le="1"} 1',
+            'latency_seconds_bucket{le="+Inf"} 1',
+            'latency_seconds_sum 0.05',
+            'latency_seconds_count 1',
+        ]
+
+    def test_merge_sums_everything(self, source):
+        merged = merge([snapshot(source), snapshot(source)])
+        text = render(merged).splitlines()
+        assert 'requests_total{route="/chat"} 4' in text
+        assert 'in_flight 2' in text
+        assert 'latency_seconds_bucket{le="0.1"} 2' in text
+
+
+class TestMultiprocess:
+    """Test aggregation across worker processes"""
+
+    def test_other_worker_included(self, source, tmp_path):
+        """Test that a scrape of one worker reports another process's values too"""
+        subprocess.run(
+            [sys.executable, '-c', WORKER_SCRIPT.format(root=PROJECT_ROOT, directory=str(tmp_path))],
+            check=True,
+        )
+        lines = render(MultiprocessExporter(str(tmp_path), source).collect()).splitlines()
+
+        assert 'requests_total{route="/chat"} 5' in lines
+        assert 'in_flight 3' in lines
+        assert 'latency_seconds_count 2' in lines
+
+    def test_exited_worker_keeps_counts_not_gauges(self, source, tmp_path):
+        """Test that a stale worker file still counts but its gauges are dropped"""
+        subprocess.run(
+            [sys.executable, '-c', WORKER_SCRIPT.format(root=PROJECT_ROOT, directory=str(tmp_path))],
+            check=True,
+        )
+        lines = render(MultiprocessExporter(str(tmp_path), source, stale_after=-1).collect()).splitlines()
+        assert 'requests_total{route="/chat"} 5' in lines
+        assert 'in_flight 1' in lines
+
+    def test_writer_thread(self, source, tmp_path):
+        """Test that start() publishes periodically and stop() archives the final values"""
+        exporter = MultiprocessExporter(str(tmp_path), source, interval=0.01)
+        exporter.start()
+        source.counter('requests_total', 'Requests', ('route',)).inc(route='/chat')
+        exporter.stop()
+
+        # Another worker still sees the counts once this worker's file is gone
+        assert not os.path.exists(exporter.path)
+        reader = MultiprocessExporter(str(tmp_path), MetricsRegistry())
+        assert 'requests_total{route="/chat"} 3' in render(reader.collect()).splitlines()
+
+    def test_dead_worker_file_archived(self, source, tmp_path):
+        """Test that an exited worker's file is folded into the archive once, not summed twice"""
+        subprocess.run(
+            [sys.executable, '-c', WORKER_SCRIPT.format(root=PROJECT_ROOT, directory=str(tmp_path))],
+            check=True,
+        )
+        exporter = MultiprocessExporter(str(tmp_path), source, stale_after=-1)
+        for _ in range(2):
+            lines = render(exporter.collect()).splitlines()
+            assert 'requests_total{route="/chat"} 5' in lines
+            assert 'in_flight 1' in lines
+        assert sorted(os.listdir(str(tmp_path))) == ['archive.json', 'archive.lock']
+
+    def test_reused_pid_keeps_old_counts(self, source, tmp_path):
+        """Test that a leftover file with this process's PID is archived, not overwritten"""
+        earlier = MetricsRegistry()
+        earlier.counter('requests_total', 'Requests', ('route',)).inc(7, route='/chat')
+        MultiprocessExporter(str(tmp_path), earlier).write()
+
+        exporter = MultiprocessExporter(str(tmp_path), source, interval=60)
+        exporter.start()
+        try:
+            assert 'requests_total{route="/chat"} 9' in render(exporter.collect()).splitlines()
+        finally:
+            exporter.stop()
+
+
+class TestInstrumentation:
+    """Test the per-stage metrics recorded by the chat pipeline"""
+
+    @pytest.fixture
+    def async_client(self):
+        client = Mock()
+        client.messages.create = AsyncMock(side_effect=[
+            answer_response("GENERAL_QUERY"), answer_response("Clean the wound."),
+        ])
+        return client
+
+    def test_pipeline_stages_recorded(self, async_client):
+        """Test that every stage and the classification are counted"""
+        stages = ('validate', 'rate_limit', 'retrieve', 'classify', 'generate', 'total')
+        before = {stage: STAGE_SECONDS.count(stage=stage) for stage in stages}
+        classified = CLASSIFICATIONS.value(classification='GENERAL_QUERY', degraded='false')
+
+        asyncio.run(run_chat_pipeline("How do I treat a minor cut?", async_client, "s1", Deadline(60)))
+
+        assert {stage: STAGE_SECONDS.count(stage=stage) - before[stage] for stage in stages} == dict.fromkeys(stages, 1)
+        assert CLASSIFICATIONS.value(classification='GENERAL_QUERY', degraded='false') == classified + 1
+
+    def test_api_errors_by_type(self, async_client):
+        """Test that failed attempts are counted by error type"""
+        from First_Aid_buddy.core import _record_failed_attempt
+        from First_Aid_buddy.retry import RetryPolicy, RetryState
+
+        before = LLM_ERRORS.value(operation='classify_intent', error='ValueError')
+        state = RetryState(RetryPolicy(max_retries=0), Deadline(5))
+        _record_failed_attempt(state, 'classify_intent', ValueError("boom"), 0.01, 1.0)
+        assert LLM_ERRORS.value(operation='classify_intent', error='ValueError') == before + 1
+
+    @pytest.mark.slow
+    def test_overhead_per_request(self):
+        """Test that a request's instrumentation costs well under 50us (run with --no-cov)"""
+        if _traced():
+            pytest.skip("timings are meaningless under coverage or a debugger")
+
+        rounds = 2000
+        best = float('inf')
+        for _ in range(5):
+            started = time.perf_counter()
+            for _ in range(rounds):
+                for stage in ('validate', 'rate_limit', 'retrieve', 'classify', 'generate'):
+                    with pipeline._stage(stage):
+                        pass
+                STAGE_SECONDS.observe(0.1, stage='total')
+                CLASSIFICATIONS.inc(classification='GENERAL_QUERY', degraded='false')
+            best = min(best, (time.perf_counter() - started) / rounds)
+        assert best < 50e-6
+
+    def test_stage_records_one_observation(self):
+        """Test that _stage() observes each stage once, also when the stage fails"""
+        stages = ('validate', 'rate_limit', 'retrieve', 'classify', 'generate')
+        before = {stage: STAGE_SECONDS.count(stage=stage) for stage in stages}
+
+        for stage in stages:
+            with pipeline._stage(stage):
+                pass
+        with pytest.raises(ValueError):
+            with pipeline._stage('generate'):
+                raise ValueError("boom")
+
+        counts = {stage: STAGE_SECONDS.count(stage=stage) - before[stage] for stage in stages}
+        assert counts == {**dict.fromkeys(stages, 1), 'generate': 2}
+
+
+class TestMetricsEndpoint:
+    """Test GET /metrics"""
+
+    def test_disabled_by_default(self, monkeypatch):
+        monkeypatch.setattr(Config, 'ENABLE_METRICS', False)
+        with pytest.raises(HTTPException) as exc_info:
+            asyncio.run(metrics_endpoint())
+        assert exc_info.value.status_code == 404
+
+    def test_serves_exposition(self, monkeypatch):
+        monkeypatch.setattr(Config, 'ENABLE_METRICS', True)
+        response = asyncio.run(metrics_endpoint())
+        assert response.media_type.startswith('text/plain; version=0.0.4')
+        assert '# TYPE chat_stage_seconds histogram' in response.body.decode()
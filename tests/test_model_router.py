@@ -0,0 +1,153 @@
+"""
+Tests for per-stage model routing
+"""
+
+import time
+from unittest.mock import patch
+
+import anthropic
+import httpx
+import pytest
+
+from First_Aid_buddy.core import classify_intent, generate_final_answer, APIError
+from First_Aid_buddy.model_router import ModelRouter, record_attempt
+
+ROUTES = {'triage': 'small', 'answer': 'large', 'emergency': 'fast'}
+
+
+def make_router(**kwargs):
+    options = dict(
+        routes=ROUTES,
+        fallback='backup',
+        thresholds={'triage': 1.0, 'answer': 5.0, 'emergency': 5.0},
+        enabled=True,
+        min_samples=3,
+        window_seconds=60,
+    )
+    options.update(kwargs)
+    return ModelRouter(**options)
+
+
+def make_overloaded_error():
+    request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+    return anthropic.InternalServerError("overloaded", response=httpx.Response(529, request=request), body=None)
+
+
+def record_many(router, stage, model, seconds, count=5):
+    for _ in range(count):
+        router.record(stage, model, seconds)
+
+
+class TestModelRouter:
+    """Test model selection"""
+
+    def test_routes_each_stage_to_its_model(self):
+        """Test that stages use their configured models"""
+        router = make_router()
+        assert router.select('triage') == 'small'
+        assert router.select('answer') == 'large'
+        assert router.select('emergency') == 'fast'
+
+    def test_slow_model_falls_back(self):
+        """Test that a stage moves to the fallback when p95 is over threshold"""
+        router = make_router()
+        record_many(router, 'answer', 'large', 8.0)
+        assert router.select('answer') == 'backup'
+
+    def test_latency_is_tracked_per_stage(self):
+        """Test that a slow answer stage does not affect triage"""
+        router = make_router(routes={'triage': 'large', 'answer': 'large', 'emergency': 'large'})
+        record_many(router, 'answer', 'large', 8.0)
+        record_many(router, 'triage', 'large', 0.2)
+        assert router.select('triage') == 'large'
+        assert router.select('answer') == 'backup'
+
+    def test_needs_min_samples(self):
+        """Test that a couple of slow calls do not trigger fallback"""
+        router = make_router()
+        record_many(router, 'answer', 'large', 8.0, count=2)
+        assert router.select('answer') == 'large'
+
+    def test_slow_fallback_is_not_used(self):
+        """Test that routing stays put when the fallback is slow too"""
+        router = make_router()
+        record_many(router, 'answer', 'large', 8.0)
+        record_many(router, 'answer', 'backup', 9.0)
+        assert router.select('answer') == 'large'
+
+    def test_disabled_never_falls_back(self):
+        """Test that fallback can be switched off"""
+        router = make_router(enabled=False)
+        record_many(router, 'answer', 'large', 8.0)
+        assert router.select('answer') == 'large'
+
+    def test_recovers_once_samples_expire(self):
+        """Test that the primary is used again after its slow samples age out"""
+        router = make_router(window_seconds=10)
+        with patch('First_Aid_buddy.hedging.time.monotonic', return_value=1000.0):
+            record_many(router, 'answer', 'large', 8.0)
+            assert router.select('answer') == 'backup'
+        with patch('First_Aid_buddy.hedging.time.monotonic', return_value=1011.0):
+            assert router.select('answer') == 'large'
+
+    def test_observe_records_attempts(self):
+        """Test that attempts inside observe() are recorded for its stage and model"""
+        router = make_router(min_samples=2)
+        record_attempt(0.5)
+        with router.observe('triage', 'small'):
+            record_attempt(0.2)
+            record_attempt(0.4)
+        record_attempt(0.5)
+        assert router.p95('triage', 'small') == 0.4
+
+    def test_snapshot(self):
+        """Test that the snapshot reports routing state per stage"""
+        router = make_router()
+        record_many(router, 'answer', 'large', 8.0)
+        router.select('answer')
+        snapshot = router.snapshot()
+        assert snapshot['answer']['on_fallback'] is True
+        assert snapshot['answer']['p95_ms']['large'] == 8000.0
+        assert snapshot['triage']['on_fallback'] is False
+
+
+class TestStageRouting:
+    """Test that pipeline calls use the routed model"""
+
+    def test_generation_uses_emergency_route(self, mock_anthropic_client):
+        """Test that emergencies use the emergency stage model"""
+        router = make_router()
+        with patch('First_Aid_buddy.core.model_router', router):
+            generate_final_answer("bleeding", "docs", True, mock_anthropic_client)
+            generate_final_answer("a cut", "docs", False, mock_anthropic_client)
+
+        models = [c[1]['model'] for c in mock_anthropic_client.messages.create.call_args_list]
+        assert models == ['fast', 'large']
+
+    def test_classification_latency_recorded(self, mock_anthropic_client):
+        """Test that triage calls feed the router's latency window"""
+        router = make_router(min_samples=1)
+        with patch('First_Aid_buddy.core.model_router', router):
+            classify_intent("a cut", mock_anthropic_client)
+        assert router.p95('triage', 'small') is not None
+
+    def test_backoff_not_recorded(self, mock_anthropic_client, mock_classification_response):
+        """Test that each attempt is a sample and the wait between them is not"""
+        mock_anthropic_client.messages.create.side_effect = [make_overloaded_error(), mock_classification_response]
+        router = make_router(min_samples=2)
+        real_sleep = time.sleep
+        with patch('First_Aid_buddy.core.model_router', router), \
+                patch('First_Aid_buddy.core.time.sleep', side_effect=lambda _: real_sleep(0.3)):
+            classify_intent("a cut", mock_anthropic_client)
+        assert len(router._window('triage', 'small')) == 2
+        assert router.p95('triage', 'small') < 0.3
+
+    @patch('First_Aid_buddy.core.time.sleep')
+    def test_failed_call_recorded(self, mock_sleep, mock_anthropic_client):
+        """Test that a call failing after retries is still a latency sample"""
+        mock_anthropic_client.messages.create.side_effect = RuntimeError("boom")
+        router = make_router(min_samples=1)
+        with patch('First_Aid_buddy.core.model_router', router):
+            with pytest.raises(APIError):
+                classify_intent("a cut", mock_anthropic_client)
+        assert router.p95('triage', 'small') is not None
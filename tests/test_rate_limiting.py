@@ -2,9 +2,15 @@
 Tests for rate limiting
 """
 
+import asyncio
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
-from datetime import datetime, timedelta
 from First_Aid_buddy.core import RateLimiter
+from First_Aid_buddy.rate_limiter import HOUR, MINUTE, IDENTIFIERS, MEMORY_BYTES, EVICTIONS
 from First_Aid_buddy.config import Config
 
 
@@ -64,16 +70,17 @@ class TestRateLimiter:
         user_id = "user123"
 
         # Add old timestamp manually
-        old_time = datetime.now() - timedelta(hours=2)
-        limiter.requests[user_id].append(old_time)
+        old_time = time.monotonic() - 2 * HOUR
+        limiter.window(user_id).append(old_time)
 
         # Make new request - should clean up old timestamp
         allowed, message = limiter.check_rate_limit(user_id)
         assert allowed is True
 
         # Old timestamp should be removed
-        for timestamp in limiter.requests[user_id]:
-            assert timestamp > datetime.now() - timedelta(hours=1)
+        for timestamp in limiter.window(user_id).hour:
+            assert timestamp > time.monotonic() - HOUR
+        assert len(limiter.window(user_id)) == 1
 
     def test_hour_limit_enforced(self):
         """Test that hourly limit is enforced"""
@@ -81,13 +88,284 @@ class TestRateLimiter:
         user_id = "user123"
 
         # Add timestamps within the hour up to limit
-        now = datetime.now()
-        for i in range(Config.RATE_LIMIT_PER_HOUR):
-            # Spread across the hour to avoid minute limit
-            timestamp = now - timedelta(minutes=i)
-            limiter.requests[user_id].append(timestamp)
+        # Spread across the hour to avoid minute limit (oldest first)
+        now = time.monotonic()
+        spacing = (HOUR - MINUTE) / Config.RATE_LIMIT_PER_HOUR
+        for i in reversed(range(Config.RATE_LIMIT_PER_HOUR)):
+            limiter.window(user_id).append(now - MINUTE - i * spacing)
 
         # Next request should be blocked
         allowed, message = limiter.check_rate_limit(user_id)
         assert allowed is False
         assert "per hour" in message.lower()
+
+
+class FakeClock:
+    """Manually advanced monotonic clock"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestSlidingWindow:
+    """Test window expiry and memory bounds"""
+
+    def test_minute_window_slides(self):
+        """Test that requests are allowed again once the oldest leaves the minute"""
+        clock = FakeClock()
+        limiter = RateLimiter(clock=clock)
+
+        for _ in range(Config.RATE_LIMIT_PER_MINUTE):
+            clock.now += 1
+            assert limiter.check_rate_limit("user")[0] is True
+        assert limiter.check_rate_limit("user")[0] is False
+
+        # Oldest request was at +1s; 60s later exactly one slot frees up
+        clock.now += MINUTE - Config.RATE_LIMIT_PER_MINUTE + 1
+        assert limiter.check_rate_limit("user")[0] is True
+        assert limiter.check_rate_limit("user")[0] is False
+
+    def test_hour_window_slides(self):
+        """Test that the hourly limit lifts as requests age past an hour"""
+        clock = FakeClock()
+        limiter = RateLimiter(clock=clock)
+
+        for _ in range(Config.RATE_LIMIT_PER_HOUR):
+            assert limiter.check_rate_limit("user")[0] is True
+            clock.now += MINUTE / Config.RATE_LIMIT_PER_MINUTE + 0.01
+
+        allowed, message = limiter.check_rate_limit("user")
+        assert allowed is False
+        assert "per hour" in message.lower()
+
+        clock.now += HOUR
+        assert limiter.check_rate_limit("user")[0] is True
+        assert len(limiter.window("user")) == 1
+
+    def test_memory_bounded_by_limits(self):
+        """Test that blocked requests are not stored"""
+        clock = FakeClock()
+        limiter = RateLimiter(clock=clock)
+
+        for _ in range(10 * Config.RATE_LIMIT_PER_HOUR):
+            limiter.check_rate_limit("user")
+            clock.now += 0.5
+
+        window = limiter.window("user")
+        assert len(window.minute) <= Config.RATE_LIMIT_PER_MINUTE
+        assert len(window.hour) <= Config.RATE_LIMIT_PER_HOUR
+
+    def test_blocked_check_does_not_rescan(self, monkeypatch):
+        """Test that checks stay cheap when the window is full"""
+        monkeypatch.setattr(Config, 'RATE_LIMIT_PER_MINUTE', 10_000)
+        monkeypatch.setattr(Config, 'RATE_LIMIT_PER_HOUR', 10_000)
+        limiter = RateLimiter()
+        for _ in range(10_000):
+            limiter.check_rate_limit("user")
+
+        started = time.perf_counter()
+        for _ in range(1_000):
+            limiter.check_rate_limit("user")
+        elapsed = time.perf_counter() - started
+
+        # A list rebuild per call would be ~10^7 comparisons here
+        assert elapsed < 1.0
+
+
+class TestIdentifierEviction:
+    """Test that tracked identifiers stay bounded"""
+
+    def test_idle_identifiers_swept(self):
+        """Test that identifiers idle for an hour are dropped on the next sweep"""
+        clock = FakeClock()
+        limiter = RateLimiter(clock=clock, sweep_interval=60, stripes=1)
+
+        for i in range(50):
+            limiter.check_rate_limit(f"ip-{i}")
+        assert len(limiter) == 50
+
+        clock.now += HOUR + 1
+        limiter.check_rate_limit("new-visitor")
+
+        assert limiter.identifiers() == ["new-visitor"]
+        assert IDENTIFIERS.value(limiter='requests') == 1
+
+    def test_active_identifiers_survive_sweep(self):
+        """Test that a sweep keeps identifiers with requests in the last hour"""
+        clock = FakeClock()
+        limiter = RateLimiter(clock=clock, sweep_interval=60, stripes=1)
+
+        limiter.check_rate_limit("old")
+        clock.now += HOUR - 10
+        limiter.check_rate_limit("recent")
+        clock.now += 20
+
+        assert limiter.sweep() == 1
+        assert limiter.identifiers() == ["recent"]
+
+    def test_sweep_waits_for_interval(self):
+        """Test that checks between sweeps do not scan all identifiers"""
+        clock = FakeClock()
+        limiter = RateLimiter(clock=clock, sweep_interval=2 * HOUR, stripes=1)
+
+        limiter.check_rate_limit("a")
+        clock.now += HOUR + 1
+        limiter.check_rate_limit("b")
+        # "a" is idle but no sweep is due yet
+        assert limiter.identifiers() == ["a", "b"]
+
+        clock.now += HOUR
+        limiter.check_rate_limit("c")
+        assert limiter.identifiers() == ["c"]
+
+    def test_capacity_evicts_least_recently_checked(self):
+        """Test the hard cap on tracked identifiers"""
+        limiter = RateLimiter(max_identifiers=3, stripes=1)
+        before = EVICTIONS.value(limiter='requests', reason='capacity')
+
+        for identifier in ("a", "b", "c"):
+            limiter.check_rate_limit(identifier)
+        limiter.check_rate_limit("a")  # "b" is now least recently checked
+        limiter.check_rate_limit("d")
+
+        assert limiter.identifiers() == ["c", "a", "d"]
+        assert EVICTIONS.value(limiter='requests', reason='capacity') == before + 1
+
+    def test_cap_holds_under_many_distinct_ips(self):
+        """Test that memory stays bounded with a stream of new identifiers"""
+        limiter = RateLimiter(max_identifiers=100)
+        for i in range(5000):
+            limiter.check_rate_limit(f"10.0.{i // 256}.{i % 256}")
+
+        assert len(limiter) <= 100
+        assert IDENTIFIERS.value(limiter='requests') == len(limiter)
+
+    def test_memory_gauge_updated_on_sweep(self):
+        """Test that the bytes gauge reflects the tracked state"""
+        limiter = RateLimiter()
+        for i in range(20):
+            limiter.check_rate_limit(f"user-{i}")
+
+        limiter.sweep()
+        assert MEMORY_BYTES.value(limiter='requests') == limiter.memory_bytes() > 0
+
+    def test_memory_gauge_tracks_checks(self):
+        """Test that the bytes gauge follows new identifiers, evictions and lazy sweeps"""
+        clock = FakeClock()
+        limiter = RateLimiter(clock=clock, max_identifiers=10, sweep_interval=60, stripes=1)
+        for i in range(5):
+            limiter.check_rate_limit(f"user-{i}")
+        assert MEMORY_BYTES.value(limiter='requests') == limiter.memory_bytes() > 0
+
+        for i in range(5, 30):
+            limiter.check_rate_limit(f"user-{i}")
+        assert MEMORY_BYTES.value(limiter='requests') == limiter.memory_bytes()
+
+        clock.now += HOUR + 1
+        limiter.check_rate_limit("late")
+        assert len(limiter) == 1
+        assert MEMORY_BYTES.value(limiter='requests') == limiter.memory_bytes()
+
+
+@pytest.fixture
+def fast_switching():
+    """Make the interpreter switch threads as often as possible"""
+    previous = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(previous)
+
+
+class TestConcurrency:
+    """Stress the shared limiter from threads and coroutines"""
+
+    def test_same_identifier_exact_count(self, monkeypatch, fast_switching):
+        """Test that concurrent checks on one identifier never lose an update"""
+        monkeypatch.setattr(Config, 'RATE_LIMIT_PER_MINUTE', 1000)
+        monkeypatch.setattr(Config, 'RATE_LIMIT_PER_HOUR', 1000)
+        limiter = RateLimiter(clock=FakeClock())
+        threads, per_thread = 16, 200
+        start = threading.Barrier(threads)
+
+        def hammer():
+            start.wait()
+            return sum(limiter.check_rate_limit("shared")[0] for _ in range(per_thread))
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            allowed = sum(pool.map(lambda _: hammer(), range(threads)))
+
+        assert allowed == 1000
+        assert len(limiter.window("shared")) == 1000
+
+    def test_many_identifiers_exact_counts(self, monkeypatch, fast_switching):
+        """Test that every identifier gets exactly its limit under contention"""
+        monkeypatch.setattr(Config, 'RATE_LIMIT_PER_MINUTE', 30)
+        monkeypatch.setattr(Config, 'RATE_LIMIT_PER_HOUR', 30)
+        limiter = RateLimiter(clock=FakeClock(), stripes=4)
+        identifiers = [f"session-{i}" for i in range(50)]
+        allowed = {identifier: 0 for identifier in identifiers}
+        lock = threading.Lock()
+
+        start = threading.Barrier(8)
+
+        def hammer(offset):
+            counts = dict.fromkeys(identifiers, 0)
+            start.wait()
+            for round_ in range(5):
+                for i in range(len(identifiers)):
+                    identifier = identifiers[(i + offset + round_) % len(identifiers)]
+                    counts[identifier] += limiter.check_rate_limit(identifier)[0]
+            with lock:
+                for identifier, count in counts.items():
+                    allowed[identifier] += count
+
+        workers = [threading.Thread(target=hammer, args=(n,)) for n in range(8)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        # 8 threads x 5 rounds = 40 attempts per identifier
+        assert set(allowed.values()) == {30}
+        assert len(limiter) == 50
+
+    def test_threads_and_coroutines_together(self, monkeypatch):
+        """Test checks from an event loop racing checks from worker threads"""
+        monkeypatch.setattr(Config, 'RATE_LIMIT_PER_MINUTE', 500)
+        monkeypatch.setattr(Config, 'RATE_LIMIT_PER_HOUR', 500)
+        limiter = RateLimiter(clock=FakeClock())
+
+        async def check():
+            await asyncio.sleep(0)
+            return limiter.check_rate_limit("mixed")[0]
+
+        def blocking_checks():
+            return sum(limiter.check_rate_limit("mixed")[0] for _ in range(100))
+
+        async def main():
+            threaded = [asyncio.to_thread(blocking_checks) for _ in range(4)]
+            inline = [check() for _ in range(400)]
+            results = await asyncio.gather(*threaded, *inline)
+            return sum(results)
+
+        assert asyncio.run(main()) == 500
+
+    def test_stripes_do_not_block_each_other(self):
+        """Test that a held stripe lock only delays identifiers on that stripe"""
+        limiter = RateLimiter(stripes=8)
+        busy = "busy-user"
+        other = next(
+            f"user-{i}" for i in range(1000)
+            if limiter._stripe(f"user-{i}") is not limiter._stripe(busy)
+        )
+
+        result = []
+        with limiter._stripe(busy).lock:
+            worker = threading.Thread(target=lambda: result.append(limiter.check_rate_limit(other)))
+            worker.start()
+            worker.join(timeout=2)
+
+        assert result == [(True, None)]
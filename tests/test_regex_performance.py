@@ -0,0 +1,153 @@
+"""
+Worst-case latency tests for every regex that sees user-controlled text
+Adversarial and seeded random inputs up to MAX_INPUT_LENGTH and the 10k
+character upper bound are run through each pattern; any pattern that
+backtracks catastrophically blows its per-pattern time ceiling
+"""
+
+import logging
+import random
+import re
+import string
+import time
+
+import pytest
+
+from First_Aid_buddy import singleflight
+from First_Aid_buddy.config import Config
+from First_Aid_buddy.core import EMERGENCY_PATTERN, validate_input
+from First_Aid_buddy.logger import SanitizingFormatter
+from First_Aid_buddy.screening import DEFAULT_RULES, RuleSet, _TOKEN, screening_engine
+
+# Upper bound on MAX_INPUT_LENGTH enforced by Config.validate()
+LONGEST_INPUT = 10000
+
+# Time ceiling per pattern and input: linear patterns stay far below it,
+# quadratic ones exceed it at 10k characters
+SECONDS_PER_CHAR = 5e-6
+MIN_CEILING = 0.002
+
+RANDOM_INPUTS = 40
+SEED = 20240601
+
+
+def request_path_patterns():
+    """Every compiled regex applied to user input or to log lines containing it"""
+    patterns = {f'log_{name}': pattern for name, pattern in SanitizingFormatter.PATTERNS.items()}
+    patterns['log_combined'] = SanitizingFormatter.COMBINED
+    patterns['log_markers'] = SanitizingFormatter.MARKERS
+    patterns['emergency'] = EMERGENCY_PATTERN
+    patterns['screening_tokens'] = _TOKEN
+    patterns['singleflight_punctuation'] = singleflight._PUNCTUATION
+    patterns['singleflight_whitespace'] = singleflight._WHITESPACE
+    for rule in screening_engine.rules.rules + RuleSet.from_dicts(DEFAULT_RULES).rules:
+        patterns[f'screening_{rule.name}'] = rule.regex
+    return patterns
+
+
+PATTERNS = request_path_patterns()
+
+
+def literal_fragments(pattern: re.Pattern) -> list:
+    """Literal runs of a pattern's source, to build near-miss inputs from"""
+    return re.findall(r'[A-Za-z0-9@:<._-]{1,12}', pattern.pattern)
+
+
+def adversarial_units(pattern: re.Pattern) -> list:
+    """Repeating units that make backtracking regexes try many overlapping starts"""
+    units = list('a0.-_@: \t<+%Z') + [
+        'a.', 'a@', 'a-', '0-', '0 ', '0.', '.a', 'a@a.', 'a.a@', 'a@a-', '1234 ', 'AB1 ', 'sk-ant-',
+        'a' * 70 + '@', '@a.' + 'b' * 70, '0' * 11 + 'x',
+    ]
+    for fragment in literal_fragments(pattern):
+        units += [fragment, fragment + ' ', fragment[:-1], fragment + fragment[-1]]
+    return [unit for unit in units if unit]
+
+
+def random_input(rng: random.Random, pattern: re.Pattern, length: int) -> str:
+    """Random text from the pattern's literals and the characters regexes branch on"""
+    pieces = literal_fragments(pattern) + list(string.ascii_letters[:6] + string.digits[:4] + ' .-@:<\t_')
+    parts = []
+    size = 0
+    while size < length:
+        piece = rng.choice(pieces) * rng.choice((1, 1, 2, 8, 64))
+        parts.append(piece)
+        size += len(piece)
+    return ''.join(parts)[:length]
+
+
+def inputs_for(pattern: re.Pattern, length: int):
+    for unit in adversarial_units(pattern):
+        yield (unit * (length // len(unit) + 1))[:length]
+    rng = random.Random(f"{SEED}:{pattern.pattern}:{length}")
+    for _ in range(RANDOM_INPUTS):
+        yield random_input(rng, pattern, length)
+
+
+def ceiling(length: int) -> float:
+    return max(MIN_CEILING, length * SECONDS_PER_CHAR)
+
+
+def worst_case_seconds(pattern: re.Pattern, length: int):
+    """
+    Slowest sub() over all inputs of `length`
+
+    Each input is timed best-of-3 to ignore scheduler noise; the search
+    stops at the first input over the ceiling.
+    """
+    limit = ceiling(length)
+    worst = (0.0, '')
+    for text in inputs_for(pattern, length):
+        best = float('inf')
+        for _ in range(3):
+            started = time.perf_counter()
+            pattern.sub('', text)
+            best = min(best, time.perf_counter() - started)
+            if best <= limit / 10:
+                break
+        worst = max(worst, (best, text))
+        if best >= limit:
+            break
+    return worst
+
+
+class TestRegexWorstCase:
+    """Test that no pattern backtracks catastrophically"""
+
+    @pytest.mark.parametrize('name', sorted(PATTERNS))
+    @pytest.mark.parametrize('length', [Config.MAX_INPUT_LENGTH, LONGEST_INPUT])
+    def test_pattern_under_time_ceiling(self, name, length):
+        """Test each pattern's slowest adversarial input against its ceiling"""
+        seconds, text = worst_case_seconds(PATTERNS[name], length)
+        assert seconds < ceiling(length), (
+            f"{name} took {seconds * 1000:.1f}ms on {length} chars starting {text[:40]!r}"
+        )
+
+    def test_quadratic_pattern_detected(self):
+        """Test that the suite catches a known catastrophic pattern"""
+        quadratic = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b')
+        seconds, _ = worst_case_seconds(quadratic, LONGEST_INPUT)
+        assert seconds >= ceiling(LONGEST_INPUT)
+
+
+class TestRequestPathWorstCase:
+    """Test whole request-path stages on adversarial input"""
+
+    def test_validate_input(self, monkeypatch):
+        """Test validate_input() at the longest allowed input"""
+        monkeypatch.setattr(Config, 'MAX_INPUT_LENGTH', LONGEST_INPUT)
+        for unit in ('ignore ', 'system ', '< ', 'you are ', 'a@', '0-'):
+            text = (unit * LONGEST_INPUT)[:LONGEST_INPUT].strip()
+            started = time.perf_counter()
+            validate_input(text)
+            assert time.perf_counter() - started < ceiling(LONGEST_INPUT)
+
+    def test_log_sanitizer(self):
+        """Test a full log line through every redaction pattern"""
+        formatter = SanitizingFormatter('%(message)s')
+        for unit in ('a.', 'a@', '0-', '0 ', 'AB1 ', 'sk-ant-'):
+            message = (unit * LONGEST_INPUT)[:LONGEST_INPUT]
+            record = logging.LogRecord('test', logging.INFO, __file__, 0, message, None, None)
+            started = time.perf_counter()
+            formatter.format(record)
+            assert time.perf_counter() - started < len(SanitizingFormatter.PATTERNS) * ceiling(LONGEST_INPUT)
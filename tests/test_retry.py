@@ -0,0 +1,165 @@
+"""
+Tests for the retry policy and retrying API calls
+"""
+
+import asyncio
+import random
+
+import anthropic
+import httpx
+import pytest
+from unittest.mock import Mock, patch
+
+from First_Aid_buddy.core import call_claude_with_retry, call_claude_with_retry_async, APIError
+from First_Aid_buddy.retry import RetryPolicy, is_retryable, retry_after_seconds
+
+
+def make_status_error(error_class, status_code, headers=None):
+    """Build an SDK status error carrying the given response headers"""
+    request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+    response = httpx.Response(status_code, headers=headers or {}, request=request)
+    return error_class("error", response=response, body=None)
+
+
+def make_timeout_error():
+    request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+    return anthropic.APITimeoutError(request=request)
+
+
+def ok_response(text="GENERAL_QUERY"):
+    response = Mock()
+    response.content = [Mock(text=text)]
+    return response
+
+
+class TestRetryPolicy:
+    """Test backoff computation"""
+
+    def test_delays_stay_within_bounds(self):
+        """Test that jittered delays stay between base and max delay"""
+        policy = RetryPolicy(max_retries=50, base_delay=0.1, max_delay=2.0, deadline=1000, rng=random.Random(1))
+        state = policy.start()
+        for _ in range(50):
+            delay = state.next_delay(make_timeout_error())
+            if delay is None:
+                break
+            assert 0.1 <= delay <= 2.0
+
+    def test_jitter_spreads_clients(self):
+        """Test that two clients do not retry in lockstep"""
+        first = RetryPolicy(max_retries=3, rng=random.Random(1)).start()
+        second = RetryPolicy(max_retries=3, rng=random.Random(2)).start()
+        error = make_timeout_error()
+        assert first.next_delay(error) != second.next_delay(error)
+
+    def test_gives_up_after_max_retries(self):
+        """Test that no delay is returned once attempts are exhausted"""
+        state = RetryPolicy(max_retries=2, deadline=1000).start()
+        error = make_timeout_error()
+        assert state.next_delay(error) is not None
+        assert state.next_delay(error) is not None
+        assert state.next_delay(error) is None
+
+    def test_retry_after_header_honoured(self):
+        """Test that retry-after overrides the jittered delay"""
+        state = RetryPolicy(deadline=1000).start()
+        error = make_status_error(anthropic.RateLimitError, 429, {"retry-after": "3"})
+        assert state.next_delay(error) == pytest.approx(3.0)
+
+    def test_retry_after_ms_header_preferred(self):
+        """Test that retry-after-ms takes precedence over retry-after"""
+        error = make_status_error(anthropic.RateLimitError, 429, {"retry-after-ms": "250", "retry-after": "3"})
+        assert retry_after_seconds(error) == pytest.approx(0.25)
+
+    def test_retry_after_beyond_deadline_gives_up(self):
+        """Test that a retry-after longer than the remaining budget stops retrying"""
+        state = RetryPolicy(deadline=2).start()
+        error = make_status_error(anthropic.RateLimitError, 429, {"retry-after": "30"})
+        assert state.next_delay(error) is None
+
+    def test_delay_shrinks_to_fit_deadline(self):
+        """Test that backoff is clipped to leave room for one more attempt"""
+        policy = RetryPolicy(base_delay=5, max_delay=5, deadline=1.0, min_attempt_time=0.5)
+        state = policy.start()
+        delay = state.next_delay(make_timeout_error())
+        assert delay is not None
+        assert delay <= 0.5
+
+    def test_attempt_timeout_bounded_by_deadline(self):
+        """Test that attempt timeouts never exceed the remaining budget"""
+        state = RetryPolicy(deadline=2).start()
+        assert state.attempt_timeout() <= 2
+
+    def test_retryable_classification(self):
+        """Test which errors are retried"""
+        assert is_retryable(make_timeout_error())
+        assert is_retryable(make_status_error(anthropic.RateLimitError, 429))
+        assert is_retryable(make_status_error(anthropic.InternalServerError, 529))
+        assert not is_retryable(make_status_error(anthropic.BadRequestError, 400))
+        assert not is_retryable(make_status_error(anthropic.AuthenticationError, 401))
+        assert not is_retryable(ValueError("bug"))
+
+
+class TestCallClaudeWithRetry:
+    """Test the retrying API call wrappers"""
+
+    @patch('First_Aid_buddy.core.time.sleep')
+    def test_retries_then_succeeds(self, mock_sleep, mock_anthropic_client):
+        """Test that a transient failure is retried"""
+        mock_anthropic_client.messages.create.side_effect = [
+            make_status_error(anthropic.RateLimitError, 429, {"retry-after": "1"}),
+            ok_response(),
+        ]
+
+        response = call_claude_with_retry(mock_anthropic_client, 'test', model='m')
+
+        assert response.content[0].text == "GENERAL_QUERY"
+        assert mock_anthropic_client.messages.create.call_count == 2
+        mock_sleep.assert_called_once_with(pytest.approx(1.0))
+
+    @patch('First_Aid_buddy.core.time.sleep')
+    def test_non_retryable_error_fails_fast(self, mock_sleep, mock_anthropic_client):
+        """Test that client errors are not retried"""
+        mock_anthropic_client.messages.create.side_effect = make_status_error(anthropic.BadRequestError, 400)
+
+        with pytest.raises(APIError):
+            call_claude_with_retry(mock_anthropic_client, 'test', model='m')
+
+        assert mock_anthropic_client.messages.create.call_count == 1
+        mock_sleep.assert_not_called()
+
+    def test_authentication_error_message(self, mock_anthropic_client):
+        """Test that authentication failures keep their explicit message"""
+        mock_anthropic_client.messages.create.side_effect = make_status_error(anthropic.AuthenticationError, 401)
+
+        with pytest.raises(APIError, match="Authentication failed"):
+            call_claude_with_retry(mock_anthropic_client, 'test', model='m')
+
+    @patch('First_Aid_buddy.core.time.sleep')
+    def test_passes_attempt_timeout(self, mock_sleep, mock_anthropic_client):
+        """Test that every attempt carries a timeout within the deadline"""
+        mock_anthropic_client.messages.create.return_value = ok_response()
+
+        call_claude_with_retry(mock_anthropic_client, 'test', retry_policy=RetryPolicy(deadline=5), model='m')
+
+        timeout = mock_anthropic_client.messages.create.call_args[1]['timeout']
+        assert 0 < timeout.read <= 5
+        assert timeout.connect <= timeout.read
+
+    def test_async_variant_uses_asyncio_sleep(self, mock_anthropic_client):
+        """Test that the async variant backs off without blocking a thread"""
+        mock_anthropic_client.messages.create.side_effect = [make_timeout_error(), ok_response()]
+        sleeps = []
+
+        async def fake_sleep(delay):
+            sleeps.append(delay)
+
+        with patch('First_Aid_buddy.core.asyncio.sleep', fake_sleep), \
+                patch('First_Aid_buddy.core.time.sleep') as blocking_sleep:
+            response = asyncio.run(
+                call_claude_with_retry_async(mock_anthropic_client, 'test', model='m')
+            )
+
+        assert response.content[0].text == "GENERAL_QUERY"
+        assert len(sleeps) == 1
+        blocking_sleep.assert_not_called()
@@ -0,0 +1,130 @@
+"""
+Tests for the Server-Timing header and timing breakdown on /chat
+"""
+
+import asyncio
+import re
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+from fastapi.testclient import TestClient
+
+from First_Aid_buddy.config import Config
+from First_Aid_buddy.request_timing import RequestTimings, record_stage, timing
+from backend.main import app
+from backend.services import pipeline
+
+
+def answer_response(text):
+    response = Mock()
+    response.content = [Mock(text=text)]
+    return response
+
+
+def parse_server_timing(header):
+    """{name: dur or desc} from a Server-Timing header"""
+    entries = {}
+    for entry in header.split(', '):
+        name, _, param = entry.partition(';')
+        match = re.fullmatch(r'dur=([\d.]+)|desc="([^"]*)"', param)
+        entries[name] = float(match.group(1)) if match.group(1) else match.group(2)
+    return entries
+
+
+@pytest.fixture
+def client():
+    """/chat with a mocked Anthropic client (lifespan not run)"""
+    anthropic_client = Mock()
+    anthropic_client.messages.create = AsyncMock(side_effect=[
+        answer_response("GENERAL_QUERY"), answer_response("Clean the wound."),
+    ])
+    app.state.anthropic_client = anthropic_client
+    yield TestClient(app)
+    app.state.anthropic_client = None
+
+
+class TestRequestTimings:
+    """Test the collector on its own"""
+
+    def test_header_format(self):
+        timings = RequestTimings()
+        timings.add_stage('generate', 0.8)
+        timings.add_stage('validate', 0.0004)
+        timings.add_stage('generate', 0.2)
+        timings.add_attempt()
+        assert timings.server_timing() == 'validate;dur=0.4, generate;dur=1000.0, llm;desc="1 attempt", cache;desc="miss"'
+
+    def test_recording_outside_request_is_noop(self):
+        record_stage('validate', 1.0)
+        with timing() as timings:
+            record_stage('validate', 0.5)
+        record_stage('validate', 1.0)
+        assert timings.as_dict()['validate_ms'] == 500.0
+
+
+class TestChatServerTiming:
+    """Test the header and body on real /chat responses"""
+
+    def test_header_on_every_response(self, client):
+        """Test that a normal answer carries every stage and the attempt count"""
+        response = client.post("/chat", json={"message": "How do I treat a minor cut?"})
+        assert response.status_code == 200
+
+        entries = parse_server_timing(response.headers["Server-Timing"])
+        for stage in ('validate', 'rate_limit', 'retrieve', 'classify', 'generate', 'total'):
+            assert entries[stage] >= 0
+        assert entries['total'] >= entries['generate']
+        assert entries['llm'] == "2 attempts"
+        assert entries['cache'] == "miss"
+        assert response.json()["timings"] is None
+
+    def test_body_timings_on_request(self, client):
+        """Test that include_timings returns the same breakdown in the body"""
+        response = client.post("/chat", json={"message": "How do I treat a minor cut?", "include_timings": True})
+
+        timings = response.json()["timings"]
+        assert timings["llm_attempts"] == 2
+        assert timings["cache"] == "miss"
+        assert timings["classify_ms"] is not None and timings["generate_ms"] is not None
+        assert timings["total_ms"] >= timings["retrieve_ms"]
+
+    def test_header_on_errors(self, client, monkeypatch):
+        """Test that rejected requests still report how far they got"""
+        monkeypatch.setattr(Config, 'MAX_INPUT_LENGTH', 10)
+        response = client.post("/chat", json={"message": "How do I treat a minor cut?"})
+
+        assert response.status_code == 422
+        entries = parse_server_timing(response.headers["Server-Timing"])
+        assert 'validate' in entries and 'generate' not in entries
+        assert entries['llm'] == "0 attempts"
+
+    def test_disabled(self, client, monkeypatch):
+        monkeypatch.setattr(Config, 'SERVER_TIMING_ENABLED', False)
+        response = client.post("/chat", json={"message": "How do I treat a minor cut?"})
+        assert "Server-Timing" not in response.headers
+
+    def test_coalesced_answer_is_cache_hit(self, monkeypatch):
+        """Test that a caller served by an identical in-flight query reports a hit"""
+        release = asyncio.Event()
+
+        async def slow_answer(*args):
+            await release.wait()
+            return "answer", False, "GENERAL_QUERY", False
+
+        # The API shares one client between all callers
+        client = Mock()
+
+        async def ask():
+            with timing() as timings:
+                await pipeline.run_chat_pipeline("How do I treat a minor cut?", client)
+            return timings
+
+        async def main():
+            tasks = [asyncio.create_task(ask()) for _ in range(2)]
+            await asyncio.sleep(0.01)
+            release.set()
+            return await asyncio.gather(*tasks)
+
+        monkeypatch.setattr(pipeline, '_answer_query', slow_answer)
+        leader, follower = asyncio.run(main())
+        assert (leader.cache, follower.cache) == ("miss", "hit")
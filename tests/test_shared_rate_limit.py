@@ -0,0 +1,329 @@
+"""
+Tests for the shared (SQLite / Redis) rate limit stores
+"""
+
+import asyncio
+import multiprocessing
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+
+from First_Aid_buddy.config import Config
+from First_Aid_buddy.deadline import Deadline
+from First_Aid_buddy.rate_limiter import (
+    BACKEND_ERRORS, HOUR, MINUTE, BaseRateLimiter, RateLimiter, create_rate_limiter
+)
+from First_Aid_buddy.shared_rate_limit import RedisConnection, RedisRateLimiter, SQLiteRateLimiter
+from backend.services.pipeline import run_chat_pipeline
+
+
+class FakeClock:
+    """Manually advanced wall clock"""
+
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _hammer_sqlite(path: str, checks: int) -> int:
+    """Worker process: count allowed checks against a shared database"""
+    limiter = SQLiteRateLimiter(path)
+    try:
+        return sum(limiter.check_rate_limit("shared")[0] for _ in range(checks))
+    finally:
+        limiter.close()
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "rate_limit.sqlite3")
+
+
+class TestSQLiteRateLimiter:
+    """Test the single-host SQLite store"""
+
+    def test_minute_limit(self, db_path):
+        """Test that the per-minute limit is enforced"""
+        limiter = SQLiteRateLimiter(db_path)
+        for _ in range(Config.RATE_LIMIT_PER_MINUTE):
+            assert limiter.check_rate_limit("user")[0] is True
+
+        allowed, message = limiter.check_rate_limit("user")
+        assert allowed is False
+        assert "per minute" in message.lower()
+        assert limiter.check_rate_limit("other")[0] is True
+
+    def test_hour_limit_and_window_slide(self, db_path):
+        """Test the hourly limit and that it lifts as requests age out"""
+        clock = FakeClock()
+        limiter = SQLiteRateLimiter(db_path, clock=clock)
+        for _ in range(Config.RATE_LIMIT_PER_HOUR):
+            assert limiter.check_rate_limit("user")[0] is True
+            clock.now += MINUTE / Config.RATE_LIMIT_PER_MINUTE + 0.01
+
+        allowed, message = limiter.check_rate_limit("user")
+        assert allowed is False
+        assert "per hour" in message.lower()
+
+        clock.now += HOUR
+        assert limiter.check_rate_limit("user")[0] is True
+
+    def test_state_survives_restart(self, db_path):
+        """Test that a new process (new limiter) sees earlier requests"""
+        first = SQLiteRateLimiter(db_path)
+        for _ in range(Config.RATE_LIMIT_PER_MINUTE):
+            first.check_rate_limit("user")
+        first.close()
+
+        second = SQLiteRateLimiter(db_path)
+        assert second.check_rate_limit("user")[0] is False
+
+    def test_sweep_deletes_expired_rows(self, db_path):
+        """Test that rows older than an hour are deleted in bulk"""
+        clock = FakeClock()
+        limiter = SQLiteRateLimiter(db_path, clock=clock, sweep_interval=60)
+        for i in range(20):
+            limiter.check_rate_limit(f"user-{i}")
+
+        clock.now += HOUR + 1
+        limiter.check_rate_limit("late")
+
+        rows = limiter._connect().execute("SELECT identifier FROM rate_limit_hits").fetchall()
+        assert rows == [("late",)]
+
+    def test_wal_mode(self, db_path):
+        """Test that the database uses write-ahead logging"""
+        limiter = SQLiteRateLimiter(db_path)
+        limiter.check_rate_limit("user")
+        mode = limiter._connect().execute("PRAGMA journal_mode").fetchone()[0]
+        assert mode == "wal"
+
+    def test_exact_across_processes(self, db_path, monkeypatch):
+        """Test that workers sharing the file admit exactly the limit in total"""
+        monkeypatch.setattr(Config, 'RATE_LIMIT_PER_MINUTE', 60)
+        monkeypatch.setattr(Config, 'RATE_LIMIT_PER_HOUR', 60)
+        SQLiteRateLimiter(db_path).reset()
+
+        context = multiprocessing.get_context('fork')
+        with context.Pool(4) as pool:
+            allowed = pool.starmap(_hammer_sqlite, [(db_path, 40)] * 4)
+
+        assert sum(allowed) == 60
+
+    def test_exact_across_threads(self, db_path, monkeypatch):
+        """Test that threads sharing one limiter admit exactly the limit"""
+        monkeypatch.setattr(Config, 'RATE_LIMIT_PER_MINUTE', 100)
+        monkeypatch.setattr(Config, 'RATE_LIMIT_PER_HOUR', 100)
+        limiter = SQLiteRateLimiter(db_path)
+
+        def hammer(_):
+            return sum(limiter.check_rate_limit("shared")[0] for _ in range(50))
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            assert sum(pool.map(hammer, range(8))) == 100
+
+    def test_connection_per_thread(self, db_path):
+        """Test that threads do not share (and queue on) one connection"""
+        limiter = SQLiteRateLimiter(db_path)
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            first, second = pool.map(lambda _: (limiter._connect(), time.sleep(0.05))[0], range(2))
+        assert first is not second
+
+        conn = limiter._connect()
+        assert limiter._connect() is conn
+        limiter.close()
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+
+    def test_unavailable_store_fails_open(self, tmp_path):
+        """Test that a broken database allows the request and counts the error"""
+        limiter = SQLiteRateLimiter(str(tmp_path / "missing" / "rate_limit.sqlite3"))
+        before = BACKEND_ERRORS.value(backend='sqlite')
+
+        assert limiter.check_rate_limit("user") == (True, None)
+        assert BACKEND_ERRORS.value(backend='sqlite') == before + 1
+
+
+class TestRedisConnection:
+    """Test the minimal RESP client"""
+
+    def test_url_parsing(self):
+        """Test host, port, password and database from the URL"""
+        conn = RedisConnection("redis://:s%40cret@cache.internal:6380/2", timeout=1)
+        assert (conn.host, conn.port, conn.password, conn.db) == ("cache.internal", 6380, "s@cret", 2)
+
+        conn = RedisConnection("redis://localhost", timeout=1)
+        assert (conn.port, conn.password, conn.db) == (6379, None, 0)
+
+    def test_rejects_other_schemes(self):
+        """Test that TLS URLs are refused rather than sent in clear text"""
+        with pytest.raises(ValueError):
+            RedisConnection("rediss://cache.internal:6380/0", timeout=1)
+
+    def test_auth_and_select_on_connect(self, fake_redis):
+        """Test that password and database are sent once per connection"""
+        url = fake_redis.url.replace("redis://", "redis://:pw@").replace("/0", "/3")
+        conn = RedisConnection(url, timeout=1)
+        assert conn.execute(("PING",), ("PING",)) == ["PONG", "PONG"]
+        assert conn.execute(("PING",)) == ["PONG"]
+
+        commands = fake_redis.stats.snapshot()['commands']
+        assert commands['AUTH'] == 1
+        assert commands['SELECT'] == 1
+        assert fake_redis.stats.snapshot()['connections'] == 1
+
+
+class TestRedisRateLimiter:
+    """Test the Redis store against the local stand-in"""
+
+    def test_minute_limit(self, fake_redis):
+        """Test that the per-minute limit is enforced"""
+        limiter = RedisRateLimiter(fake_redis.url)
+        for _ in range(Config.RATE_LIMIT_PER_MINUTE):
+            assert limiter.check_rate_limit("user")[0] is True
+
+        allowed, message = limiter.check_rate_limit("user")
+        assert allowed is False
+        assert "per minute" in message.lower()
+        assert limiter.check_rate_limit("other")[0] is True
+
+    def test_blocked_requests_not_kept(self, fake_redis):
+        """Test that refused requests are removed from the sorted set"""
+        limiter = RedisRateLimiter(fake_redis.url)
+        for _ in range(3 * Config.RATE_LIMIT_PER_MINUTE):
+            limiter.check_rate_limit("user")
+
+        assert len(fake_redis.zset(limiter.prefix + "user")) == Config.RATE_LIMIT_PER_MINUTE
+
+    def test_hour_limit_and_window_slide(self, fake_redis):
+        """Test the hourly limit and that it lifts as requests age out"""
+        clock = FakeClock()
+        limiter = RedisRateLimiter(fake_redis.url, clock=clock)
+        for _ in range(Config.RATE_LIMIT_PER_HOUR):
+            assert limiter.check_rate_limit("user")[0] is True
+            clock.now += MINUTE / Config.RATE_LIMIT_PER_MINUTE + 0.01
+
+        allowed, message = limiter.check_rate_limit("user")
+        assert allowed is False
+        assert "per hour" in message.lower()
+
+        clock.now += HOUR
+        assert limiter.check_rate_limit("user")[0] is True
+        assert len(fake_redis.zset(limiter.prefix + "user")) == 1
+
+    def test_one_round_trip_per_allowed_check(self, fake_redis):
+        """Test that an allowed check is a single pipelined transaction"""
+        limiter = RedisRateLimiter(fake_redis.url)
+        limiter.check_rate_limit("user")
+        limiter.check_rate_limit("user")
+
+        stats = fake_redis.stats.snapshot()
+        assert stats['connections'] == 1
+        assert stats['commands']['EXEC'] == 2
+        assert 'ZREM' not in stats['commands']
+
+    def test_keys_expire_when_idle(self, fake_redis):
+        """Test that each key carries an hour's expiry"""
+        limiter = RedisRateLimiter(fake_redis.url)
+        limiter.check_rate_limit("user")
+
+        conn = RedisConnection(fake_redis.url, timeout=1)
+        ttl = conn.execute(("PTTL", limiter.prefix + "user"))[0]
+        assert HOUR * 1000 - 5000 < ttl <= HOUR * 1000
+
+    def test_reset_only_touches_own_keys(self, fake_redis):
+        """Test that reset() leaves other applications' keys alone"""
+        conn = RedisConnection(fake_redis.url, timeout=1)
+        conn.execute(("ZADD", "other:app", "1", "x"))
+        limiter = RedisRateLimiter(fake_redis.url)
+        limiter.check_rate_limit("user")
+
+        limiter.reset()
+        assert fake_redis.keys() == ["other:app"]
+
+    def test_never_over_admits_under_concurrency(self, fake_redis, monkeypatch):
+        """Test that several workers together stay within the limit"""
+        monkeypatch.setattr(Config, 'RATE_LIMIT_PER_MINUTE', 50)
+        monkeypatch.setattr(Config, 'RATE_LIMIT_PER_HOUR', 50)
+        # Separate limiters = separate connections, like separate processes
+        limiters = [RedisRateLimiter(fake_redis.url) for _ in range(4)]
+        start = threading.Barrier(len(limiters))
+
+        def hammer(limiter):
+            start.wait()
+            return sum(limiter.check_rate_limit("shared")[0] for _ in range(40))
+
+        with ThreadPoolExecutor(max_workers=len(limiters)) as pool:
+            allowed = sum(pool.map(hammer, limiters))
+
+        assert 0 < allowed <= 50
+        assert len(fake_redis.zset(limiters[0].prefix + "shared")) == allowed
+
+    def test_unreachable_server_fails_open(self, fake_redis):
+        """Test that an unreachable server allows the request and counts the error"""
+        limiter = RedisRateLimiter(fake_redis.url, timeout=0.2)
+        assert limiter.check_rate_limit("user")[0] is True
+        fake_redis.stop()
+        before = BACKEND_ERRORS.value(backend='redis')
+
+        assert limiter.check_rate_limit("user") == (True, None)
+        assert BACKEND_ERRORS.value(backend='redis') == before + 1
+
+
+class TestBackendSelection:
+    """Test create_rate_limiter()"""
+
+    def test_memory_default(self):
+        assert isinstance(create_rate_limiter('memory'), RateLimiter)
+
+    def test_sqlite(self, db_path, monkeypatch):
+        monkeypatch.setattr(Config, 'RATE_LIMIT_SQLITE_PATH', db_path)
+        limiter = create_rate_limiter('sqlite')
+        assert isinstance(limiter, SQLiteRateLimiter)
+        assert limiter.path == db_path
+
+    def test_redis(self, fake_redis, monkeypatch):
+        monkeypatch.setattr(Config, 'RATE_LIMIT_REDIS_URL', fake_redis.url)
+        limiter = create_rate_limiter('REDIS')
+        assert isinstance(limiter, RedisRateLimiter)
+        assert limiter.check_rate_limit("user")[0] is True
+
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError):
+            create_rate_limiter('memcached')
+
+    def test_base_is_abstract(self):
+        """Test that a backend must implement acquire() and reset()"""
+        with pytest.raises(TypeError):
+            BaseRateLimiter()
+
+
+class TestPipelineCheck:
+    """Test the shared store from the async chat pipeline"""
+
+    def test_shared_store_checked_off_event_loop(self, db_path):
+        """Test that a blocking store is queried from a worker thread"""
+        limiter = SQLiteRateLimiter(db_path)
+        threads = []
+        check = limiter.check_rate_limit
+
+        def recording_check(identifier):
+            threads.append(threading.get_ident())
+            return check(identifier)
+
+        client = Mock()
+        client.messages.create = AsyncMock(side_effect=[
+            Mock(content=[Mock(text="GENERAL_QUERY")]), Mock(content=[Mock(text="Clean the wound.")]),
+        ])
+        with patch.object(limiter, 'check_rate_limit', recording_check), \
+                patch('backend.services.pipeline.rate_limiter', limiter):
+            asyncio.run(run_chat_pipeline("How do I treat a minor cut?", client, "session-1", deadline=Deadline(5)))
+
+        assert len(threads) == 1
+        assert threads[0] != threading.get_ident()
@@ -0,0 +1,180 @@
+"""
+Tests for single-flight coalescing of identical queries
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+from unittest.mock import Mock
+
+from First_Aid_buddy.core import process_query
+from First_Aid_buddy.singleflight import SingleFlight, normalize_query, SHARED
+
+
+def run_concurrently(count, target):
+    """Start `count` threads on target() together and collect results"""
+    results = []
+    errors = []
+    barrier = threading.Barrier(count)
+
+    def worker():
+        barrier.wait()
+        try:
+            results.append(target())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+class TestNormalizeQuery:
+    """Test coalescing keys"""
+
+    def test_case_punctuation_and_spacing_ignored(self):
+        """Test that trivially different phrasings share a key"""
+        assert normalize_query("My child is  CHOKING!") == normalize_query("my child is choking")
+
+    def test_different_questions_differ(self):
+        """Test that different questions do not share a key"""
+        assert normalize_query("treat a burn") != normalize_query("treat a cut")
+
+
+class TestSingleFlight:
+    """Test the coalescing primitive"""
+
+    def test_concurrent_callers_share_one_execution(self):
+        """Test that only the leader runs the work"""
+        flight = SingleFlight('test')
+        executions = []
+
+        def work():
+            executions.append(1)
+            time.sleep(0.1)
+            return 'answer'
+
+        results, errors = run_concurrently(5, lambda: flight.do('key', work))
+
+        assert not errors
+        assert len(executions) == 1
+        assert [r[0] for r in results] == ['answer'] * 5
+        assert sum(1 for _, shared in results if shared) == 4
+        assert flight.in_flight() == 0
+
+    def test_errors_reach_every_waiter(self):
+        """Test that the leader's exception is re-raised for waiters"""
+        flight = SingleFlight('test')
+
+        def work():
+            time.sleep(0.1)
+            raise RuntimeError("boom")
+
+        results, errors = run_concurrently(3, lambda: flight.do('key', work))
+
+        assert not results
+        assert len(errors) == 3
+
+    def test_sequential_calls_are_not_cached(self):
+        """Test that finished executions are not reused"""
+        flight = SingleFlight('test')
+        counter = iter(range(10))
+        assert flight.do('key', lambda: next(counter)) == (0, False)
+        assert flight.do('key', lambda: next(counter)) == (1, False)
+
+    def test_async_callers_share_one_execution(self):
+        """Test coalescing on the async path"""
+        flight = SingleFlight('test')
+        executions = []
+
+        async def work():
+            executions.append(1)
+            await asyncio.sleep(0.05)
+            return 'answer'
+
+        async def run():
+            return await asyncio.gather(*(flight.do_async('key', work) for _ in range(5)))
+
+        results = asyncio.run(run())
+
+        assert len(executions) == 1
+        assert sum(1 for _, shared in results if shared) == 4
+
+    def test_async_leader_cancellation_spares_waiters(self):
+        """Test that cancelling the leader does not cancel the shared work"""
+        flight = SingleFlight('test')
+
+        async def work():
+            await asyncio.sleep(0.05)
+            return 'answer'
+
+        async def run():
+            leader = asyncio.ensure_future(flight.do_async('key', work))
+            await asyncio.sleep(0)
+            waiter = asyncio.ensure_future(flight.do_async('key', work))
+            await asyncio.sleep(0)
+            leader.cancel()
+            return await waiter
+
+        assert asyncio.run(run()) == ('answer', True)
+
+
+class TestProcessQueryCoalescing:
+    """Test coalescing in the sync pipeline"""
+
+    def test_identical_queries_call_api_once(self):
+        """Test that concurrent identical queries classify and generate once"""
+        client = Mock()
+
+        def create(**kwargs):
+            time.sleep(0.1)
+            response = Mock()
+            text = "GENERAL_QUERY" if kwargs['max_tokens'] < 100 else "Cool the burn."
+            response.content = [Mock(text=text)]
+            return response
+
+        client.messages.create.side_effect = create
+        before = SHARED.value(flight='query')
+
+        results, errors = run_concurrently(
+            4, lambda: process_query("How do I treat a burn?", client)
+        )
+
+        assert not errors
+        assert all(answer == "Cool the burn." for answer, _ in results)
+        assert client.messages.create.call_count == 2
+        assert SHARED.value(flight='query') == before + 3
+
+    def test_clients_are_not_shared(self):
+        """Test that identical queries on different (per-user) clients each call their own API"""
+        def make_client():
+            client = Mock()
+
+            def create(**kwargs):
+                time.sleep(0.1)
+                response = Mock()
+                text = "GENERAL_QUERY" if kwargs['max_tokens'] < 100 else "Cool the burn."
+                response.content = [Mock(text=text)]
+                return response
+
+            client.messages.create.side_effect = create
+            return client
+
+        clients = [make_client(), make_client()]
+        turn = iter(clients)
+        lock = threading.Lock()
+
+        def query():
+            with lock:
+                client = next(turn)
+            return process_query("How do I treat a burn?", client)
+
+        results, errors = run_concurrently(2, query)
+
+        assert not errors
+        assert [client.messages.create.call_count for client in clients] == [2, 2]
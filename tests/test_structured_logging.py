@@ -0,0 +1,139 @@
+"""
+Tests for structured (JSON) logging of API calls and queries
+"""
+
+import json
+import logging
+from unittest.mock import MagicMock
+
+import pytest
+
+from First_Aid_buddy.logger import (
+    JSON_KEYS, JsonFormatter, SanitizingFormatter, StructuredMessage, _QueueHandler,
+    log_api_call, log_user_query, session_hash
+)
+
+
+class Collector(logging.Handler):
+    def __init__(self, formatter):
+        super().__init__()
+        self.setFormatter(formatter)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+    @property
+    def lines(self):
+        return [self.format(record) for record in self.records]
+
+
+@pytest.fixture
+def make_logger():
+    created = []
+
+    def make(formatter, level=logging.DEBUG):
+        logger = logging.getLogger(f'test_structured_{len(created)}')
+        collector = Collector(formatter)
+        logger.handlers = [collector]
+        logger.propagate = False
+        logger.setLevel(level)
+        created.append(logger)
+        return logger, collector
+
+    yield make
+    for logger in created:
+        logger.handlers = []
+
+
+class TestTextFormat:
+    """Test that text output is unchanged"""
+
+    def test_api_call_line(self, make_logger):
+        logger, collector = make_logger(SanitizingFormatter('%(levelname)s %(message)s'))
+        log_api_call(logger, 'classify_intent', success=False, duration_ms=12.345,
+                     metadata={'attempt': 1, 'max_attempts': 3, 'error': 'APITimeoutError',
+                               'user_input': 'secret'}, retrying=True)
+        assert collector.lines == [
+            "WARNING API Call: {'operation': 'classify_intent', 'status': 'RETRY', "
+            "'duration_ms': 12.35, 'attempt': 1, 'max_attempts': 3, 'error': 'APITimeoutError'}"
+        ]
+
+    def test_user_query_line(self, make_logger):
+        logger, collector = make_logger(SanitizingFormatter('%(message)s'))
+        log_user_query(logger, 42, 'GENERAL_QUERY', 1234.5678, session_id='abc')
+        assert collector.lines == ["Query processed: length=42, classification=GENERAL_QUERY, time=1234.57ms"]
+
+
+class TestJsonFormat:
+    """Test one-object-per-line output with fixed keys"""
+
+    def test_api_call_columns(self, make_logger):
+        """Test that API calls fill the schema columns and keep the rest in details"""
+        logger, collector = make_logger(JsonFormatter())
+        log_api_call(logger, 'generate_answer', success=True, duration_ms=812.0,
+                     metadata={'attempt': 2, 'total_ms': 1500.0})
+
+        line = json.loads(collector.lines[0])
+        assert list(line) == list(JSON_KEYS)
+        assert line['level'] == 'INFO'
+        assert (line['event'], line['operation'], line['stage']) == ('api_call', 'generate_answer', 'success')
+        assert (line['duration_ms'], line['attempt']) == (812.0, 2)
+        assert line['details'] == {'total_ms': 1500.0}
+        assert line['message'] is None
+
+    def test_user_query_columns(self, make_logger):
+        """Test that queries log the classification and a session hash, never the id"""
+        logger, collector = make_logger(JsonFormatter())
+        log_user_query(logger, 30, 'LIFE_THREATENING', 95.0, session_id='session-123')
+
+        raw = collector.lines[0]
+        line = json.loads(raw)
+        assert line['classification'] == 'LIFE_THREATENING'
+        assert line['query_length'] == 30
+        assert line['session'] == session_hash('session-123')
+        assert 'session-123' not in raw
+
+    def test_plain_messages_and_exceptions(self, make_logger):
+        """Test that ordinary log calls are sanitized into 'message' and 'exc'"""
+        logger, collector = make_logger(JsonFormatter())
+        try:
+            raise RuntimeError("key sk-ant-secret")
+        except RuntimeError:
+            logger.exception("failed for %s", "john@example.com")
+
+        line = json.loads(collector.lines[0])
+        assert line['event'] is None
+        assert line['message'] == "failed for [REDACTED_EMAIL]"
+        assert "RuntimeError" in line['exc'] and "sk-ant-secret" not in line['exc']
+
+    def test_detail_strings_sanitized(self, make_logger):
+        logger, collector = make_logger(JsonFormatter())
+        log_api_call(logger, 'classify_intent', success=False, duration_ms=1,
+                     metadata={'error': 'bad key sk-ant-abc'})
+        assert json.loads(collector.lines[0])['details'] == {'error': 'bad key [REDACTED_API_KEY]'}
+
+
+class TestLazyFields:
+    """Test that disabled levels cost nothing and text is rendered late"""
+
+    def test_disabled_level_builds_nothing(self, make_logger):
+        """Test that metadata is not touched when the level is off"""
+        logger, collector = make_logger(JsonFormatter(), level=logging.ERROR)
+        metadata = MagicMock()
+        log_api_call(logger, 'classify_intent', success=True, duration_ms=1, metadata=metadata)
+        log_user_query(logger, 1, 'GENERAL_QUERY', 1)
+
+        metadata.items.assert_not_called()
+        assert collector.records == []
+
+    def test_text_rendered_only_when_formatted(self, make_logger):
+        """Test that the queue handler passes structured messages through unrendered"""
+        render = MagicMock(return_value="rendered")
+        message = StructuredMessage('api_call', {'operation': 'x'}, render=render)
+        record = logging.LogRecord('test', logging.INFO, __file__, 1, message, None, None)
+
+        prepared = _QueueHandler(None, logging.NullHandler()).prepare(record)
+        assert prepared.msg is message
+        render.assert_not_called()
+        assert prepared.getMessage() == "rendered"
@@ -0,0 +1,227 @@
+"""
+Tests for token usage metering and per-session token budgets
+"""
+
+import asyncio
+from unittest.mock import Mock
+
+import pytest
+
+from First_Aid_buddy.config import Config
+from First_Aid_buddy.core import (
+    ValidationError, call_claude_with_retry, estimate_query_tokens, process_query, token_limiter
+)
+from First_Aid_buddy.rate_limiter import HOUR, MINUTE, TokenRateLimiter
+from First_Aid_buddy.token_usage import metering, record_usage
+
+
+class FakeClock:
+    """Manually advanced monotonic clock"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def usage(input_tokens, output_tokens):
+    return Mock(input_tokens=input_tokens, output_tokens=output_tokens)
+
+
+def response(text, input_tokens=0, output_tokens=0):
+    result = Mock()
+    result.content = [Mock(text=text)]
+    result.usage = usage(input_tokens, output_tokens)
+    return result
+
+
+class TestUsageMetering:
+    """Test per-query usage collection"""
+
+    def test_sums_calls_inside_block(self):
+        """Test that every recorded response adds to the meter"""
+        with metering() as meter:
+            record_usage(usage(100, 5))
+            record_usage(usage(300, 400))
+
+        assert (meter.input_tokens, meter.output_tokens, meter.calls) == (400, 405, 2)
+        assert meter.total_tokens == 805
+
+    def test_outside_block_is_ignored(self):
+        """Test that usage outside metering() goes nowhere"""
+        record_usage(usage(100, 5))
+        with metering() as meter:
+            pass
+        record_usage(usage(100, 5))
+        assert meter.total_tokens == 0
+
+    def test_malformed_usage_ignored(self):
+        """Test that mocks and missing usage do not break metering"""
+        with metering() as meter:
+            record_usage(Mock())
+            record_usage(None)
+        assert meter.calls == 0
+
+    def test_async_tasks_share_meter(self):
+        """Test that tasks and worker threads started inside the block are metered"""
+        async def call(tokens):
+            await asyncio.sleep(0)
+            record_usage(usage(tokens, 0))
+
+        async def main():
+            with metering() as meter:
+                await asyncio.gather(call(10), call(20), asyncio.to_thread(record_usage, usage(30, 0)))
+            return meter
+
+        assert asyncio.run(main()).input_tokens == 60
+
+    def test_retry_path_records_usage(self, mock_anthropic_client):
+        """Test that call_claude_with_retry reports each response's usage"""
+        mock_anthropic_client.messages.create.return_value = response("ok", 120, 30)
+
+        with metering() as meter:
+            call_claude_with_retry(mock_anthropic_client, 'test', model='m', max_tokens=50, messages=[])
+
+        assert meter.total_tokens == 150
+
+
+class TestTokenRateLimiter:
+    """Test per-identifier token budgets"""
+
+    def test_reserve_within_budget(self):
+        """Test that queries are admitted while usage is under the budget"""
+        limiter = TokenRateLimiter(per_minute=1000, per_hour=5000, clock=FakeClock())
+        charge, message = limiter.reserve("user", 600)
+        assert charge is not None and message is None
+        assert limiter.usage("user") == (600, 600)
+
+    def test_query_crossing_budget_runs_next_is_refused(self):
+        """Test that the budget is checked before charging, not against the estimate"""
+        limiter = TokenRateLimiter(per_minute=1000, per_hour=5000, clock=FakeClock())
+        assert limiter.reserve("user", 600)[0] is not None
+        assert limiter.reserve("user", 600)[0] is not None
+
+        charge, message = limiter.reserve("user", 10)
+        assert charge is None
+        assert "1000 tokens per minute" in message
+
+    def test_settle_replaces_estimate(self):
+        """Test that unused estimated tokens are given back"""
+        limiter = TokenRateLimiter(per_minute=1000, per_hour=5000, clock=FakeClock())
+        charge, _ = limiter.reserve("user", 1600)
+        assert limiter.reserve("user", 1)[0] is None
+
+        limiter.settle(charge, 200)
+        assert limiter.usage("user") == (200, 200)
+        assert limiter.reserve("user", 1)[0] is not None
+
+    def test_heavy_user_throttled_sooner(self):
+        """Test that budgets follow actual load, not query count"""
+        clock = FakeClock()
+        limiter = TokenRateLimiter(per_minute=5000, per_hour=50000, clock=clock)
+
+        def run_queries(identifier, tokens):
+            admitted = 0
+            while admitted < 100:
+                charge, _ = limiter.reserve(identifier, 1500)
+                if charge is None:
+                    return admitted
+                limiter.settle(charge, tokens)
+                admitted += 1
+            return admitted
+
+        assert run_queries("light", 150) > 3 * run_queries("heavy", 1200)
+
+    def test_settle_after_minute_window(self):
+        """Test that a charge that left the minute window only corrects the hour"""
+        clock = FakeClock()
+        limiter = TokenRateLimiter(per_minute=1000, per_hour=5000, clock=clock)
+        charge, _ = limiter.reserve("user", 800)
+
+        clock.now += MINUTE + 1
+        assert limiter.usage("user") == (0, 800)
+        limiter.settle(charge, 300)
+        assert limiter.usage("user") == (0, 300)
+
+    def test_hour_budget(self):
+        """Test that the hourly budget applies and lifts after an hour"""
+        clock = FakeClock()
+        limiter = TokenRateLimiter(per_minute=1000, per_hour=2000, clock=clock)
+        for _ in range(2):
+            assert limiter.reserve("user", 1000)[0] is not None
+            clock.now += MINUTE
+
+        charge, message = limiter.reserve("user", 1)
+        assert charge is None
+        assert "per hour" in message
+
+        clock.now += HOUR
+        assert limiter.reserve("user", 1)[0] is not None
+
+    def test_settle_after_eviction(self):
+        """Test that settling a charge of an evicted identifier is harmless"""
+        limiter = TokenRateLimiter(per_minute=1000, per_hour=5000, max_identifiers=1, stripes=1)
+        charge, _ = limiter.reserve("first", 500)
+        limiter.reserve("second", 500)
+
+        limiter.settle(charge, 100)
+        assert limiter.usage("second") == (500, 500)
+
+
+class TestTokenBudgetInPipeline:
+    """Test process_query() charging sessions by usage"""
+
+    @pytest.fixture
+    def enabled(self, monkeypatch):
+        monkeypatch.setattr(token_limiter, 'enabled', True)
+        monkeypatch.setattr(token_limiter, 'per_minute', 2000)
+        monkeypatch.setattr(token_limiter, 'per_hour', 20000)
+
+    def test_session_charged_actual_usage(self, mock_anthropic_client, enabled):
+        """Test that the session is charged what both calls used"""
+        mock_anthropic_client.messages.create.side_effect = [
+            response("GENERAL_QUERY", 150, 2),
+            response("Rinse with water.", 700, 300),
+        ]
+
+        process_query("How do I treat a minor burn?", mock_anthropic_client, session_id="session-1")
+
+        assert token_limiter.usage("session-1") == (1152, 1152)
+
+    def test_budget_exhausted_raises(self, mock_anthropic_client, enabled):
+        """Test that a session over its token budget is refused before any call"""
+        mock_anthropic_client.messages.create.side_effect = [
+            response("GENERAL_QUERY", 150, 2),
+            response("Long answer", 1200, 900),
+        ]
+        process_query("How do I treat a minor burn?", mock_anthropic_client, session_id="session-1")
+        calls = mock_anthropic_client.messages.create.call_count
+
+        with pytest.raises(ValidationError, match="Usage limit exceeded"):
+            process_query("How do I treat a sprain?", mock_anthropic_client, session_id="session-1")
+        assert mock_anthropic_client.messages.create.call_count == calls
+
+    def test_failed_query_charged_what_it_used(self, mock_anthropic_client, enabled):
+        """Test that the estimate is not left charged when the query fails"""
+        mock_anthropic_client.messages.create.side_effect = ValueError("boom")
+
+        with pytest.raises(Exception):
+            process_query("How do I treat a minor burn?", mock_anthropic_client, session_id="session-1")
+
+        assert token_limiter.usage("session-1") == (0, 0)
+
+    def test_disabled_by_default(self, mock_anthropic_client):
+        """Test that nothing is charged unless TOKEN_RATE_LIMIT_ENABLED"""
+        assert Config.TOKEN_RATE_LIMIT_ENABLED is False
+        mock_anthropic_client.messages.create.side_effect = [
+            response("GENERAL_QUERY", 150, 2),
+            response("Rinse with water.", 700, 300),
+        ]
+        process_query("How do I treat a minor burn?", mock_anthropic_client, session_id="session-1")
+        assert token_limiter.usage("session-1") == (0, 0)
+
+    def test_estimate_covers_max_output(self):
+        """Test that the pre-charge covers the configured output limits"""
+        estimate = estimate_query_tokens("How do I treat a minor burn?")
+        assert estimate > Config.MAX_TOKENS_GENERATION + Config.MAX_TOKENS_CLASSIFICATION
@@ -0,0 +1,203 @@
+"""
+Tests for request tracing (spans, traceparent propagation, exporters)
+"""
+
+import asyncio
+import json
+from unittest.mock import AsyncMock, Mock
+
+import anthropic
+import httpx
+import pytest
+from fastapi import HTTPException, Response
+
+from First_Aid_buddy.config import Config
+from First_Aid_buddy.core import call_claude_with_retry_async
+from First_Aid_buddy.retry import RetryPolicy
+from First_Aid_buddy.tracing import (
+    FileExporter, InMemoryExporter, Tracer, current_span, parse_traceparent, tracer
+)
+from backend.models.chat import ChatRequest
+from backend.routers.chat import chat
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+
+def answer_response(text, input_tokens=20, output_tokens=8):
+    response = Mock()
+    response.content = [Mock(text=text)]
+    response.usage = Mock(input_tokens=input_tokens, output_tokens=output_tokens)
+    return response
+
+
+def timeout_error():
+    request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+    return anthropic.APITimeoutError(request=request)
+
+
+@pytest.fixture
+def exporter(monkeypatch):
+    """Turn the global tracer on with a fresh in-memory exporter"""
+    exporter = InMemoryExporter()
+    monkeypatch.setattr(tracer, 'enabled', True)
+    monkeypatch.setattr(tracer, 'exporter', exporter)
+    return exporter
+
+
+def by_name(spans):
+    return {span.name: span for span in spans}
+
+
+class TestTraceparent:
+    """Test W3C header parsing"""
+
+    def test_valid_header(self):
+        context = parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-01")
+        assert (context.trace_id, context.span_id, context.sampled) == (TRACE_ID, PARENT_ID, True)
+        assert parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-00").sampled is False
+
+    @pytest.mark.parametrize('header', [
+        None, "", "garbage", f"00-{TRACE_ID}-{PARENT_ID}", f"ff-{TRACE_ID}-{PARENT_ID}-01",
+        f"00-{'0' * 32}-{PARENT_ID}-01", f"00-{TRACE_ID}-{'0' * 16}-01", f"00-{TRACE_ID[:-1]}x-{PARENT_ID}-01",
+    ])
+    def test_invalid_header_ignored(self, header):
+        assert parse_traceparent(header) is None
+
+
+class TestTracer:
+    """Test span creation and parenting"""
+
+    def test_children_follow_active_span(self):
+        """Test that nested spans share the trace and point at their parent"""
+        local = Tracer(InMemoryExporter())
+        with local.span("root") as root:
+            with local.span("child", {'step': 1}) as child:
+                assert current_span() is child
+            assert current_span() is root
+
+        spans = by_name(local.exporter.spans())
+        assert spans['child'].parent_id == root.context.span_id
+        assert spans['child'].context.trace_id == root.context.trace_id
+        assert spans['root'].parent_id is None
+        assert spans['child'].attributes == {'step': 1}
+        assert spans['root'].duration_ms >= spans['child'].duration_ms
+
+    def test_context_follows_asyncio_tasks(self):
+        """Test that spans started in concurrent tasks attach to the right parent"""
+        local = Tracer(InMemoryExporter())
+
+        async def request(name):
+            with local.span(name) as root:
+                await asyncio.sleep(0.01)
+                with local.span(f"{name}.stage"):
+                    await asyncio.sleep(0)
+                return root.context.span_id
+
+        async def main():
+            return await asyncio.gather(request("a"), request("b"))
+
+        a_id, b_id = asyncio.run(main())
+        spans = by_name(local.exporter.spans())
+        assert spans['a.stage'].parent_id == a_id
+        assert spans['b.stage'].parent_id == b_id
+
+    def test_error_recorded(self):
+        local = Tracer(InMemoryExporter())
+        with pytest.raises(ValueError):
+            with local.span("failing"):
+                raise ValueError("boom")
+        span = local.exporter.spans()[0]
+        assert span.status == 'ERROR'
+        assert span.attributes['exception.type'] == 'ValueError'
+
+    def test_disabled_and_unsampled_record_nothing(self):
+        local = Tracer(InMemoryExporter(), enabled=False)
+        with local.span("root") as root:
+            assert root.recording is False
+        local.enabled = True
+        with local.span("remote", parent=parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-00")):
+            with local.span("child") as child:
+                assert child.recording is False
+        assert local.exporter.spans() == []
+
+    def test_file_exporter(self, tmp_path):
+        """Test that spans are appended as JSON lines"""
+        path = tmp_path / "traces.jsonl"
+        local = Tracer(FileExporter(str(path)))
+        with local.span("root", {'http.route': '/chat'}):
+            with local.span("child"):
+                pass
+
+        lines = [json.loads(line) for line in path.read_text().splitlines()]
+        assert [line['name'] for line in lines] == ['child', 'root']
+        assert lines[1]['attributes'] == {'http.route': '/chat'}
+        assert lines[0]['parent_id'] == lines[1]['span_id']
+
+
+class TestRequestTrace:
+    """Test the spans of a whole /chat request"""
+
+    def test_chat_request_spans(self, exporter):
+        """Test the router root, stage children and LLM attempt grandchildren"""
+        client = Mock()
+        client.messages.create = AsyncMock(side_effect=[
+            answer_response("GENERAL_QUERY", 50, 3), answer_response("Clean the wound.", 400, 120),
+        ])
+        request = Mock()
+        request.app.state.anthropic_client = client
+        request.client.host = "127.0.0.1"
+        request.headers = {"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-01"}
+
+        asyncio.run(chat(ChatRequest(message="How do I treat a minor cut?"), request, Response()))
+
+        spans = exporter.spans(TRACE_ID)
+        names = by_name(spans)
+        root = names['POST /chat']
+        assert root.parent_id == PARENT_ID
+        for stage in ('validate', 'rate_limit', 'retrieve', 'classify', 'generate'):
+            assert names[f'pipeline.{stage}'].parent_id == root.context.span_id
+        assert root.attributes['pipeline.classification'] == 'GENERAL_QUERY'
+
+        classify = names['llm.classify_intent']
+        assert classify.parent_id == names['pipeline.classify'].context.span_id
+        assert (classify.attributes['llm.input_tokens'], classify.attributes['llm.output_tokens']) == (50, 3)
+        generate = names['llm.generate_answer']
+        assert generate.parent_id == names['pipeline.generate'].context.span_id
+        assert generate.attributes['llm.output_tokens'] == 120
+
+    def test_retry_attempts(self, exporter):
+        """Test that each attempt gets a span with the retry reason"""
+        client = Mock()
+        client.messages.create = AsyncMock(side_effect=[timeout_error(), answer_response("ok")])
+        policy = RetryPolicy(max_retries=2, base_delay=0.001, max_delay=0.001)
+
+        async def main():
+            with tracer.span("root"):
+                await call_claude_with_retry_async(
+                    client, 'generate_answer', retry_policy=policy, model='claude-test', max_tokens=10, messages=[]
+                )
+
+        asyncio.run(main())
+        attempts = [span for span in exporter.spans() if span.name == 'llm.generate_answer']
+        assert [span.attributes['llm.attempt'] for span in attempts] == [1, 2]
+        assert attempts[0].status == 'ERROR'
+        assert attempts[0].attributes['llm.retry'] is True
+        assert attempts[0].attributes['llm.retry_reason'] == 'APITimeoutError'
+        assert attempts[1].status == 'OK'
+        assert attempts[1].attributes['llm.model'] == 'claude-test'
+
+    def test_rejected_request_marked(self, exporter, monkeypatch):
+        """Test that a request refused by validation ends its root span with the status"""
+        monkeypatch.setattr(Config, 'MAX_INPUT_LENGTH', 10)
+        request = Mock()
+        request.app.state.anthropic_client = Mock()
+        request.client.host = "127.0.0.1"
+        request.headers = {}
+
+        with pytest.raises(HTTPException):
+            asyncio.run(chat(ChatRequest(message="How do I treat a minor cut?"), request, Response()))
+
+        root = by_name(exporter.spans())['POST /chat']
+        assert root.status == 'ERROR'
+        assert root.attributes['http.status_code'] == 422
@@ -0,0 +1,172 @@
+"""
+Tests for token usage and cost accounting by stage, model and session
+"""
+
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+from fastapi.testclient import TestClient
+
+from First_Aid_buddy.config import Config
+from First_Aid_buddy.core import call_claude_with_retry, process_query
+from First_Aid_buddy.logger import session_hash
+from First_Aid_buddy.token_usage import (
+    COST, PROMPT_TOKENS, TOKENS, TokenCounts, UsageLedger, estimate_cost, metering, record_usage,
+    token_counts, usage_ledger
+)
+from backend.main import app
+
+
+def usage(input_tokens, output_tokens, cache_creation=None, cache_read=None):
+    return Mock(
+        input_tokens=input_tokens, output_tokens=output_tokens,
+        cache_creation_input_tokens=cache_creation, cache_read_input_tokens=cache_read,
+    )
+
+
+def response(text, input_tokens=0, output_tokens=0, cache_read=None):
+    result = Mock()
+    result.content = [Mock(text=text)]
+    result.usage = usage(input_tokens, output_tokens, cache_read=cache_read)
+    return result
+
+
+class TestTokenCounts:
+    """Test reading and pricing response.usage"""
+
+    def test_cache_fields(self):
+        assert token_counts(usage(100, 20, 300, 400)) == TokenCounts(100, 20, 300, 400)
+        assert token_counts(usage(100, 20)) == TokenCounts(100, 20, 0, 0)
+        assert token_counts(Mock()) is None
+
+    def test_cost(self):
+        """Test list prices by model prefix, with cache writes and reads"""
+        counts = TokenCounts(1_000_000, 100_000, 0, 1_000_000)
+        assert estimate_cost('claude-haiku-4-5-20251001', counts) == pytest.approx(1.0 + 0.5 + 0.1)
+        assert estimate_cost('claude-sonnet-4-5-20250929', TokenCounts(0, 0, 1_000_000, 0)) == pytest.approx(3.75)
+        assert estimate_cost('claude-opus-4-5-20251101', TokenCounts(1_000_000, 0)) == pytest.approx(5.0)
+        assert estimate_cost('some-other-model', counts) is None
+
+
+class TestUsageLedger:
+    """Test the in-memory aggregates"""
+
+    def test_breakdown_by_stage_and_model(self):
+        ledger = UsageLedger()
+        ledger.record('classify_intent', 'claude-haiku-4-5', TokenCounts(50, 3), 0.2, 'a')
+        ledger.record('generate_answer', 'claude-sonnet-4-5', TokenCounts(400, 100), 1.0, 'a')
+        ledger.record('generate_answer', 'claude-sonnet-4-5', TokenCounts(800, 100), 3.0, 'b')
+
+        report = ledger.report()
+        assert report['totals']['calls'] == 3
+        heaviest = report['by_stage'][0]
+        assert (heaviest['operation'], heaviest['model'], heaviest['calls']) == ('generate_answer', 'claude-sonnet-4-5', 2)
+        assert heaviest['avg_prompt_tokens'] == 600
+        assert heaviest['avg_latency_ms'] == 2000
+        assert [s['session'] for s in report['top_sessions']] == ['b', 'a']
+
+    def test_sessions_bounded(self):
+        """Test that only the most recently active sessions are kept"""
+        ledger = UsageLedger(max_sessions=2)
+        for session in ('a', 'b', 'a', 'c'):
+            ledger.record('generate_answer', 'claude-sonnet-4-5', TokenCounts(10, 1), 0.1, session)
+
+        report = ledger.report()
+        assert {s['session'] for s in report['top_sessions']} == {'a', 'c'}
+        assert (report['sessions_tracked'], report['sessions_evicted']) == (2, 1)
+        assert report['totals']['calls'] == 4
+
+    def test_breakdowns_bounded(self):
+        ledger = UsageLedger(max_breakdowns=2)
+        for model in ('m1', 'm2', 'm3', 'm4'):
+            ledger.record('generate_answer', model, TokenCounts(10, 1), 0.1)
+
+        report = ledger.report()
+        assert len(report['by_stage']) == 3
+        assert ('other', 'other') in {(s['operation'], s['model']) for s in report['by_stage']}
+        assert report['unpriced_calls'] == 4
+
+
+class TestCallAccounting:
+    """Test that every Anthropic call is accounted"""
+
+    def test_call_recorded_with_session(self, mock_anthropic_client):
+        """Test that a query's calls land under its stage, model and hashed session"""
+        mock_anthropic_client.messages.create.side_effect = [
+            response("GENERAL_QUERY", 60, 2), response("Clean the wound.", 500, 150, cache_read=1000),
+        ]
+        haiku_tokens = TOKENS.value(operation='classify_intent', model=Config.CLAUDE_MODEL_TRIAGE, kind='input')
+        prompts = PROMPT_TOKENS.count(operation='generate_answer')
+
+        process_query("How do I treat a minor cut?", mock_anthropic_client, session_id="session-1")
+
+        report = usage_ledger.report()
+        stages = {(s['operation'], s['model']): s for s in report['by_stage']}
+        generate = stages[('generate_answer', Config.CLAUDE_MODEL_ANSWER)]
+        assert (generate['input_tokens'], generate['output_tokens'], generate['cache_read_input_tokens']) == (500, 150, 1000)
+        assert generate['cost_usd'] > 0
+        assert stages[('classify_intent', Config.CLAUDE_MODEL_TRIAGE)]['input_tokens'] == 60
+
+        [session] = report['top_sessions']
+        assert session['session'] == session_hash("session-1")
+        assert session['input_tokens'] == 560
+        assert "session-1" not in str(report)
+
+        assert TOKENS.value(operation='classify_intent', model=Config.CLAUDE_MODEL_TRIAGE, kind='input') == haiku_tokens + 60
+        assert PROMPT_TOKENS.count(operation='generate_answer') == prompts + 1
+
+    def test_call_outside_query(self, mock_anthropic_client):
+        """Test that calls without a session still count towards the stage totals"""
+        mock_anthropic_client.messages.create.return_value = response("ok", 10, 5)
+        cost = COST.value(operation='generate_answer', model='claude-haiku-4-5')
+
+        call_claude_with_retry(mock_anthropic_client, 'generate_answer', model='claude-haiku-4-5', max_tokens=10, messages=[])
+
+        report = usage_ledger.report()
+        assert report['totals']['input_tokens'] == 10
+        assert report['top_sessions'] == []
+        assert COST.value(operation='generate_answer', model='claude-haiku-4-5') > cost
+
+    def test_meter_unaffected_when_disabled(self, monkeypatch):
+        """Test that disabling accounting keeps per-query metering (token budgets)"""
+        monkeypatch.setattr(Config, 'USAGE_ACCOUNTING_ENABLED', False)
+        with metering("s") as meter:
+            record_usage(usage(100, 5, cache_read=50), 'generate_answer', 'claude-haiku-4-5', 0.1)
+        assert (meter.total_tokens, meter.cache_read_input_tokens) == (105, 50)
+        assert usage_ledger.report()['totals']['calls'] == 0
+
+
+class TestUsageEndpoint:
+    """Test GET /admin/usage"""
+
+    @pytest.fixture
+    def client(self):
+        return TestClient(app)
+
+    def test_disabled_without_token(self, client, monkeypatch):
+        monkeypatch.setattr(Config, 'ADMIN_TOKEN', '')
+        assert client.get("/admin/usage").status_code == 404
+
+    def test_wrong_token_rejected(self, client, monkeypatch):
+        monkeypatch.setattr(Config, 'ADMIN_TOKEN', 'secret')
+        assert client.get("/admin/usage").status_code == 403
+        assert client.get("/admin/usage", headers={"X-Admin-Token": "wrong"}).status_code == 403
+
+    def test_report(self, client, monkeypatch):
+        """Test that a /chat request's usage shows up in the report"""
+        monkeypatch.setattr(Config, 'ADMIN_TOKEN', 'secret')
+        anthropic_client = Mock()
+        anthropic_client.messages.create = AsyncMock(side_effect=[
+            response("GENERAL_QUERY", 40, 2), response("Clean the wound.", 300, 80),
+        ])
+        app.state.anthropic_client = anthropic_client
+        try:
+            assert client.post("/chat", json={"message": "How do I treat a minor cut?"}).status_code == 200
+        finally:
+            app.state.anthropic_client = None
+
+        body = client.get("/admin/usage", params={"top": 5}, headers={"X-Admin-Token": "secret"}).json()
+        assert body['accounting_enabled'] is True
+        assert body['totals']['calls'] == 2
+        assert body['totals']['input_tokens'] == 340
+        assert {s['operation'] for s in body['by_stage']} == {'classify_intent', 'generate_answer'}